@@ -1,5 +1,14 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import pre_save
 
 
 class CommonsserverConfig(AppConfig):
     name = 'commonsServer'
+    
+    def ready(self):
+        from commonsServer.models import Version, compute_version_sort_key
+        
+        # signals are sent with the proxy model as sender, when a version is saved through it
+        for model in apps.get_models():
+            if model._meta.proxy and issubclass(model, Version):
+                pre_save.connect(compute_version_sort_key, sender=model, dispatch_uid='compute_version_sort_key_%s' % model._meta.label)
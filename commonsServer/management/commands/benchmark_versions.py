@@ -0,0 +1,113 @@
+import json
+import logging
+import random
+import time
+
+import numpy
+
+from looseversion import LooseVersion
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+def percentile(durations, percent):
+    return float(numpy.percentile(durations, percent)) * 1000
+
+
+class Command(BaseCommand):
+    help = """Benchmark search of previous / next versions of an application, and print results as JSON
+Synthetic versions are created in a transaction which is rolled back at the end
+Search in database, using the version sort key, is compared to sorting versions in python with LooseVersion"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--versions', type=int, default=1200, help="number of versions of the application")
+        parser.add_argument('--iterations', type=int, default=5, help="number of times each search is timed")
+        parser.add_argument('--seed', type=int, default=0, help="seed of the random generator, so that data is the same between runs")
+        parser.add_argument('--output', help="file where JSON results are written. Defaults to standard output")
+
+    def handle(self, *args, **options):
+
+        if options['iterations'] < 1:
+            raise CommandError("At least 1 iteration is needed")
+        if options['versions'] < 1:
+            raise CommandError("At least 1 version is needed")
+
+        with transaction.atomic():
+            try:
+                current = self._create_data(random.Random(options['seed']), options['versions'])
+                timings, equivalent = self._run_scenarios(current, options['iterations'])
+            finally:
+                transaction.set_rollback(True)
+
+        report = {
+            'versions': options['versions'],
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'equivalent': equivalent,
+            'timings': timings, # durations in milliseconds
+        }
+
+        content = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+        else:
+            self.stdout.write(content)
+
+    def _create_data(self, rng, version_count):
+        """
+        Creates an application with versions named 'major.minor.patch', in random order
+        @return: the version to search previous / next versions for
+        """
+        from commonsServer.models import Application, Version
+
+        application = Application.objects.create(name='benchmark_app')
+        names = set()
+        while len(names) < version_count:
+            names.add('%d.%d.%d' % (rng.randrange(10), rng.randrange(50), rng.randrange(50)))
+        names = sorted(names)
+        rng.shuffle(names)
+
+        versions = Version.objects.bulk_create([Version(application=application, name=name) for name in names], batch_size=1000)
+        logger.info("created %d versions" % len(versions))
+        return rng.choice(versions)
+
+    def _run_scenarios(self, current, iterations):
+        from commonsServer.models import Version
+
+        def database():
+            return [v.name for v in current.previous_versions()], [v.name for v in current.next_versions()]
+
+        def python_sort():
+            current_version = LooseVersion(current.name)
+            versions = sorted(Version.objects.filter(application=current.application_id), key=lambda v: LooseVersion(v.name))
+            return ([v.name for v in versions if LooseVersion(v.name) < current_version],
+                    [v.name for v in versions if LooseVersion(v.name) >= current_version])
+
+        calls = {
+            'pythonSort': python_sort,
+            'database': database,
+        }
+
+        timings = {}
+        results = {}
+        for name, call in calls.items():
+            durations = []
+            for i in range(iterations):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    results[name] = call()
+                    durations.append(time.perf_counter() - start)
+
+            timings[name] = {
+                'p50': percentile(durations, 50),
+                'p95': percentile(durations, 95),
+                'min': min(durations) * 1000,
+                'max': max(durations) * 1000,
+                'queries': len(queries.captured_queries),
+            }
+
+        return timings, results['pythonSort'] == results['database']
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.15 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+def forwards_func(apps, schema_editor):
+    """
+    Compute sort key of existing versions
+    """
+    from commonsServer.models import version_sort_key
+    
+    Version = apps.get_model("commonsServer", "Version")
+    db_alias = schema_editor.connection.alias
+    
+    versions = list(Version.objects.using(db_alias).only('id', 'name'))
+    for version in versions:
+        version.sortKey = version_sort_key(version.name)
+    Version.objects.using(db_alias).bulk_update(versions, ['sortKey'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commonsServer', '0005_apppreference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='sortKey',
+            field=models.CharField(default='', editable=False, max_length=400),
+        ),
+        migrations.AddIndex(
+            model_name='version',
+            index=models.Index(fields=['application', 'sortKey'], name='version_application_sort_key'),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -3,7 +3,7 @@ from looseversion import LooseVersion
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.contrib.auth.models import Permission
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 
 class TruncatingCharField(models.CharField):
@@ -65,34 +65,94 @@ class Application(models.Model):
         super(Application, self).delete(*args, **kwargs)
         Permission.objects.get(codename=Application.app_variable_permission_code + self.name).delete()
     
+def version_sort_key(name):
+    """
+    Build a string which, compared with other keys, orders version names as LooseVersion does
+    It allows sorting / filtering versions directly in database
+    
+    Each LooseVersion component is encoded as bytes
+    - numbers: 0x01, number of digits, digits => 2 < 10
+    - strings: 0x02, utf-8 text, 0x00 => 'a' < 'ab'
+    numbers come before strings, where LooseVersion would fail to compare them
+    The result is hex encoded so that the database collation does not change the order
+    """
+    key = b''
+    for component in (LooseVersion(name).version if name else []):
+        if isinstance(component, int):
+            digits = str(component).encode()[:255]
+            key += b'\x01' + bytes([len(digits)]) + digits
+        else:
+            key += b'\x02' + component.encode('utf-8') + b'\x00'
+            
+    return key.hex()[:Version.SORT_KEY_LENGTH]
+
+class VersionQuerySet(models.QuerySet):
+    """
+    Bulk operations do not send 'pre_save' signal, so sort key is computed here
+    update() only computes it when name is a string (not an expression), unless sort key is also given
+    """
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for version in objs:
+            version.sortKey = version_sort_key(version.name)
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'name' in fields:
+            objs = list(objs)
+            for version in objs:
+                version.sortKey = version_sort_key(version.name)
+            fields = list(fields) + ['sortKey']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+    
+    def update(self, **kwargs):
+        if 'name' in kwargs and 'sortKey' not in kwargs:
+            if not isinstance(kwargs['name'], str):
+                raise ValueError("Version name can only be updated with a string, so that sort key can be computed")
+            kwargs['sortKey'] = version_sort_key(kwargs['name'])
+        return super().update(**kwargs)
+
 class Version(models.Model):
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['name', 'application'], name='unique_name_for_application')
         ]
+        indexes = [
+            models.Index(fields=['application', 'sortKey'], name='version_application_sort_key'),
+        ]
+        
+    SORT_KEY_LENGTH = 400
 
     application = models.ForeignKey(Application, related_name='version', on_delete=models.CASCADE)
     name = models.CharField(max_length=50)
+    sortKey = models.CharField(max_length=SORT_KEY_LENGTH, default='', editable=False) # computed from name, see version_sort_key
+    
+    objects = VersionQuerySet.as_manager()
     
     def __str__(self):
         return self.application.name + '-' + self.name
     
     def previous_versions(self):
         """
-        Get all versions for the same application, previous to this one
+        Get all versions for the same application, previous to this one, sorted
         """
-        versions = [v for v in Version.objects.filter(application=self.application) if LooseVersion(v.name) < LooseVersion(self.name)]
-        versions.sort(key=lambda v: LooseVersion(v.name), reverse=False)
-        return versions
+        return list(Version.objects.filter(application=self.application_id, sortKey__lt=version_sort_key(self.name)).order_by('sortKey', 'pk'))
     
     def next_versions(self):
         """
-        Get all versions for the same application, previous to this one
+        Get all versions for the same application, next to this one (this one included), sorted
         """
-        versions = [v for v in Version.objects.filter(application=self.application) if LooseVersion(v.name) >= LooseVersion(self.name)]
-        versions.sort(key=lambda v: LooseVersion(v.name), reverse=False)
-        return versions
+        return list(Version.objects.filter(application=self.application_id, sortKey__gte=version_sort_key(self.name)).order_by('sortKey', 'pk'))
+    
+@receiver(pre_save, sender=Version)
+def compute_version_sort_key(sender, instance, **kwargs):
+    """
+    Keep sort key in line with the name
+    Version is also used through proxy models in each application (and fixtures), they are connected when application is ready (see CommonsserverConfig)
+    """
+    instance.sortKey = version_sort_key(instance.name)
     
 class TestEnvironment(models.Model):
     """
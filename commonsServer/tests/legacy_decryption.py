@@ -0,0 +1,17 @@
+import base64
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+from django.conf import settings
+
+def legacy_decrypt_data(encrypted_text):
+    """
+    Decryption as it was done before, with a new cipher for each value
+    Kept as a reference: tests compare results with decrypt_data, and 'benchmark_decryption' command compares performance
+    """
+    encrypted_text_bytes = base64.urlsafe_b64decode(encrypted_text)
+    iv = encrypted_text_bytes[:16]
+    cipher = Cipher(algorithms.AES(settings.VARIABLE_SECRET_KEY), modes.CFB(iv), backend=default_backend())
+    decryptor = cipher.decryptor()
+    decrypted_data = decryptor.update(encrypted_text_bytes[16:]) + decryptor.finalize()
+    return decrypted_data.decode()
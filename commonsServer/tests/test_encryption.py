@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase, override_settings
+
+from commonsServer.tests.legacy_decryption import legacy_decrypt_data
+from commonsServer.utils.encryption import encrypt_data, decrypt_data, _cached_decrypt, _algorithm
+
+
+class TestEncryption(SimpleTestCase):
+
+    def test_decrypt(self):
+        """
+        Decryption gives the same result as a CFB cipher, whatever the length of the value (full blocks or not)
+        """
+        for length in [1, 15, 16, 17, 32, 33, 100, 3000]:
+            plain_text = ''.join(chr(ord('a') + i % 26) for i in range(length))
+            encrypted_text = encrypt_data(plain_text)
+            self.assertEqual(plain_text, legacy_decrypt_data(encrypted_text))
+            self.assertEqual(plain_text, decrypt_data(encrypted_text))
+            # from cache
+            self.assertEqual(plain_text, decrypt_data(encrypted_text))
+
+    def test_algorithm_reused(self):
+        """
+        AES algorithm of the key is created once, not for each value
+        """
+        _algorithm.cache_clear()
+        for i in range(3):
+            self.assertEqual('value%d' % i, decrypt_data(encrypt_data('value%d' % i)))
+        self.assertEqual(1, _algorithm.cache_info().misses)
+        self.assertEqual(2, _algorithm.cache_info().hits)
+
+    def test_decrypt_unicode(self):
+        self.assertEqual('mot de passe é€', decrypt_data(encrypt_data('mot de passe é€')))
+
+    def test_decrypt_empty(self):
+        self.assertIsNone(encrypt_data(''))
+        self.assertIsNone(decrypt_data(''))
+        self.assertIsNone(decrypt_data(None))
+
+    def test_decrypt_other_key(self):
+        """
+        Cached values are not returned when key changes
+        """
+        encrypted_text = encrypt_data('myValue' * 20)
+        self.assertEqual('myValue' * 20, decrypt_data(encrypted_text))
+        with override_settings(VARIABLE_SECRET_KEY=b'0123456789abcdef0123456789abcdef'):
+            with self.assertRaises(UnicodeDecodeError):
+                decrypt_data(encrypted_text)
+
+    def test_decryption_cache_size(self):
+        """
+        Cache size is read from settings when cache is used, not when module is loaded
+        """
+        with override_settings(VARIABLE_DECRYPTION_CACHE_SIZE=2):
+            for i in range(3):
+                self.assertEqual('myValue%d' % i, decrypt_data(encrypt_data('myValue%d' % i)))
+            self.assertEqual(2, _cached_decrypt().cache_info().maxsize)
+            self.assertEqual(2, _cached_decrypt().cache_info().currsize)
+
+        with override_settings(VARIABLE_DECRYPTION_CACHE_SIZE=0):
+            self.assertEqual('myValue', decrypt_data(encrypt_data('myValue')))
+            self.assertEqual(0, _cached_decrypt().cache_info().currsize)
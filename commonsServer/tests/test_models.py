@@ -1,7 +1,17 @@
+import io
+import json
+
+from looseversion import LooseVersion
+
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db.models import F, Value
+from django.db.models.functions import Concat
 from django.test import TestCase
 
+from commonsServer.models import version_sort_key, Version as CommonsVersion
+from snapshotServer.models import Version as SnapshotVersion
 from variableServer.models import Application, TestEnvironment, Version
 
 
@@ -99,6 +109,94 @@ class TestVersionModel(TestCase):
 
         self.assertEqual(["2.0", "2.1", "13.0"], [v.name for v in next_versions])
 
+    def test_sort_key_computed_on_save(self):
+        application = Application.objects.create(name="app-v5")
+        version = Version.objects.create(application=application, name="1.2")
+        self.assertEqual(version_sort_key("1.2"), Version.objects.get(pk=version.pk).sortKey)
+
+        version.name = "1.3"
+        version.save()
+        self.assertEqual(version_sort_key("1.3"), Version.objects.get(pk=version.pk).sortKey)
+
+    def test_sort_key_follows_loose_version(self):
+        names = ["1.0", "1.0.1", "1.0a", "1.0-SNAPSHOT", "1.1", "1.9", "1.10", "2.0", "10.0", "008", "8.0b2", "0", "a", "ab", "a.b"]
+        for name1 in names:
+            for name2 in names:
+                try:
+                    expected = (LooseVersion(name1) < LooseVersion(name2), LooseVersion(name1) == LooseVersion(name2))
+                except TypeError:
+                    continue
+                self.assertEqual(expected, (version_sort_key(name1) < version_sort_key(name2), version_sort_key(name1) == version_sort_key(name2)), f"{name1} / {name2}")
+
+    def test_sort_key_mixed_components(self):
+        """
+        LooseVersion cannot compare a number with a string, numbers are considered lower
+        """
+        self.assertTrue(version_sort_key("1.1") < version_sort_key("1.a"))
+        self.assertTrue(version_sort_key("1") < version_sort_key("1.a"))
+        self.assertEqual("", version_sort_key(""))
+
+    def test_previous_and_next_versions_equivalent_versions(self):
+        """
+        '1.0' and '1.00' are the same version for LooseVersion
+        """
+        application = Application.objects.create(name="app-v6")
+        Version.objects.create(application=application, name="1.0")
+        current = Version.objects.create(application=application, name="1.00")
+
+        self.assertEqual([], current.previous_versions())
+        self.assertEqual(["1.0", "1.00"], [v.name for v in current.next_versions()])
+
+    def test_previous_and_next_versions_many_versions(self):
+        """
+        Check versions are searched with a single query, whatever the number of versions of the application
+        """
+        application = Application.objects.create(name="app-v7")
+        names = [f"{major}.{minor}.{patch}" for major in range(3) for minor in range(20) for patch in range(20)]
+        Version.objects.bulk_create([Version(application=application, name=name) for name in names])
+        current = Version.objects.get(application=application, name="1.10.0")
+
+        with self.assertNumQueries(1):
+            previous_versions = [v.name for v in current.previous_versions()]
+        with self.assertNumQueries(1):
+            next_versions = [v.name for v in current.next_versions()]
+
+        versions = sorted(names, key=LooseVersion)
+        self.assertEqual([name for name in versions if LooseVersion(name) < LooseVersion(current.name)], previous_versions)
+        self.assertEqual([name for name in versions if LooseVersion(name) >= LooseVersion(current.name)], next_versions)
+
+    def test_sort_key_computed_on_bulk_operations(self):
+        application = Application.objects.create(name="app-v8")
+        Version.objects.bulk_create([Version(application=application, name="1.2")])
+        version = Version.objects.get(application=application)
+        self.assertEqual(version_sort_key("1.2"), version.sortKey)
+
+        version.name = "1.3"
+        Version.objects.bulk_update([version], ['name'])
+        self.assertEqual(version_sort_key("1.3"), Version.objects.get(pk=version.pk).sortKey)
+
+        Version.objects.filter(pk=version.pk).update(name="1.4")
+        self.assertEqual(version_sort_key("1.4"), Version.objects.get(pk=version.pk).sortKey)
+
+        with self.assertRaises(ValueError):
+            Version.objects.filter(pk=version.pk).update(name=Concat(F('name'), Value('.1')))
+
+    def test_sort_key_computed_on_proxy_save(self):
+        application = Application.objects.create(name="app-v9")
+        version = SnapshotVersion.objects.create(application=application, name="2.0")
+        self.assertEqual(version_sort_key("2.0"), CommonsVersion.objects.get(pk=version.pk).sortKey)
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        call_command('benchmark_versions', versions=100, iterations=1, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertTrue(report['equivalent'])
+        self.assertEqual(2, report['timings']['database']['queries'])
+
+        # benchmark data is removed
+        self.assertFalse(Application.objects.filter(name='benchmark_app').exists())
+
 
 class TestEnvironmentModel(TestCase):
 
@@ -0,0 +1,59 @@
+from django.contrib.auth.models import User, Permission
+from django.test import TestCase
+from django.test.client import RequestFactory
+from rest_framework.request import Request
+
+from seleniumRobotServer.permissions.permissions import PermissionResolver, \
+    APP_SPECIFIC_VARIABLE_HANDLING_PERMISSION_PREFIX
+from variableServer.models import Version, Application
+
+
+class TestPermissionResolver(TestCase):
+
+    fixtures = ['commons_server.yaml']
+
+    def setUp(self):
+        # be sure permission for application is created
+        Application.objects.get(pk=1).save()
+
+        self.user = User.objects.create_user(username='user', password='pwd')
+        self.user.user_permissions.add(Permission.objects.get(codename='can_view_application_app1'))
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_same_resolver_for_request(self):
+        """
+        Django request and rest framework request share the same resolver
+        """
+        resolver = PermissionResolver.for_request(self.request)
+        self.assertIs(resolver, PermissionResolver.for_request(self.request))
+        self.assertIs(resolver, PermissionResolver.for_request(Request(self.request)))
+
+    def test_get_object_fetched_once(self):
+        resolver = PermissionResolver.for_request(self.request)
+        with self.assertNumQueries(1):
+            version = resolver.get_object(Version, 1, 'application')
+            self.assertEqual('app1', version.application.name)
+        with self.assertNumQueries(0):
+            self.assertIs(version, resolver.get_object(Version, '1', 'application'))
+            self.assertIs(version, resolver.get_cached_object(Version, 1))
+
+    def test_get_object_does_not_exist(self):
+        """
+        Missing object is searched once, and error is raised each time
+        """
+        resolver = PermissionResolver.for_request(self.request)
+        with self.assertNumQueries(1):
+            for i in range(2):
+                with self.assertRaises(Version.DoesNotExist):
+                    resolver.get_object(Version, 12345)
+        self.assertIsNone(resolver.get_cached_object(Version, 12345))
+
+    def test_get_allowed_names(self):
+        resolver = PermissionResolver.for_request(self.request)
+        self.assertEqual(['app1'], resolver.get_allowed_names(APP_SPECIFIC_VARIABLE_HANDLING_PERMISSION_PREFIX))
+
+        # result is cached, and a copy is returned
+        resolver.get_allowed_names(APP_SPECIFIC_VARIABLE_HANDLING_PERMISSION_PREFIX).append('app2')
+        self.user.user_permissions.clear()
+        self.assertEqual(['app1'], resolver.get_allowed_names(APP_SPECIFIC_VARIABLE_HANDLING_PERMISSION_PREFIX))
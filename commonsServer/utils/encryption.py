@@ -2,8 +2,12 @@ from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 from django.conf import settings
 import base64
+import functools
 import os
 
+_decrypt_with_cache = None
+_decrypt_cache_size = None
+
 def encrypt_data(plain_text):
     """
     Encrypt the plain text using AES encryption.
@@ -20,12 +24,39 @@ def encrypt_data(plain_text):
 def decrypt_data(encrypted_text):
     """
     Decrypt the encrypted text using AES encryption.
+    Decrypted values are kept in a bounded cache (VARIABLE_DECRYPTION_CACHE_SIZE), as the same values are read again and again
     """
     if not encrypted_text:
         return None
+    return _cached_decrypt()(settings.VARIABLE_SECRET_KEY, encrypted_text)
+
+
+def _cached_decrypt():
+    """
+    Decryption function with its cache. Cache is created on first use, and created again when its size setting changes
+    """
+    global _decrypt_with_cache, _decrypt_cache_size
+    cache_size = settings.VARIABLE_DECRYPTION_CACHE_SIZE
+    if _decrypt_with_cache is None or _decrypt_cache_size != cache_size:
+        _decrypt_with_cache = functools.lru_cache(maxsize=cache_size)(_decrypt)
+        _decrypt_cache_size = cache_size
+    return _decrypt_with_cache
+
+
+@functools.lru_cache(maxsize=8)
+def _algorithm(key):
+    """
+    AES algorithm of the key, reused by all ciphers. It holds no state, so it can be shared between threads
+    """
+    return algorithms.AES(key)
+
+
+def _decrypt(key, encrypted_text):
+    """
+    AES algorithm of the key is reused, only the CFB context, bound to the iv of the value, is created for each value
+    """
     encrypted_text_bytes = base64.urlsafe_b64decode(encrypted_text)
     iv = encrypted_text_bytes[:16]
-    cipher = Cipher(algorithms.AES(settings.VARIABLE_SECRET_KEY), modes.CFB(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
+    decryptor = Cipher(_algorithm(key), modes.CFB(iv)).decryptor()
     decrypted_data = decryptor.update(encrypted_text_bytes[16:]) + decryptor.finalize()
-    return decrypted_data.decode()
\ No newline at end of file
+    return decrypted_data.decode()
@@ -1,15 +1,21 @@
 import hashlib
 import logging
+import time
 
 import rest_framework.authentication
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import exceptions
 
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
 
+from hashed_auth.token_cache import TokenCache
+
 logger = logging.getLogger(__name__)
 
+token_cache = TokenCache(settings.TOKEN_AUTH_CACHE_TIMEOUT)
+
 def crypt_token(key):
     return hashlib.sha256(key.encode('utf-8')).hexdigest()
 
@@ -40,9 +46,24 @@ class TokenAuthentication(rest_framework.authentication.TokenAuthentication):
     """
 
     def authenticate_credentials(self, key):
+        start = time.perf_counter()
+        try:
+            return self._authenticate_credentials(key)
+        finally:
+            token_cache.record_lookup(time.perf_counter() - start)
+
+    def _authenticate_credentials(self, key):
 
         model = self.get_model()
         token_hash = crypt_token(key)
+        
+        # only default token model is cached, as invalidation relies on its signals
+        use_cache = self.model is None
+        if use_cache:
+            cached = token_cache.get(token_hash)
+            if cached is not None:
+                return cached
+            
         try:
             token = model.objects.select_related('user').get(key=token_hash)
         except ObjectDoesNotExist:
@@ -55,6 +76,8 @@ class TokenAuthentication(rest_framework.authentication.TokenAuthentication):
         if not token.user.is_active:
             raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
 
+        if use_cache:
+            token_cache.set(token_hash, token.user, token)
         return (token.user, token)
 
 
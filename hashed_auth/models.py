@@ -2,10 +2,14 @@ import hashlib
 import secrets
 
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
 from django.db import models
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
-from hashed_auth.authentication import crypt_token
+from hashed_auth.authentication import crypt_token, token_cache
 
 
 class Token(models.Model):
@@ -70,4 +74,46 @@ class TokenProxy(Token):
         proxy = 'hashed_auth.apps.AuthTokenConfig' in settings.INSTALLED_APPS
         abstract = 'hashed_auth.apps.AuthTokenConfig' not in settings.INSTALLED_APPS
         verbose_name = _("Token")
-        verbose_name_plural = _("Tokens")
\ No newline at end of file
+        verbose_name_plural = _("Tokens")
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=TokenProxy)     # tokens created / changed from admin
+@receiver(post_delete, sender=TokenProxy)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_token_cache_for_user(sender, instance, **kwargs):
+    """
+    Authenticated user is cached with its token (see TokenCache). Remove it when token or user changes
+    """
+    token_cache.invalidate_user(instance.user_id if isinstance(instance, Token) else instance.pk)
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+def invalidate_token_cache_for_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Cached users come with their permissions. Remove them when their permissions or groups change
+    """
+    if not action.startswith('post_'):
+        return
+    
+    if not reverse:
+        token_cache.invalidate_user(instance.pk)
+    elif pk_set is not None:
+        # group / permission side: pk_set contains user ids
+        for user_id in pk_set:
+            token_cache.invalidate_user(user_id)
+    else:
+        # users removed from a group / permission (clear), we do not know which ones
+        token_cache.clear()
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_token_cache(sender, **kwargs):
+    """
+    Group permission changes may concern any user
+    """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        token_cache.clear()
@@ -1,6 +1,9 @@
 
+import time
+from unittest.mock import patch
+
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group, Permission
 from django.http import HttpResponse
 from django.urls import include, path
 
@@ -11,9 +14,10 @@ from rest_framework import HTTP_HEADER_ENCODING, exceptions, permissions, render
 
 from django.test import TestCase, override_settings
 
-from hashed_auth.authentication import TokenAuthentication
-from hashed_auth.models import Token
-from hashed_auth.views import obtain_auth_token
+from hashed_auth.authentication import TokenAuthentication, token_cache, crypt_token
+from hashed_auth.models import Token, TokenProxy
+from hashed_auth.token_cache import TokenCache
+from hashed_auth.views import obtain_auth_token, TokenCacheStatistics
 
 
 class MockView(APIView):
@@ -37,6 +41,7 @@ urlpatterns = [
     ),
 
     path('auth-token/', obtain_auth_token),
+    path('auth-token/cache/', TokenCacheStatistics.as_view()),
     path('auth/', include('rest_framework.urls', namespace='rest_framework')),
 ]
 
@@ -62,6 +67,12 @@ class TokenAuthTests(TestCase):
 
         self.token = self.model.objects.create(user=self.user)
         self.key = self.token.raw_key
+        token_cache.clear()
+
+        # cache is disabled by default (TOKEN_AUTH_CACHE_TIMEOUT)
+        patcher = patch.object(token_cache, 'timeout', 60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_post_form_passing_token_auth(self):
         """
@@ -270,3 +281,142 @@ class TokenAuthTests(TestCase):
         )
         assert response.status_code == status.HTTP_200_OK
         assert response.data['token'] != self.key
+
+    def _post_with_token(self, key=None):
+        return self.csrf_client.post(
+            self.path, {'example': 'example'},
+            format='json', HTTP_AUTHORIZATION=self.header_prefix + (key or self.key)
+        ).status_code
+
+    def test_token_authentication_cached(self):
+        """
+        Once user and its permissions are in cache, authentication does not query database
+        """
+        stats = token_cache.stats()
+        self._post_with_token()
+        self._post_with_token()
+        with self.assertNumQueries(0):
+            assert self._post_with_token() == status.HTTP_200_OK
+        assert token_cache.stats()['hits'] - stats['hits'] == 2
+        assert token_cache.stats()['misses'] - stats['misses'] == 1
+        assert token_cache.stats()['lookups'] - stats['lookups'] == 3
+
+    def test_token_cache_invalidated_on_token_update(self):
+        self._post_with_token()
+        self.token.update_key()
+        self.token.save()
+        assert self._post_with_token() == status.HTTP_401_UNAUTHORIZED
+        assert self._post_with_token(self.token.raw_key) == status.HTTP_200_OK
+
+    def test_token_cache_invalidated_on_token_delete(self):
+        self._post_with_token()
+        self.token.delete()
+        assert self._post_with_token() == status.HTTP_401_UNAUTHORIZED
+
+    def test_token_cache_invalidated_on_token_proxy_update(self):
+        """
+        Admin saves tokens through TokenProxy
+        """
+        self._post_with_token()
+        token = TokenProxy.objects.get(user=self.user)
+        token.update_key()
+        token.save()
+        assert self._post_with_token() == status.HTTP_401_UNAUTHORIZED
+        assert self._post_with_token(token.raw_key) == status.HTTP_200_OK
+
+    def test_token_cache_invalidated_on_token_proxy_delete(self):
+        self._post_with_token()
+        TokenProxy.objects.get(user=self.user).delete()
+        assert self._post_with_token() == status.HTTP_401_UNAUTHORIZED
+
+    def test_token_cache_invalidated_on_user_update(self):
+        self._post_with_token()
+        self.user.is_active = False
+        self.user.save()
+        assert self._post_with_token() == status.HTTP_401_UNAUTHORIZED
+
+    def test_token_cache_invalidated_on_user_permission_change(self):
+        self._post_with_token()
+        self._post_with_token()
+        self.user.user_permissions.add(Permission.objects.get(codename='view_token'))
+        assert token_cache.get(crypt_token(self.key)) is None
+
+    def test_token_cache_invalidated_on_group_change(self):
+        group = Group.objects.create(name='group')
+        self._post_with_token()
+        group.user_set.add(self.user)
+        assert token_cache.get(crypt_token(self.key)) is None
+
+        self._post_with_token()
+        group.permissions.add(Permission.objects.get(codename='view_token'))
+        assert token_cache.get(crypt_token(self.key)) is None
+
+        self._post_with_token()
+        user, token = token_cache.get(crypt_token(self.key))
+        assert user.has_perm('hashed_auth.view_token')
+
+    def test_token_cache_statistics(self):
+        stats = token_cache.stats()
+        self._post_with_token()
+        self.user.is_staff = True
+        self.user.save()
+        response = self.csrf_client.get('/auth-token/cache/', HTTP_AUTHORIZATION=self.header_prefix + self.key)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['misses'] - stats['misses'] == 2
+        assert response.data['lookups'] - stats['lookups'] == 2
+        assert 'hitRate' in response.data
+        assert 'averageLookupTime' in response.data
+
+    def test_token_cache_statistics_forbidden(self):
+        response = self.csrf_client.get('/auth-token/cache/', HTTP_AUTHORIZATION=self.header_prefix + self.key)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('john', 'lennon@thebeatles.com', 'password')
+        self.user2 = User.objects.create_user('paul', 'mccartney@thebeatles.com', 'password')
+
+    def test_entry_expires(self):
+        cache = TokenCache(0.05)
+        cache.set('hash', self.user, None)
+        assert cache.get('hash')[0].username == 'john'
+        time.sleep(0.1)
+        assert cache.get('hash') is None
+        assert cache.stats()['evictions'] == 1
+
+    def test_cache_disabled(self):
+        cache = TokenCache(0)
+        cache.set('hash', self.user, None)
+        assert cache.get('hash') is None
+        assert cache.stats()['entries'] == 0
+
+    def test_user_is_copied(self):
+        """
+        Each request gets its own user object, with permissions already computed
+        """
+        cache = TokenCache(60)
+        cache.set('hash', self.user, None)
+        user1 = cache.get('hash')[0]
+        with self.assertNumQueries(0):
+            user2 = cache.get('hash')[0]
+            user2.get_all_permissions()
+        assert user1 is not user2
+        assert user1.pk == user2.pk
+
+    def test_max_entries(self):
+        cache = TokenCache(60, max_entries=1)
+        cache.set('hash', self.user, None)
+        cache.set('hash2', self.user2, None)
+        assert cache.get('hash') is None
+        assert cache.get('hash2')[0].username == 'paul'
+        assert cache.stats()['evictions'] == 1
+
+    def test_invalidate_user(self):
+        cache = TokenCache(60)
+        cache.set('hash', self.user, None)
+        cache.set('hash2', self.user2, None)
+        cache.invalidate_user(self.user.pk)
+        assert cache.get('hash') is None
+        assert cache.get('hash2') is not None
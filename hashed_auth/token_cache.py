@@ -0,0 +1,135 @@
+import copy
+import threading
+import time
+
+class TokenCache:
+    """
+    Cache of authenticated users, keyed by token hash, so that API clients sending many requests with the same token
+    do not require a database query (and a permission computation) for each request
+
+    Users are stored with their permission set (see ModelBackend.get_all_permissions), computed once, and each request
+    gets its own copy of the user
+    Entries expire after 'timeout' seconds. They are also invalidated when token, user or permissions change (see signals in models.py),
+    but only in the current process, so 'timeout' is the maximum delay for other processes to see a change
+    """
+
+    def __init__(self, timeout, max_entries=10000):
+        """
+        @param timeout: number of seconds an entry is valid. 0 disables the cache
+        @param max_entries: maximum number of tokens in cache. When reached, expired entries are removed, then the oldest ones
+        """
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookups = 0
+        self.lookup_time = 0.0
+        self.max_lookup_time = 0.0
+        self._entries = {}
+        self._user_tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, token_hash):
+        """
+        Returns (user, token) for this token hash, or None if it's not in cache or expired
+        """
+        if not self.timeout:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(token_hash)
+                    self.evictions += 1
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            expiry, user, token = entry
+
+        # permissions are usually computed by the request that stored the user. If it did not need them, do it now
+        if not hasattr(user, '_perm_cache'):
+            user.get_all_permissions()
+
+        return copy.copy(user), token
+
+    def set(self, token_hash, user, token):
+        """
+        Store the user authenticated by this token hash. The same user object is used by the current request, so that
+        permissions it computes are kept
+        """
+        if not self.timeout:
+            return
+
+        with self._lock:
+            if token_hash in self._entries:
+                self._remove(token_hash)
+            elif len(self._entries) >= self.max_entries:
+                self._make_room()
+
+            self._entries[token_hash] = (time.monotonic() + self.timeout, user, token)
+            self._user_tokens.setdefault(user.pk, set()).add(token_hash)
+
+    def invalidate_user(self, user_id):
+        """
+        Remove tokens of this user from cache (e.g: when user, its token or its permissions change)
+        """
+        with self._lock:
+            for token_hash in list(self._user_tokens.get(user_id, [])):
+                self._remove(token_hash)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_tokens.clear()
+
+    def record_lookup(self, duration):
+        """
+        Record the time spent to authenticate a token (from cache or from database)
+        @param duration: duration in seconds
+        """
+        with self._lock:
+            self.lookups += 1
+            self.lookup_time += duration
+            self.max_lookup_time = max(self.max_lookup_time, duration)
+
+    def stats(self):
+        """
+        @return: a dict with cache usage counters. Lookup times are in milliseconds
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'timeout': self.timeout,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / total if total else 0.0,
+                'lookups': self.lookups,
+                'averageLookupTime': self.lookup_time * 1000 / self.lookups if self.lookups else 0.0,
+                'maxLookupTime': self.max_lookup_time * 1000
+            }
+
+    def _make_room(self):
+        now = time.monotonic()
+        for token_hash in [token_hash for token_hash, entry in self._entries.items() if entry[0] < now]:
+            self._remove(token_hash)
+            self.evictions += 1
+
+        # entries are in insertion order
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, token_hash):
+        expiry, user, token = self._entries.pop(token_hash)
+        user_tokens = self._user_tokens.get(user.pk)
+        if user_tokens is not None:
+            user_tokens.discard(token_hash)
+            if not user_tokens:
+                del self._user_tokens[user.pk]
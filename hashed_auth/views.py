@@ -1,10 +1,11 @@
-from rest_framework import parsers, renderers
+from rest_framework import parsers, renderers, permissions
 from rest_framework.compat import coreapi, coreschema
 from rest_framework.response import Response
 from rest_framework.schemas import ManualSchema
 from rest_framework.schemas import coreapi as coreapi_schema
 from rest_framework.views import APIView
 
+from hashed_auth.authentication import token_cache
 from hashed_auth.models import Token
 from hashed_auth.serializers import AuthTokenSerializer
 
@@ -75,4 +76,15 @@ class ObtainAuthToken(APIView):
             return Response({'message': 'invalid user'})
 
 
+class TokenCacheStatistics(APIView):
+    """
+    Usage of the token authentication cache of the process serving the request (hit rate, lookup times in milliseconds), for monitoring
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (renderers.JSONRenderer,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(token_cache.stats())
+
+
 obtain_auth_token = ObtainAuthToken.as_view()
\ No newline at end of file
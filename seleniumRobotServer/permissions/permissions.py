@@ -11,6 +11,66 @@ ENV_SPECIFIC_RESULT_VIEW_PERMISSION_PREFIX = 'variableServer.' + TestEnvironment
 class BYPASS_APPLICATION_CHECK:
     name = '_BYPASS_APPLICATION_CHECK_'
 
+class PermissionResolver:
+    """
+    Request scoped cache of what permission checking needs, so that it's computed only once per request
+    - objects on which permission is checked, fetched with their application / environment (select_related). The view can reuse them
+    - names of the applications / environments user has permission on
+    """
+    
+    def __init__(self, request):
+        self.request = request
+        self._objects = {}
+        self._allowed = {}
+        
+    @classmethod
+    def for_request(cls, request):
+        """
+        Returns the resolver of the request, created on first call
+        @param request: django HttpRequest or rest framework Request (resolver is shared between both)
+        """
+        http_request = getattr(request, '_request', request)
+        resolver = getattr(http_request, '_permission_resolver', None)
+        if resolver is None:
+            resolver = cls(http_request)
+            http_request._permission_resolver = resolver
+        return resolver
+    
+    def get_object(self, model, pk, *related):
+        """
+        Returns the object of 'model' with this primary key. It's fetched only on first call
+        @param related: relations to fetch with the object, see QuerySet.select_related
+        @raise model.DoesNotExist: if object does not exist
+        """
+        key = (model, str(pk))
+        if key not in self._objects:
+            try:
+                self._objects[key] = model.objects.select_related(*related).get(pk=pk)
+            except (model.DoesNotExist, ValueError) as e:
+                self._objects[key] = e
+                
+        obj = self._objects[key]
+        if isinstance(obj, Exception):
+            raise obj
+        return obj
+    
+    def get_cached_object(self, model, pk):
+        """
+        Returns the object if it has already been fetched during this request, else None
+        """
+        obj = self._objects.get((model, str(pk)))
+        return None if isinstance(obj, Exception) else obj
+    
+    def get_allowed_names(self, prefix):
+        """
+        Returns the names of the applications / environments for which user has the permission starting with 'prefix'
+        """
+        user = self.request.user
+        key = (prefix, user.pk)
+        if key not in self._allowed:
+            self._allowed[key] = [p.removeprefix(prefix) for p in user.get_all_permissions() if prefix in p]
+        return list(self._allowed[key])
+
 class GenericPermissions(DjangoModelPermissions):
     """
     Default permission that will be applied to any API
@@ -32,6 +92,13 @@ class ContextSpecificPermissions(GenericPermissions):
     env_prefix = ENV_SPECIFIC_VARIABLE_HANDLING_PERMISSION_PREFIX
     bypass_application_check = 'BYPASS_APPLICATION_CHECK'
     
+    def get_object_for_permission(self, request, model, pk, *related):
+        """
+        Returns the object on which permission is checked, fetched only once per request, with the 'related' relations selected
+        so that its application / environment are read without further query (see PermissionResolver)
+        """
+        return PermissionResolver.for_request(request).get_object(model, pk, *related)
+    
     def _has_model_permission(self, request, view):
         """
         Returns True if user has the required permission on the model
@@ -51,7 +118,7 @@ class ContextSpecificPermissions(GenericPermissions):
             if request.POST.get('application', ''):
                 return Application.objects.get(id=request.data['application'])
             elif view.kwargs.get('pk', ''): # GET, needed so that we can refuse access if object is unknown
-                return self.get_object_application(view.queryset.model.objects.get(pk=view.kwargs['pk']))
+                return self.get_object_application(self.get_object_for_permission(request, view.queryset.model, view.kwargs['pk']))
             else:
                 return ''
         except Exception:
@@ -67,7 +134,7 @@ class ContextSpecificPermissions(GenericPermissions):
             if request.POST.get('environment', ''):
                 return TestEnvironment.objects.get(id=request.data['environment'])
             elif view.kwargs.get('pk', ''): # GET, needed so that we can refuse access if object is unknown
-                return self.get_object_environment(view.queryset.model.objects.get(pk=view.kwargs['pk']))
+                return self.get_object_environment(self.get_object_for_permission(request, view.queryset.model, view.kwargs['pk']))
             else:
                 return ''
         except Exception:
@@ -88,8 +155,9 @@ class ContextSpecificPermissions(GenericPermissions):
         except Exception:
             # if we cannot check the application, stop
             return has_model_permission
-        allowed_applications = ContextPermissionChecker.get_allowed_applications(request, self.app_prefix)
-        allowed_environments = ContextPermissionChecker.get_allowed_environments(request, self.env_prefix)
+        resolver = PermissionResolver.for_request(request)
+        allowed_applications = resolver.get_allowed_names(self.app_prefix)
+        allowed_environments = resolver.get_allowed_names(self.env_prefix)
 
         return ((application and application.name in allowed_applications)
                 or (environment and environment.name in allowed_environments)
@@ -190,12 +258,12 @@ class ContextPermissionChecker:
         """
         Returns the list of applications a user has rights on
         """
-        return [p.removeprefix(prefix) for p in request.user.get_all_permissions() if prefix in p]
+        return PermissionResolver.for_request(request).get_allowed_names(prefix)
 
     @staticmethod
     def get_allowed_environments(request, prefix=ENV_SPECIFIC_VARIABLE_HANDLING_PERMISSION_PREFIX):
         """
         Returns the list of environments a user has rights on
         """
-        return [p.removeprefix(prefix) for p in request.user.get_all_permissions() if prefix in p]
+        return PermissionResolver.for_request(request).get_allowed_names(prefix)
    
\ No newline at end of file
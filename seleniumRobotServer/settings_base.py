@@ -200,4 +200,46 @@ LOGIN_REDIRECT_URL_FAILURE = "/accounts/login/?next=/snapshot/home/"
 # if the pixel intensity difference between the reference and the image to compare is under this threshold, ignore the difference
 IMAGE_COMPARISON_THRESHOLD = 10
 
+# Snapshot comparisons are stored as jobs in database and processed by diff workers
+# if True, a diff worker thread is started inside each web server process. Set it to False when workers are started with 'python manage.py diff_workers --processes <N>'
+DIFF_WORKER_EMBEDDED = True
+# number of seconds a worker owns a job. After this delay, if job is not finished (worker killed), an other worker may claim it
+DIFF_JOB_LEASE_DURATION = 300
+# number of times a job may be claimed before giving up
+DIFF_JOB_MAX_ATTEMPTS = 3
+# when there is no job, workers poll the database less and less often, up to this delay (in seconds). The embedded worker is woken up as soon as its own process adds a job
+DIFF_WORKER_MAX_IDLE_WAIT = 10
+# memory (in bytes) that each diff worker may use to keep decoded reference pictures, so that a reference compared to many snapshots is decoded only once
+REFERENCE_IMAGE_CACHE_MAX_MEMORY = 256 * 1024 * 1024
+# maximum number of comparisons computed at the same time on request threads (compare-only uploads, recomputation from GUI), in each web server process. None means no limit
+# over this limit, clients get a '429 Too Many Requests' response and should retry after DIFF_SYNC_RETRY_AFTER seconds
+DIFF_SYNC_COMPUTATION_MAX = 4
+DIFF_SYNC_RETRY_AFTER = 2
+
+# number of seconds a user authenticated by an API token is kept in cache (with its permissions), so that clients sending many requests
+# do not need a database query for each one. 0 disables the cache
+# Changes on tokens, users and permissions only invalidate the cache of the current process: other processes still authenticate a revoked token,
+# or a deactivated user, until this delay is over. Only enable it when server runs in a single process, or when this delay is acceptable
+TOKEN_AUTH_CACHE_TIMEOUT = 0
+
+# number of seconds the variables applying to a (version, environment, test) are kept in cache (Django cache), so that tests starting at the same time
+# do not all resolve them. Changes on variables, applications, versions, tests and environments invalidate the cache. 0 disables the cache
+# Invalidation goes through the Django cache: only enable it with a cache backend shared by all processes (e.g: 'RedisCache', 'PyMemcacheCache' in CACHES).
+# With the default per process cache ('LocMemCache'), other processes would return the previous variables until this delay is over
+VARIABLE_CACHE_TIMEOUT = 0
+# number of seconds between 2 runs of the scheduler job which releases variables whose reservation is over, and deletes variables whose time to live is over
+# variable requests already ignore them, so this delay only affects the database content (and what is displayed in admin)
+VARIABLE_EXPIRY_INTERVAL = 60
+# clients may wait for reservable variables to be released ('wait=<seconds>' parameter) instead of getting a '423 Locked' response
+# maximum number of seconds a request may wait, and maximum number of waiting requests in each web server process. Over this limit, requests do not wait
+# Each waiting request holds a thread of the web server process. Keep VARIABLE_RESERVATION_MAX_WAITERS well below the number of threads of a process
+# (e.g: 'threads' option of mod_wsgi 'WSGIDaemonProcess', 15 by default) as waiting requests are only woken up by the requests releasing variables
+# (PATCH with releaseDate=''), which need a free thread
+VARIABLE_RESERVATION_MAX_WAIT = 300
+VARIABLE_RESERVATION_MAX_WAITERS = 5
+# releases done in an other web server process are not notified, waiting requests check at least every N seconds
+VARIABLE_RESERVATION_POLL_INTERVAL = 5
+# number of decrypted values of protected variables kept in memory by each process, so that values read again are not decrypted again
+VARIABLE_DECRYPTION_CACHE_SIZE = 10000
+
 # More settings can be found can be found in preferences.py
\ No newline at end of file
@@ -8,7 +8,7 @@ from django.urls.conf import path, re_path
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 
-from hashed_auth.views import ObtainAuthToken
+from hashed_auth.views import ObtainAuthToken, TokenCacheStatistics
 
 # in case openid is configured for login, change login page
 views.LoginView.site_header = 'Selenium Server administration'
@@ -20,6 +20,7 @@ else:
 
 urlpatterns = [
     
+    path('api-token-auth/cache/', TokenCacheStatistics.as_view()),
     re_path(r'^api-token-auth/', ObtainAuthToken.as_view()),
     path('admin/login/', views.LoginView.as_view()),
     path('admin/', admin.site.urls),
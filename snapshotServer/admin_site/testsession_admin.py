@@ -46,7 +46,7 @@ class TestSessionAdmin(BaseServerModelAdmin):
         Filter the returned variables with the application user is allowed to see
         view_testenvironment won't allow to view all test sessions
         """
-        return super().get_queryset(request, '')
+        return super().get_queryset(request, '').select_related('summary')
 
 
     def get_deleted_objects(self, test_sessions, request):
@@ -1,108 +1,239 @@
-
 import threading
 import time
+import os
+import socket
+import datetime
 
 from snapshotServer.controllers import tools
-from django.db.models import Q
-from django.db import close_old_connections
+from django.conf import settings
+from django.db.models import Q, F
+from django.db.models.functions import Least
+from django.db import close_old_connections, OperationalError
+from django.utils import timezone
+from snapshotServer.controllers.diff_mask import DiffMask
 from snapshotServer.controllers.picture_comparator import PictureComparator
+from snapshotServer.controllers.reference_image_cache import ReferenceImageCache
+from snapshotServer.exceptions.diff_computer_busy_error import DiffComputerBusyError
 from snapshotServer.exceptions.picture_comparator_error import PictureComparatorError
-from snapshotServer.models import ExcludeZone
-import io
+from snapshotServer.models import ExcludeZone, DiffJob, Snapshot
 import logging
-import cv2
 
 logger = logging.getLogger(__name__)
 
 class DiffComputer(threading.Thread):
     """
     Class for processing differences asynchronously
+    Jobs are stored in database (DiffJob table) and are processed by diff workers:
+    - the thread started by 'get_instance()', inside the web server process, if DIFF_WORKER_EMBEDDED setting is True
+    - the processes started by 'manage.py diff_workers --processes N', on any host sharing the same database
+    Jobs are processed by priority (see DiffJob.PRIORITIES)
+    
+    Comparisons may also be computed synchronously (compute_now), on the request thread. Their number is limited by DIFF_SYNC_COMPUTATION_MAX setting
     """
     
     _instance = None
-    _jobLock = threading.Lock()
     _instanceLock = threading.Lock()
-    picture_comparator = PictureComparator()
+    _sync_computations = 0
+    _sync_computations_lock = threading.Lock()
+    _job_added = threading.Event()
+    IDLE_WAIT = 0.5
+    picture_comparator = PictureComparator(reference_cache=ReferenceImageCache(settings.REFERENCE_IMAGE_CACHE_MAX_MEMORY))
     
     @classmethod
     def get_instance(cls):
         with cls._instanceLock:
             if not cls._instance:
                 cls._instance = DiffComputer()
-                cls._instance.start()
                 
-                if not cls._instance.running:
-                    time.sleep(0.1)
+                if settings.DIFF_WORKER_EMBEDDED:
+
+                    # in unit tests, database is not shared between threads
+                    if not tools.is_test_mode():
+                        cls._instance.requeue_uncomputed_snapshots()
+                    cls._instance.start()
+
+                    if not cls._instance.running:
+                        time.sleep(0.1)
                 
             return cls._instance
 
-    def add_jobs(self, ref_snapshot, step_snapshot, check_test_mode=True):
+    def add_jobs(self, ref_snapshot, step_snapshot, check_test_mode=True, priority=DiffJob.PRIORITY_NORMAL):
         """
         Add a job to handle
         @param ref_snapshot: reference snapshot
         @param step_snapshot: snapshot to compare with reference
         @param check_test_mode: default is True. If True and we are in unit tests, computation is not done through thread
+        @param priority: lane of the job. Jobs with the lowest value are computed first
         """
         # as we will (re)compute, consider that current diff are not valid anymore
         step_snapshot.computed = False
         step_snapshot.save()
         
+        # computed here, but this is background work, not subject to the synchronous computing limit
         if tools.is_test_mode() and check_test_mode:
-            self.compute_now(ref_snapshot, step_snapshot)
+            self._compute_diff(ref_snapshot, step_snapshot)
    
         else:
-            with DiffComputer._jobLock:
-                self.jobs.append((ref_snapshot, step_snapshot))
+            self._enqueue(ref_snapshot, step_snapshot, priority)
+
+    def _enqueue(self, ref_snapshot, step_snapshot, priority=DiffJob.PRIORITY_NORMAL):
+        """
+        Store the job in database
+        If a job, not already claimed by a worker, exists for this snapshot, it's reused so that the same snapshot is not computed twice. It keeps the highest priority
+        """
+        pending_jobs = DiffJob.objects.filter(stepSnapshot=step_snapshot, claimedBy=None)
+        if not pending_jobs.update(refSnapshot=ref_snapshot, priority=Least(F('priority'), priority)):
+            DiffJob(refSnapshot=ref_snapshot, stepSnapshot=step_snapshot, priority=priority).save()
+
+        # wake up the worker of this process, if it's waiting for jobs
+        DiffComputer._job_added.set()
 
-    def compute_now(self, ref_snapshot, step_snapshot, save_snapshot=True, additional_exclude_zones=[]):
+    def compute_now(self, ref_snapshot, step_snapshot, save_snapshot=True, additional_exclude_zones=[], step_picture=None):
         """
         Compute difference now
         @param ref_snapshot: the reference snapshot
         @param step_snapshot: the snapshot to compare to step_snapshot
         @param save_snapshot: (default True). When computing, snapshot is saved into database. By setting it to False, we prevent this
         @param additional_exclude_zones: more exclude zones to use when comparing. Allow to use exclude zones without storing them into database
+        @param step_picture: the step picture, already decoded (see picture_comparator.decode_picture), used instead of the step snapshot image file
+        @raise DiffComputerBusyError: when too many comparisons are already computed synchronously. Nothing is computed
         """
-        self._compute_diff(ref_snapshot, step_snapshot, save_snapshot, additional_exclude_zones)
+        self._acquire_sync_slot()
+        try:
+            self._compute_diff(ref_snapshot, step_snapshot, save_snapshot, additional_exclude_zones, step_picture)
+        finally:
+            self._release_sync_slot()
         
+        # a job waiting for this snapshot is now useless
+        if save_snapshot and step_snapshot and step_snapshot.id:
+            DiffJob.objects.filter(stepSnapshot=step_snapshot, refSnapshot=ref_snapshot, claimedBy=None).delete()
+
+    @classmethod
+    def _acquire_sync_slot(cls):
+        """
+        Reserve a slot for a synchronous computation
+        It fails immediately when limit is reached, so that client is told to come back later instead of waiting, holding a server thread
+        """
+        with cls._sync_computations_lock:
+            if settings.DIFF_SYNC_COMPUTATION_MAX is not None and cls._sync_computations >= settings.DIFF_SYNC_COMPUTATION_MAX:
+                raise DiffComputerBusyError("Too many comparisons in progress (%d)" % cls._sync_computations, settings.DIFF_SYNC_RETRY_AFTER)
+            cls._sync_computations += 1
+        
+    @classmethod
+    def _release_sync_slot(cls):
+        with cls._sync_computations_lock:
+            cls._sync_computations -= 1
+
+    def requeue_uncomputed_snapshots(self):
+        """
+        Create jobs for snapshots which are not computed and for which no job exists
+        This happens when server has been stopped before jobs were stored in database
+        """
+        try:
+            uncomputed_snapshots = Snapshot.objects.filter(computed=False, refSnapshot__isnull=False, diffJobs=None)
+            DiffJob.objects.bulk_create([DiffJob(refSnapshot_id=snapshot.refSnapshot_id, stepSnapshot=snapshot) for snapshot in uncomputed_snapshots])
+        except Exception as e:
+            logger.exception('Error requeuing uncomputed snapshots: %s', str(e))
+
     @classmethod
     def stopThread(cls):
         with cls._instanceLock:
             if cls._instance:
                 cls._instance.running = False
-                cls._instance.join()
+                cls._job_added.set()
+                if cls._instance.is_alive():
+                    cls._instance.join()
             cls._instance = None
     
     def __init__(self):
-        self.jobs = []
         self.running = False
-        super(DiffComputer, self).__init__()
+        self.worker_name = "%s-%d-%d" % (socket.gethostname(), os.getpid(), id(self))
+        super(DiffComputer, self).__init__(daemon=True)
     
     def run(self):
-        logger.info('starting compute thread')
+        logger.info('starting compute thread %s', self.worker_name)
         self.running = True
         
+        idle_wait = DiffComputer.IDLE_WAIT
+        
         # be sure we can restart a new thread if something goes wrong
         try:
-            while self.running or self.jobs:
-                with DiffComputer._jobLock:
-                    tmp_jobs = self.jobs[:]
-                    self.jobs = []
-
-                if tmp_jobs:
-                    close_old_connections()
-                for ref_snapshot, step_snapshot in tmp_jobs:
-                    try:
-                        self._compute_diff(ref_snapshot, step_snapshot)
-                    except Exception as e:
-                        logger.exception('Error computing snapshot: %s', str(e))
-                time.sleep(0.5)
+            while self.running:
+                DiffComputer._job_added.clear()
+                try:
+                    processed = self.process_next_job()
+                except Exception as e:
+                    logger.exception('Error computing snapshot: %s', str(e))
+                    processed = False
+
+                if processed:
+                    idle_wait = DiffComputer.IDLE_WAIT
+                    
+                # nothing to do: query the database less and less often (it may be locked by polling workers, with SQLite), 
+                # unless a job is added by this process. Jobs added by other processes are seen after DIFF_WORKER_MAX_IDLE_WAIT seconds at most
+                elif DiffComputer._job_added.wait(idle_wait):
+                    idle_wait = DiffComputer.IDLE_WAIT
+                else:
+                    idle_wait = min(idle_wait * 2, settings.DIFF_WORKER_MAX_IDLE_WAIT)
         
         except Exception as e:
             logger.exception('Exception during computing: %s', str(e))
         
-        DiffComputer._instance = None
+        if DiffComputer._instance is self:
+            DiffComputer._instance = None
+
+    def _claim_job(self):
+        """
+        Claim the available job (never claimed or which lease has expired) with the highest priority, the oldest first
+        Claiming is done with a conditional update so that, when several workers try to claim the same job, only one wins
+        @return: the claimed job or None if there is nothing to do
+        """
+        now = timezone.now()
+        available = Q(leaseExpiration__isnull=True) | Q(leaseExpiration__lt=now)
+
+        for job_id in DiffJob.objects.filter(available).order_by('priority', 'id').values_list('id', flat=True)[:10]:
+            claimed = DiffJob.objects.filter(available, pk=job_id).update(claimedBy=self.worker_name,
+                                                                          leaseExpiration=now + datetime.timedelta(seconds=settings.DIFF_JOB_LEASE_DURATION),
+                                                                          attempts=F('attempts') + 1)
+            if claimed:
+                try:
+                    return DiffJob.objects.select_related('refSnapshot', 'stepSnapshot').get(pk=job_id, claimedBy=self.worker_name)
+                except DiffJob.DoesNotExist:
+                    continue
+
+        return None
+
+    def process_next_job(self):
+        """
+        Claim a job and compute it
+        @return: True if a job has been processed
+        """
+        close_old_connections()
+        try:
+            job = self._claim_job()
+        except OperationalError as e:
+            
+            # DiffJob table is locked by an other writer (SQLite), job will be claimed later
+            logger.info('Cannot claim job: %s', str(e))
+            return False
+        if not job:
+            return False
 
-    def _compute_diff(self, ref_snapshot, step_snapshot, save_snapshot=True, additional_exclude_zones=[]): 
+        try:
+            # job failed too many times (worker killed while computing, for example): give up
+            if job.attempts > settings.DIFF_JOB_MAX_ATTEMPTS:
+                step_snapshot = job.stepSnapshot
+                step_snapshot.computed = True
+                step_snapshot.computingError = "Computing aborted after %d attempts" % settings.DIFF_JOB_MAX_ATTEMPTS
+                step_snapshot.save()
+            else:
+                self._compute_diff(job.refSnapshot, job.stepSnapshot)
+        finally:
+            DiffJob.objects.filter(pk=job.pk, claimedBy=self.worker_name).delete()
+
+        return True
+
+    def _compute_diff(self, ref_snapshot, step_snapshot, save_snapshot=True, additional_exclude_zones=[], step_picture=None): 
         """
         Compare all pixels from reference snapshto and step snapshot, and store difference to database
         
@@ -110,27 +241,47 @@ class DiffComputer(threading.Thread):
         @param step_snapshot: snapshot for the current step. We compare it to the reference
         @param save_snapshot: (default True) saved the step_snapshot object / update it's computed state. Will be False for temporary computing
         @param additional_exclude_zones: more exclude zones to use when comparing. Allow to use exclude zones without storing them into database
+        @param step_picture: decoded step picture, to compare a picture which is not stored on disk
         """
         
         logger.info('computing') 
         start = time.perf_counter()
         try:
-            if ref_snapshot and step_snapshot and ref_snapshot.image and step_snapshot.image:
+            if ref_snapshot and step_snapshot and step_snapshot.hasSameContentAs(ref_snapshot):
                 
-                # get the list of exclude zones
-                exclude_zones = [e.toRectangle() for e in ExcludeZone.objects.filter(Q(snapshot=ref_snapshot) | Q(snapshot=step_snapshot))]
+                # pictures are identical (hashes computed at upload), no need to compare them
+                step_snapshot.pixelsDiff = None
+                step_snapshot.diffPixelCount = 0
+                step_snapshot.diffPercentage = 0.0
+                step_snapshot.diffBoxes = []
+                step_snapshot.tooManyDiffs = False
+                
+            elif ref_snapshot and step_snapshot and ref_snapshot.image and (step_picture is not None or step_snapshot.image):
+                
+                # get the list of exclude zones. Snapshots which are not saved (temporary computing) cannot have any
+                saved_snapshots = [snapshot for snapshot in (ref_snapshot, step_snapshot) if snapshot.pk is not None]
+                exclude_zones = [e.toRectangle() for e in ExcludeZone.objects.filter(snapshot__in=saved_snapshots)] if saved_snapshots else []
                 exclude_zones += [e.toRectangle() for e in additional_exclude_zones]
                 
-                pixel_diffs, diff_percentage, diff_image = DiffComputer.picture_comparator.get_changed_pixels(ref_snapshot.image.path, step_snapshot.image.path, exclude_zones)
+                pixel_diffs, diff_percentage, diff_image = DiffComputer.picture_comparator.get_changed_pixels(ref_snapshot.image.path, 
+                                                                                                              step_picture if step_picture is not None else step_snapshot.image.path, 
+                                                                                                              exclude_zones)
                 
-                # store diff picture mask into database instead of pixels, to reduce size of stored object
-#                 step_snapshot.pixelsDiff = self.mark_diff(step_snapshot.image.width, step_snapshot.image.height, pixel_diffs)
-                step_snapshot.pixelsDiff = self.mark_diff(diff_image)
+                # store a compact mask of differences into database, with its statistics so that readers do not need to decode it
+                # red picture displayed to user is rendered from this mask, only when needed
+                diff_mask = DiffMask.from_diff_image(diff_image)
+                step_snapshot.pixelsDiff = self.mark_diff(diff_mask)
+                step_snapshot.diffPixelCount = diff_mask.pixel_count()
+                step_snapshot.diffPercentage = diff_percentage
+                step_snapshot.diffBoxes = diff_mask.bounding_boxes()
                 
                 # too many pixel differences if we go over tolerance
                 step_snapshot.tooManyDiffs = step_snapshot.diffTolerance < diff_percentage
             else:
                 step_snapshot.pixelsDiff = None
+                step_snapshot.diffPixelCount = None
+                step_snapshot.diffPercentage = None
+                step_snapshot.diffBoxes = None
                 step_snapshot.tooManyDiffs = False
                 
             step_snapshot.refSnapshot = ref_snapshot
@@ -149,11 +300,10 @@ class DiffComputer(threading.Thread):
                     step_snapshot.save()
             logger.info('finished computing in %.2fs' % (time.perf_counter() - start))
 
-    def mark_diff(self, diff_image):
+    def mark_diff(self, diff_mask):
         """
-        Save 'difference' pixels to a picture
+        Save 'difference' pixels to a compact mask
         """
-        is_success, buffer = cv2.imencode(".png", diff_image)
-        return io.BytesIO(buffer).getvalue()
+        return diff_mask.encode()
+                
                 
-                
\ No newline at end of file
@@ -0,0 +1,101 @@
+import struct
+import zlib
+
+import cv2
+import numpy
+from numpy import uint8
+
+class DiffMask:
+    """
+    Pixels which are different between a reference and a step snapshot
+    The mask is stored in database with 1 bit per pixel, compressed, as differences are mostly long runs of identical bits
+    The red picture displayed to user is only rendered when needed
+    """
+
+    MAGIC = b'SRM1'
+    HEADER = struct.Struct('<4sII') # magic, width, height
+    PNG_MAGIC = b'\x89PNG'
+    MAX_BOXES = 50
+
+    def __init__(self, mask):
+        """
+        @param mask: boolean numpy array (height x width), True where pixel is different
+        """
+        self.mask = mask
+
+    @property
+    def width(self):
+        return self.mask.shape[1]
+
+    @property
+    def height(self):
+        return self.mask.shape[0]
+
+    @classmethod
+    def from_diff_image(cls, diff_image):
+        """
+        Build the mask from the RGBA image produced by PictureComparator, where different pixels are not transparent
+        """
+        return DiffMask(diff_image[:, :, 3] > 0)
+
+    @classmethod
+    def decode(cls, data):
+        """
+        Read mask stored in database
+        Masks stored as PNG (before compact storage was introduced) can also be read
+        @return: the DiffMask or None if data cannot be read
+        """
+        if not data:
+            return None
+        data = bytes(data)
+
+        if data.startswith(cls.MAGIC):
+            magic, width, height = cls.HEADER.unpack_from(data)
+            bits = numpy.frombuffer(zlib.decompress(data[cls.HEADER.size:]), dtype=uint8)
+            return DiffMask(numpy.unpackbits(bits, count=width * height).reshape((height, width)).astype(bool))
+
+        elif data.startswith(cls.PNG_MAGIC):
+            diff_image = cv2.imdecode(numpy.frombuffer(data, dtype=uint8), cv2.IMREAD_UNCHANGED)
+            if diff_image is None or diff_image.ndim != 3 or diff_image.shape[2] != 4:
+                return None
+            return cls.from_diff_image(diff_image)
+
+        return None
+
+    def encode(self):
+        """
+        @return: the compact representation of the mask, to store in database
+        """
+        return self.HEADER.pack(self.MAGIC, self.width, self.height) + zlib.compress(numpy.packbits(self.mask, axis=None).tobytes())
+
+    def pixel_count(self):
+        return int(numpy.count_nonzero(self.mask))
+
+    def percentage(self):
+        if not self.mask.size:
+            return 0.0
+        return self.pixel_count() * 100.0 / self.mask.size
+
+    def bounding_boxes(self, max_boxes=MAX_BOXES):
+        """
+        Returns the rectangles surrounding groups of different pixels, the greatest first
+        @param max_boxes: maximum number of rectangles to return
+        @return: list of [x, y, width, height]
+        """
+        if not self.mask.any():
+            return []
+
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(self.mask.astype(uint8), connectivity=8)
+
+        # component 0 is the background
+        boxes = sorted(stats[1:].tolist(), key=lambda stat: stat[cv2.CC_STAT_AREA], reverse=True)[:max_boxes]
+        return [box[:4] for box in boxes]
+
+    def to_png(self):
+        """
+        Render the mask as a transparent picture where different pixels are red
+        """
+        diff_image = numpy.zeros((self.height, self.width, 4), dtype=uint8)
+        diff_image[self.mask] = [0, 0, 255, 255]
+        is_success, buffer = cv2.imencode(".png", diff_image)
+        return buffer.tobytes()
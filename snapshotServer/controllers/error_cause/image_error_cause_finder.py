@@ -1,4 +1,3 @@
-import json
 import os
 from typing import Optional
 
@@ -84,7 +83,7 @@ class ImageErrorCauseFinder:
 
         try:
             # load details
-            step_result_details = json.loads(failed_step_result.stacktrace)
+            step_result_details = failed_step_result.get_details()
             for snapshot in step_result_details['snapshots']:
                 if snapshot['idImage'] and snapshot['snapshotCheckType'] == 'NONE_REFERENCE':
                     image_file = File.objects.get(pk=snapshot['idImage'])
@@ -130,7 +129,7 @@ class ImageErrorCauseFinder:
 
             try:
                 # load details
-                step_result_details = json.loads(last_step.stacktrace)
+                step_result_details = last_step.get_details()
                 error_messages = []
                 analysis_errors = []
 
@@ -193,7 +192,7 @@ class ImageErrorCauseFinder:
 
             try:
                 # load details
-                step_result_details = json.loads(last_step.stacktrace)
+                step_result_details = last_step.get_details()
                 analysis_errors = []
 
                 if not step_result_details['snapshots']:
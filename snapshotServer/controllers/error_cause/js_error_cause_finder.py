@@ -1,8 +1,7 @@
-import json
 from datetime import datetime
 from typing import Optional
 
-from snapshotServer.models import StepResult, TestStep, File
+from snapshotServer.models import StepResult, TestStep, File, StepResultAttachment
 
 class JavascriptAnalysisDetails:
 
@@ -22,21 +21,21 @@ class JsErrorCauseFinder:
         Browser logs are recorded to 'Test end' step
         :return [[logs], <analysis_error_if_any>]
         """
-        last_step = StepResult.objects.filter(testCase=self.test_case_in_session, step__name=TestStep.LAST_STEP_NAME)
-        failed_step_result = StepResult.objects.filter(testCase=self.test_case_in_session, result=False).exclude(step__name=TestStep.LAST_STEP_NAME).order_by('-pk')
+        # step details are not needed, files and timestamp have been extracted when step result has been recorded
+        last_step = StepResult.objects.filter(testCase=self.test_case_in_session, step__name=TestStep.LAST_STEP_NAME).defer('stacktrace', 'details')
+        failed_step_result = StepResult.objects.filter(testCase=self.test_case_in_session, result=False).exclude(step__name=TestStep.LAST_STEP_NAME).defer('stacktrace', 'details').order_by('-pk')
 
         if len(last_step) > 0 and len(failed_step_result) > 0:
             last_step = last_step[0]
             failed_step_result = failed_step_result[0]
 
             try:
-                # load details
-                last_step_result_details = json.loads(last_step.stacktrace)
-                failed_step_result_details = json.loads(failed_step_result.stacktrace)
-                for file_info in last_step_result_details['files']:
-                    if file_info["name"] == "Browser log file":
-                        log_file = File.objects.get(pk=file_info['id'])
-                        return self._analyze_javascript_logs(log_file.file.path, failed_step_result_details['timestamp'])
+                log_file_attachment = StepResultAttachment.objects.filter(stepResult=last_step, type=StepResultAttachment.FILE, name="Browser log file").order_by('id').first()
+                if log_file_attachment:
+                    if failed_step_result.timestamp is None:
+                        return JavascriptAnalysisDetails([], "Error reading step details for analysis: no timestamp for failed step")
+                    log_file = File.objects.get(pk=log_file_attachment.fileId)
+                    return self._analyze_javascript_logs(log_file.file.path, failed_step_result.timestamp)
 
                 return JavascriptAnalysisDetails([], "No browser logs to analyze")
             except Exception as e:
@@ -0,0 +1,94 @@
+import hashlib
+import random
+import re
+
+class ErrorClustering:
+    """
+    Computes signatures of error messages, so that similar errors can be grouped in clusters, in roughly constant time
+    - message is masked: parts that change between executions (numbers, ids, URLs, quoted values) are replaced by placeholders
+    - masked message is split in shingles (groups of consecutive words), and a MinHash signature is computed on these shingles.
+      The proportion of equal values between 2 signatures estimates the similarity (Jaccard index) of the 2 messages
+    - signature is split in bands. Each band is hashed to a bucket key (locality sensitive hashing).
+      Similar messages share at least one bucket with a high probability, so only clusters sharing a bucket need to be compared
+    """
+
+    # Mersenne prime used for the hash permutations
+    PRIME = (1 << 61) - 1
+
+    # order matters: URLs and UUIDs contain numbers and hex values
+    MASKS = [
+        (re.compile(r'https?://\S+', re.IGNORECASE), '<url>'),
+        (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.IGNORECASE), '<uuid>'),
+        (re.compile(r'\b(?:0x[0-9a-f]+|(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{8,})\b', re.IGNORECASE), '<hex>'),
+        (re.compile(r'"[^"]*"|\'[^\']*\''), '<str>'),
+        (re.compile(r'\d+(?:\.\d+)*'), '<num>'),
+    ]
+
+    def __init__(self, permutations=64, bands=16, shingle_size=2, seed=1):
+        """
+        @param permutations: length of the signature
+        @param bands: number of bands of the signature, each one is a bucket. 'permutations' must be a multiple of 'bands'
+        @param shingle_size: number of words in a shingle
+        @param seed: seed of the permutations. Changing it changes all signatures
+        """
+        if permutations % bands:
+            raise ValueError("Number of permutations (%d) must be a multiple of number of bands (%d)" % (permutations, bands))
+
+        self.bands = bands
+        self.rows = permutations // bands
+        self.shingle_size = shingle_size
+
+        rng = random.Random(seed)
+        self.coefficients = [(rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME)) for i in range(permutations)]
+
+    def mask(self, message):
+        """
+        Returns the message, in lower case, where variable parts are replaced by placeholders
+        """
+        message = message or ''
+        for pattern, placeholder in self.MASKS:
+            message = pattern.sub(placeholder, message)
+        return ' '.join(message.lower().split())
+
+    def shingles(self, text):
+        """
+        Returns the set of groups of 'shingle_size' consecutive words of the text
+        """
+        words = text.split()
+        if len(words) <= self.shingle_size:
+            return {' '.join(words)}
+        return {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def signature(self, text):
+        """
+        MinHash signature of the text
+        @return: list of 'permutations' integers
+        """
+        hashes = [self._hash(shingle) for shingle in self.shingles(text)]
+        return [min((a * h + b) % self.PRIME for h in hashes) for a, b in self.coefficients]
+
+    def buckets(self, signature):
+        """
+        Returns the bucket keys of the signature, one per band
+        """
+        return ['%d:%s' % (band, hashlib.blake2b(repr(signature[band * self.rows:(band + 1) * self.rows]).encode('utf-8'), digest_size=8).hexdigest())
+                for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(signature1, signature2):
+        """
+        Estimation of the Jaccard index of the 2 texts
+        """
+        if not signature1 or len(signature1) != len(signature2):
+            return 0.0
+        return sum(1 for value1, value2 in zip(signature1, signature2) if value1 == value2) / len(signature1)
+
+    def error_text(self, exception, error_message):
+        """
+        Text used to cluster an error: exception and masked message. Action is not used, so that the same failure in different steps or tests is in the same cluster
+        """
+        return ' '.join([exception or '', self.mask(error_message)]).strip()
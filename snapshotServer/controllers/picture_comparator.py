@@ -5,14 +5,18 @@ Created on 8 mars 2017
 '''
 
 import collections
+import hashlib
+import io
 import logging
 import os
+import threading
 import numpy
 import cv2 
 
 from snapshotServer.exceptions.picture_comparator_error import PictureComparatorError
 from numpy import uint8
 from django.conf import settings
+from PIL import Image
 
 
 Rectangle = collections.namedtuple("Rectangle", ['x', 'y', 'width', 'height'])
@@ -20,16 +24,67 @@ Pixel = collections.namedtuple("Pixel", ['x', 'y'])
 
 logger = logging.getLogger(__name__)
 
+def compute_picture_hashes(picture_file):
+    """
+    Computes the hashes used to detect identical pictures without comparing them pixel by pixel
+    @param picture_file: the uploaded picture file
+    @return: SHA-256 of the file content and SHA-256 of the decoded pixels (empty if picture cannot be decoded)
+    """
+    picture_file.seek(0)
+    content = picture_file.read()
+    picture_file.seek(0)
+    
+    file_hash = hashlib.sha256(content).hexdigest()
+    
+    try:
+        with Image.open(io.BytesIO(content)) as picture:
+            pixel_hash = hashlib.sha256(("%s-%dx%d-" % (picture.mode, picture.width, picture.height)).encode('ascii'))
+            pixel_hash.update(picture.tobytes())
+            pixel_hash = pixel_hash.hexdigest()
+    except Exception as e:
+        logger.warning("Cannot compute pixel hash: %s" % str(e))
+        pixel_hash = ''
+        
+    return file_hash, pixel_hash
+
+def decode_picture(picture_file):
+    """
+    Decodes an uploaded picture, as grayscale, directly from its content (no need to write it to disk)
+    @return: the picture as numpy array, or None if it cannot be decoded
+    """
+    picture_file.seek(0)
+    content = picture_file.read()
+    picture_file.seek(0)
+    
+    return cv2.imdecode(numpy.frombuffer(content, dtype=uint8), cv2.IMREAD_GRAYSCALE)
+
 class PictureComparator:
     
     MAX_DIFF_THRESHOLD = 0.1
+    EXCLUSION_MASK_CACHE_MAX_MEMORY = 64 * 1024 * 1024
+    MATCH_THRESHOLD = 0.95
     
-    def __init__(self):
-        pass
+    # multi-scale search in compare(), only done when requested (pyramid_levels > 0)
+    # on pictures with repeated patterns, it may select a different location than the exhaustive search
+    PYRAMID_LEVELS = 3                      # suggested number of levels
+    PYRAMID_MIN_SIZE = 16                   # image to find is not downsampled below this size (pixels)
+    PYRAMID_CANDIDATES = 5                  # number of locations found at lowest resolution which are refined
+    PYRAMID_CANDIDATE_THRESHOLD = 0.5       # minimal score of a location found at lowest resolution
+    PYRAMID_MARGIN = 3                      # search window around the location found at the previous level (pixels)
     
-    def compare(self, reference, image):
+    def __init__(self, reference_cache=None):
+        """
+        @param reference_cache: optional ReferenceImageCache used to avoid decoding the same reference picture for each comparison
+        """
+        self.reference_cache = reference_cache
+        self._exclusion_masks = collections.OrderedDict()
+        self._exclusion_masks_lock = threading.Lock()
+    
+    def compare(self, reference, image, pyramid_levels=0):
         """
         Compares an image to its reference
+        @param pyramid_levels: number of times pictures are downsampled to search candidate locations before refining them at full resolution.
+                                0 (default) means an exhaustive search at full resolution. See PYRAMID_LEVELS
         @return: a rectangle of the matching zone in reference image or None if nothing is found
         """
         
@@ -46,21 +101,87 @@ class PictureComparator:
         if reference_width < image_width or reference_height < image_height:
             raise PictureComparatorError("Reference picture must be greater than image to find")
 
-        method = cv2.TM_CCOEFF_NORMED
-    
-        # Apply template Matching
-        res = cv2.matchTemplate(reference_img, image_img, method)
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+        match = None
+        if pyramid_levels > 0 and (reference_width, reference_height) != (image_width, image_height):
+            match = self._pyramid_match(reference_img, image_img, pyramid_levels)
+            
+        # fallback to exhaustive search when pyramid does not give any match
+        if match is None:
+            match = self._match(reference_img, image_img)
+            
+        max_val, max_loc = match
 
-        if max_val > 0.95:
+        if max_val > self.MATCH_THRESHOLD:
             return Rectangle(max_loc[0], max_loc[1], image_width, image_height)
         else:
             return None
         
+    def _match(self, reference_img, image_img):
+        """
+        Search image in reference picture
+        @return: (best score, best location as (x, y))
+        """
+        res = cv2.matchTemplate(reference_img, image_img, cv2.TM_CCOEFF_NORMED)
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+        return max_val, max_loc
+    
+    def _pyramid_match(self, reference_img, image_img, levels):
+        """
+        Search image in downsampled pictures, and refine the best candidate locations in small windows, level after level, up to full resolution
+        @return: (best score, best location as (x, y)) or None if no candidate matches at full resolution
+        """
+        references = [reference_img]
+        images = [image_img]
+        while len(images) <= levels and min(images[-1].shape) // 2 >= self.PYRAMID_MIN_SIZE:
+            references.append(cv2.pyrDown(references[-1]))
+            images.append(cv2.pyrDown(images[-1]))
+            
+        if len(images) == 1:
+            return None
+        
+        # candidates at lowest resolution
+        res = cv2.matchTemplate(references[-1], images[-1], cv2.TM_CCOEFF_NORMED)
+        candidates = []
+        for i in range(self.PYRAMID_CANDIDATES):
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+            if max_val < self.PYRAMID_CANDIDATE_THRESHOLD:
+                break
+            candidates.append(max_loc)
+            
+            # do not select the same place twice
+            image_height, image_width = images[-1].shape
+            res[max(0, max_loc[1] - image_height // 2):max_loc[1] + image_height // 2 + 1, 
+                max(0, max_loc[0] - image_width // 2):max_loc[0] + image_width // 2 + 1] = -1
+        
+        best_match = None
+        for candidate in candidates:
+            max_val, max_loc = None, candidate
+            for level in range(len(images) - 2, -1, -1):
+                max_val, max_loc = self._window_match(references[level], images[level], (max_loc[0] * 2, max_loc[1] * 2))
+                
+            if max_val > self.MATCH_THRESHOLD and (best_match is None or max_val > best_match[0]):
+                best_match = (max_val, max_loc)
+                
+        return best_match
+        
+    def _window_match(self, reference_img, image_img, location):
+        """
+        Search image in reference picture, only around location
+        """
+        image_height, image_width = image_img.shape
+        reference_height, reference_width = reference_img.shape
+        x_start = min(max(0, location[0] - self.PYRAMID_MARGIN), reference_width - image_width)
+        y_start = min(max(0, location[1] - self.PYRAMID_MARGIN), reference_height - image_height)
+        x_end = min(reference_width, location[0] + image_width + self.PYRAMID_MARGIN)
+        y_end = min(reference_height, location[1] + image_height + self.PYRAMID_MARGIN)
+        
+        max_val, max_loc = self._match(reference_img[y_start:y_end, x_start:x_end], image_img)
+        return max_val, (max_loc[0] + x_start, max_loc[1] + y_start)
+        
     def get_changed_pixels(self, reference, image, exclude_zones=[]):
         """
         @param reference: reference picture
-        @param image: image to compare with
+        @param image: image to compare with: its path, or the picture already decoded as grayscale (see decode_picture)
         @param exclude_zones: list of zones (Rectangle objects) which should not be marked as differences.
         @return: list of pixels which are different between reference and image (as numpy array)
                 a percentage of diff pixels
@@ -68,12 +189,15 @@ class PictureComparator:
         """
         if not os.path.isfile(reference):
             raise PictureComparatorError("Reference file %s does not exist" % reference)
-        if not os.path.isfile(image):
+        if isinstance(image, numpy.ndarray):
+            image_img = image
+        elif not os.path.isfile(image):
             raise PictureComparatorError("Image file %s does not exist" % image)
+        else:
+            image_img = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
         
         # compute area where comparison will be done (<min_width>x<min_height>)
-        reference_img = cv2.imread(reference, cv2.IMREAD_GRAYSCALE)
-        image_img = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+        reference_img = self._read_reference(reference)
 
         reference_height = len(reference_img)
         reference_width = len(reference_img[0])
@@ -91,6 +215,14 @@ class PictureComparator:
         
         return pixels, len(pixels) * 100.0 / (image_height * image_width), diff_image
     
+    def _read_reference(self, reference):
+        """
+        Read reference picture as grayscale, from cache if one is configured
+        """
+        if self.reference_cache is not None:
+            return self.reference_cache.get(reference)
+        return cv2.imread(reference, cv2.IMREAD_GRAYSCALE)
+    
     def _build_list_of_changed_pixels(self, diff, image_width, image_height, min_width, min_height, exclude_zones):
         """
         From a matrix of difference pixels (for each pixel, we have 0 if pixel is the same, or non-zero if they are different), creates
@@ -102,7 +234,9 @@ class PictureComparator:
         diff = numpy.pad(diff, ((0, max(0, image_height - min_height)), (0, max(0, image_width - min_width))), constant_values=1)
 
         # ignore excluded pixels
-        diff *= self._build_list_of_excluded_pixels2(exclude_zones, image_width, image_height)
+        exclusion_mask = self._build_exclusion_mask(exclude_zones, image_width, image_height)
+        if exclusion_mask is not None:
+            diff *= exclusion_mask
         
         # draw mask of differences
         mask = numpy.ones((image_height, image_width, 1), dtype=uint8)
@@ -115,31 +249,33 @@ class PictureComparator:
         
         return diff_pixels, diff_image
     
-    def _build_list_of_excluded_pixels2(self, exclude_zones, img_width, img_height):
+    def _build_exclusion_mask(self, exclude_zones, img_width, img_height):
         """
-        From the list of rectangles, build a list of pixels that these rectangles cover
+        From the list of rectangles, build a matrix of the image size where 0 is placed on pixels to exclude, and 1 on pixels to keep
+        Zones are clipped to image dimensions (exclusion zone outside of image)
+        As all snapshots compared to the same reference use the same exclude zones, masks are cached
+        @return: the mask (read-only) or None if no zone is defined
         """
+        zones = tuple(sorted(set((x, y, width, height) for x, y, width, height in exclude_zones)))
+        if not zones:
+            return None
         
-        full_image = numpy.ones((img_height, img_width), dtype=uint8)
-        for x, y, width, height in exclude_zones:
-            
-            # creates a matrix where 0 is placed on pixels to exclude, and 1 on pixel to keep
-            exclusion = numpy.zeros((height, width), dtype=uint8)
-            exclusion = numpy.pad(exclusion, ((min(y, img_height) , max(0, img_height - (y + height))), (min(x, img_width), max(0, img_width - (x + width)))), constant_values=1)
-                  
-            full_image *= exclusion[0:img_height, 0:img_width] # crop exclusion array if it's size is higher than image (exclusion zone outside of image dimensions)
-       
-        return full_image
-    
-    def _build_list_of_excluded_pixels(self, exclude_zones):
-        """
-        From the list of rectangles, build a list of pixels that these rectangles cover
-        """
+        key = (zones, img_width, img_height)
+        with self._exclusion_masks_lock:
+            mask = self._exclusion_masks.get(key)
+            if mask is not None:
+                self._exclusion_masks.move_to_end(key)
+                return mask
         
-        pixels = []
-        for x, y, width, height in exclude_zones:
-            for row in range(height):
-                for col in range(width):
-                    pixels.append(Pixel(col + x, row + y))
-                    
-        return pixels
+        mask = numpy.ones((img_height, img_width), dtype=uint8)
+        for x, y, width, height in zones:
+            mask[max(0, y):max(0, y + height), max(0, x):max(0, x + width)] = 0
+        mask.setflags(write=False)
+        
+        if mask.nbytes <= self.EXCLUSION_MASK_CACHE_MAX_MEMORY:
+            with self._exclusion_masks_lock:
+                self._exclusion_masks[key] = mask
+                while sum(m.nbytes for m in self._exclusion_masks.values()) > self.EXCLUSION_MASK_CACHE_MAX_MEMORY:
+                    self._exclusion_masks.popitem(last=False)
+       
+        return mask
@@ -0,0 +1,105 @@
+import collections
+import os
+import threading
+
+import cv2
+
+class ReferenceImageCache:
+    """
+    Bounded cache of decoded (grayscale) reference pictures
+    The same reference snapshot is compared against many step snapshots, so decoding it each time is useless
+
+    Entries are keyed by file path and validated against file modification time and size, so that a replaced or deleted file is never served from cache
+    Least recently used entries are evicted when the memory budget is exceeded
+    """
+
+    def __init__(self, max_memory):
+        """
+        @param max_memory: maximum number of bytes that decoded pictures may use. 0 disables the cache
+        """
+        self.max_memory = max_memory
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Returns the grayscale picture stored at 'path', decoding it only if it's not already in cache (or if file changed)
+        The returned array is read-only as it's shared between comparisons
+        @param path: path of the picture file
+        @return: the decoded picture (numpy array) or None if it cannot be read
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.invalidate(path)
+            return None
+
+        file_signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry[0] == file_signature:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return entry[1]
+
+                # file has been replaced
+                self._remove(path)
+            self.misses += 1
+
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+
+        image.setflags(write=False)
+        if image.nbytes <= self.max_memory:
+            with self._lock:
+                if path in self._entries:
+                    self._remove(path)
+                self._entries[path] = (file_signature, image)
+                self.memory += image.nbytes
+
+                while self.memory > self.max_memory:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+
+        return image
+
+    def invalidate(self, path):
+        """
+        Remove picture from cache (e.g: when reference file is deleted)
+        """
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory = 0
+
+    def stats(self):
+        """
+        @return: a dict with cache usage counters
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'memory': self.memory,
+                'maxMemory': self.max_memory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / total if total else 0.0
+            }
+
+    def _remove(self, path):
+        file_signature, image = self._entries.pop(path)
+        self.memory -= image.nbytes
@@ -0,0 +1,12 @@
+
+class DiffComputerBusyError(Exception):
+    """
+    Raised when too many comparisons are already computed synchronously
+    """
+    
+    def __init__(self, message, retry_after):
+        """
+        @param retry_after: number of seconds after which client may retry
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
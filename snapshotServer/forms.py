@@ -45,6 +45,7 @@ class ImageForComparisonUploadFormNoStorage(forms.Form):
     Image upload form.
     This form will create a temp StepResult so that we can compare the image with reference
     without recording every test session details
+    StepResult, and its test session, are only built in memory, nothing is written to database
     """
     image = forms.ImageField()
     stepName = forms.CharField()
@@ -69,10 +70,11 @@ class ImageForComparisonUploadFormNoStorage(forms.Form):
             raise forms.ValidationError("stepName, testCaseName, version, environment, browser must be specified")
           
           
-        # create the StepResult object from provided data
-        version = Version.objects.get(id=self.cleaned_data['versionId'])
+        # create the StepResult object from provided data. It's never saved, so it must not be used in queries
+        version = Version.objects.select_related('application').get(id=self.cleaned_data['versionId'])
         environment = TestEnvironment.objects.get(id=self.cleaned_data['environmentId'])
-        test_case = TestCase.objects.get_or_create(name=self.cleaned_data['testCaseName'], application=version.application)[0]
+        test_case = TestCase.objects.filter(name=self.cleaned_data['testCaseName'], application=version.application).first() \
+                    or TestCase(name=self.cleaned_data['testCaseName'], application=version.application)
         test_session = TestSession(sessionId='123',
                                   version=version,
                                   browser=self.cleaned_data['browser'],
@@ -80,19 +82,15 @@ class ImageForComparisonUploadFormNoStorage(forms.Form):
                                   compareSnapshot=True,
                                   date=datetime.datetime.now(),
                                   ttl=datetime.timedelta(days=0))
-        test_session.save() # should be deleted later / save it due to django 5 change
         
         step = TestStep.objects.get(name=self.cleaned_data['stepName'])
         test_case_in_session = TestCaseInSession(testCase=test_case, 
                                               session=test_session
                                               )
-        test_case_in_session.save() # should be deleted later / save it due to django 5 change
         step_result = StepResult(step=step,
                                  testCase=test_case_in_session,
                                  result=True)
-        step_result.save() # should be deleted later / save it due to django 5 change
         self.cleaned_data['stepResult'] = step_result
-        self.cleaned_data['testSession'] = test_session
         self.cleaned_data['testCase'] = test_case
         self.cleaned_data['storeSnapshot'] = False
         
@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy
+from numpy import uint8
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+SIZES = {
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+    'fullpage': (1920, 10000),
+}
+
+def parse_size(size):
+    """
+    @param size: a size name (see SIZES) or '<width>x<height>'
+    @return: (width, height)
+    """
+    if size in SIZES:
+        return SIZES[size]
+    try:
+        width, height = size.lower().split('x')
+        return int(width), int(height)
+    except ValueError:
+        raise CommandError("Invalid size '%s', use one of %s or <width>x<height>" % (size, ', '.join(SIZES)))
+
+def peak_rss():
+    """
+    @return: peak resident memory of the process, in bytes, or None if it cannot be read
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def percentile(durations, percent):
+    return float(numpy.percentile(durations, percent)) * 1000
+
+
+class Command(BaseCommand):
+    help = """Benchmark the visual comparison pipeline on synthetic screenshots, and print results as JSON
+For each picture size / difference density / number of exclude zones, get_changed_pixels, _build_list_of_changed_pixels, mark_diff, compare (exhaustive and multi-scale search) and DiffComputer._compute_diff are timed
+Nothing is read from / written to database"""
+
+    OPERATIONS = ['get_changed_pixels', 'build_list_of_changed_pixels', 'mark_diff', 'compare', 'compare_pyramid', 'compute_diff']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=list(SIZES), help="picture sizes: %s or <width>x<height>. Defaults to all named sizes" % ', '.join(SIZES))
+        parser.add_argument('--densities', nargs='+', type=float, default=[0.0, 0.1, 5.0], help="percentage of different pixels between reference and image")
+        parser.add_argument('--exclude-zones', nargs='+', type=int, default=[0, 10, 100], help="number of exclude zones")
+        parser.add_argument('--operations', nargs='+', choices=self.OPERATIONS, default=self.OPERATIONS, help="operations to time. Defaults to all")
+        parser.add_argument('--iterations', type=int, default=5, help="number of times each operation is timed")
+        parser.add_argument('--seed', type=int, default=0, help="seed of the random generator, so that pictures are the same between runs")
+        parser.add_argument('--output', help="file where JSON results are written. Defaults to standard output")
+
+    def handle(self, *args, **options):
+
+        if options['iterations'] < 1:
+            raise CommandError("At least 1 iteration is needed")
+
+        rng = numpy.random.default_rng(options['seed'])
+        results = []
+
+        # pictures are written inside media folder as Snapshot images must be stored there
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix='benchmark_', dir=settings.MEDIA_ROOT)
+        try:
+            for size in options['sizes']:
+                width, height = parse_size(size)
+                for density in options['densities']:
+                    for zone_count in options['exclude_zones']:
+                        results.append(self._run_scenario(rng, work_dir, size, width, height, density, zone_count, options['operations'], options['iterations']))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        report = {
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'peakRss': peak_rss(),
+            'results': results,
+        }
+
+        content = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+        else:
+            self.stdout.write(content)
+
+    def _build_pictures(self, rng, work_dir, width, height, density):
+        """
+        Writes a reference picture, a copy with 'density' percent of pixels changed (in blocks of 8x8 pixels) and a crop of the reference, to search with 'compare'
+        """
+        # random text-like content, so that pictures do not compress to nothing
+        reference = numpy.full((height, width, 3), 255, dtype=uint8)
+        block_count = width * height // 2000
+        for x, y, w, h, color in zip(rng.integers(0, width, block_count), rng.integers(0, height, block_count),
+                                     rng.integers(5, 60, block_count), rng.integers(5, 20, block_count),
+                                     rng.integers(0, 200, (block_count, 3))):
+            reference[y:y + h, x:x + w] = color
+
+        image = reference.copy()
+        changed_block_count = int(width * height * density / 100 / 64)
+        for x, y in zip(rng.integers(0, max(1, width - 8), changed_block_count), rng.integers(0, max(1, height - 8), changed_block_count)):
+            image[y:y + 8, x:x + 8] = 255 - image[y:y + 8, x:x + 8]
+
+        template = reference[height // 4:height // 4 + height // 2, width // 4:width // 4 + width // 2]
+
+        paths = []
+        for name, picture in (('reference', reference), ('image', image), ('template', template)):
+            path = os.path.join(work_dir, '%s.png' % name)
+            cv2.imwrite(path, picture)
+            paths.append(path)
+        return paths
+
+    def _build_exclude_zones(self, rng, width, height, zone_count):
+        from snapshotServer.models import ExcludeZone
+
+        return [ExcludeZone(x=int(x), y=int(y), width=int(w), height=int(h))
+                for x, y, w, h in zip(rng.integers(0, width, zone_count), rng.integers(0, height, zone_count),
+                                      rng.integers(10, 300, zone_count), rng.integers(10, 100, zone_count))]
+
+    def _run_scenario(self, rng, work_dir, size, width, height, density, zone_count, operations, iterations):
+        from snapshotServer.controllers.diff_computer import DiffComputer
+        from snapshotServer.controllers.diff_mask import DiffMask
+        from snapshotServer.controllers.picture_comparator import PictureComparator
+        from snapshotServer.models import Snapshot
+
+        logger.info("benchmark %s (%dx%d), %.2f%% of differences, %d exclude zones" % (size, width, height, density, zone_count))
+
+        reference_path, image_path, template_path = self._build_pictures(rng, work_dir, width, height, density)
+        exclude_zones = self._build_exclude_zones(rng, width, height, zone_count)
+        rectangles = [zone.toRectangle() for zone in exclude_zones]
+
+        comparator = PictureComparator()
+        diff_computer = DiffComputer()
+        diff = cv2.absdiff(cv2.imread(reference_path, cv2.IMREAD_GRAYSCALE), cv2.imread(image_path, cv2.IMREAD_GRAYSCALE))
+        pixels, percentage, diff_image = comparator.get_changed_pixels(reference_path, image_path, rectangles)
+        diff_mask = DiffMask.from_diff_image(diff_image)
+
+        # snapshots are not saved, so database is not needed
+        ref_snapshot = Snapshot(image=os.path.relpath(reference_path, settings.MEDIA_ROOT), name='reference')
+        step_snapshot = Snapshot(image=os.path.relpath(image_path, settings.MEDIA_ROOT), name='image')
+
+        calls = {
+            'get_changed_pixels': lambda: comparator.get_changed_pixels(reference_path, image_path, rectangles),
+            'build_list_of_changed_pixels': lambda: comparator._build_list_of_changed_pixels(diff, width, height, width, height, rectangles),
+            'mark_diff': lambda: diff_computer.mark_diff(diff_mask),
+            'compare': lambda: comparator.compare(reference_path, template_path),
+            'compare_pyramid': lambda: comparator.compare(reference_path, template_path, pyramid_levels=PictureComparator.PYRAMID_LEVELS),
+            'compute_diff': lambda: diff_computer._compute_diff(ref_snapshot, step_snapshot, save_snapshot=False, additional_exclude_zones=exclude_zones),
+        }
+
+        timings = {}
+        for operation in operations:
+            durations = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                calls[operation]()
+                durations.append(time.perf_counter() - start)
+
+            timings[operation] = {
+                'p50': percentile(durations, 50),
+                'p95': percentile(durations, 95),
+                'min': min(durations) * 1000,
+                'max': max(durations) * 1000,
+                'throughput': iterations / sum(durations) if sum(durations) else None,
+                'megapixelsPerSecond': iterations * width * height / 1000000 / sum(durations) if sum(durations) else None,
+            }
+
+        if 'compute_diff' in operations and step_snapshot.computingError:
+            logger.warning("error computing diff: %s" % step_snapshot.computingError)
+
+        return {
+            'size': size,
+            'width': width,
+            'height': height,
+            'density': density,
+            'measuredDensity': percentage,
+            'excludeZones': zone_count,
+            'timings': timings, # durations in milliseconds, throughput in operations per second
+            'peakRss': peak_rss(),
+        }
@@ -0,0 +1,44 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """Put recorded errors in clusters of similar errors (see ErrorCluster), batch by batch, oldest errors first
+Errors already in a cluster are skipped, so the command can be stopped and restarted"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="number of errors processed in a transaction")
+        parser.add_argument('--reset', action='store_true', help="delete existing clusters and cluster all errors again (e.g: when clustering parameters changed)")
+
+    def handle(self, *args, **options):
+        from snapshotServer.models import Error, ErrorCluster
+
+        if options['batch_size'] < 1:
+            raise CommandError("Batch size must be at least 1")
+
+        if options['reset']:
+            Error.objects.exclude(cluster=None).update(cluster=None)
+            ErrorCluster.objects.all().delete()
+
+        processed = 0
+        last_id = 0
+        while True:
+            errors = list(Error.objects.filter(cluster=None, id__gt=last_id)
+                          .select_related('stepResult__testCase')
+                          .order_by('id')[:options['batch_size']])
+            if not errors:
+                break
+
+            with transaction.atomic():
+                for error in errors:
+                    ErrorCluster.add_error(error)
+
+            processed += len(errors)
+            last_id = errors[-1].id
+            logger.info("%d errors clustered" % processed)
+
+        self.stdout.write("%d errors clustered in %d clusters" % (processed, ErrorCluster.objects.count()))
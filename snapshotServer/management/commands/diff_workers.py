@@ -0,0 +1,65 @@
+import logging
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+def run_worker():
+    """
+    Entry point of each worker process
+    Django is set up again as processes may be spawned (Windows)
+    """
+    import django
+    django.setup()
+
+    from snapshotServer.controllers.diff_computer import DiffComputer
+
+    try:
+        DiffComputer().run()
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Starts a pool of processes computing snapshot differences"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help="number of worker processes. Defaults to the number of CPU")
+
+    def handle(self, *args, **options):
+
+        from snapshotServer.controllers.diff_computer import DiffComputer
+
+        # snapshots which were not computed when server stopped
+        DiffComputer().requeue_uncomputed_snapshots()
+
+        # database connection must not be shared with child processes
+        connections.close_all()
+
+        processes = []
+        for i in range(max(1, options['processes'])):
+            process = multiprocessing.Process(target=run_worker, name="diff_worker_%d" % i, daemon=True)
+            process.start()
+            processes.append(process)
+        logger.info("Started %d diff workers" % len(processes))
+
+        try:
+            while True:
+
+                # restart workers that could have died
+                for i, process in enumerate(processes):
+                    if not process.is_alive():
+                        logger.error("Diff worker %s stopped with code %s, restarting it" % (process.name, process.exitcode))
+                        processes[i] = multiprocessing.Process(target=run_worker, name=process.name, daemon=True)
+                        processes[i].start()
+                time.sleep(5)
+
+        except KeyboardInterrupt:
+            logger.info("Stopping diff workers...")
+            for process in processes:
+                process.terminate()
+                process.join()
+            logger.info("Diff workers stopped")
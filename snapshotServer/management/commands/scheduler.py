@@ -3,11 +3,13 @@ import logging
 from django.conf import settings
 
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from django.core.management.base import BaseCommand
 from django_apscheduler.jobstores import DjangoJobStore
 from django_apscheduler.models import DjangoJobExecution
 from django_apscheduler import util
 from snapshotServer.utils.clean import clean_old_references, clean_old_sessions, replace_html, replace_video, compress_images, replace_har
+from variableServer.utils.expiry import release_expired_reservations, delete_expired_variables
 from apscheduler.schedulers.blocking import BlockingScheduler
 
 logger = logging.getLogger(__name__)
@@ -21,6 +23,15 @@ def daily_clean():
     replace_har()
     replace_video()
 
+@util.close_old_connections
+def variable_expiry():
+    """
+    Release variables whose reservation is over and delete variables whose time to live is over
+    Variable requests already ignore them, this keeps the table clean
+    """
+    release_expired_reservations()
+    delete_expired_variables()
+
 # The `close_old_connections` decorator ensures that database connections, that have become
 # unusable or are obsolete, are closed before and after your job has run. You should use it
 # to wrap any jobs that you schedule that access the Django database in any way. 
@@ -53,6 +64,15 @@ class Command(BaseCommand):
             replace_existing=True,
         )
         logger.info("Added job 'daily_clean'.")
+
+        scheduler.add_job(
+            variable_expiry,
+            trigger=IntervalTrigger(seconds=settings.VARIABLE_EXPIRY_INTERVAL),
+            id="variable_expiry",
+            max_instances=1,
+            replace_existing=True,
+        )
+        logger.info("Added job 'variable_expiry'.")
     
         scheduler.add_job(
             delete_old_job_executions,
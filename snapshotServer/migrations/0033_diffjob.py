@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0032_alter_error_relatederrors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiffJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('claimedBy', models.CharField(blank=True, max_length=150, null=True)),
+                ('leaseExpiration', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('refSnapshot', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='diffJobsAsReference', to='snapshotServer.snapshot')),
+                ('stepSnapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='diffJobs', to='snapshotServer.snapshot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['leaseExpiration', 'id'], name='diffjob_lease_idx')],
+            },
+        ),
+    ]
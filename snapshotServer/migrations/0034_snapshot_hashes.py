@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0033_diffjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshot',
+            name='fileHash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='pixelHash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
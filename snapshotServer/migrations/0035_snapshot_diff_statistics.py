@@ -0,0 +1,85 @@
+# Generated by Django 5.1.15 on 2026-10-18 10:31
+
+import struct
+import zlib
+
+import cv2
+import numpy
+
+from django.db import migrations, models
+
+# compact mask format at the time of this migration (see DiffMask). It's copied here so that later changes of DiffMask do not change this migration
+MASK_MAGIC = b'SRM1'
+MASK_HEADER = struct.Struct('<4sII') # magic, width, height
+PNG_MAGIC = b'\x89PNG'
+MAX_BOXES = 50
+
+def decode_png_mask(data):
+    """
+    @return: boolean numpy array, True where pixel is different (not transparent), or None if data is not a difference picture
+    """
+    diff_image = cv2.imdecode(numpy.frombuffer(data, dtype=numpy.uint8), cv2.IMREAD_UNCHANGED)
+    if diff_image is None or diff_image.ndim != 3 or diff_image.shape[2] != 4:
+        return None
+    return diff_image[:, :, 3] > 0
+
+def bounding_boxes(mask):
+    """
+    Rectangles [x, y, width, height] surrounding groups of different pixels, the greatest first
+    """
+    if not mask.any():
+        return []
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask.astype(numpy.uint8), connectivity=8)
+    
+    # component 0 is the background
+    boxes = sorted(stats[1:].tolist(), key=lambda stat: stat[cv2.CC_STAT_AREA], reverse=True)[:MAX_BOXES]
+    return [box[:4] for box in boxes]
+
+def forwards_func(apps, schema_editor):
+    """
+    Convert difference pictures (PNG) to compact masks and compute their statistics
+    """
+    Snapshot = apps.get_model("snapshotServer", "Snapshot")
+    db_alias = schema_editor.connection.alias
+    
+    for snapshot in Snapshot.objects.using(db_alias).filter(pixelsDiff__isnull=False).only('id', 'pixelsDiff').iterator(chunk_size=100):
+        data = bytes(snapshot.pixelsDiff)
+        if not data.startswith(PNG_MAGIC):
+            continue
+        mask = decode_png_mask(data)
+        if mask is None:
+            continue
+        
+        height, width = mask.shape
+        pixel_count = int(numpy.count_nonzero(mask))
+        snapshot.pixelsDiff = MASK_HEADER.pack(MASK_MAGIC, width, height) + zlib.compress(numpy.packbits(mask, axis=None).tobytes())
+        snapshot.diffPixelCount = pixel_count
+        snapshot.diffPercentage = pixel_count * 100.0 / mask.size if mask.size else 0.0
+        snapshot.diffBoxes = bounding_boxes(mask)
+        snapshot.save(update_fields=['pixelsDiff', 'diffPixelCount', 'diffPercentage', 'diffBoxes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0034_snapshot_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshot',
+            name='diffBoxes',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='diffPercentage',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='diffPixelCount',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
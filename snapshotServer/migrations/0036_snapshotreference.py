@@ -0,0 +1,62 @@
+# Generated by Django 5.1.15 on 2026-10-18 10:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+def forwards_func(apps, schema_editor):
+    """
+    Fill the reference index with the most recent reference snapshot of each group
+    """
+    Snapshot = apps.get_model("snapshotServer", "Snapshot")
+    SnapshotReference = apps.get_model("snapshotServer", "SnapshotReference")
+    db_alias = schema_editor.connection.alias
+    
+    references = {}
+    for values in Snapshot.objects.using(db_alias).filter(refSnapshot=None).order_by('pk').values_list('pk', 
+                                                                                                       'stepResult__testCase__session__version__application',
+                                                                                                       'stepResult__testCase__testCase__name',
+                                                                                                       'stepResult__step',
+                                                                                                       'stepResult__testCase__session__environment',
+                                                                                                       'stepResult__testCase__session__browser',
+                                                                                                       'name',
+                                                                                                       'stepResult__testCase__session__version').iterator():
+        references[values[1:]] = values[0]
+        
+    SnapshotReference.objects.using(db_alias).bulk_create([SnapshotReference(application_id=application_id,
+                                                                             testCaseName=test_case_name,
+                                                                             step_id=step_id,
+                                                                             environment_id=environment_id,
+                                                                             browser=browser,
+                                                                             name=name,
+                                                                             version_id=version_id,
+                                                                             snapshot_id=snapshot_id) 
+                                                           for (application_id, test_case_name, step_id, environment_id, browser, name, version_id), snapshot_id in references.items()], 
+                                                          batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0035_snapshot_diff_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotReference',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('testCaseName', models.CharField(max_length=150)),
+                ('browser', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=150)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshotReferences', to='snapshotServer.application')),
+                ('environment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshotReferences', to='snapshotServer.testenvironment')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshotReferences', to='snapshotServer.snapshot')),
+                ('step', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshotReferences', to='snapshotServer.teststep')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshotReferences', to='snapshotServer.version')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('application', 'testCaseName', 'step', 'environment', 'browser', 'name', 'version'), name='unique_snapshot_reference')],
+            },
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0036_snapshotreference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diffjob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'interactive'), (1, 'normal'), (2, 'bulk')], default=1),
+        ),
+        migrations.AddIndex(
+            model_name='diffjob',
+            index=models.Index(fields=['priority', 'id'], name='diffjob_priority_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+def forwards_func(apps, schema_editor):
+    """
+    Store test names of existing sessions (same as TestSessionSummary.refresh)
+    Rollups of existing test cases are computed when they are first read (see TestCaseInSessionSummary.for_test_cases)
+    """
+    TestCaseInSession = apps.get_model("snapshotServer", "TestCaseInSession")
+    TestSessionSummary = apps.get_model("snapshotServer", "TestSessionSummary")
+    db_alias = schema_editor.connection.alias
+    
+    summaries = []
+    summary = None
+    for session_id, test_name in TestCaseInSession.objects.using(db_alias) \
+                                        .order_by('session', 'pk') \
+                                        .values_list('session', 'testCase__name') \
+                                        .iterator(chunk_size=2000):
+        if summary is None or summary.session_id != session_id:
+            if len(summaries) >= 500:
+                TestSessionSummary.objects.using(db_alias).bulk_create(summaries)
+                summaries = []
+            summary = TestSessionSummary(session_id=session_id, testNames=test_name)
+            summaries.append(summary)
+        else:
+            summary.testNames += "," + test_name
+            
+    TestSessionSummary.objects.using(db_alias).bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0037_diffjob_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestCaseInSessionSummary',
+            fields=[
+                ('testCase', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='snapshotServer.testcaseinsession')),
+                ('stepsNumber', models.IntegerField(default=0)),
+                ('failedStepsNumber', models.IntegerField(default=0)),
+                ('duration', models.FloatField(default=0.0)),
+                ('snapshotsNumber', models.IntegerField(default=0)),
+                ('snapshotComputingErrors', models.IntegerField(default=0)),
+                ('snapshotFailures', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TestSessionSummary',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='snapshotServer.testsession')),
+                ('testNames', models.TextField(default='')),
+            ],
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
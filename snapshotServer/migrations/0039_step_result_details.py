@@ -0,0 +1,105 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:32
+
+import json
+
+import commonsServer.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+def search_failed_action(data, path):
+    """
+    Same as StepResult.search_failed_action, only path is returned
+    """
+    for action in data.get('actions', []):
+        if action.get('type') == 'step' and 'actions' in action:
+            failed_action = search_failed_action(action, path + '>' + action['action'])
+            if failed_action:
+                return failed_action
+
+        if action.get('failed', False):
+            if action.get('element', ''):
+                return f"{path}>{action['action']} on {action['origin']}.{action['element']}"
+            else:
+                return f"{path}>{action['action']} in {action['origin']}"
+    return None
+
+def forwards_func(apps, schema_editor):
+    """
+    Parse stacktrace of existing step results
+    """
+    StepResult = apps.get_model("snapshotServer", "StepResult")
+    StepResultAttachment = apps.get_model("snapshotServer", "StepResultAttachment")
+    db_alias = schema_editor.connection.alias
+    
+    step_results = []
+    attachments = []
+    for step_result in StepResult.objects.using(db_alias).exclude(stacktrace=None).only('id', 'stacktrace').iterator(chunk_size=500):
+        try:
+            details = json.loads(step_result.stacktrace)
+        except ValueError:
+            continue
+        if not isinstance(details, dict):
+            continue
+        
+        step_result.details = details
+        step_result.timestamp = details.get('timestamp') if isinstance(details.get('timestamp'), int) else None
+        try:
+            step_result.failedAction = search_failed_action(details, details.get('action', ''))
+        except (KeyError, TypeError):
+            step_result.failedAction = None
+        step_results.append(step_result)
+        
+        for snapshot in details.get('snapshots') or []:
+            attachments.append(StepResultAttachment(stepResult_id=step_result.id, type='snapshot', fileId=snapshot.get('idImage') or None, 
+                                                    name=(snapshot.get('name') or '')[:150], snapshotCheckType=snapshot.get('snapshotCheckType')))
+        for file in (details.get('files') or []) + (details.get('harCaptures') or []):
+            attachments.append(StepResultAttachment(stepResult_id=step_result.id, type='file', fileId=file.get('id') or None, name=(file.get('name') or '')[:150]))
+        
+        if len(step_results) >= 500:
+            StepResult.objects.using(db_alias).bulk_update(step_results, ['details', 'timestamp', 'failedAction'])
+            StepResultAttachment.objects.using(db_alias).bulk_create(attachments)
+            step_results = []
+            attachments = []
+            
+    StepResult.objects.using(db_alias).bulk_update(step_results, ['details', 'timestamp', 'failedAction'])
+    StepResultAttachment.objects.using(db_alias).bulk_create(attachments)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0038_test_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stepresult',
+            name='details',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='stepresult',
+            name='failedAction',
+            field=commonsServer.models.TruncatingCharField(blank=True, db_index=True, editable=False, max_length=250, null=True),
+        ),
+        migrations.AddField(
+            model_name='stepresult',
+            name='timestamp',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='StepResultAttachment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('snapshot', 'snapshot'), ('file', 'file')], max_length=10)),
+                ('fileId', models.IntegerField(db_index=True, null=True)),
+                ('name', commonsServer.models.TruncatingCharField(default='', max_length=150, null=True)),
+                ('snapshotCheckType', models.CharField(max_length=30, null=True)),
+                ('stepResult', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='snapshotServer.stepresult')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stepResult', 'type'], name='stepresultattachment_type_idx')],
+            },
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
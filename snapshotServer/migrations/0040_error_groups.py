@@ -0,0 +1,93 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:45
+
+import datetime
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TIME_FRAME = datetime.timedelta(seconds=3600)
+
+def compute_fingerprint(error):
+    """
+    Same as Error.compute_fingerprint
+    """
+    message = ' '.join((error.errorMessage or '')[:1000].split())
+    return hashlib.sha256('\n'.join([(error.action or '')[:250], (error.exception or '')[:100], message]).encode('utf-8')).hexdigest()
+
+def forwards_func(apps, schema_editor):
+    """
+    Compute fingerprint of existing errors and group them, in test date order: an error joins the last group 
+    with the same fingerprint if this group has been created less than an hour before (same as ErrorGroup.add_error)
+    """
+    Error = apps.get_model("snapshotServer", "Error")
+    ErrorGroup = apps.get_model("snapshotServer", "ErrorGroup")
+    db_alias = schema_editor.connection.alias
+    
+    groups = []
+    last_groups = {}
+    errors = []
+    for error in Error.objects.using(db_alias) \
+                    .select_related('stepResult__testCase') \
+                    .only('id', 'action', 'exception', 'errorMessage', 'stepResult', 'stepResult__testCase', 'stepResult__testCase__date') \
+                    .order_by('stepResult__testCase__date', 'id') \
+                    .iterator(chunk_size=500):
+        date = error.stepResult.testCase.date
+        error.fingerprint = compute_fingerprint(error)
+        
+        # tests without date were never related to other ones
+        group = last_groups.get(error.fingerprint)
+        if date is None:
+            group = None
+        elif group is None or date - group.firstSeen > TIME_FRAME:
+            group = ErrorGroup.objects.using(db_alias).create(fingerprint=error.fingerprint, firstSeen=date, lastSeen=date)
+            last_groups[error.fingerprint] = group
+            groups.append(group)
+        else:
+            group.lastSeen = max(group.lastSeen, date)
+        
+        error.group = group
+        errors.append(error)
+        if len(errors) >= 500:
+            Error.objects.using(db_alias).bulk_update(errors, ['fingerprint', 'group'])
+            errors = []
+            
+    Error.objects.using(db_alias).bulk_update(errors, ['fingerprint', 'group'])
+    ErrorGroup.objects.using(db_alias).bulk_update(groups, ['lastSeen'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0039_step_result_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='error',
+            name='fingerprint',
+            field=models.CharField(db_index=True, default='', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ErrorGroup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('firstSeen', models.DateTimeField()),
+                ('lastSeen', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fingerprint', 'firstSeen'], name='errorgroup_fingerprint_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='error',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='errors', to='snapshotServer.errorgroup'),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='error',
+            name='relatedErrors',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snapshotServer', '0040_error_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ErrorCluster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.TextField(default='')),
+                ('signature', models.JSONField(default=list)),
+                ('firstSeen', models.DateTimeField()),
+                ('lastSeen', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='error',
+            name='cluster',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='errors', to='snapshotServer.errorcluster'),
+        ),
+        migrations.CreateModel(
+            name='ErrorClusterBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=24)),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='snapshotServer.errorcluster')),
+            ],
+        ),
+    ]
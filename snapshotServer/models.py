@@ -1,19 +1,24 @@
 
 from django.db import models
-from django.db.models import Q
+from django.db.models import Q, F, Count, Sum, QuerySet, Case, When, Value
 from django.contrib import admin
 from django.utils.html import format_html
 
 from snapshotServer.controllers.error_cause import Cause, Reason
 from snapshotServer.controllers.picture_comparator import Rectangle
+from snapshotServer.controllers.error_clustering import ErrorClustering
+import json
 import pickle
 import commonsServer.models
 from django.dispatch.dispatcher import receiver
-from django.db.models.signals import  pre_delete
+from django.db.models.signals import  pre_delete, post_save, post_delete, pre_save
+from django.core.exceptions import ObjectDoesNotExist
 from django.urls import reverse
 import datetime
-from commonsServer.models import TruncatingCharField
+import hashlib
+from commonsServer.models import TruncatingCharField, version_sort_key
 from django.utils.safestring import mark_safe
+from django.utils import timezone
 
 class TestEnvironment(commonsServer.models.TestEnvironment):
     class Meta:
@@ -58,13 +63,29 @@ class TestCaseInSession(models.Model):
     optimized = models.IntegerField(default=0) # do attachments have been optimized (deleted, compressed): 0 (no), 10 (html deleted), 20 (images compressed), 30 (video deleted)
     date = models.DateTimeField(blank=True, null=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        
+        # session rollup only needs to be refreshed when these values change (see 'update_session_summary')
+        instance._summary_values = instance.summary_values()
+        return instance
+    
+    def summary_values(self):
+        """
+        Values of the test used by session rollup, or None if they are not loaded
+        """
+        if not {'session_id', 'testCase_id'}.issubset(self.__dict__):
+            return None
+        return (self.session_id, self.testCase_id)
+    
     def isOkWithSnapshots(self):
         """
         Returns True if test is OK for this test case, executed in session. Look at each step. None of the snapshot should
         show a diff
         """
         
-        snapshots = Snapshot.objects.filter(stepResult__testCase=self)
+        snapshots = Snapshot.objects.filter(stepResult__testCase=self).defer('pixelsDiff')
         result = True 
         computing_errors = 0
         
@@ -72,6 +93,9 @@ class TestCaseInSession(models.Model):
             if snapshot.computingError:
                 computing_errors += 1
                 continue
+            if snapshot.diffPixelCount is not None:
+                result = result and not snapshot.tooManyDiffs
+                continue
             if snapshot.pixelsDiff is None:
                 continue
             
@@ -90,6 +114,46 @@ class TestCaseInSession(models.Model):
             
         return result
     
+    @classmethod
+    def snapshotCounts(cls, test_cases_in_session):
+        """
+        Count, in a single query, the snapshots of several test cases, the ones whose comparison failed and the ones that show too many differences
+        Result only relies on stored columns: a snapshot is KO when comparison has been done and shows too many differences
+        @param test_cases_in_session: queryset or list of TestCaseInSession
+        @return: dict {test case in session id: {'total': <count>, 'computing_errors': <count>, 'failed': <count>}}. Test cases without snapshot are not in the dict
+        """
+        counts = Snapshot.objects.filter(stepResult__testCase__in=test_cases_in_session) \
+            .values('stepResult__testCase') \
+            .order_by() \
+            .annotate(total=Count('id'),
+                      computing_errors=Count('id', filter=~Q(computingError='')),
+                      failed=Count('id', filter=Q(computingError='', tooManyDiffs=True) & (Q(diffPixelCount__isnull=False) | Q(pixelsDiff__isnull=False))))
+        
+        return {count.pop('stepResult__testCase'): count for count in counts}
+    
+    @staticmethod
+    def snapshotComparisonResult(computing_errors, failed):
+        """
+        Same rules as isOkWithSnapshots: result is undefined if no snapshot has been computed or if a computation failed and remaining result is OK
+        @return: True / False / None
+        """
+        if failed > 0:
+            return False
+        elif computing_errors > 0:
+            return None
+        else:
+            return True
+    
+    @classmethod
+    def snapshotComparisonResults(cls, test_cases_in_session):
+        """
+        Same as isOkWithSnapshots, for several test cases, in a single query
+        @param test_cases_in_session: queryset of TestCaseInSession
+        @return: dict {test case in session id: True / False / None}. Test cases without snapshot are not in the dict, their result is None
+        """
+        return {test_case_id: cls.snapshotComparisonResult(count['computing_errors'], count['failed']) 
+                for test_case_id, count in cls.snapshotCounts(test_cases_in_session).items()}
+    
     def computed(self):
         """
         Returns True if all snapshots have been computed
@@ -163,7 +227,7 @@ class TestStep(models.Model):
         @param test_case: the test case this step belongs
         """
         
-        snapshots = Snapshot.objects.filter(stepResult__testCase=test_case, stepResult__step=self)
+        snapshots = Snapshot.objects.filter(stepResult__testCase=test_case, stepResult__step=self).defer('pixelsDiff')
         step_status = StepResult.objects.filter(step=self, testCase=test_case).last()
         
         if step_status == None:
@@ -172,6 +236,9 @@ class TestStep(models.Model):
             result = step_status.result
         
         for snapshot in snapshots:
+            if snapshot.diffPixelCount is not None:
+                result = result and not snapshot.tooManyDiffs
+                continue
             if snapshot.pixelsDiff is None:
                 continue
             
@@ -206,6 +273,22 @@ class TestSession(models.Model):
             return self.name
         else:
             return "Session %s with %s" % (self.sessionId, self.browser)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        
+        # reference index of the session snapshots depends on these values (see 'update_session_snapshot_references')
+        instance._reference_values = instance.reference_values()
+        return instance
+    
+    def reference_values(self):
+        """
+        Values of the session used by reference index, or None if they are not loaded
+        """
+        if not {'version_id', 'environment_id', 'browser'}.issubset(self.__dict__):
+            return None
+        return (self.version_id, self.environment_id, self.browser)
 
     @admin.display(ordering='pk')
     def link(self):
@@ -214,7 +297,10 @@ class TestSession(models.Model):
 
     @admin.display(ordering='test__name')
     def allTests(self):
-        return ",".join([t.testCase.name for t in self.testcaseinsession_set.all()])
+        try:
+            return self.summary.testNames
+        except ObjectDoesNotExist:
+            return ",".join([t.testCase.name for t in self.testcaseinsession_set.all()])
 
      
 def upload_path(instance, filename):
@@ -312,6 +398,11 @@ class Snapshot(models.Model):
     computed = models.BooleanField(default=False)
     diffTolerance = models.FloatField(default=0.0) # pixel tolerance when comparing pictures. 0.0 means all pixels must be identical, 10.0 means 10% of the pixels may be different 
     computingError = TruncatingCharField(max_length=250, default="")
+    fileHash = models.CharField(max_length=64, default="", blank=True) # SHA-256 of the picture file, computed at upload
+    pixelHash = models.CharField(max_length=64, default="", blank=True) # SHA-256 of the decoded pixels, computed at upload. Same pixels may be encoded differently
+    diffPixelCount = models.IntegerField(null=True) # number of different pixels, None if comparison has not been done
+    diffPercentage = models.FloatField(null=True) # percentage of different pixels, None if comparison has not been done
+    diffBoxes = models.JSONField(null=True) # rectangles [x, y, width, height] surrounding the differences, the greatest first
   
     def __str__(self):
         return "%s - %s - %s - %d" % (self.stepResult.testCase.testCase.name, self.stepResult.step.name, self.stepResult.testCase.session.sessionId, self.id) 
@@ -321,6 +412,48 @@ class Snapshot(models.Model):
             models.CheckConstraint(check=Q(diffTolerance__gte=0) & Q(diffTolerance__lte=100) , name='percentage_diff_tolerance'),
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        
+        # reference index only needs to be updated when these values change (see 'update_snapshot_reference')
+        instance._reference_values = instance.reference_values()
+        
+        # rollup of the test is updated with the difference between loaded and saved counts (see 'update_summary_from_snapshot')
+        instance._summary_counts = instance.summary_counts()
+        return instance
+    
+    def reference_values(self):
+        """
+        Values of the snapshot used by reference index, or None if they are not loaded
+        """
+        if not {'refSnapshot_id', 'name'}.issubset(self.__dict__):
+            return None
+        return (self.refSnapshot_id, self.name)
+    
+    def summary_counts(self):
+        """
+        Counts this snapshot adds to the rollup of its test (see TestCaseInSession.snapshotCounts), or None if values are not loaded
+        @return: (step result id, counts)
+        """
+        if not {'stepResult_id', 'computingError', 'tooManyDiffs', 'diffPixelCount', 'pixelsDiff'}.issubset(self.__dict__):
+            return None
+        failed = not self.computingError and self.tooManyDiffs and (self.diffPixelCount is not None or self.pixelsDiff is not None)
+        return (self.stepResult_id, {'snapshotsNumber': 1, 
+                                     'snapshotComputingErrors': 1 if self.computingError else 0, 
+                                     'snapshotFailures': 1 if failed else 0})
+    
+    def hasSameContentAs(self, snapshot):
+        """
+        Returns True if both snapshots are known to have the same pictures, based on hashes computed at upload
+        In this case, there is no need to compare pixels
+        """
+        if not snapshot:
+            return False
+        if self.fileHash and self.fileHash == snapshot.fileHash:
+            return True
+        return bool(self.pixelHash) and self.pixelHash == snapshot.pixelHash
+    
     def snapshotsUntilNextRef(self, ref_snapshot):
         """
         get all snapshots, sharing the same reference snapshot, until the next reference for the same testCase / testStep
@@ -374,7 +507,13 @@ def submission_delete(sender, instance, **kwargs):
 
     from snapshotServer.controllers.diff_computer import DiffComputer
     
+    # reference index will be updated once snapshot is deleted, related objects may not be available anymore
+    if instance.refSnapshot_id is None:
+        instance.reference_key = SnapshotReference.key_for(instance)
+    
     # deletion of image file
+    if instance.image:
+        DiffComputer.picture_comparator.reference_cache.invalidate(instance.image.path)
     instance.image.delete(False) 
     
     # recompute references if this snapshot is a reference for other
@@ -399,18 +538,194 @@ def submission_delete(sender, instance, **kwargs):
             
             diff_computer = DiffComputer.get_instance()
             
-            # recompute diff pixels
-            diff_computer.compute_now(snapshot.refSnapshot, snapshot)
+            # recompute diff pixels. This is done by diff workers so that deletion is not slowed down by computing
+            diff_computer.add_jobs(snapshot.refSnapshot, snapshot)
             
             # recompute all following snapshot as they will depend on a previous ref
             for snap in snapshot.snapshotsUntilNextRef(snapshot):
-                diff_computer.add_jobs(snapshot.refSnapshot, snap)
+                diff_computer.add_jobs(snapshot.refSnapshot, snap, priority=DiffJob.PRIORITY_BULK)
             
         # no reference snapshot found, only remove information about reference which makes this snapshot a reference    
         else:
             snapshot.refSnapshot = None
             snapshot.save()
             
+class DiffJob(models.Model):
+    """
+    A comparison to perform between a step snapshot and its reference
+    Jobs are stored in database so that they survive a server restart and can be shared by several diff workers (threads, processes or hosts)
+    A worker claims a job by writing its name in 'claimedBy' and setting 'leaseExpiration'. If the worker dies while computing,
+    lease expires and the job can be claimed by an other worker
+    Jobs are claimed by priority, then in creation order
+    """
+    
+    PRIORITY_INTERACTIVE = 0    # a user / test runner is waiting for the result
+    PRIORITY_NORMAL = 1         # snapshot uploaded and stored by a test
+    PRIORITY_BULK = 2           # recomputation of snapshots following a reference which changed
+    PRIORITIES = (
+        (PRIORITY_INTERACTIVE, 'interactive'),
+        (PRIORITY_NORMAL, 'normal'),
+        (PRIORITY_BULK, 'bulk'),
+    )
+    
+    refSnapshot = models.ForeignKey(Snapshot, related_name='diffJobsAsReference', null=True, on_delete=models.CASCADE)
+    stepSnapshot = models.ForeignKey(Snapshot, related_name='diffJobs', on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    claimedBy = models.CharField(max_length=150, null=True, blank=True)     # name of the worker computing this job
+    leaseExpiration = models.DateTimeField(null=True, blank=True)           # after this date, job may be claimed again by an other worker
+    attempts = models.PositiveSmallIntegerField(default=0)                  # number of times this job has been claimed
+    priority = models.PositiveSmallIntegerField(choices=PRIORITIES, default=PRIORITY_NORMAL)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['leaseExpiration', 'id'], name='diffjob_lease_idx'),
+            models.Index(fields=['priority', 'id'], name='diffjob_priority_idx'),
+        ]
+
+    def __str__(self):
+        return "diff job %d for snapshot %d" % (self.id, self.stepSnapshot_id)
+    
+class SnapshotReference(models.Model):
+    """
+    Index of the current reference snapshot for a test case / step / environment / browser / snapshot name, in each version
+    It allows to find the reference of an uploaded snapshot with a single query, instead of searching it version after version
+    Index is maintained when a snapshot is saved or deleted (see 'update_snapshot_reference' / 'delete_snapshot_reference')
+    """
+    application = models.ForeignKey(Application, related_name='snapshotReferences', on_delete=models.CASCADE)
+    testCaseName = models.CharField(max_length=150)
+    step = models.ForeignKey(TestStep, related_name='snapshotReferences', on_delete=models.CASCADE)
+    environment = models.ForeignKey(TestEnvironment, related_name='snapshotReferences', on_delete=models.CASCADE)
+    browser = models.CharField(max_length=100)
+    name = models.CharField(max_length=150)
+    version = models.ForeignKey(Version, related_name='snapshotReferences', on_delete=models.CASCADE)
+    snapshot = models.ForeignKey(Snapshot, related_name='snapshotReferences', on_delete=models.CASCADE)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['application', 'testCaseName', 'step', 'environment', 'browser', 'name', 'version'], name='unique_snapshot_reference')
+        ]
+        
+    def __str__(self):
+        return "reference %s - %s - %s for version %s: %d" % (self.testCaseName, self.name, self.browser, self.version_id, self.snapshot_id)
+    
+    @classmethod
+    def key_for(cls, snapshot):
+        """
+        Returns the fields identifying the reference group of the snapshot
+        """
+        test_case_in_session = snapshot.stepResult.testCase
+        session = test_case_in_session.session
+        return {'application_id': session.version.application_id,
+                'testCaseName': test_case_in_session.testCase.name,
+                'step_id': snapshot.stepResult.step_id,
+                'environment_id': session.environment_id,
+                'browser': session.browser,
+                'name': snapshot.name,
+                'version_id': session.version_id}
+    
+    @classmethod
+    def refresh(cls, key):
+        """
+        Point the index entry to the most recent reference snapshot of the group, or remove it if there is no reference anymore
+        """
+        reference = Snapshot.objects.filter(stepResult__step=key['step_id'],
+                                            stepResult__testCase__testCase__name=key['testCaseName'],
+                                            stepResult__testCase__session__version=key['version_id'],
+                                            stepResult__testCase__session__environment=key['environment_id'],
+                                            stepResult__testCase__session__browser=key['browser'],
+                                            refSnapshot=None,
+                                            name=key['name']).order_by('pk').last()
+        if reference:
+            cls.objects.update_or_create(defaults={'snapshot': reference}, **key)
+        else:
+            cls.objects.filter(**key).delete()
+    
+    @classmethod
+    def find_reference(cls, step_result, name):
+        """
+        Search the reference snapshot for a new snapshot of this step result, with the same test case / step / environment / browser / name
+        This is the most recent reference in the same version or, if none exists, in the greatest previous version
+        @return: the reference snapshot or None
+        """
+        session = step_result.testCase.session
+        current_version = version_sort_key(session.version.name)
+        
+        # same version first, then the greatest previous version, and the most recent reference in this version
+        reference = cls.objects.filter(Q(version=session.version_id) | Q(version__sortKey__lt=current_version),
+                                       application=session.version.application_id,
+                                       testCaseName=step_result.testCase.testCase.name,
+                                       step=step_result.step_id,
+                                       environment=session.environment_id,
+                                       browser__contains=session.browser,
+                                       name=name) \
+                            .select_related('snapshot') \
+                            .order_by(Case(When(version=session.version_id, then=Value(0)), default=Value(1)), '-version__sortKey', '-snapshot_id') \
+                            .first()
+                
+        return reference.snapshot if reference else None
+
+@receiver(post_save, sender=Snapshot)
+def update_snapshot_reference(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep reference index up to date when a snapshot becomes or is no more a reference
+    Other changes (e.g: comparison results) do not change the index
+    """
+    if update_fields is not None and not {'refSnapshot', 'refSnapshot_id', 'name'}.intersection(update_fields):
+        return
+    
+    previous_values = getattr(instance, '_reference_values', None)
+    instance._reference_values = instance.reference_values()
+    
+    if created:
+        changed = instance.refSnapshot_id is None
+    elif previous_values is None:
+        # values at loading are unknown
+        changed = instance.refSnapshot_id is None or SnapshotReference.objects.filter(snapshot=instance).exists()
+    else:
+        changed = previous_values != instance._reference_values
+    if not changed:
+        return
+    
+    try:
+        key = SnapshotReference.key_for(instance)
+        SnapshotReference.refresh(key)
+        
+        # a reference has been renamed, it's not the reference of its former group anymore
+        if previous_values and previous_values[1] != instance.name:
+            SnapshotReference.refresh(dict(key, name=previous_values[1]))
+    except ObjectDoesNotExist:
+        # fixture loading, related objects may not exist yet
+        pass
+
+@receiver(post_save, sender=TestSession)
+def update_session_snapshot_references(sender, instance, created, **kwargs):
+    """
+    When version, environment or browser of a session changes, its reference snapshots move to an other reference group
+    """
+    previous_values = getattr(instance, '_reference_values', None)
+    instance._reference_values = instance.reference_values()
+    if created or previous_values is None or previous_values == instance._reference_values:
+        return
+    
+    references = list(Snapshot.objects.filter(stepResult__testCase__session=instance, refSnapshot=None)
+                                      .select_related('stepResult__testCase__testCase', 'stepResult__testCase__session__version'))
+    
+    # groups the references belonged to, and groups they now belong to
+    keys = list(SnapshotReference.objects.filter(snapshot__in=references)
+                                         .values('application_id', 'testCaseName', 'step_id', 'environment_id', 'browser', 'name', 'version_id'))
+    keys += [SnapshotReference.key_for(snapshot) for snapshot in references]
+    for key in {tuple(sorted(key.items())) for key in keys}:
+        SnapshotReference.refresh(dict(key))
+
+@receiver(post_delete, sender=Snapshot)
+def delete_snapshot_reference(sender, instance, **kwargs):
+    """
+    When a reference is deleted, an older one may become the current reference
+    Key has been computed before deletion, see 'submission_delete'
+    """
+    reference_key = getattr(instance, 'reference_key', None)
+    if reference_key:
+        SnapshotReference.refresh(reference_key)
         
 class StepResult(models.Model):
     """
@@ -423,11 +738,371 @@ class StepResult(models.Model):
         else:
             return "result tmp"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        
+        # rollup of the test is updated with the difference between loaded and saved counts (see 'update_summary_from_step_result')
+        instance._summary_counts = instance.summary_counts()
+        return instance
+    
+    def summary_counts(self):
+        """
+        Counts this step result adds to the rollup of its test, or None if values are not loaded
+        @return: (test case in session id, counts)
+        """
+        if not {'testCase_id', 'result', 'duration'}.issubset(self.__dict__):
+            return None
+        return (self.testCase_id, {'stepsNumber': 1, 
+                                   'failedStepsNumber': 0 if self.result else 1, 
+                                   'duration': self.duration or 0.0})
+    
     step = models.ForeignKey(TestStep, related_name='stepresult', on_delete=models.CASCADE)
     testCase = models.ForeignKey(TestCaseInSession, related_name='stepresult', on_delete=models.CASCADE)
     result = models.BooleanField(null=False)
     duration = models.FloatField(default=0.0)
-    stacktrace = models.TextField(null=True)
+    stacktrace = models.TextField(null=True)                                            # step details, as JSON, sent by seleniumRobot
+    
+    # stacktrace, parsed once when step result is recorded (see parse_stacktrace)
+    details = models.JSONField(null=True, blank=True, editable=False)
+    timestamp = models.BigIntegerField(null=True, blank=True, db_index=True, editable=False) # start of the step, in milliseconds
+    failedAction = TruncatingCharField(max_length=250, null=True, blank=True, db_index=True, editable=False) # path to the action that failed (e.g: 'openPage>sendKeys on LoginPage.login'), if any
+    
+    def parse_stacktrace(self):
+        """
+        Parse the step details (stacktrace) and extract the fields that are searched
+        Files and snapshots referenced by the step are kept in 'attachments' list, so that they can be stored once step result is saved
+        """
+        self.details = None
+        self.timestamp = None
+        self.failedAction = None
+        self.attachments_to_store = []
+        
+        try:
+            details = json.loads(self.stacktrace)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(details, dict):
+            return
+        
+        self.details = details
+        self.timestamp = details.get('timestamp') if isinstance(details.get('timestamp'), int) else None
+        try:
+            self.failedAction = StepResult.search_failed_action(details, details.get('action', ''))[0]
+        except (KeyError, TypeError):
+            pass
+        
+        for snapshot in details.get('snapshots') or []:
+            self.attachments_to_store.append(StepResultAttachment(type=StepResultAttachment.SNAPSHOT, 
+                                                                  fileId=snapshot.get('idImage') or None, 
+                                                                  name=snapshot.get('name', ''),
+                                                                  snapshotCheckType=snapshot.get('snapshotCheckType')))
+        for file in (details.get('files') or []) + (details.get('harCaptures') or []):
+            self.attachments_to_store.append(StepResultAttachment(type=StepResultAttachment.FILE, 
+                                                                  fileId=file.get('id') or None, 
+                                                                  name=file.get('name', '')))
+            
+    def get_details(self):
+        """
+        Returns the step details
+        For step results whose stacktrace could not be parsed, it's parsed again, so that caller gets the parsing error
+        """
+        if self.details is None:
+            return json.loads(self.stacktrace)
+        return self.details
+    
+    @staticmethod
+    def search_failed_action(data, path=''):
+        """
+        Look for an action that has the 'failed' flag set to true and return the name and the exception message, if it's present
+        @return: (failed action path, exception, exception message, element description)
+        """
+
+        if 'actions' in data:
+
+            for action in data['actions']:
+
+                if action.get('type') == 'step' and 'actions' in action:
+                    failed_action, exception, exception_message, element = StepResult.search_failed_action(action, path + '>' + action['action'])
+                    if failed_action:
+                        return failed_action, exception, exception_message, element
+
+                if action.get('failed', False):
+                    if action.get('element', ''):
+                        return f"{path}>{action['action']} on {action['origin']}.{action['element']}", action.get('exception', None), action.get('exceptionMessage', None), action.get('elementDescription', '')
+                    else:
+                        return f"{path}>{action['action']} in {action['origin']}", action.get('exception', None), action.get('exceptionMessage', None), ''
+
+        return None, None, None, None
+    
+@receiver(pre_save, sender=StepResult)
+def parse_step_result_stacktrace(sender, instance, **kwargs):
+    """
+    Step details are parsed once, when step result is recorded, so that readers do not parse stacktrace again
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or 'stacktrace' in update_fields:
+        instance.parse_stacktrace()
+    
+@receiver(post_save, sender=StepResult)
+def store_step_result_attachments(sender, instance, **kwargs):
+    """
+    Replace the files / snapshots referenced by the step with the ones found by parse_stacktrace
+    """
+    if not hasattr(instance, 'attachments_to_store'):
+        return
+    
+    if not kwargs.get('created'):
+        StepResultAttachment.objects.filter(stepResult=instance).delete()
+    for attachment in instance.attachments_to_store:
+        attachment.stepResult = instance
+    StepResultAttachment.objects.bulk_create(instance.attachments_to_store)
+    del instance.attachments_to_store
+    
+class StepResultAttachment(models.Model):
+    """
+    A file (picture, HTML, video, network capture, ...) or a snapshot referenced by the details of a step result
+    Allows searching step results by file, without parsing their details
+    """
+    SNAPSHOT = 'snapshot'
+    FILE = 'file'
+    
+    stepResult = models.ForeignKey(StepResult, related_name='attachments', on_delete=models.CASCADE)
+    type = models.CharField(max_length=10, choices=((SNAPSHOT, SNAPSHOT), (FILE, FILE)))
+    fileId = models.IntegerField(null=True, db_index=True)                              # id of the File, None if file has not been uploaded
+    name = TruncatingCharField(max_length=150, default="", null=True)
+    snapshotCheckType = models.CharField(max_length=30, null=True)                      # for snapshots, the type of check requested (NONE, FULL, NONE_REFERENCE, ...)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['stepResult', 'type'], name='stepresultattachment_type_idx'),
+        ]
+    
+class TestCaseInSessionSummary(models.Model):
+    """
+    Rollup of the results of a test case in session (steps, duration, snapshots), so that summaries do not read every StepResult / Snapshot
+    It's updated with the difference of counts each time a step result or a snapshot is saved or deleted (see 'update_summary_from_step_result'
+    and 'update_summary_from_snapshot'). Rollups which do not exist (tests recorded before rollups existed) are computed when needed
+    """
+    testCase = models.OneToOneField(TestCaseInSession, related_name='summary', on_delete=models.CASCADE, primary_key=True)
+    stepsNumber = models.IntegerField(default=0)
+    failedStepsNumber = models.IntegerField(default=0)
+    duration = models.FloatField(default=0.0)                   # in milliseconds
+    snapshotsNumber = models.IntegerField(default=0)
+    snapshotComputingErrors = models.IntegerField(default=0)    # number of snapshots whose comparison failed
+    snapshotFailures = models.IntegerField(default=0)           # number of snapshots with too many differences
+    
+    def snapshotComparisonResult(self):
+        """
+        Same as TestCaseInSession.isOkWithSnapshots, from stored counts
+        """
+        if self.snapshotsNumber == 0:
+            return None
+        return TestCaseInSession.snapshotComparisonResult(self.snapshotComputingErrors, self.snapshotFailures)
+    
+    @classmethod
+    def refresh(cls, test_cases_in_session):
+        """
+        Recompute the rollup of the test cases with a fixed number of queries, whatever the number of test cases
+        @param test_cases_in_session: queryset or list of TestCaseInSession
+        @return: dict {test case in session id: TestCaseInSessionSummary}
+        """
+        test_cases_in_session = list(test_cases_in_session)
+        if not test_cases_in_session:
+            return {}
+        
+        step_counts = {count.pop('testCase'): count for count in StepResult.objects.filter(testCase__in=test_cases_in_session) 
+                                                                         .values('testCase')
+                                                                         .order_by()
+                                                                         .annotate(steps=Count('id'),
+                                                                                   failed_steps=Count('id', filter=Q(result=False)),
+                                                                                   duration=Sum('duration'))}
+        snapshot_counts = TestCaseInSession.snapshotCounts(test_cases_in_session)
+        
+        summaries = {}
+        for test_case_in_session in test_cases_in_session:
+            step_count = step_counts.get(test_case_in_session.id, {})
+            snapshot_count = snapshot_counts.get(test_case_in_session.id, {})
+            summaries[test_case_in_session.id] = cls(testCase=test_case_in_session,
+                                                     stepsNumber=step_count.get('steps', 0),
+                                                     failedStepsNumber=step_count.get('failed_steps', 0),
+                                                     duration=step_count.get('duration', 0.0),
+                                                     snapshotsNumber=snapshot_count.get('total', 0),
+                                                     snapshotComputingErrors=snapshot_count.get('computing_errors', 0),
+                                                     snapshotFailures=snapshot_count.get('failed', 0))
+        
+        cls.objects.bulk_create(summaries.values(), 
+                                update_conflicts=True, 
+                                unique_fields=['testCase'], 
+                                update_fields=['stepsNumber', 'failedStepsNumber', 'duration', 'snapshotsNumber', 'snapshotComputingErrors', 'snapshotFailures'])
+        
+        return summaries
+    
+    @classmethod
+    def apply_counts(cls, test_case_filter, previous_counts, counts, deleted=False):
+        """
+        Add the difference between new and previous counts of a step result / snapshot to the rollup of its test
+        @param test_case_filter: lookup of the test case in session, e.g: {'pk': 1} or {'stepresult': 2}
+        @param previous_counts: counts of the object when it was loaded, empty if object has been created
+        @param counts: counts of the object once saved, empty if object has been deleted
+        @param deleted: if True, a missing rollup is not computed (test case may be deleted too)
+        """
+        differences = {field: counts.get(field, 0) - previous_counts.get(field, 0) for field in set(counts) | set(previous_counts)}
+        differences = {field: difference for field, difference in differences.items() if difference}
+        if not differences:
+            return
+        
+        summaries = cls.objects.filter(**{'testCase__' + lookup: value for lookup, value in test_case_filter.items()})
+        if not summaries.update(**{field: F(field) + difference for field, difference in differences.items()}) and not deleted:
+            cls.refresh(TestCaseInSession.objects.filter(**test_case_filter))
+    
+    @classmethod
+    def for_test_cases(cls, test_cases_in_session):
+        """
+        Returns the rollup of each test case. Missing rollups (tests recorded before rollups existed) are computed and stored
+        @param test_cases_in_session: list of TestCaseInSession, with 'summary' selected (select_related) 
+        @return: dict {test case in session id: TestCaseInSessionSummary}
+        """
+        summaries = {}
+        missing = []
+        for test_case_in_session in test_cases_in_session:
+            try:
+                summaries[test_case_in_session.id] = test_case_in_session.summary
+            except ObjectDoesNotExist:
+                missing.append(test_case_in_session)
+                
+        summaries.update(cls.refresh(missing))
+        return summaries
+    
+class TestSessionSummary(models.Model):
+    """
+    Names of the tests of a session, so that session lists do not read the tests of each session
+    Results of a session are not stored: pages and APIs read them from the rollups of its test cases (TestCaseInSessionSummary)
+    """
+    session = models.OneToOneField(TestSession, related_name='summary', on_delete=models.CASCADE, primary_key=True)
+    testNames = models.TextField(default="")                    # comma separated list of test names
+    
+    @classmethod
+    def refresh(cls, session_ids, create=True):
+        """
+        Recompute the test names of the sessions
+        @param session_ids: ids of the sessions to refresh
+        @param create: if False, only existing rollups are updated
+        """
+        session_ids = set(session_ids)
+        if not session_ids:
+            return
+        
+        summaries = {session_id: cls(session_id=session_id) for session_id in session_ids}
+        test_names = {}
+        for session_id, test_name in TestCaseInSession.objects.filter(session__in=session_ids).order_by('pk').values_list('session', 'testCase__name'):
+            test_names.setdefault(session_id, []).append(test_name)
+        for session_id, names in test_names.items():
+            summaries[session_id].testNames = ",".join(names)
+            
+        if create:
+            cls.objects.bulk_create(summaries.values(), 
+                                    update_conflicts=True, 
+                                    unique_fields=['session'], 
+                                    update_fields=['testNames'])
+        else:
+            for summary in summaries.values():
+                cls.objects.filter(session=summary.session_id).update(testNames=summary.testNames)
+    
+def _deleted_with_test_case(origin):
+    """
+    Returns True if deletion has been requested on test cases or sessions, whose rollups are deleted too
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, (TestCaseInSession, TestSession))
+
+def _apply_summary_counts(previous_counts, counts, lookup, deleted=False):
+    """
+    @param previous_counts: (related id, counts) when object was loaded, or None
+    @param counts: (related id, counts) of the saved object, or None if object has been deleted
+    @param lookup: lookup of the related id, from TestCaseInSession
+    """
+    if previous_counts == counts:
+        return
+    if previous_counts and counts and previous_counts[0] != counts[0]:
+        TestCaseInSessionSummary.apply_counts({lookup: previous_counts[0]}, previous_counts[1], {})
+        previous_counts = None
+    if counts:
+        TestCaseInSessionSummary.apply_counts({lookup: counts[0]}, previous_counts[1] if previous_counts else {}, counts[1])
+    elif previous_counts:
+        TestCaseInSessionSummary.apply_counts({lookup: previous_counts[0]}, previous_counts[1], {}, deleted=deleted)
+
+@receiver(post_save, sender=StepResult)
+def update_summary_from_step_result(sender, instance, created, raw=False, **kwargs):
+    """
+    Step counts / duration of the test changed
+    """
+    if raw:
+        return
+    
+    previous_counts = getattr(instance, '_summary_counts', None)
+    instance._summary_counts = instance.summary_counts()
+    if not created and previous_counts is None:
+        # counts at loading are unknown
+        TestCaseInSessionSummary.refresh(TestCaseInSession.objects.filter(pk=instance.testCase_id))
+    else:
+        _apply_summary_counts(previous_counts, instance._summary_counts, 'pk')
+
+@receiver(post_delete, sender=StepResult)
+def update_summary_on_step_result_deletion(sender, instance, origin=None, **kwargs):
+    if origin is not None and _deleted_with_test_case(origin):
+        return
+    _apply_summary_counts(instance.summary_counts(), None, 'pk', deleted=True)
+
+@receiver(post_save, sender=Snapshot)
+def update_summary_from_snapshot(sender, instance, created, raw=False, **kwargs):
+    """
+    Snapshot verdict of the test changed (comparison done, snapshot becomes a reference, ...)
+    """
+    if raw:
+        return
+    
+    previous_counts = getattr(instance, '_summary_counts', None)
+    instance._summary_counts = instance.summary_counts()
+    if not created and previous_counts is None:
+        # counts at loading are unknown
+        TestCaseInSessionSummary.refresh(TestCaseInSession.objects.filter(stepresult=instance.stepResult_id))
+    else:
+        _apply_summary_counts(previous_counts, instance._summary_counts, 'stepresult')
+
+@receiver(post_delete, sender=Snapshot)
+def update_summary_on_snapshot_deletion(sender, instance, origin=None, **kwargs):
+    if origin is not None and _deleted_with_test_case(origin):
+        return
+    _apply_summary_counts(instance.summary_counts(), None, 'stepresult', deleted=True)
+
+@receiver(post_save, sender=TestCaseInSession)
+def update_session_summary(sender, instance, created, raw=False, **kwargs):
+    """
+    Session rollup (test names) is refreshed when a test is added, or its session / test case changes
+    """
+    if raw:
+        return
+    
+    previous_values = getattr(instance, '_summary_values', None)
+    instance._summary_values = instance.summary_values()
+    if created:
+        TestCaseInSessionSummary.objects.bulk_create([TestCaseInSessionSummary(testCase=instance)], ignore_conflicts=True)
+    elif previous_values is not None and previous_values == instance._summary_values:
+        return
+    
+    session_ids = {instance.session_id}
+    if previous_values:
+        session_ids.add(previous_values[0])
+    TestSessionSummary.refresh(session_ids)
+
+@receiver(post_delete, sender=TestCaseInSession)
+def update_session_summary_on_deletion(sender, instance, origin=None, **kwargs):
+    if origin is not None and issubclass(origin.model if isinstance(origin, QuerySet) else type(origin), TestSession):
+        return
+    
+    # session may be deleted too (e.g: deletion of its version), its rollup is only updated
+    TestSessionSummary.refresh({instance.session_id}, create=False)
     
 class ExcludeZone(models.Model):
     """
@@ -479,10 +1154,36 @@ class Error(models.Model):
     causedBy = TruncatingCharField(max_length=100, null=True)                   # the origin of error: 'Error message displayed', 'Field in error', 'The application has been modified', 'Error in selenium operation', 'unknown page'
     causeDetails = models.TextField(blank=True, default="")                     # additional information about the detected cause
     causeAnalysisErrors = models.TextField(blank=True, default="")              # a list of errors that may have raise during error cause analysis
-    relatedErrors = models.ManyToManyField('self')                              # errors related to this one
+    fingerprint = models.CharField(max_length=64, default="", db_index=True)    # hash of action, exception and normalized message, computed on save. Used for correlation
+    group = models.ForeignKey('ErrorGroup', related_name='errors', null=True, blank=True, on_delete=models.SET_NULL) # group of the same errors, see ErrorGroup
+    cluster = models.ForeignKey('ErrorCluster', related_name='errors', null=True, blank=True, on_delete=models.SET_NULL) # cluster of similar errors, see ErrorCluster
     
     def __str__(self):
         return f'Error {self.errorMessage} in {self.action}'
+    
+    @staticmethod
+    def normalize_message(error_message):
+        """
+        Message without formatting differences (white spaces, line breaks)
+        """
+        return ' '.join((error_message or '').split())
+    
+    def compute_fingerprint(self):
+        """
+        Returns the hash identifying the same errors: same action, same exception and same message
+        Values are hashed as they are stored (truncated)
+        """
+        action, exception, error_message = [self._meta.get_field(name).get_prep_value(getattr(self, name)) or '' 
+                                            for name in ('action', 'exception', 'errorMessage')]
+        return hashlib.sha256('\n'.join([action, exception, self.normalize_message(error_message)]).encode('utf-8')).hexdigest()
+    
+    def related_errors(self):
+        """
+        Returns the other errors of the group of this error
+        """
+        if self.group_id is None:
+            return Error.objects.none()
+        return Error.objects.filter(group=self.group_id).exclude(pk=self.pk)
 
 
     def friendly_message(self):
@@ -522,6 +1223,109 @@ class Error(models.Model):
         else:
             return "%s - %s" % (self.cause, self.causedBy)
 
+@receiver(pre_save, sender=Error)
+def compute_error_fingerprint(sender, instance, **kwargs):
+    instance.fingerprint = instance.compute_fingerprint()
+    
+class ErrorGroup(models.Model):
+    """
+    Group of the same errors (same fingerprint), raised by tests executed in the same time frame
+    Each error joins a single group, so that related errors are found and counted with a single indexed query
+    """
+    
+    # a group covers errors of tests executed in [firstSeen, firstSeen + TIME_FRAME]
+    TIME_FRAME = datetime.timedelta(seconds=3600)
+    
+    fingerprint = models.CharField(max_length=64)
+    firstSeen = models.DateTimeField()      # date of the first test with this error
+    lastSeen = models.DateTimeField()       # date of the last test with this error
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['fingerprint', 'firstSeen'], name='errorgroup_fingerprint_idx'),
+        ]
+    
+    def __str__(self):
+        return f'Error group {self.id}: {self.firstSeen} - {self.lastSeen}'
+    
+    @classmethod
+    def add_error(cls, error):
+        """
+        Put the error in the most recent group with the same fingerprint, whose time frame contains the date of the test. Else, a new group is created
+        The date of the test is used, not the current one, so that results uploaded late join the group of the time they were executed
+        @param error: a saved Error
+        @return: the group of the error
+        """
+        date = error.stepResult.testCase.date or timezone.now()
+        group = cls.objects.filter(fingerprint=error.fingerprint, firstSeen__lte=date, firstSeen__gte=date - cls.TIME_FRAME).order_by('-firstSeen').first()
+        
+        if group is None:
+            group = cls.objects.create(fingerprint=error.fingerprint, firstSeen=date, lastSeen=date)
+        elif group.lastSeen < date:
+            cls.objects.filter(pk=group.pk).update(lastSeen=date)
+            group.lastSeen = date
+            
+        error.group = group
+        Error.objects.filter(pk=error.pk).update(group=group)
+        return group
+
+class ErrorCluster(models.Model):
+    """
+    Errors with similar messages, once variable parts (numbers, ids, URLs, quoted values) are masked, whatever the session or application
+    Errors are put in a cluster when they are recorded, comparing their MinHash signature only with clusters sharing a bucket (see ErrorClustering)
+    """
+    
+    clustering = ErrorClustering()
+    
+    # minimal estimated similarity between an error and the first error of a cluster, to join this cluster
+    SIMILARITY_THRESHOLD = 0.8
+    
+    pattern = models.TextField(default="")          # exception and masked message of the first error of the cluster
+    signature = models.JSONField(default=list)      # MinHash signature of the first error of the cluster
+    firstSeen = models.DateTimeField()              # date of the first test with this error
+    lastSeen = models.DateTimeField()               # date of the last test with this error
+    
+    def __str__(self):
+        return f'Error cluster {self.id}: {self.pattern}'
+    
+    @classmethod
+    def add_error(cls, error):
+        """
+        Put the error in the most similar cluster, or in a new one if no cluster is similar enough
+        @param error: a saved Error
+        @return: the cluster of the error
+        """
+        date = error.stepResult.testCase.date or timezone.now()
+        pattern = cls.clustering.error_text(error.exception, error.errorMessage)
+        signature = cls.clustering.signature(pattern)
+        buckets = cls.clustering.buckets(signature)
+        
+        cluster = None
+        best_similarity = cls.SIMILARITY_THRESHOLD
+        for candidate in cls.objects.filter(buckets__key__in=buckets).distinct():
+            similarity = cls.clustering.similarity(signature, candidate.signature)
+            if similarity >= best_similarity:
+                cluster = candidate
+                best_similarity = similarity
+        
+        if cluster is None:
+            cluster = cls.objects.create(pattern=pattern, signature=signature, firstSeen=date, lastSeen=date)
+            ErrorClusterBucket.objects.bulk_create([ErrorClusterBucket(cluster=cluster, key=key) for key in buckets])
+        elif cluster.lastSeen < date:
+            cls.objects.filter(pk=cluster.pk).update(lastSeen=date)
+            cluster.lastSeen = date
+            
+        error.cluster = cluster
+        Error.objects.filter(pk=error.pk).update(cluster=cluster)
+        return cluster
+    
+class ErrorClusterBucket(models.Model):
+    """
+    Locality sensitive hashing bucket of a cluster. Each cluster is in one bucket per band of its signature
+    """
+    cluster = models.ForeignKey(ErrorCluster, related_name='buckets', on_delete=models.CASCADE)
+    key = models.CharField(max_length=24, db_index=True)
+
 
 
     
\ No newline at end of file
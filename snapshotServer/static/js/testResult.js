@@ -14,3 +14,33 @@ function runErrorAnalysis(currentTestId) {
     });
 }
 
+/**
+ * Load step bodies from server when a step is expanded
+ * Bodies are loaded by pages of 'pageSize' steps, so that expanding the next step does not require a new request
+ */
+function loadStepBodies(stepsUrl, pageSize) {
+    var loadedPages = {};
+
+    document.querySelectorAll('.lazy-step').forEach(function(element) {
+        element.addEventListener('show.bs.collapse', function() {
+            var page = Math.floor(element.dataset.stepIndex / pageSize) + 1;
+            if (loadedPages[page]) {
+                return;
+            }
+            loadedPages[page] = true;
+
+            $.getJSON(stepsUrl, {page: page, pageSize: pageSize}, function(data) {
+                data.steps.forEach(function(step) {
+                    // scripts of the body (snapshot comparison panel) are executed by jQuery
+                    var body = $('#step-body-' + step.id);
+                    body.html(step.html);
+                    body.find('[data-bs-toggle="popover"]').each(function() {
+                        new bootstrap.Popover(this);
+                    });
+                });
+            }).fail(function() {
+                loadedPages[page] = false;
+            });
+        });
+    });
+}
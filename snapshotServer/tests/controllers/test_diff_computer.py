@@ -4,6 +4,7 @@ Created on 15 mai 2017
 @author: bhecquet
 '''
 
+import datetime
 import os
 import time
 from unittest.mock import MagicMock, patch
@@ -11,8 +12,13 @@ from unittest.mock import MagicMock, patch
 from django.core.files.images import ImageFile
 
 from snapshotServer.controllers.diff_computer import DiffComputer
-from snapshotServer.models import Snapshot, StepResult, ExcludeZone
+from snapshotServer.controllers.diff_mask import DiffMask
+from snapshotServer.exceptions.diff_computer_busy_error import DiffComputerBusyError
+from snapshotServer.models import Snapshot, StepResult, ExcludeZone, DiffJob, TestCaseInSessionSummary
 from django.conf import settings
+from django.test.utils import override_settings
+from django.db import OperationalError
+from django.utils import timezone
 from snapshotServer.tests import SnapshotTestCase
 import shutil
 
@@ -97,9 +103,47 @@ class TestDiffComputer(SnapshotTestCase):
                 self.assertTrue(step_snapshot.tooManyDiffs)
                 self.assertEqual(step_snapshot.refSnapshot, ref_snapshot, "refSnapshot should have been updated")
                 
+                # compact mask and statistics are stored
+                step_snapshot.refresh_from_db()
+                diff_mask = DiffMask.decode(step_snapshot.pixelsDiff)
+                self.assertTrue(bytes(step_snapshot.pixelsDiff).startswith(DiffMask.MAGIC))
+                self.assertEqual(diff_mask.pixel_count(), step_snapshot.diffPixelCount)
+                self.assertTrue(step_snapshot.diffPixelCount > 0)
+                self.assertAlmostEqual(diff_mask.percentage(), step_snapshot.diffPercentage)
+                self.assertTrue(len(step_snapshot.diffBoxes) > 0)
+                
                 self.assertTrue(step_snapshot.computed)
                 self.assertTrue(step_snapshot.computingError == '')
          
+    def test_compute_diff_same_content(self):
+        """
+        Check pictures are not compared when hashes show they are identical
+        """
+        with open("snapshotServer/tests/data/test_Image1.png", 'rb') as reference:
+            img_reference = ImageFile(reference)
+            ref_snapshot = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None, fileHash='abc', pixelHash='def')
+            ref_snapshot.save()
+            ref_snapshot.image.save("img", img_reference)
+            ref_snapshot.save()
+            step_snapshot = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=b'old', tooManyDiffs=True, fileHash='abd', pixelHash='def')
+            step_snapshot.save()
+            step_snapshot.image.save("img", img_reference)
+            step_snapshot.save()
+     
+            with patch.object(DiffComputer.picture_comparator, 'get_changed_pixels') as get_changed_pixels:
+                DiffComputer.get_instance().compute_now(ref_snapshot, step_snapshot)
+                get_changed_pixels.assert_not_called()
+     
+            step_snapshot.refresh_from_db()
+            self.assertIsNone(step_snapshot.pixelsDiff)
+            self.assertEqual(step_snapshot.diffPixelCount, 0)
+            self.assertEqual(step_snapshot.diffPercentage, 0.0)
+            self.assertEqual(step_snapshot.diffBoxes, [])
+            self.assertFalse(step_snapshot.tooManyDiffs)
+            self.assertEqual(step_snapshot.refSnapshot, ref_snapshot)
+            self.assertTrue(step_snapshot.computed)
+            self.assertEqual(step_snapshot.computingError, '')
+         
     def test_compute_diff_with_tolerance_higher_than_difference(self):
         """
         Check that even with differences, as tolerance is higher, images are considered the same
@@ -145,6 +189,11 @@ class TestDiffComputer(SnapshotTestCase):
                 # something has been computed
                 self.assertIsNotNone(step_snapshot.pixelsDiff)
                 self.assertTrue(step_snapshot.tooManyDiffs)
+                
+                # test rollup gets the snapshot verdict
+                summary = TestCaseInSessionSummary.objects.get(testCase=step_snapshot.stepResult.testCase)
+                self.assertEqual(1, summary.snapshotFailures)
+                self.assertFalse(summary.snapshotComparisonResult())
 
          
     def test_ref_is_none(self):
@@ -202,29 +251,298 @@ class TestDiffComputer(SnapshotTestCase):
             s3.image.save("img", img)
             s3.save()
      
-            diff_computer = DiffComputer.get_instance()
+            # worker is not started as database is not shared between threads in tests
+            diff_computer = DiffComputer()
             diff_computer.add_jobs(s1, s2, check_test_mode=False)
             diff_computer.add_jobs(s1, s3, check_test_mode=False)
-            time.sleep(1)
-            diff_computer.stopThread()
+            
+            # jobs are stored in database
+            self.assertEqual(DiffJob.objects.count(), 2)
+            self.assertFalse(Snapshot.objects.get(id=s2.id).computed)
+            
+            while diff_computer.process_next_job():
+                pass
              
             # something has been computed
-            self.assertIsNotNone(s2.pixelsDiff)
-            self.assertIsNotNone(s3.pixelsDiff)
+            self.assertIsNotNone(Snapshot.objects.get(id=s2.id).pixelsDiff)
+            self.assertIsNotNone(Snapshot.objects.get(id=s3.id).pixelsDiff)
+            self.assertTrue(Snapshot.objects.get(id=s3.id).computed)
+            self.assertEqual(Snapshot.objects.get(id=s3.id).refSnapshot, s1)
+            self.assertEqual(DiffJob.objects.count(), 0, "jobs should be deleted once computed")
+         
+    def test_add_jobs_twice(self):
+        """
+        Check that a pending job is reused when the same snapshot is added again, with the last reference
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        s3 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s3.save()
+        
+        diff_computer = DiffComputer()
+        diff_computer.add_jobs(s1, s3, check_test_mode=False)
+        diff_computer.add_jobs(s2, s3, check_test_mode=False)
+        
+        self.assertEqual(DiffJob.objects.count(), 1)
+        self.assertEqual(DiffJob.objects.all()[0].refSnapshot, s2)
+        
+    def test_add_jobs_twice_keeps_highest_priority(self):
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        
+        diff_computer = DiffComputer()
+        diff_computer.add_jobs(s1, s2, check_test_mode=False, priority=DiffJob.PRIORITY_NORMAL)
+        diff_computer.add_jobs(s1, s2, check_test_mode=False, priority=DiffJob.PRIORITY_BULK)
+        self.assertEqual(DiffJob.objects.get().priority, DiffJob.PRIORITY_NORMAL)
+        
+        diff_computer.add_jobs(s1, s2, check_test_mode=False, priority=DiffJob.PRIORITY_INTERACTIVE)
+        self.assertEqual(DiffJob.objects.get().priority, DiffJob.PRIORITY_INTERACTIVE)
+        
+    def test_claim_job_by_priority(self):
+        """
+        Check jobs are claimed by priority, then the oldest first
+        """
+        snapshots = []
+        for i in range(4):
+            snapshot = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+            snapshot.save()
+            snapshots.append(snapshot)
+        
+        diff_computer = DiffComputer()
+        diff_computer.add_jobs(snapshots[0], snapshots[1], check_test_mode=False, priority=DiffJob.PRIORITY_BULK)
+        diff_computer.add_jobs(snapshots[0], snapshots[2], check_test_mode=False)
+        diff_computer.add_jobs(snapshots[0], snapshots[3], check_test_mode=False, priority=DiffJob.PRIORITY_INTERACTIVE)
+        
+        self.assertEqual([diff_computer._claim_job().stepSnapshot for i in range(3)], [snapshots[3], snapshots[2], snapshots[1]])
+        
+    def test_compute_now_too_many_computations(self):
+        """
+        Check synchronous computing is refused when limit is reached, and accepted again when a computing ends
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        
+        diff_computer = DiffComputer()
+        with self.settings(DIFF_SYNC_COMPUTATION_MAX=1, DIFF_SYNC_RETRY_AFTER=5):
+            DiffComputer._acquire_sync_slot()
+            try:
+                with self.assertRaises(DiffComputerBusyError) as context:
+                    diff_computer.compute_now(s1, s2)
+                self.assertEqual(context.exception.retry_after, 5)
+                self.assertFalse(Snapshot.objects.get(id=s2.id).computed)
+            finally:
+                DiffComputer._release_sync_slot()
+                
+            diff_computer.compute_now(s1, s2)
+            self.assertTrue(Snapshot.objects.get(id=s2.id).computed)
+            self.assertEqual(DiffComputer._sync_computations, 0)
+        
+    def test_compute_now_without_limit(self):
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        
+        with self.settings(DIFF_SYNC_COMPUTATION_MAX=None):
+            DiffComputer().compute_now(s1, s2)
+        self.assertTrue(Snapshot.objects.get(id=s2.id).computed)
+        
+    def test_add_jobs_while_computing(self):
+        """
+        Check that a new job is created if the snapshot is being computed, as reference may have changed
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        
+        diff_computer = DiffComputer()
+        diff_computer.add_jobs(s1, s2, check_test_mode=False)
+        self.assertIsNotNone(diff_computer._claim_job())
+        diff_computer.add_jobs(s1, s2, check_test_mode=False)
+        
+        self.assertEqual(DiffJob.objects.count(), 2)
+        
+    def test_claim_job(self):
+        """
+        Check a job claimed by a worker cannot be claimed by an other one until its lease expires
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        
+        worker1 = DiffComputer()
+        worker2 = DiffComputer()
+        worker1.add_jobs(s1, s2, check_test_mode=False)
+        
+        job = worker1._claim_job()
+        self.assertEqual(job.stepSnapshot, s2)
+        self.assertEqual(job.claimedBy, worker1.worker_name)
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.leaseExpiration > timezone.now())
+        self.assertIsNone(worker2._claim_job())
+        
+        # worker1 died, lease expires
+        DiffJob.objects.filter(pk=job.pk).update(leaseExpiration=timezone.now() - datetime.timedelta(seconds=1))
+        job = worker2._claim_job()
+        self.assertEqual(job.claimedBy, worker2.worker_name)
+        self.assertEqual(job.attempts, 2)
+        
+    def test_job_aborted_after_too_many_attempts(self):
+        """
+        Check that a job which has been claimed too many times (e.g: worker crash) is not computed anymore
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        DiffJob(refSnapshot=s1, stepSnapshot=s2, attempts=settings.DIFF_JOB_MAX_ATTEMPTS).save()
+        
+        diff_computer = DiffComputer()
+        diff_computer._compute_diff = MagicMock()
+        self.assertTrue(diff_computer.process_next_job())
+        
+        diff_computer._compute_diff.assert_not_called()
+        self.assertTrue(Snapshot.objects.get(id=s2.id).computed)
+        self.assertEqual(Snapshot.objects.get(id=s2.id).computingError, "Computing aborted after 3 attempts")
+        self.assertEqual(DiffJob.objects.count(), 0)
+        
+    def test_process_without_job(self):
+        """
+        Check nothing happens when there is no job
+        """
+        self.assertFalse(DiffComputer().process_next_job())
+        
+    def test_requeue_uncomputed_snapshots(self):
+        """
+        Check snapshots with a reference that have not been computed (server stopped) get a job
+        Snapshots already computed, references or already having a job are not requeued
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=s1, pixelsDiff=None, computed=False)
+        s2.save()
+        s3 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=s1, pixelsDiff=None, computed=True)
+        s3.save()
+        s4 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=s1, pixelsDiff=None, computed=False)
+        s4.save()
+        DiffJob(refSnapshot=s1, stepSnapshot=s4).save()
+        
+        DiffComputer().requeue_uncomputed_snapshots()
+        
+        self.assertEqual(DiffJob.objects.filter(stepSnapshot=s2, refSnapshot=s1).count(), 1)
+        self.assertEqual(DiffJob.objects.filter(stepSnapshot=s4).count(), 1)
+        self.assertEqual(DiffJob.objects.count(), 2)
+        
+    def test_compute_now_removes_pending_job(self):
+        """
+        Check that computing a snapshot synchronously removes the job waiting for it
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        
+        diff_computer = DiffComputer()
+        diff_computer.add_jobs(s1, s2, check_test_mode=False)
+        diff_computer.compute_now(s1, s2)
+        
+        self.assertEqual(DiffJob.objects.count(), 0)
          
     def test_error_while_computing(self):
         """
-        Check that if an error occurs during computing, 
+        Check that if an error occurs during computing, job is removed
         """
         s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
         s1.save()
         s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
         s2.save()
-        diff_computer = DiffComputer.get_instance()
+        diff_computer = DiffComputer()
         diff_computer._compute_diff = MagicMock(side_effect=Exception("error while computing"))
         diff_computer.add_jobs(s1, s2, check_test_mode=False)
+        with self.assertRaises(Exception):
+            diff_computer.process_next_job()
+        self.assertEqual(DiffJob.objects.count(), 0)
+        
+    def test_error_while_computing_in_thread(self):
+        """
+        Check that if an error occurs during computing, thread is still running
+        """
+        diff_computer = DiffComputer.get_instance()
+        diff_computer.process_next_job = MagicMock(side_effect=Exception("error while computing"))
         time.sleep(0.7)
         self.assertIsNotNone(diff_computer._instance, "thread should still be running")
+        self.assertTrue(diff_computer.is_alive())
+        
+    @override_settings(DIFF_WORKER_MAX_IDLE_WAIT=3)
+    def test_idle_wait_grows(self):
+        """
+        Check that, when there is no job, worker waits longer and longer before querying database again, up to DIFF_WORKER_MAX_IDLE_WAIT
+        """
+        diff_computer = DiffComputer()
+        diff_computer.process_next_job = MagicMock(return_value=False)
+        
+        waits = []
+        def wait(timeout):
+            waits.append(timeout)
+            diff_computer.running = len(waits) < 5
+            return False
+        
+        with patch.object(DiffComputer, '_job_added') as job_added:
+            job_added.wait.side_effect = wait
+            diff_computer.run()
+            
+        self.assertEqual(waits, [0.5, 1, 2, 3, 3])
+        
+    @override_settings(DIFF_WORKER_MAX_IDLE_WAIT=3)
+    def test_idle_wait_reset(self):
+        """
+        Check that worker polls quickly again once a job has been added or processed
+        """
+        diff_computer = DiffComputer()
+        diff_computer.process_next_job = MagicMock(side_effect=[False, False, False, True, False, False])
+        
+        waits = []
+        def wait(timeout):
+            waits.append(timeout)
+            diff_computer.running = len(waits) < 4
+            return len(waits) == 2  # job added while waiting
+        
+        with patch.object(DiffComputer, '_job_added') as job_added:
+            job_added.wait.side_effect = wait
+            diff_computer.run()
+            
+        self.assertEqual(waits, [0.5, 1, 0.5, 0.5])
+        
+    def test_claim_job_database_locked(self):
+        """
+        Check that a locked database is not an error: worker will try to claim the job later
+        """
+        diff_computer = DiffComputer()
+        diff_computer._compute_diff = MagicMock()
+        with patch.object(diff_computer, '_claim_job', side_effect=OperationalError("database table is locked: snapshotServer_diffjob")):
+            self.assertFalse(diff_computer.process_next_job())
+        diff_computer._compute_diff.assert_not_called()
+        
+    def test_add_job_wakes_worker(self):
+        """
+        Check that the waiting worker is woken up when a job is stored
+        """
+        s1 = Snapshot(stepResult=StepResult.objects.get(id=1), refSnapshot=None, pixelsDiff=None)
+        s1.save()
+        s2 = Snapshot(stepResult=StepResult.objects.get(id=2), refSnapshot=None, pixelsDiff=None)
+        s2.save()
+        
+        DiffComputer._job_added.clear()
+        DiffComputer().add_jobs(s1, s2, check_test_mode=False)
+        self.assertTrue(DiffComputer._job_added.is_set())
          
     def test_error_while_computing_computed_flag_set(self):
         """
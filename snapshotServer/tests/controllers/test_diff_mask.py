@@ -0,0 +1,74 @@
+import cv2
+import numpy
+from numpy import uint8
+
+from snapshotServer.controllers.diff_mask import DiffMask
+from snapshotServer.tests import SnapshotTestCase
+
+class TestDiffMask(SnapshotTestCase):
+
+    def _build_mask(self):
+        mask = numpy.zeros((100, 200), dtype=bool)
+        mask[10:20, 30:50] = True   # 200 pixels
+        mask[60, 150:155] = True    # 5 pixels
+        return mask
+
+    def test_encode_decode(self):
+        diff_mask = DiffMask(self._build_mask())
+        data = diff_mask.encode()
+
+        self.assertTrue(data.startswith(DiffMask.MAGIC))
+        self.assertTrue(len(data) < 200, "mask should be compact")
+
+        decoded_mask = DiffMask.decode(data)
+        self.assertEqual(decoded_mask.width, 200)
+        self.assertEqual(decoded_mask.height, 100)
+        self.assertTrue((decoded_mask.mask == diff_mask.mask).all())
+
+    def test_decode_memoryview(self):
+        """
+        Binary fields may be read as memoryview from database
+        """
+        diff_mask = DiffMask(self._build_mask())
+        self.assertEqual(DiffMask.decode(memoryview(diff_mask.encode())).pixel_count(), 205)
+
+    def test_decode_legacy_png(self):
+        """
+        Difference pictures stored as PNG before compact masks can still be read
+        """
+        diff_image = numpy.zeros((100, 200, 4), dtype=uint8)
+        diff_image[self._build_mask()] = [0, 0, 255, 255]
+        is_success, buffer = cv2.imencode(".png", diff_image)
+
+        decoded_mask = DiffMask.decode(buffer.tobytes())
+        self.assertTrue((decoded_mask.mask == self._build_mask()).all())
+
+    def test_decode_invalid(self):
+        self.assertIsNone(DiffMask.decode(None))
+        self.assertIsNone(DiffMask.decode(b''))
+        self.assertIsNone(DiffMask.decode(b'some data'))
+
+    def test_from_diff_image(self):
+        diff_image = numpy.zeros((100, 200, 4), dtype=uint8)
+        diff_image[self._build_mask()] = [0, 0, 255, 255]
+
+        self.assertTrue((DiffMask.from_diff_image(diff_image).mask == self._build_mask()).all())
+
+    def test_statistics(self):
+        diff_mask = DiffMask(self._build_mask())
+        self.assertEqual(diff_mask.pixel_count(), 205)
+        self.assertAlmostEqual(diff_mask.percentage(), 1.025)
+
+    def test_bounding_boxes(self):
+        diff_mask = DiffMask(self._build_mask())
+        self.assertEqual(diff_mask.bounding_boxes(), [[30, 10, 20, 10], [150, 60, 5, 1]])
+        self.assertEqual(diff_mask.bounding_boxes(max_boxes=1), [[30, 10, 20, 10]])
+
+    def test_bounding_boxes_no_diff(self):
+        self.assertEqual(DiffMask(numpy.zeros((10, 10), dtype=bool)).bounding_boxes(), [])
+
+    def test_to_png(self):
+        diff_image = cv2.imdecode(numpy.frombuffer(DiffMask(self._build_mask()).to_png(), dtype=uint8), cv2.IMREAD_UNCHANGED)
+        self.assertEqual(diff_image.shape, (100, 200, 4))
+        self.assertEqual(diff_image[15, 40].tolist(), [0, 0, 255, 255])
+        self.assertEqual(diff_image[0, 0].tolist(), [0, 0, 0, 0])
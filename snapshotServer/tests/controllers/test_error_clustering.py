@@ -0,0 +1,48 @@
+from snapshotServer.controllers.error_clustering import ErrorClustering
+from snapshotServer.tests import SnapshotTestCase
+
+
+class TestErrorClustering(SnapshotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clustering = ErrorClustering()
+
+    def test_mask(self):
+        self.assertEqual("element at (<num>, <num>) not found on <url> after <num> seconds",
+                         self.clustering.mask("Element at (12, 455) not found on https://myapp/login?session=12 after 1.5 seconds"))
+        self.assertEqual("session <uuid> closed", self.clustering.mask("Session 3f2a9c1e-1234-4abc-9def-0123456789ab closed"))
+        self.assertEqual("object <hex> at <hex>", self.clustering.mask("Object deadbeef1234 at 0x7ffe"))
+        self.assertEqual("field <str> is empty, <str> expected", self.clustering.mask("""Field 'login' is empty, "foo bar" expected"""))
+        self.assertEqual("", self.clustering.mask(None))
+
+    def test_signature_same_masked_messages(self):
+        signature1 = self.clustering.signature(self.clustering.error_text("NoSuchElementException", "Element #12 not found after 10 seconds"))
+        signature2 = self.clustering.signature(self.clustering.error_text("NoSuchElementException", "Element #45 not found after 30 seconds"))
+
+        self.assertEqual(64, len(signature1))
+        self.assertEqual(1.0, self.clustering.similarity(signature1, signature2))
+        self.assertEqual(self.clustering.buckets(signature1), self.clustering.buckets(signature2))
+
+    def test_signature_similar_messages(self):
+        """
+        Similar messages share buckets, different ones do not
+        """
+        signature1 = self.clustering.signature("element not found on page LoginPage after waiting for the element to be displayed")
+        signature2 = self.clustering.signature("element not found on page HomePage after waiting for the element to be displayed")
+        signature3 = self.clustering.signature("expected true but found false")
+
+        self.assertTrue(self.clustering.similarity(signature1, signature2) > 0.7)
+        self.assertTrue(set(self.clustering.buckets(signature1)) & set(self.clustering.buckets(signature2)))
+        self.assertTrue(self.clustering.similarity(signature1, signature3) < 0.2)
+        self.assertFalse(set(self.clustering.buckets(signature1)) & set(self.clustering.buckets(signature3)))
+
+    def test_buckets(self):
+        buckets = self.clustering.buckets(self.clustering.signature("some text"))
+        self.assertEqual(16, len(buckets))
+        self.assertEqual('0:', buckets[0][:2])
+        self.assertEqual('15:', buckets[15][:3])
+
+    def test_invalid_bands(self):
+        with self.assertRaises(ValueError):
+            ErrorClustering(permutations=64, bands=10)
@@ -6,12 +6,19 @@ Created on 8 mars 2017
 
 from snapshotServer.utils.utils import getTestDirectory
 from snapshotServer.controllers.picture_comparator import Pixel, Rectangle
-from snapshotServer.controllers.picture_comparator import PictureComparator
+from snapshotServer.controllers.picture_comparator import PictureComparator, compute_picture_hashes, decode_picture
 from snapshotServer.exceptions.picture_comparator_error import PictureComparatorError
+import io
+import logging
+import time
 import numpy
 from numpy import uint8
+from PIL import Image
 from snapshotServer.tests import SnapshotTestCase
 from django.test import override_settings
+from unittest import mock
+
+logger = logging.getLogger(__name__)
 
 @override_settings(IMAGE_COMPARISON_THRESHOLD=0)
 class TestPictureComparator(SnapshotTestCase):
@@ -51,6 +58,70 @@ class TestPictureComparator(SnapshotTestCase):
         rect = comparator.compare(self.dataDir + 'Ibis_Mulhouse.png', self.dataDir + 'engie.png')
         self.assertEqual(rect, None, "A matching should not have been found")
    
+    def test_compare_sample_image_exhaustive(self):
+        comparator = PictureComparator();
+        rect = comparator.compare(self.dataDir + 'Ibis_Mulhouse.png', self.dataDir + 'template_Ibis_Mulhouse.png', pyramid_levels=0)
+        self.assertEqual(rect, Rectangle(467, 244, 942, 545))
+        
+    def test_compare_exhaustive_by_default(self):
+        """
+        Multi-scale search is only done when requested
+        """
+        comparator = PictureComparator();
+        with mock.patch.object(PictureComparator, '_pyramid_match') as pyramid_match:
+            rect = comparator.compare(self.dataDir + 'Ibis_Mulhouse.png', self.dataDir + 'template_Ibis_Mulhouse.png')
+            
+        pyramid_match.assert_not_called()
+        self.assertEqual(rect, Rectangle(467, 244, 942, 545))
+        
+    def test_compare_pyramid_same_result_as_exhaustive(self):
+        """
+        Multi-scale search gives the same results as exhaustive search on test pictures
+        Time spent by each search is logged
+        """
+        comparator = PictureComparator();
+        for reference, image in [('Ibis_Mulhouse.png', 'template_Ibis_Mulhouse.png'),
+                                 ('Ibis_Mulhouse_diff.png', 'template_Ibis_Mulhouse.png'),
+                                 ('Ibis_Mulhouse.png', 'Ibis_Mulhouse.png'),
+                                 ('Ibis_Mulhouse.png', 'engie.png'),
+                                 ('test_Image1.png', 'test_Image1Crop.png')]:
+            start = time.perf_counter()
+            expected_rect = comparator.compare(self.dataDir + reference, self.dataDir + image, pyramid_levels=0)
+            exhaustive_duration = time.perf_counter() - start
+            
+            for levels in (1, 2, 3, 6):
+                start = time.perf_counter()
+                rect = comparator.compare(self.dataDir + reference, self.dataDir + image, pyramid_levels=levels)
+                duration = time.perf_counter() - start
+                self.assertEqual(rect, expected_rect, f"{reference} / {image} with {levels} levels")
+                logger.info(f"compare {reference} / {image}: exhaustive {exhaustive_duration * 1000:.1f} ms, {levels} levels {duration * 1000:.1f} ms")
+            
+    def test_compare_pyramid_does_not_search_whole_picture(self):
+        """
+        With pyramid, full resolution pictures are only compared in small windows
+        """
+        comparator = PictureComparator();
+        with mock.patch.object(PictureComparator, '_match', wraps=comparator._match) as match:
+            rect = comparator.compare(self.dataDir + 'Ibis_Mulhouse.png', self.dataDir + 'template_Ibis_Mulhouse.png', pyramid_levels=3)
+            
+        self.assertEqual(rect, Rectangle(467, 244, 942, 545))
+        for call in match.call_args_list:
+            reference_img, image_img = call.args
+            if image_img.shape == (545, 942):
+                self.assertTrue(reference_img.shape[0] <= 545 + 2 * PictureComparator.PYRAMID_MARGIN)
+                self.assertTrue(reference_img.shape[1] <= 942 + 2 * PictureComparator.PYRAMID_MARGIN)
+            
+    def test_compare_pyramid_fallback(self):
+        """
+        When no candidate is found with pyramid, exhaustive search is done
+        """
+        comparator = PictureComparator();
+        with mock.patch.object(PictureComparator, '_pyramid_match', return_value=None) as pyramid_match:
+            rect = comparator.compare(self.dataDir + 'Ibis_Mulhouse.png', self.dataDir + 'template_Ibis_Mulhouse.png', pyramid_levels=3)
+            
+        pyramid_match.assert_called_once()
+        self.assertEqual(rect, Rectangle(467, 244, 942, 545))
+   
     def test_compare_with_greater_image(self):
         comparator = PictureComparator();
         self.assertRaisesRegex(PictureComparatorError, 
@@ -82,6 +153,24 @@ class TestPictureComparator(SnapshotTestCase):
         self.assertEqual(int(diff_percentage), 0)
            
           
+    def test_diff_with_decoded_picture(self):
+        """
+        Image to compare may be given already decoded, as for uploaded pictures which are not stored
+        """
+        comparator = PictureComparator()
+        expected_pixels, expected_percentage, expected_image = comparator.get_changed_pixels(self.dataDir + 'Ibis_Mulhouse.png', self.dataDir + 'Ibis_Mulhouse_diff.png')
+        
+        with open(self.dataDir + 'Ibis_Mulhouse_diff.png', 'rb') as picture_file:
+            picture = decode_picture(picture_file)
+            self.assertEqual(picture_file.tell(), 0, "file should be rewound")
+        diff_pixels, diff_percentage, diff_image = comparator.get_changed_pixels(self.dataDir + 'Ibis_Mulhouse.png', picture)
+        
+        self.assertEqual(diff_percentage, expected_percentage)
+        self.assertTrue((diff_image == expected_image).all())
+        
+    def test_decode_invalid_picture(self):
+        self.assertIsNone(decode_picture(io.BytesIO(b'not a picture')))
+          
     def test_real_diff(self):
         comparator = PictureComparator()
         diff_pixels, diff_percentage, diff_image = comparator.get_changed_pixels(self.dataDir + 'Ibis_Mulhouse.png', self.dataDir + 'Ibis_Mulhouse_diff.png')
@@ -326,4 +415,87 @@ class TestPictureComparator(SnapshotTestCase):
         
         
         
-        
\ No newline at end of file
+        
+        
+    def test_compute_picture_hashes(self):
+        with open(self.dataDir + 'Ibis_Mulhouse.png', 'rb') as picture:
+            file_hash, pixel_hash = compute_picture_hashes(picture)
+            self.assertEqual(picture.tell(), 0, "file should be rewinded so that it can be stored")
+        with open(self.dataDir + 'Ibis_Mulhouse.png', 'rb') as picture:
+            self.assertEqual(compute_picture_hashes(picture), (file_hash, pixel_hash))
+        with open(self.dataDir + 'Ibis_Mulhouse_diff.png', 'rb') as picture:
+            other_file_hash, other_pixel_hash = compute_picture_hashes(picture)
+            
+        self.assertEqual(len(file_hash), 64)
+        self.assertEqual(len(pixel_hash), 64)
+        self.assertNotEqual(file_hash, other_file_hash)
+        self.assertNotEqual(pixel_hash, other_pixel_hash)
+        
+    def test_compute_picture_hashes_same_pixels(self):
+        """
+        The same pixels, encoded differently, give the same pixel hash
+        """
+        with open(self.dataDir + 'Ibis_Mulhouse.png', 'rb') as picture:
+            file_hash, pixel_hash = compute_picture_hashes(picture)
+            
+        with open(self.dataDir + 'Ibis_Mulhouse.png', 'rb') as picture:
+            buffer = io.BytesIO()
+            Image.open(picture).save(buffer, format='PNG', compress_level=1)
+            other_file_hash, other_pixel_hash = compute_picture_hashes(buffer)
+            
+        self.assertNotEqual(file_hash, other_file_hash)
+        self.assertEqual(pixel_hash, other_pixel_hash)
+        
+    def test_compute_picture_hashes_invalid_picture(self):
+        file_hash, pixel_hash = compute_picture_hashes(io.BytesIO(b'not a picture'))
+        self.assertEqual(len(file_hash), 64)
+        self.assertEqual(pixel_hash, '')
+        
+    def test_build_exclusion_mask(self):
+        comparator = PictureComparator()
+        mask = comparator._build_exclusion_mask([Rectangle(2, 1, 3, 2), Rectangle(8, 5, 5, 5)], 10, 8)
+        
+        expected = numpy.ones((8, 10), dtype=uint8)
+        for x, y in [(2, 1), (3, 1), (4, 1), (2, 2), (3, 2), (4, 2)] + [(x, y) for x in range(8, 10) for y in range(5, 8)]:
+            expected[y, x] = 0
+        self.assertTrue((mask == expected).all())
+        self.assertFalse(mask.flags.writeable)
+        
+    def test_build_exclusion_mask_zones_outside_image(self):
+        """
+        Zones are clipped to the image
+        """
+        comparator = PictureComparator()
+        mask = comparator._build_exclusion_mask([Rectangle(-2, -2, 3, 3), Rectangle(20, 20, 5, 5)], 10, 8)
+        
+        self.assertEqual(mask.shape, (8, 10))
+        self.assertEqual(mask[0, 0], 0)
+        self.assertEqual(mask[0, 1], 1)
+        self.assertEqual(mask[1, 0], 1)
+        self.assertEqual(numpy.count_nonzero(mask == 0), 1)
+        
+    def test_build_exclusion_mask_no_zone(self):
+        self.assertIsNone(PictureComparator()._build_exclusion_mask([], 10, 8))
+        
+    def test_build_exclusion_mask_cached(self):
+        """
+        Mask is reused for the same zones, whatever their order
+        """
+        comparator = PictureComparator()
+        mask = comparator._build_exclusion_mask([Rectangle(2, 1, 3, 2), Rectangle(8, 5, 5, 5)], 10, 8)
+        self.assertIs(comparator._build_exclusion_mask([Rectangle(8, 5, 5, 5), Rectangle(2, 1, 3, 2)], 10, 8), mask)
+        self.assertIsNot(comparator._build_exclusion_mask([Rectangle(2, 1, 3, 2), Rectangle(8, 5, 5, 5)], 10, 9), mask)
+        self.assertIsNot(comparator._build_exclusion_mask([Rectangle(2, 1, 3, 2)], 10, 8), mask)
+        
+    def test_build_exclusion_mask_cache_memory(self):
+        """
+        Oldest masks are evicted when cache is full
+        """
+        comparator = PictureComparator()
+        comparator.EXCLUSION_MASK_CACHE_MAX_MEMORY = 200
+        mask1 = comparator._build_exclusion_mask([Rectangle(0, 0, 1, 1)], 10, 10)
+        comparator._build_exclusion_mask([Rectangle(0, 0, 2, 2)], 10, 10)
+        comparator._build_exclusion_mask([Rectangle(0, 0, 3, 3)], 10, 10)
+        
+        self.assertIsNot(comparator._build_exclusion_mask([Rectangle(0, 0, 1, 1)], 10, 10), mask1)
+        self.assertEqual(len(comparator._exclusion_masks), 2)
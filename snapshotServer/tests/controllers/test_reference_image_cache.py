@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import time
+
+from snapshotServer.controllers.picture_comparator import PictureComparator
+from snapshotServer.controllers.reference_image_cache import ReferenceImageCache
+from snapshotServer.tests import SnapshotTestCase
+from snapshotServer.utils.utils import getTestDirectory
+from unittest.mock import patch
+from django.test import override_settings
+import cv2
+
+class TestReferenceImageCache(SnapshotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dataDir = getTestDirectory()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reference = os.path.join(self.tmp_dir, 'reference.png')
+        shutil.copy(self.dataDir + 'Ibis_Mulhouse.png', self.reference)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        super().tearDown()
+
+    def test_get_decodes_once(self):
+        """
+        Picture is decoded on first access, then served from cache
+        """
+        cache = ReferenceImageCache(100000000)
+        with patch('snapshotServer.controllers.reference_image_cache.cv2.imread', wraps=cv2.imread) as wrapped_imread:
+            image1 = cache.get(self.reference)
+            image2 = cache.get(self.reference)
+
+            self.assertEqual(wrapped_imread.call_count, 1)
+        self.assertIs(image1, image2)
+        self.assertEqual(len(image1.shape), 2, "picture should be grayscale")
+        self.assertFalse(image1.flags.writeable, "cached picture must not be modified")
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['memory'], image1.nbytes)
+        self.assertEqual(stats['hitRate'], 0.5)
+
+    def test_get_file_replaced(self):
+        """
+        When reference file is replaced, picture is decoded again
+        """
+        cache = ReferenceImageCache(100000000)
+        image1 = cache.get(self.reference)
+
+        shutil.copy(self.dataDir + 'Ibis_Mulhouse_diff.png', self.reference)
+        os.utime(self.reference, ns=(time.time_ns(), time.time_ns() + 1000000000))
+        image2 = cache.get(self.reference)
+
+        self.assertIsNot(image1, image2)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['memory'], image2.nbytes)
+
+    def test_get_file_deleted(self):
+        """
+        When reference file is deleted, entry is evicted
+        """
+        cache = ReferenceImageCache(100000000)
+        cache.get(self.reference)
+        os.remove(self.reference)
+
+        self.assertIsNone(cache.get(self.reference))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.stats()['memory'], 0)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        cache = ReferenceImageCache(100000000)
+        cache.get(self.reference)
+        cache.invalidate(self.reference)
+
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.stats()['memory'], 0)
+
+    def test_memory_budget(self):
+        """
+        Least recently used pictures are evicted when memory budget is exceeded
+        """
+        reference2 = os.path.join(self.tmp_dir, 'reference2.png')
+        reference3 = os.path.join(self.tmp_dir, 'reference3.png')
+        shutil.copy(self.dataDir + 'Ibis_Mulhouse.png', reference2)
+        shutil.copy(self.dataDir + 'Ibis_Mulhouse.png', reference3)
+
+        image_size = cv2.imread(self.reference, cv2.IMREAD_GRAYSCALE).nbytes
+        cache = ReferenceImageCache(image_size * 2)
+        cache.get(self.reference)
+        cache.get(reference2)
+        cache.get(self.reference) # reference2 becomes the least recently used
+        cache.get(reference3)
+
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['memory'], image_size * 2)
+
+        cache.get(self.reference)
+        self.assertEqual(cache.stats()['hits'], 2)
+        cache.get(reference2)
+        self.assertEqual(cache.stats()['misses'], 4)
+
+    def test_picture_too_big(self):
+        """
+        A picture greater than memory budget is not cached
+        """
+        cache = ReferenceImageCache(10)
+        self.assertIsNotNone(cache.get(self.reference))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.stats()['memory'], 0)
+
+    @override_settings(IMAGE_COMPARISON_THRESHOLD=0)
+    def test_comparator_with_cache(self):
+        """
+        Results are the same with or without cache
+        """
+        comparator = PictureComparator(reference_cache=ReferenceImageCache(100000000))
+        for i in range(2):
+            diff_pixels, diff_percentage, diff_image = comparator.get_changed_pixels(self.reference, self.dataDir + 'Ibis_Mulhouse_diff.png')
+            diff_pixels_no_cache, diff_percentage_no_cache, diff_image_no_cache = PictureComparator().get_changed_pixels(self.reference, self.dataDir + 'Ibis_Mulhouse_diff.png')
+
+            self.assertEqual(diff_pixels.tolist(), diff_pixels_no_cache.tolist())
+            self.assertEqual(diff_percentage, diff_percentage_no_cache)
+            self.assertTrue((diff_image == diff_image_no_cache).all())
+
+        self.assertEqual(comparator.reference_cache.stats()['hits'], 1)
@@ -0,0 +1,47 @@
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from snapshotServer.tests import SnapshotTestCase
+
+
+class TestBenchmarkComparison(SnapshotTestCase):
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        call_command('benchmark_comparison', sizes=['200x100'], densities=[0, 5], exclude_zones=[2], iterations=2, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['iterations'], 2)
+        self.assertEqual(len(report['results']), 2)
+
+        result = report['results'][1]
+        self.assertEqual(result['width'], 200)
+        self.assertEqual(result['height'], 100)
+        self.assertEqual(result['density'], 5)
+        self.assertTrue(result['measuredDensity'] > 0)
+        self.assertEqual(result['excludeZones'], 2)
+        self.assertEqual(set(result['timings']), {'get_changed_pixels', 'build_list_of_changed_pixels', 'mark_diff', 'compare', 'compare_pyramid', 'compute_diff'})
+        for timing in result['timings'].values():
+            self.assertTrue(timing['p50'] <= timing['p95'])
+
+        # synthetic pictures are removed
+        self.assertEqual([f for f in os.listdir(settings.MEDIA_ROOT) if f.startswith('benchmark_')], [])
+
+    def test_benchmark_to_file(self):
+        output = os.path.join(settings.MEDIA_ROOT, 'benchmark.json')
+        try:
+            call_command('benchmark_comparison', sizes=['200x100'], densities=[0], exclude_zones=[0], operations=['mark_diff'], iterations=1, output=output)
+            with open(output) as report_file:
+                report = json.load(report_file)
+            self.assertEqual(list(report['results'][0]['timings']), ['mark_diff'])
+        finally:
+            os.remove(output)
+
+    def test_benchmark_invalid_size(self):
+        with self.assertRaisesRegex(CommandError, "Invalid size"):
+            call_command('benchmark_comparison', sizes=['big'], iterations=1, stdout=io.StringIO())
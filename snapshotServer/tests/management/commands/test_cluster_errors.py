@@ -0,0 +1,54 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from snapshotServer.models import Error, ErrorCluster, StepResult
+from snapshotServer.tests import SnapshotTestCase
+
+
+class TestClusterErrors(SnapshotTestCase):
+
+    fixtures = ['error_cause_finder/error_cause_finder_commons.yaml',
+                'error_cause_finder/error_cause_finder_test_ok.yaml',
+                'error_cause_finder/error_cause_finder_test_ko.yaml']
+
+    def _create_errors(self):
+        Error.objects.all().delete()
+        step_result = StepResult.objects.get(pk=11)
+        for message in ["element 'login' not found", "element 'password' not found", "expected [true] but found [false]"]:
+            Error(stepResult=step_result, action="openPage>click", exception="NoSuchElementException", errorMessage=message).save()
+
+    def test_cluster_errors(self):
+        self._create_errors()
+        out = io.StringIO()
+        call_command('cluster_errors', batch_size=2, stdout=out)
+
+        self.assertEqual("3 errors clustered in 2 clusters", out.getvalue().strip())
+        self.assertEqual(0, Error.objects.filter(cluster=None).count())
+        self.assertEqual(1, Error.objects.values('cluster').filter(errorMessage__startswith='element').distinct().count())
+
+    def test_cluster_errors_already_clustered(self):
+        """
+        Errors already in a cluster are skipped
+        """
+        self._create_errors()
+        call_command('cluster_errors', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('cluster_errors', stdout=out)
+
+        self.assertEqual("0 errors clustered in 2 clusters", out.getvalue().strip())
+
+    def test_cluster_errors_reset(self):
+        self._create_errors()
+        call_command('cluster_errors', stdout=io.StringIO())
+        cluster_ids = set(ErrorCluster.objects.values_list('id', flat=True))
+
+        out = io.StringIO()
+        call_command('cluster_errors', reset=True, stdout=out)
+        self.assertEqual("3 errors clustered in 2 clusters", out.getvalue().strip())
+        self.assertFalse(cluster_ids & set(ErrorCluster.objects.values_list('id', flat=True)))
+
+    def test_cluster_errors_invalid_batch_size(self):
+        with self.assertRaises(CommandError):
+            call_command('cluster_errors', batch_size=0, stdout=io.StringIO())
@@ -1,5 +1,9 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
 from snapshotServer.controllers.error_cause import Reason, Cause
-from snapshotServer.models import StepResult, Error
+from snapshotServer.models import StepResult, Error, ErrorGroup, ErrorCluster
 from snapshotServer.tests import SnapshotTestCase
 
 
@@ -106,3 +110,122 @@ class TestError(SnapshotTestCase):
                                     'some details on error',
                                     "unknown - unknown")
 
+    def _create_error(self, error_message="element not found", test_date=None):
+        if test_date:
+            test_case_in_session = self.step_result.testCase
+            test_case_in_session.date = test_date
+            test_case_in_session.save()
+        error = Error(stepResult=self.step_result, action="openPage>click", exception="NoSuchElementException", errorMessage=error_message)
+        error.save()
+        return error
+
+    def test_fingerprint(self):
+        """
+        Fingerprint is computed on save, formatting of message does not matter
+        """
+        error1 = self._create_error("element\n  not found ")
+        error2 = self._create_error("element not found")
+        error3 = self._create_error("element not found!")
+
+        self.assertEqual(64, len(error1.fingerprint))
+        self.assertEqual(error1.fingerprint, error2.fingerprint)
+        self.assertNotEqual(error1.fingerprint, error3.fingerprint)
+        self.assertEqual([error1, error2], list(Error.objects.filter(fingerprint=error1.fingerprint).order_by('id')))
+
+    def test_fingerprint_truncated_message(self):
+        """
+        Fingerprint is computed on the stored message
+        """
+        error1 = self._create_error("a" * 1000)
+        error2 = self._create_error("a" * 1001)
+        self.assertEqual(error1.fingerprint, error2.fingerprint)
+
+    def test_add_error_same_group(self):
+        error1 = self._create_error(test_date=timezone.now() - timedelta(seconds=1800))
+        group = ErrorGroup.add_error(error1)
+        error2 = self._create_error(test_date=timezone.now())
+
+        self.assertEqual(group, ErrorGroup.add_error(error2))
+        self.assertEqual([error2], list(error1.related_errors()))
+        self.assertEqual([error1], list(error2.related_errors()))
+        self.assertEqual(2, group.errors.count())
+        self.assertEqual(error2.stepResult.testCase.date, ErrorGroup.objects.get(pk=group.id).lastSeen)
+
+    def test_add_error_group_too_old(self):
+        """
+        When the group has not been seen in the last hour, a new one is created
+        """
+        error1 = self._create_error(test_date=timezone.now() - timedelta(seconds=3601))
+        group = ErrorGroup.add_error(error1)
+        error2 = self._create_error(test_date=timezone.now())
+
+        self.assertNotEqual(group, ErrorGroup.add_error(error2))
+        self.assertEqual(0, error2.related_errors().count())
+
+    def test_add_error_uploaded_late(self):
+        """
+        Group is searched with the date of the test, not the upload date
+        """
+        error1 = self._create_error(test_date=timezone.now() - timedelta(days=2))
+        group = ErrorGroup.add_error(error1)
+        error2 = self._create_error(test_date=timezone.now())
+        ErrorGroup.add_error(error2)
+        error3 = self._create_error(test_date=timezone.now() - timedelta(days=2) + timedelta(seconds=600))
+
+        self.assertEqual(group, ErrorGroup.add_error(error3))
+        self.assertEqual([error3], list(error1.related_errors()))
+
+    def test_add_error_group_time_frame(self):
+        """
+        Errors seen regularly do not extend the group beyond its time frame
+        """
+        start = timezone.now() - timedelta(seconds=7200)
+        error1 = self._create_error(test_date=start)
+        group = ErrorGroup.add_error(error1)
+        error2 = self._create_error(test_date=start + timedelta(seconds=2400))
+        ErrorGroup.add_error(error2)
+        error3 = self._create_error(test_date=start + timedelta(seconds=4800))
+
+        self.assertNotEqual(group, ErrorGroup.add_error(error3))
+        self.assertEqual([error2], list(error1.related_errors()))
+        self.assertEqual(0, error3.related_errors().count())
+
+    def test_add_error_other_fingerprint(self):
+        error1 = self._create_error()
+        ErrorGroup.add_error(error1)
+        error2 = self._create_error("other message")
+        ErrorGroup.add_error(error2)
+
+        self.assertNotEqual(error1.group, error2.group)
+        self.assertEqual(2, ErrorGroup.objects.count())
+
+    def test_related_errors_no_group(self):
+        self.assertEqual(0, self._create_error().related_errors().count())
+
+    def test_add_error_same_cluster(self):
+        """
+        Errors whose messages only differ by variable parts are in the same cluster, whatever their date
+        """
+        error1 = self._create_error("element 'login' not found after 10 seconds", test_date=timezone.now() - timedelta(days=10))
+        cluster = ErrorCluster.add_error(error1)
+        error2 = self._create_error("element 'password' not found after 30 seconds", test_date=timezone.now())
+
+        self.assertEqual(cluster, ErrorCluster.add_error(error2))
+        self.assertEqual("NoSuchElementException element <str> not found after <num> seconds", cluster.pattern)
+        self.assertEqual(2, cluster.errors.count())
+        self.assertEqual(16, cluster.buckets.count())
+        self.assertEqual(error2.stepResult.testCase.date, ErrorCluster.objects.get(pk=cluster.id).lastSeen)
+
+    def test_add_error_other_cluster(self):
+        cluster = ErrorCluster.add_error(self._create_error("element 'login' not found"))
+        self.assertNotEqual(cluster, ErrorCluster.add_error(self._create_error("expected [true] but found [false]")))
+        self.assertEqual(2, ErrorCluster.objects.count())
+
+    def test_add_error_single_bucket_query(self):
+        ErrorCluster.add_error(self._create_error("element 'login' not found"))
+        ErrorCluster.add_error(self._create_error("expected [true] but found [false]"))
+        error = Error.objects.select_related('stepResult__testCase').get(pk=self._create_error("element 'password' not found").id)
+
+        # search of candidates, update of cluster date and error
+        with self.assertNumQueries(3):
+            ErrorCluster.add_error(error)
@@ -0,0 +1,207 @@
+from snapshotServer.models import Snapshot, SnapshotReference, StepResult, Version
+from snapshotServer.tests import SnapshotTestCase
+
+
+class TestSnapshotReference(SnapshotTestCase):
+
+    fixtures = ['test_snapshots.yaml']
+
+    def setUp(self):
+        super().setUp()
+        self.tsr1 = StepResult.objects.get(pk=1) # version 1.0
+        self.tsr2 = StepResult.objects.get(pk=2) # version 1.0
+        self.tsr3 = StepResult.objects.get(pk=3) # version 2.0
+        self.tsr4 = StepResult.objects.get(pk=4) # version 2.0
+
+    def test_reference_indexed(self):
+        """
+        Saving a reference snapshot creates the index entry
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+
+        reference = SnapshotReference.objects.get(snapshot=s1)
+        self.assertEqual(reference.application_id, 1)
+        self.assertEqual(reference.testCaseName, 'case1')
+        self.assertEqual(reference.step_id, 1)
+        self.assertEqual(reference.environment_id, 1)
+        self.assertEqual(reference.browser, 'firefox')
+        self.assertEqual(reference.name, 'img')
+        self.assertEqual(reference.version_id, 1)
+
+    def test_non_reference_not_indexed(self):
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=s1, name='img')
+        s2.save()
+
+        self.assertEqual(SnapshotReference.objects.count(), 1)
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s1)
+
+    def test_one_entry_per_group(self):
+        """
+        Snapshots with other name / version are in other groups
+        """
+        Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img').save()
+        Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img2').save()
+        Snapshot(stepResult=self.tsr3, image=None, refSnapshot=None, name='img').save()
+
+        self.assertEqual(SnapshotReference.objects.count(), 3)
+
+    def test_make_reference(self):
+        """
+        When a more recent snapshot becomes a reference, index points to it
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=s1, name='img')
+        s2.save()
+
+        s2.refSnapshot = None
+        s2.save()
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s2)
+
+    def test_unmake_reference(self):
+        """
+        When the current reference is no more a reference, index points to the previous one
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=None, name='img')
+        s2.save()
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s2)
+
+        s2.refSnapshot = s1
+        s2.save()
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s1)
+
+    def test_save_without_reference_change(self):
+        """
+        Index is not searched nor updated when reference state of a snapshot does not change
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        Snapshot(stepResult=self.tsr2, image=None, refSnapshot=s1, name='img').save()
+
+        for snapshot in Snapshot.objects.filter(name='img'):
+            snapshot.computed = True
+            with self.assertNumQueries(1):
+                snapshot.save()
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s1)
+
+    def test_rename_reference(self):
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=None, name='img')
+        s2.save()
+
+        s2.name = 'img2'
+        s2.save()
+        self.assertEqual(SnapshotReference.objects.get(name='img').snapshot, s1)
+        self.assertEqual(SnapshotReference.objects.get(name='img2').snapshot, s2)
+
+    def test_change_session_version(self):
+        """
+        When session version changes, its references move to the group of the new version
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        s3 = Snapshot(stepResult=self.tsr3, image=None, refSnapshot=None, name='img')
+        s3.save()
+        self.assertEqual(SnapshotReference.objects.get(version=1).snapshot, s1)
+
+        session = self.tsr3.testCase.session
+        session.version = self.tsr1.testCase.session.version
+        session.save()
+
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s3)
+        self.assertEqual(SnapshotReference.objects.get().version_id, 1)
+
+    def test_delete_reference(self):
+        """
+        When the current reference is deleted, index points to the previous one
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=None, name='img')
+        s2.save()
+
+        s2.delete()
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s1)
+
+        s1.delete()
+        self.assertEqual(SnapshotReference.objects.count(), 0)
+
+    def test_delete_session_with_references(self):
+        """
+        Deleting a whole session, with several references of the same group, keeps the reference of the other sessions
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        Snapshot(stepResult=self.tsr2, image=None, refSnapshot=None, name='img').save()
+        Snapshot(stepResult=self.tsr2, image=None, refSnapshot=None, name='img').save()
+
+        self.tsr2.testCase.session.delete()
+        self.assertEqual(SnapshotReference.objects.get().snapshot, s1)
+
+    def test_find_reference_same_version(self):
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        s2 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s2.save()
+
+        self.assertEqual(SnapshotReference.find_reference(self.tsr2, 'img'), s2)
+        self.assertIsNone(SnapshotReference.find_reference(self.tsr2, 'img2'))
+
+    def test_find_reference_previous_version(self):
+        """
+        Reference of the greatest previous version is used when current version has none
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img')
+        s1.save()
+        version3 = Version(application=self.tsr1.testCase.session.version.application, name='3.0')
+        version3.save()
+        session3 = self.tsr4.testCase.session
+        session3.version = version3
+        session3.save()
+
+        self.assertEqual(SnapshotReference.find_reference(self.tsr3, 'img'), s1)
+        self.assertEqual(SnapshotReference.find_reference(self.tsr4, 'img'), s1)
+
+        s3 = Snapshot(stepResult=self.tsr3, image=None, refSnapshot=None, name='img')
+        s3.save()
+        self.assertEqual(SnapshotReference.find_reference(self.tsr4, 'img'), s3)
+
+    def test_find_reference_greatest_previous_version(self):
+        """
+        Greatest previous version is used, even if a lower version has a more recent reference
+        """
+        s3 = Snapshot(stepResult=self.tsr3, image=None, refSnapshot=None, name='img')
+        s3.save()
+        Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img').save()
+        version3 = Version(application=self.tsr1.testCase.session.version.application, name='3.0')
+        version3.save()
+        session3 = self.tsr4.testCase.session
+        session3.version = version3
+        session3.save()
+
+        self.assertEqual(SnapshotReference.find_reference(self.tsr4, 'img'), s3)
+
+    def test_find_reference_not_in_next_version(self):
+        """
+        Reference of a greater version is never used
+        """
+        Snapshot(stepResult=self.tsr3, image=None, refSnapshot=None, name='img').save()
+        self.assertIsNone(SnapshotReference.find_reference(self.tsr1, 'img'))
+
+    def test_find_reference_single_query(self):
+        for i in range(5):
+            Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, name='img').save()
+            Snapshot(stepResult=self.tsr3, image=None, refSnapshot=None, name='img').save()
+        step_result = StepResult.objects.select_related('testCase__session__version', 'testCase__testCase').get(pk=4)
+
+        with self.assertNumQueries(1) as queries:
+            self.assertIsNotNone(SnapshotReference.find_reference(step_result, 'img'))
+            
+        # only the best reference is read
+        self.assertIn('LIMIT 1', queries.captured_queries[0]['sql'])
@@ -49,6 +49,33 @@ class TestSnapshots(SnapshotTestCase):
         s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, pixelsDiff=None, diffTolerance=100.1)
         self.assertRaises(IntegrityError, s1.save)
     
+    def test_same_content_with_file_hash(self):
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, fileHash='abc', pixelHash='def')
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=s1, fileHash='abc', pixelHash='')
+        self.assertTrue(s2.hasSameContentAs(s1))
+    
+    def test_same_content_with_pixel_hash(self):
+        """
+        files are different (e.g: compression level) but pixels are the same
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, fileHash='abc', pixelHash='def')
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=s1, fileHash='abd', pixelHash='def')
+        self.assertTrue(s2.hasSameContentAs(s1))
+    
+    def test_different_content(self):
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None, fileHash='abc', pixelHash='def')
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=s1, fileHash='abd', pixelHash='deg')
+        self.assertFalse(s2.hasSameContentAs(s1))
+    
+    def test_same_content_without_hash(self):
+        """
+        snapshots uploaded before hashes were computed are never considered as identical
+        """
+        s1 = Snapshot(stepResult=self.tsr1, image=None, refSnapshot=None)
+        s2 = Snapshot(stepResult=self.tsr2, image=None, refSnapshot=s1)
+        self.assertFalse(s2.hasSameContentAs(s1))
+        self.assertFalse(s2.hasSameContentAs(None))
+    
     def test_next_snapshots_with_no_ref(self):
         """
         Search for next snapshot that reference ourself
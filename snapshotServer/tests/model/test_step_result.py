@@ -0,0 +1,96 @@
+import json
+
+from snapshotServer.models import StepResult, StepResultAttachment, TestCaseInSession, TestStep
+from snapshotServer.tests import SnapshotTestCase
+
+
+class TestStepResult(SnapshotTestCase):
+
+    fixtures = ['test_test_case.yaml']
+
+    stacktrace = {
+        "name": "openPage with args: (https://jenkins/jenkins/, )",
+        "action": "openPage",
+        "type": "step",
+        "failed": True,
+        "timestamp": 1698245638814,
+        "snapshots": [
+            {"idHtml": 102, "name": "drv:main", "idImage": 103, "type": "snapshot", "snapshotCheckType": "NONE_REFERENCE"},
+            {"name": "drv:other", "type": "snapshot", "snapshotCheckType": "FULL"}
+        ],
+        "files": [{"name": "Browser log file", "id": 112, "type": "file"}],
+        "harCaptures": [{"name": "main", "id": 113, "type": "networkCapture"}],
+        "actions": [
+            {"name": "Opening page LoginPage", "action": "openPage", "origin": "LoginPage", "failed": False, "type": "action"},
+            {"name": "sendKeys", "action": "sendKeys", "origin": "LoginPage", "element": "login", "failed": True, "type": "action"}
+        ]
+    }
+
+    def _create_step_result(self, stacktrace):
+        step_result = StepResult(step=TestStep.objects.get(pk=1), testCase=TestCaseInSession.objects.get(pk=1), result=False, stacktrace=stacktrace)
+        step_result.save()
+        return StepResult.objects.get(pk=step_result.id)
+
+    def test_stacktrace_parsed_on_save(self):
+        step_result = self._create_step_result(json.dumps(self.stacktrace))
+
+        self.assertEqual(self.stacktrace, step_result.details)
+        self.assertEqual(self.stacktrace, step_result.get_details())
+        self.assertEqual(1698245638814, step_result.timestamp)
+        self.assertEqual('openPage>sendKeys on LoginPage.login', step_result.failedAction)
+
+        attachments = list(step_result.attachments.order_by('id').values_list('type', 'fileId', 'name', 'snapshotCheckType'))
+        self.assertEqual([(StepResultAttachment.SNAPSHOT, 103, 'drv:main', 'NONE_REFERENCE'),
+                          (StepResultAttachment.SNAPSHOT, None, 'drv:other', 'FULL'),
+                          (StepResultAttachment.FILE, 112, 'Browser log file', None),
+                          (StepResultAttachment.FILE, 113, 'main', None)], attachments)
+
+        # step results can be searched by file
+        self.assertEqual([step_result], list(StepResult.objects.filter(attachments__fileId=112)))
+
+    def test_stacktrace_updated(self):
+        """
+        When a new stacktrace is sent, details and attachments are replaced
+        """
+        step_result = self._create_step_result(json.dumps(self.stacktrace))
+        step_result.stacktrace = json.dumps({"name": "step", "timestamp": 12, "files": [{"name": "video", "id": 5}]})
+        step_result.save()
+
+        step_result = StepResult.objects.get(pk=step_result.id)
+        self.assertEqual(12, step_result.timestamp)
+        self.assertIsNone(step_result.failedAction)
+        self.assertEqual([5], [a.fileId for a in step_result.attachments.all()])
+
+    def test_stacktrace_not_updated(self):
+        """
+        Saving other fields does not parse stacktrace again
+        """
+        step_result = self._create_step_result(json.dumps(self.stacktrace))
+        step_result.stacktrace = '{}'
+        step_result.result = True
+        step_result.save(update_fields=['result'])
+
+        self.assertEqual(1698245638814, StepResult.objects.get(pk=step_result.id).timestamp)
+        self.assertEqual(4, step_result.attachments.count())
+
+    def test_invalid_stacktrace(self):
+        """
+        Invalid stacktrace is kept, but not parsed. Reading details gives the parsing error
+        """
+        step_result = self._create_step_result('not json')
+
+        self.assertIsNone(step_result.details)
+        self.assertIsNone(step_result.timestamp)
+        self.assertEqual(0, step_result.attachments.count())
+        with self.assertRaises(ValueError):
+            step_result.get_details()
+
+    def test_no_stacktrace(self):
+        step_result = self._create_step_result(None)
+        self.assertIsNone(step_result.details)
+        self.assertIsNone(step_result.failedAction)
+
+    def test_search_failed_action_in_sub_step(self):
+        data = {"actions": [{"type": "step", "action": "login", "actions": [{"action": "click", "origin": "LoginPage", "failed": True, "exception": "Exception"}]}]}
+        self.assertEqual(('openPage>login>click in LoginPage', 'Exception', None, ''), StepResult.search_failed_action(data, 'openPage'))
+        self.assertEqual((None, None, None, None), StepResult.search_failed_action({"actions": []}))
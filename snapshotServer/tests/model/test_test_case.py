@@ -137,6 +137,55 @@ class TestTestCases(SnapshotTestCase):
         
         self.assertFalse(tcs.isOkWithSnapshots())
 
+    def test_is_ok_with_diff_statistics(self):
+        """
+        When statistics are stored, result depends on the tolerance only
+        """
+        tcs = TestCaseInSession.objects.get(pk=5)
+        s1 = StepResult.objects.get(pk=5)
+        s2 = StepResult.objects.get(pk=6)
+        initial_ref_snapshot = Snapshot.objects.get(id=1)
+        
+        # some diffs, but under tolerance
+        s1 = Snapshot(stepResult=s1, refSnapshot=initial_ref_snapshot, pixelsDiff=b'SRM1', diffPixelCount=10, tooManyDiffs=False)
+        s1.save()
+        s2 = Snapshot(stepResult=s2, refSnapshot=initial_ref_snapshot, pixelsDiff=None, diffPixelCount=0)
+        s2.save()
+        
+        self.assertTrue(tcs.isOkWithSnapshots())
+        
+        s1.tooManyDiffs = True
+        s1.save()
+        self.assertFalse(tcs.isOkWithSnapshots())
+
+    def test_snapshot_comparison_results(self):
+        """
+        Results of several test cases are computed in a single query, from stored statistics
+        """
+        tcs = TestCaseInSession.objects.get(pk=5)
+        s1 = StepResult.objects.get(pk=5)
+        s2 = StepResult.objects.get(pk=6)
+        initial_ref_snapshot = Snapshot.objects.get(id=1)
+        
+        s1 = Snapshot(stepResult=s1, refSnapshot=initial_ref_snapshot, pixelsDiff=b'SRM1', diffPixelCount=10, tooManyDiffs=False)
+        s1.save()
+        s2 = Snapshot(stepResult=s2, refSnapshot=initial_ref_snapshot, pixelsDiff=None, diffPixelCount=0)
+        s2.save()
+        
+        with self.assertNumQueries(1):
+            self.assertTrue(TestCaseInSession.snapshotComparisonResults(TestCaseInSession.objects.all())[5])
+        
+        s1.tooManyDiffs = True
+        s1.save()
+        self.assertFalse(TestCaseInSession.snapshotComparisonResults(TestCaseInSession.objects.filter(pk=5))[5])
+        
+        # computing error with remaining result OK gives an undefined result
+        s1.tooManyDiffs = False
+        s1.save()
+        s2.computingError = 'some error'
+        s2.save()
+        self.assertIsNone(TestCaseInSession.snapshotComparisonResults(TestCaseInSession.objects.filter(pk=5))[5])
+
     
     def test_is_not_computed(self):
         """
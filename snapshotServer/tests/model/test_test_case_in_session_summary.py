@@ -0,0 +1,251 @@
+from unittest.mock import patch
+
+from snapshotServer.models import TestCaseInSession, StepResult, Snapshot, TestStep, \
+    TestCaseInSessionSummary, TestSessionSummary, TestSession, TestCase
+from snapshotServer.tests import SnapshotTestCase
+
+
+class TestTestCaseInSessionSummary(SnapshotTestCase):
+
+    fixtures = ['test_test_case.yaml']
+
+    def test_refresh(self):
+        """
+        Rollup contains step counts, duration and snapshot counts of the test
+        """
+        tcs = TestCaseInSession.objects.get(pk=5)
+        StepResult(step=TestStep.objects.get(pk=2), testCase=tcs, result=False, duration=1500.0).save()
+        snapshot = Snapshot.objects.get(pk=5)
+        snapshot.diffPixelCount = 10
+        snapshot.tooManyDiffs = True
+        snapshot.save()
+        Snapshot.objects.filter(pk=6).update(computingError='some error')
+
+        summary = TestCaseInSessionSummary.refresh([tcs])[5]
+
+        self.assertEqual(summary, TestCaseInSessionSummary.objects.get(testCase=tcs))
+        self.assertEqual(4, summary.stepsNumber)
+        self.assertEqual(1, summary.failedStepsNumber)
+        self.assertEqual(1500.0, summary.duration)
+        self.assertEqual(3, summary.snapshotsNumber)
+        self.assertEqual(1, summary.snapshotComputingErrors)
+        self.assertEqual(1, summary.snapshotFailures)
+        self.assertFalse(summary.snapshotComparisonResult())
+
+    def test_refresh_updates_existing(self):
+        """
+        Refreshing twice updates the same rollup
+        """
+        tcs = TestCaseInSession.objects.get(pk=5)
+        TestCaseInSessionSummary.refresh([tcs])
+        StepResult(step=TestStep.objects.get(pk=2), testCase=tcs, result=True, duration=1000.0).save()
+        TestCaseInSessionSummary.refresh([tcs])
+
+        self.assertEqual(1, TestCaseInSessionSummary.objects.count())
+        self.assertEqual(4, TestCaseInSessionSummary.objects.get(testCase=tcs).stepsNumber)
+
+    def test_snapshot_comparison_result(self):
+        self.assertIsNone(TestCaseInSessionSummary(snapshotsNumber=0).snapshotComparisonResult())
+        self.assertIsNone(TestCaseInSessionSummary(snapshotsNumber=2, snapshotComputingErrors=2).snapshotComparisonResult())
+        self.assertIsNone(TestCaseInSessionSummary(snapshotsNumber=2, snapshotComputingErrors=1).snapshotComparisonResult())
+        self.assertFalse(TestCaseInSessionSummary(snapshotsNumber=2, snapshotComputingErrors=1, snapshotFailures=1).snapshotComparisonResult())
+        self.assertTrue(TestCaseInSessionSummary(snapshotsNumber=2).snapshotComparisonResult())
+
+    def test_refresh_session(self):
+        """
+        Session rollup contains the names of its tests
+        """
+        tcs = TestCaseInSession.objects.get(pk=5)
+        TestCaseInSession(testCase=tcs.testCase, session=tcs.session, status='SUCCESS').save()
+        TestSessionSummary.objects.all().delete()
+
+        TestSessionSummary.refresh({6})
+
+        summary = TestSessionSummary.objects.get(session=6)
+        self.assertEqual('test login,test login', summary.testNames)
+        self.assertEqual('test login,test login', TestSession.objects.get(pk=6).allTests())
+
+    def test_refresh_constant_number_of_queries(self):
+        """
+        Refreshing several tests does not issue more queries than refreshing one
+        """
+        with self.assertNumQueries(4):
+            TestCaseInSessionSummary.refresh(TestCaseInSession.objects.filter(pk=5))
+        with self.assertNumQueries(4):
+            TestCaseInSessionSummary.refresh(TestCaseInSession.objects.all())
+
+    def test_for_test_cases(self):
+        """
+        Missing rollups are computed, existing ones are read
+        """
+        TestCaseInSessionSummary.refresh(TestCaseInSession.objects.filter(pk=5))
+        TestCaseInSessionSummary.objects.filter(testCase=5).update(stepsNumber=42)
+
+        summaries = TestCaseInSessionSummary.for_test_cases(TestCaseInSession.objects.select_related('summary'))
+        self.assertEqual(42, summaries[5].stepsNumber)
+        self.assertEqual(1, summaries[1].stepsNumber)
+        self.assertEqual(2, summaries[10].stepsNumber)
+        self.assertEqual(3, TestCaseInSessionSummary.objects.count())
+
+
+class TestSummaryUpdates(SnapshotTestCase):
+    """
+    Rollups are updated with differences when step results and snapshots are saved or deleted
+    """
+
+    fixtures = ['test_test_case.yaml']
+
+    def setUp(self):
+        super().setUp()
+        self.tcs = TestCaseInSession.objects.get(pk=5)
+        TestCaseInSessionSummary.refresh([self.tcs])
+        TestSessionSummary.refresh({self.tcs.session_id})
+
+        # fixture snapshots share their pictures with other tests, keep them when snapshots are deleted
+        patcher = patch('django.db.models.fields.files.FieldFile.delete')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _assert_summaries_up_to_date(self):
+        """
+        Stored rollups are the same as recomputed ones
+        """
+        fields = ['stepsNumber', 'failedStepsNumber', 'duration', 'snapshotsNumber', 'snapshotComputingErrors', 'snapshotFailures']
+        stored = TestCaseInSessionSummary.objects.filter(testCase=self.tcs).values(*fields).get()
+        stored_session = TestSessionSummary.objects.filter(session=self.tcs.session_id).values('testNames').get()
+
+        TestCaseInSessionSummary.refresh([self.tcs])
+        TestSessionSummary.refresh({self.tcs.session_id})
+        self.assertEqual(TestCaseInSessionSummary.objects.filter(testCase=self.tcs).values(*fields).get(), stored)
+        self.assertEqual(TestSessionSummary.objects.filter(session=self.tcs.session_id).values('testNames').get(), stored_session)
+        return stored, stored_session
+
+    def test_step_result_created(self):
+        """
+        Test rollup is updated without recomputing it, session rollup is not changed
+        """
+        step = TestStep.objects.get(pk=2)
+        with patch.object(TestCaseInSessionSummary, 'refresh') as refresh, patch.object(TestSessionSummary, 'refresh') as refresh_session:
+            
+            # insertion, then update of test rollup
+            with self.assertNumQueries(2):
+                StepResult(step=step, testCase=self.tcs, result=False, duration=1500.0).save()
+            refresh.assert_not_called()
+            refresh_session.assert_not_called()
+
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual(4, summary['stepsNumber'])
+        self.assertEqual(1, summary['failedStepsNumber'])
+
+    def test_step_result_updated(self):
+        step_result = StepResult.objects.get(pk=5)
+        step_result.result = not step_result.result
+        step_result.duration = 200.0
+        step_result.save()
+        self._assert_summaries_up_to_date()
+
+        # nothing changed for rollups
+        step_result.stacktrace = 'some details'
+        with patch.object(TestCaseInSessionSummary, 'apply_counts') as apply_counts:
+            step_result.save()
+            apply_counts.assert_not_called()
+
+    def test_step_result_deleted(self):
+        StepResult.objects.get(pk=5).delete()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual(2, summary['stepsNumber'])
+
+    def test_snapshot_compared(self):
+        """
+        Snapshot with too many differences makes the test KO, and test becomes OK again when snapshot is a reference
+        """
+        snapshot = Snapshot.objects.get(pk=5)
+        snapshot.diffPixelCount = 10
+        snapshot.tooManyDiffs = True
+        snapshot.computed = True
+        snapshot.save()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual(1, summary['snapshotFailures'])
+
+        # same as PictureView with 'makeRef'
+        snapshot.diffPixelCount = None
+        snapshot.save()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual(0, summary['snapshotFailures'])
+
+    def test_snapshot_computing_error(self):
+        snapshot = Snapshot.objects.get(pk=6)
+        snapshot.computingError = 'some error'
+        snapshot.save()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual(1, summary['snapshotComputingErrors'])
+
+    def test_snapshot_created_and_deleted(self):
+        snapshot = Snapshot(stepResult=StepResult.objects.get(pk=5), image=None, name='img', computed=True, diffPixelCount=0, diffPercentage=0.0)
+        snapshot.save()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual(4, summary['snapshotsNumber'])
+
+        snapshot.delete()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual(3, summary['snapshotsNumber'])
+
+    def test_snapshot_loaded_without_counts(self):
+        """
+        When snapshot values used by rollup are not loaded, rollup is recomputed
+        """
+        snapshot = Snapshot.objects.defer('pixelsDiff').get(pk=6)
+        snapshot.computingError = 'some error'
+        snapshot.save()
+        self.assertEqual(1, TestCaseInSessionSummary.objects.get(testCase=self.tcs).snapshotComputingErrors)
+
+    def test_missing_summary_computed(self):
+        """
+        Test recorded before rollups existed
+        """
+        TestCaseInSessionSummary.objects.all().delete()
+        StepResult(step=TestStep.objects.get(pk=2), testCase=self.tcs, result=True, duration=1000.0).save()
+        self.assertEqual(4, TestCaseInSessionSummary.objects.get(testCase=self.tcs).stepsNumber)
+
+    def test_test_case_changed(self):
+        """
+        Session rollup is refreshed only when test case changes
+        """
+        with patch.object(TestSessionSummary, 'refresh') as refresh_session:
+            self.tcs.status = 'FAILURE'
+            self.tcs.gridNode = 'node1'
+            self.tcs.save()
+            refresh_session.assert_not_called()
+            
+        self.tcs.testCase = TestCase.objects.get(name='test1')
+        self.tcs.save()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual('test1', session_summary['testNames'])
+
+    def test_test_case_created_and_deleted(self):
+        tcs = TestCaseInSession(testCase=self.tcs.testCase, session=self.tcs.session, status='SUCCESS')
+        tcs.save()
+        self.assertEqual(0, TestCaseInSessionSummary.objects.get(testCase=tcs).stepsNumber)
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual('test login,test login', session_summary['testNames'])
+
+        tcs.delete()
+        summary, session_summary = self._assert_summaries_up_to_date()
+        self.assertEqual('test login', session_summary['testNames'])
+
+    def test_session_deleted(self):
+        """
+        Rollups are deleted with the session, without being updated for each step result / snapshot
+        """
+        with patch.object(TestCaseInSessionSummary, 'apply_counts') as apply_counts:
+            self.tcs.session.delete()
+            apply_counts.assert_not_called()
+        self.assertFalse(TestSessionSummary.objects.filter(session=6).exists())
+        self.assertFalse(TestCaseInSessionSummary.objects.filter(testCase=5).exists())
+
+    def test_version_deleted(self):
+        """
+        Session rollup is not created again while session is deleted
+        """
+        self.tcs.session.version.delete()
+        self.assertFalse(TestSessionSummary.objects.filter(session=6).exists())
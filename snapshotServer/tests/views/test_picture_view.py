@@ -8,9 +8,10 @@ from django.urls.base import reverse
 from django.contrib.auth.models import Permission
 from django.db.models import Q
 from django.test.client import Client
+from unittest.mock import patch
 
 from snapshotServer.controllers.diff_computer import DiffComputer
-from snapshotServer.models import Snapshot, ExcludeZone, TestCase, TestStep, TestSession, TestCaseInSession, StepResult
+from snapshotServer.models import Snapshot, ExcludeZone, TestCase, TestStep, TestSession, TestCaseInSession, StepResult, DiffJob
 from snapshotServer.tests import SnapshotTestCase
 from variableServer.models import Application, TestEnvironment as TestEnvironmentV
 
@@ -511,6 +512,31 @@ class TestPictureView(SnapshotTestCase):
                              "ref snapshot for snapshot_same_env should have changed to first snapshot")
 
 
+    def test_remove_ref_too_many_computations(self):
+        """
+        When server cannot compute differences now, they are computed by diff workers, before other jobs
+        """
+
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+
+        with open("snapshotServer/tests/data/test_Image1.png", 'rb') as imgFile:
+            img = ImageFile(imgFile)
+
+            snapshot_ref_same_env = Snapshot(stepResult=self.sr1, refSnapshot=None, pixelsDiff=None)
+            snapshot_ref_same_env.save()
+            snapshot_ref_same_env.image.save("img", img)
+            snapshot_ref_same_env.save()
+
+            with self.settings(DIFF_SYNC_COMPUTATION_MAX=0), patch.object(DiffComputer, 'add_jobs') as add_jobs:
+                response = client.get(reverse('pictureView', kwargs={'test_case_in_session_id': self.tcs1.id,
+                                                                          'test_step_id': 1}) + "?makeRef=False&snapshotId=" + str(
+                    snapshot_ref_same_env.id))
+            DiffComputer.stopThread()
+            
+            self.assertEqual(response.status_code, 200)
+            add_jobs.assert_any_call(self.initialRefSnapshot, snapshot_ref_same_env, priority=DiffJob.PRIORITY_INTERACTIVE)
+
     def test_remove_ref_with_different_env(self):
         """
         Test the case where we remove a ref a we want to make sure that the new reference is searched with the same environment
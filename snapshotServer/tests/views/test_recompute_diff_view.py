@@ -80,6 +80,18 @@ class TestRecomputeDiffView(TestApi):
 
         response = self.client.post(reverse('recompute', args=[2]))
         self.assertEqual(response.status_code, 200, "Reference exists for the snapshot, do computing")
+          
+    def test_recompute_diff_too_many_computations(self):
+        """
+        Server is busy computing other snapshots, client is told to retry later
+        """
+
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_results_application_myapp', content_type=self.content_type_application)))
+
+        with self.settings(DIFF_SYNC_COMPUTATION_MAX=0, DIFF_SYNC_RETRY_AFTER=2):
+            response = self.client.post(reverse('recompute', args=[2]))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
 
     def test_recompute_diff_security_authenticated_with_permission_on_environment(self):
         """
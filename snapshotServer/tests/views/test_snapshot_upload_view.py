@@ -8,10 +8,13 @@ import datetime
 import os
 import pytz
 import json
+from unittest.mock import patch
 
 from django.urls.base import reverse
 from django.conf import settings
+from django.db import connection
 from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 
@@ -218,6 +221,91 @@ class TestFileUploadView(TestApi):
             self.assertTrue(uploaded_snapshot_2.computed)
             
             
+    def test_post_snapshot_existing_ref_same_content(self):
+        """
+        Check hashes are stored and that picture identical to reference is not compared
+        """
+        
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
+
+        with open('snapshotServer/tests/data/engie.png', 'rb') as fp:
+            self.client.post(reverse('upload', args=['img']), data={'stepResult': self.sr1.id, 'image': fp, 'name': 'img', 'compare': 'true'})
+            uploaded_snapshot_1 = Snapshot.objects.filter(stepResult__testCase=self.tcs1, stepResult__step__id=1).last()
+            self.assertEqual(len(uploaded_snapshot_1.fileHash), 64)
+            self.assertEqual(len(uploaded_snapshot_1.pixelHash), 64)
+
+        with patch.object(DiffComputer, 'add_jobs') as add_jobs:
+            with open('snapshotServer/tests/data/engie.png', 'rb') as fp:
+                response = self.client.post(reverse('upload', args=['img']), data={'stepResult': self.step_result_same_env.id,
+                                                                                   'image': fp,
+                                                                                   'name': 'img',
+                                                                                   'compare': 'true'})
+                self.assertEqual(response.status_code, 201, 'status code should be 201: ' + str(response.content))
+            add_jobs.assert_not_called()
+
+        uploaded_snapshot_2 = Snapshot.objects.filter(stepResult__testCase=self.tcs_same_env, stepResult__step__id=1).last()
+        self.assertEqual(uploaded_snapshot_2.refSnapshot, uploaded_snapshot_1)
+        self.assertEqual(uploaded_snapshot_2.fileHash, uploaded_snapshot_1.fileHash)
+        self.assertTrue(uploaded_snapshot_2.computed)
+        self.assertFalse(uploaded_snapshot_2.tooManyDiffs)
+        self.assertIsNone(uploaded_snapshot_2.pixelsDiff)
+        self.assertEqual(uploaded_snapshot_2.diffPixelCount, 0)
+        self.assertEqual(uploaded_snapshot_2.diffPercentage, 0.0)
+        self.assertTrue(os.path.isfile(uploaded_snapshot_2.image.path))
+            
+    def test_post_snapshot_existing_ref_different_content(self):
+        """
+        Check picture different from reference is compared
+        """
+        
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
+
+        with open('snapshotServer/tests/data/Ibis_Mulhouse.png', 'rb') as fp:
+            self.client.post(reverse('upload', args=['img']), data={'stepResult': self.sr1.id, 'image': fp, 'name': 'img', 'compare': 'true'})
+
+        with patch.object(DiffComputer, 'add_jobs') as add_jobs:
+            with open('snapshotServer/tests/data/Ibis_Mulhouse_diff.png', 'rb') as fp:
+                response = self.client.post(reverse('upload', args=['img']), data={'stepResult': self.step_result_same_env.id,
+                                                                                   'image': fp,
+                                                                                   'name': 'img',
+                                                                                   'compare': 'true'})
+                self.assertEqual(response.status_code, 201, 'status code should be 201: ' + str(response.content))
+            add_jobs.assert_called_once()
+
+        uploaded_snapshot_2 = Snapshot.objects.filter(stepResult__testCase=self.tcs_same_env, stepResult__step__id=1).last()
+        self.assertFalse(uploaded_snapshot_2.computed)
+            
+    def test_put_snapshot_existing_ref_same_content(self):
+        """
+        Check comparison result is returned without computing when picture is identical to reference
+        """
+        
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
+
+        with open('snapshotServer/tests/data/engie.png', 'rb') as fp:
+            self.client.post(reverse('upload', args=['img']), data={'stepResult': self.sr1.id, 'image': fp, 'name': 'img', 'compare': 'true'})
+
+        with patch.object(DiffComputer, 'compute_now') as compute_now:
+            with open('snapshotServer/tests/data/engie.png', 'rb') as fp:
+                response = self.client.put(reverse('upload', args=['img']), data={'image': fp,
+                                                                                   'name': 'img',
+                                                                                   'compare': 'true',
+                                                                                   'versionId': 1,
+                                                                                   'environmentId': 1,
+                                                                                   'browser': 'BROWSER:FIREFOX',
+                                                                                   'testCaseName': 'test upload',
+                                                                                   'stepName': 'Step 1'})
+                self.assertEqual(response.status_code, 201, 'status code should be 201: ' + str(response.content))
+            compute_now.assert_not_called()
+            
+        data = json.loads(response.content.decode('UTF-8'))
+        self.assertIsNone(data['id'])
+        self.assertTrue(data['computed'])
+        self.assertEqual(data['computingError'], '')
+        self.assertEqual(data['diffPixelPercentage'], 0.0)
+        self.assertFalse(data['tooManyDiffs'])
+        self.assertEqual(Snapshot.objects.filter(stepResult__testCase=self.tcs_same_env, stepResult__step__id=1).count(), 0)
+            
     # POST and PUT methods share the same code
     # here we only check the retrieving of parameters sent to PUT
     def test_put_snapshot_existing_ref(self):
@@ -636,6 +724,94 @@ class TestFileUploadView(TestApi):
             self.assertEqual(uploaded_snapshot2, uploaded_snapshot1, "the second uploaded snapshot should not be recorded")
                
         
+    def test_put_snapshot_nothing_written(self):
+        """
+        Check that comparison without storage does not write anything to database or disk
+        """
+        
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
+
+        with open('snapshotServer/tests/data/Ibis_Mulhouse.png', 'rb') as fp:
+            response = self.client.post(reverse('upload', args=['img']), data={'image': fp,
+                                                                               'stepResult': self.sr1.id,
+                                                                               'name': 'img',
+                                                                               'compare': 'true'})
+        files = set(os.listdir(self.media_dir))
+        counts = (TestSession.objects.count(), TestCase.objects.count(), TestCaseInSession.objects.count(), StepResult.objects.count(), Snapshot.objects.count())
+
+        with CaptureQueriesContext(connection) as queries:
+            with open('snapshotServer/tests/data/Ibis_Mulhouse_diff.png', 'rb') as fp:
+                response = self.client.put(reverse('upload', args=['img']), data={'image': fp,
+                                                                                   'name': 'img',
+                                                                                   'compare': 'true',
+                                                                                   'versionId': 1,
+                                                                                   'environmentId': 1,
+                                                                                   'browser': 'firefox',
+                                                                                   'testCaseName': 'test upload',
+                                                                                   'stepName': 'Step 1'})
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.content.decode('UTF-8'))
+        self.assertTrue(data['diffPixelPercentage'] > 0.000144)
+        
+        self.assertEqual([q['sql'] for q in queries.captured_queries if q['sql'].split()[0].upper() in ('INSERT', 'UPDATE', 'DELETE')], [])
+        self.assertEqual(set(os.listdir(self.media_dir)), files)
+        self.assertEqual((TestSession.objects.count(), TestCase.objects.count(), TestCaseInSession.objects.count(), StepResult.objects.count(), Snapshot.objects.count()), counts)
+        
+    def test_put_snapshot_unknown_test_case(self):
+        """
+        Test case is not created when it does not exist. There is no reference for it
+        """
+        
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
+        test_case_count = TestCase.objects.count()
+
+        with open('snapshotServer/tests/data/engie.png', 'rb') as fp:
+            response = self.client.put(reverse('upload', args=['img']), data={'image': fp,
+                                                                               'name': 'img',
+                                                                               'compare': 'true',
+                                                                               'versionId': 1,
+                                                                               'environmentId': 1,
+                                                                               'browser': 'firefox',
+                                                                               'testCaseName': 'unknown test',
+                                                                               'stepName': 'Step 1'})
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.content.decode('UTF-8'))
+        self.assertIsNone(data['id'])
+        self.assertTrue(data['computed'])
+        self.assertEqual(data['diffPixelPercentage'], 0.0)
+        self.assertEqual(TestCase.objects.count(), test_case_count)
+        
+    def test_post_snapshot_with_comparison_no_store_too_many_computations(self):
+        """
+        When too many comparisons are already computed on request threads, client is told to retry later
+        """
+        
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
+
+        with open('snapshotServer/tests/data/Ibis_Mulhouse.png', 'rb') as fp:
+            response = self.client.post(reverse('upload', args=['img']), data={'image': fp,
+                                                                               'stepResult': self.sr1.id,
+                                                                               'name': 'img',
+                                                                               'compare': 'true'})
+            self.assertEqual(response.status_code, 201, 'status code should be 201')
+        snapshot_count = Snapshot.objects.count()
+
+        with self.settings(DIFF_SYNC_COMPUTATION_MAX=0, DIFF_SYNC_RETRY_AFTER=3):
+            with open('snapshotServer/tests/data/Ibis_Mulhouse_diff.png', 'rb') as fp:
+                response = self.client.put(reverse('upload', args=['img']), data={'image': fp,
+                                                                                   'name': 'img',
+                                                                                   'compare': 'true',
+                                                                                   'versionId': Version.objects.get(pk=1).id,
+                                                                                   'environmentId': TestEnvironment.objects.get(pk=1).id,
+                                                                                   'browser': 'firefox',
+                                                                                   'testCaseName': 'test upload',
+                                                                                   'stepName': 'Step 1'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+        
+        # temporary objects are deleted
+        self.assertEqual(Snapshot.objects.count(), snapshot_count)
+               
     def test_post_snapshot_with_comparison_no_store_picture_parameter_exclude_zones(self):
         """
         Check that uploaded picture is not stored when using the "put" method
@@ -15,6 +15,8 @@ from django.urls.base import reverse
 from django.test.client import Client
 from django.db.models import Q
 from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from variableServer.models import Application, TestEnvironment
 
@@ -36,6 +38,13 @@ class TestTestResultView(SnapshotTestCase):
         TestEnvironment.objects.get(pk=1).save()
         TestEnvironment.objects.get(pk=2).save()
 
+    def _step_bodies(self, client, test_case_in_session_id):
+        """
+        Bodies of all steps of the test, as loaded when steps are expanded
+        """
+        response = client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': test_case_in_session_id}), data={'pageSize': 100})
+        return self.remove_spaces(''.join(step['html'] for step in response.json()['steps']))
+
     def test_report_result_security_not_authenticated(self):
         """
         Check that with security enabled, we cannot access view without authentication
@@ -156,6 +165,7 @@ class TestTestResultView(SnapshotTestCase):
 
         # check content
         html = self.remove_spaces(response.rendered_content)
+        steps_html = self._step_bodies(client, 1)
 
         ## details table
         self.assertTrue(
@@ -170,16 +180,16 @@ class TestTestResultView(SnapshotTestCase):
             '<div class="box success"><!-- Step result 1 --><div class="box-header with-border"><button type="button" class="btn btn-box-tool collapsed" data-bs-toggle="collapse" data-bs-target="#box-body-1" aria-expanded="false" aria-controls="box-body-1">'
             '<i class="fa-solid fa-angle-right collapse-icon"></i></button><span class="step-title">openPage with args: (https://jenkins/jenkins/, )  - 0.7 secs</span><span><i class="fas fa-file-video"></i>0.005 s</span>' in html)
         self.assertTrue(
-            """<div class="message-conf"><span class="stepTimestamp mr-1">14:53:58.815</span>Opening page LoginPage""" in html)
+            """<div class="message-conf"><span class="stepTimestamp mr-1">14:53:58.815</span>Opening page LoginPage""" in steps_html)
         self.assertTrue(
-            """<div class="message-conf"><span class="stepTimestamp mr-1">14:53:58.816</span>setWindowToRequestedSize on on page LoginPage""" in html)
+            """<div class="message-conf"><span class="stepTimestamp mr-1">14:53:58.816</span>setWindowToRequestedSize on on page LoginPage""" in steps_html)
         self.assertTrue(
-            """<div class="message-conf"><span class="stepTimestamp mr-1">14:53:58.816</span>maximizeWindow on on page LoginPage""" in html)
+            """<div class="message-conf"><span class="stepTimestamp mr-1">14:53:58.816</span>maximizeWindow on on page LoginPage""" in steps_html)
         self.assertTrue(
             """<div class="box success"><!-- Step result 2 --><div class="box-header with-border"><button type="button" class="btn btn-box-tool collapsed" data-bs-toggle="collapse" data-bs-target="#box-body-2" aria-expanded="false" aria-controls="box-body-2"><i class="fa-solid fa-angle-right collapse-icon"></i></button><span class="step-title">loginInvalid with args: (foo, bar, )  - 2.0 secs</span><span><i class="fas fa-file-video"></i>1.171 s</span>""" in html)
         ### sub-step inside step
         self.assertTrue(
-            """<ul><li><div class="message-conf"><span class="stepTimestamp mr-1">14:54:01.41</span>click on ButtonElement check, by={By.name: check}""" in html)
+            """<ul><li><div class="message-conf"><span class="stepTimestamp mr-1">14:54:01.41</span>click on ButtonElement check, by={By.name: check}""" in steps_html)
         self.assertTrue(
             '<div class="box success"><!-- Step result 3 --><div class="box-header with-border"><button type="button" class="btn btn-box-tool collapsed" data-bs-toggle="collapse" data-bs-target="#box-body-3" aria-expanded="false" aria-controls="box-body-3">'
             '<i class="fa-solid fa-angle-right collapse-icon"></i></button><span class="step-title">getErrorMessage   - 5.0 secs</span><span><i class="fas fa-file-video"></i>3.508 s</span>' in html)
@@ -188,16 +198,16 @@ class TestTestResultView(SnapshotTestCase):
         ## pictures on steps
         self.assertTrue(
             '''<a href="#" onclick="$('#imagepreview').attr('src', $('#88').attr('src'));$('#imagemodal').modal('show');"><img id="88" src="/snapshot/api/file/88/download/" style="width: 300px"></a></div></div><div class="text-center">drv:main:Current Window: S&#x27;identifier [Jenkins]</div>'''
-            '<div class="text-center font-weight-lighter"><a href="https://jenkins/login?from=%2Fjenkins%2F" target=url>URL</a>' in html)
+            '<div class="text-center font-weight-lighter"><a href="https://jenkins/login?from=%2Fjenkins%2F" target=url>URL</a>' in steps_html)
         ## log value on step
         self.assertTrue(
             '<table class="table table-bordered table-sm"><tr><th style="width:15%">Key</th><th style="width:60%">Message</th><th style="width:25%">Value</th></tr>'
-            '<tr><td><div class="message-conf"><span class="stepTimestamp mr-1"></span>key' in html)
+            '<tr><td><div class="message-conf"><span class="stepTimestamp mr-1"></span>key' in steps_html)
         ## snapshot comparison is not displayed
         self.assertFalse('Snapshot comparison' in html)
         ## files available
-        self.assertTrue("""Video capture:<a href="/snapshot/api/file/91/download/">file</a>""" in html)
-        self.assertTrue("""Network capture "main" browser:<a href="/snapshot/api/file/92/download/">HAR file</a>""" in html)
+        self.assertTrue("""Video capture:<a href="/snapshot/api/file/91/download/">file</a>""" in steps_html)
+        self.assertTrue("""Network capture "main" browser:<a href="/snapshot/api/file/92/download/">HAR file</a>""" in steps_html)
         ## no description in details table
         self.assertFalse("""<th>Description</th>""" in html)
         self.assertFalse("""<th>Started by</th>""" in html)
@@ -220,6 +230,7 @@ class TestTestResultView(SnapshotTestCase):
         self.assertEqual(response.context['status'], "FAILURE")
 
         html = self.remove_spaces(response.rendered_content)
+        steps_html = self._step_bodies(client, 11)
 
         # a step in error has the right class
         self.assertTrue(
@@ -235,21 +246,21 @@ class TestTestResultView(SnapshotTestCase):
             '<tr><th>Last State</th><td><a class="errorTooltip" tabindex="0" data-bs-trigger="focus" data-bs-toggle="popover" title="Exception" data-bs-content="Browsermob proxy (captureNetwork option) is only compatible with DIRECT and &lt;MANUAL&gt;"><i class="fas fa-file-alt" aria-hidden="true"></i></a></td></tr>' in html)
         ## on last step
         self.assertTrue(
-            '<div class="message-log message-conf"><span class="stepTimestamp mr-1"></span>Test is KO with error: class java.lang.AssertionError: expected [false] but &lt;&gt; found [true]' in html)
+            '<div class="message-log message-conf"><span class="stepTimestamp mr-1"></span>Test is KO with error: class java.lang.AssertionError: expected [false] but &lt;&gt; found [true]' in steps_html)
         ## error message on step
         self.assertTrue(
-            """<div class="message-error message-conf"><span class="stepTimestamp mr-1"></span>!!!FAILURE ALERT!!! - Assertion Failure: expected [false] but found [true]""" in html)
+            """<div class="message-error message-conf"><span class="stepTimestamp mr-1"></span>!!!FAILURE ALERT!!! - Assertion Failure: expected [false] but found [true]""" in steps_html)
         ## assertion check displayed
         self.assertTrue(
-            """<div class="message-error message-conf"><span class="stepTimestamp mr-1"></span>Check: verification of value</div>""" in html)
+            """<div class="message-error message-conf"><span class="stepTimestamp mr-1"></span>Check: verification of value</div>""" in steps_html)
 
         # reference snapshot
         self.assertTrue(
             '''<div class="message-snapshot col"><div class="message-snapshot col"><div class="text-center"><a href="#" onclick="$('#imagepreview').attr('src', $('#108').attr('src'));$('#imagemodal').modal('show');">'''
-            '<img id="108" src="/snapshot/api/file/108/download/" style="width: 300px"></a></div></div><div class="text-center">Step beginning state</div>' in html)
+            '<img id="108" src="/snapshot/api/file/108/download/" style="width: 300px"></a></div></div><div class="text-center">Step beginning state</div>' in steps_html)
         self.assertTrue(
             '''<div class="message-snapshot col"><div class="message-snapshot col"><div class="text-center"><a href="#" onclick="$('#imagepreview').attr('src', $('#109').attr('src'));$('#imagemodal').modal('show');">'''
-            '<img id="109" src="/snapshot/api/file/109/download/" style="width: 300px"></a></div></div><div class="text-center">Valid-reference</div>' in html)
+            '<img id="109" src="/snapshot/api/file/109/download/" style="width: 300px"></a></div></div><div class="text-center">Valid-reference</div>' in steps_html)
 
 
     def test_report_result_encoding(self):
@@ -265,17 +276,18 @@ class TestTestResultView(SnapshotTestCase):
         self.assertEqual(response.context['status'], "FAILURE")
 
         html = self.remove_spaces(response.rendered_content)
+        steps_html = self._step_bodies(client, 11)
 
         # step is encoded
         self.assertTrue("""<span class="step-title">❌getErrorMessage&lt;&gt;""" in html)
 
         # error message is encoded
         self.assertTrue(
-            """<div class="message-error">class java.lang.AssertionError: expected [false] but &lt;_&gt; found [true]</div>""" in html)
+            """<div class="message-error">class java.lang.AssertionError: expected [false] but &lt;_&gt; found [true]</div>""" in steps_html)
 
         # actions are encoded
         self.assertTrue(
-            """<span class="stepTimestamp mr-1"></span>Test is KO with error: class java.lang.AssertionError: expected [false] but &lt;&gt; found [true]""" in html)
+            """<span class="stepTimestamp mr-1"></span>Test is KO with error: class java.lang.AssertionError: expected [false] but &lt;&gt; found [true]""" in steps_html)
 
         # logs are encoded
         self.assertTrue(
@@ -548,16 +560,17 @@ class TestTestResultView(SnapshotTestCase):
         self.assertEqual(response.context['status'], "FAILURE")
 
         html = self.remove_spaces(response.rendered_content)
+        steps_html = self._step_bodies(client, 11)
 
         # messages
         self.assertTrue(
-            '<div class="message-log message-conf"><span class="stepTimestamp mr-1"></span>Test is KO with error: class java.lang.AssertionError: expected [false] but &lt;&gt; found [true]' in html)
+            '<div class="message-log message-conf"><span class="stepTimestamp mr-1"></span>Test is KO with error: class java.lang.AssertionError: expected [false] but &lt;&gt; found [true]' in steps_html)
         self.assertTrue(
-            """<div class="message-error message-conf"><span class="stepTimestamp mr-1"></span>!!!FAILURE ALERT!!! - Assertion Failure: expected [false] but found [true]""" in html)
+            """<div class="message-error message-conf"><span class="stepTimestamp mr-1"></span>!!!FAILURE ALERT!!! - Assertion Failure: expected [false] but found [true]""" in steps_html)
         self.assertTrue(
-            """<div class="message-warning message-conf"><span class="stepTimestamp mr-1"></span>[NOT RETRYING] max retry count (0) reached""" in html)
+            """<div class="message-warning message-conf"><span class="stepTimestamp mr-1"></span>[NOT RETRYING] max retry count (0) reached""" in steps_html)
         self.assertTrue(
-            """<div class="message-info message-conf"><span class="stepTimestamp mr-1"></span>Video file copied to videoCapture.avi""" in html)
+            """<div class="message-info message-conf"><span class="stepTimestamp mr-1"></span>Video file copied to videoCapture.avi""" in steps_html)
 
 
     def test_stacktraceExists(self):
@@ -573,6 +586,130 @@ class TestTestResultView(SnapshotTestCase):
         self.assertEqual(len(response.context['stacktrace']), 2)
         self.assertTrue('line1' in response.context['stacktrace'][0])
 
+    def _add_steps(self, count):
+        """
+        Add step results, each with a snapshot, to test 1
+        """
+        test_case_in_session = TestCaseInSession.objects.get(pk=1)
+        stacktrace = StepResult.objects.get(pk=2).stacktrace
+        for i in range(count):
+            step_result = StepResult(step_id=2, testCase=test_case_in_session, result=True, duration=1000, stacktrace=stacktrace)
+            step_result.save()
+            Snapshot(stepResult=step_result, image=None, refSnapshot=None, name='img').save()
+
+    def test_report_constant_number_of_queries(self):
+        """
+        Number of queries does not depend on the number of steps
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('testResultView', kwargs={'test_case_in_session_id': 1}))
+            response.rendered_content
+        query_count = len(queries)
+
+        self._add_steps(10)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('testResultView', kwargs={'test_case_in_session_id': 1}))
+            response.rendered_content
+
+        self.assertEqual(len(response.context['object_list']), 14)
+        self.assertEqual(len(queries), query_count)
+
+    def test_report_step_bodies_not_rendered(self):
+        """
+        Step bodies are not rendered in page, they are loaded when step is expanded
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+
+        response = client.get(reverse('testResultView', kwargs={'test_case_in_session_id': 1}))
+        html = self.remove_spaces(response.rendered_content)
+
+        # step headers are still displayed
+        self.assertTrue('<span class="step-title">openPage with args: (https://jenkins/jenkins/, )  - 0.7 secs</span>' in html)
+        self.assertTrue('<div class="box-body collapse lazy-step" id="box-body-1" data-step-index="0"><!-- body is loaded when step is expanded --><div id="step-body-1">Loading...</div>' in html)
+        self.assertFalse('Opening page LoginPage' in html)
+        self.assertTrue('loadStepBodies("/snapshot/testResults/result/1/steps/", 20);' in html)
+
+    def test_report_step_details_not_loaded(self):
+        """
+        Page only reads from step details what step header displays
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+
+        response = client.get(reverse('testResultView', kwargs={'test_case_in_session_id': 1}))
+
+        step_result = list(response.context['object_list'])[0]
+        self.assertEqual({'details', 'stacktrace', 'timestamp', 'failedAction'}, step_result.get_deferred_fields())
+        self.assertEqual('SUCCESS', step_result.stepStatus)
+        self.assertEqual('openPage with args: (https://jenkins/jenkins/, )', step_result.stepName)
+        self.assertEqual(5, step_result.videoTimeStamp)
+
+    def test_steps_paginated(self):
+        """
+        Step bodies are returned page by page
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+
+        response = client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': 1}), data={'page': 1, 'pageSize': 3})
+        self.assertEqual(200, response.status_code)
+        content = response.json()
+        self.assertEqual(4, content['count'])
+        self.assertEqual(1, content['page'])
+        self.assertEqual(2, content['pageCount'])
+        self.assertEqual([1, 2, 3], [step['id'] for step in content['steps']])
+        self.assertEqual([1, 2, 3], [step['stepId'] for step in content['steps']])
+
+        # same body as the one rendered in page
+        html = self.remove_spaces(content['steps'][0]['html'])
+        self.assertTrue("""<div class="message-conf"><span class="stepTimestamp mr-1">14:53:58.815</span>Opening page LoginPage""" in html)
+        self.assertTrue('updatePanel("/snapshot/compare/picture/1/1/noheader/", "step_1")' in html)
+
+        response = client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': 1}), data={'page': 2, 'pageSize': 3})
+        self.assertEqual([4], [step['id'] for step in response.json()['steps']])
+
+    def test_steps_invalid_page_size(self):
+        """
+        Invalid page size falls back to the default one
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+
+        response = client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': 1}), data={'pageSize': 'foo'})
+        self.assertEqual(1, response.json()['pageCount'])
+        self.assertEqual(4, len(response.json()['steps']))
+
+    def test_steps_constant_number_of_queries(self):
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+        self._add_steps(10)
+
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': 1}), data={'pageSize': 2})
+        query_count = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': 1}), data={'pageSize': 10})
+
+        self.assertEqual(10, len(response.json()['steps']))
+        self.assertEqual(len(queries), query_count)
+
+    def test_steps_no_permission_on_application(self):
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp2')))
+        response = client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': 1}))
+        self.assertEqual(403, response.status_code)
+
+    def test_steps_not_found(self):
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(
+            Q(codename='can_view_results_application_myapp')))
+        response = client.get(reverse('testResultStepsView', kwargs={'test_case_in_session_id': 909}))
+        self.assertEqual(404, response.status_code)
+
     # Tests
     # - no logs available
     # - cannot load step details
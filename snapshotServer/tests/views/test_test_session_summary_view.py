@@ -5,9 +5,12 @@ import os
 from django.test.client import Client
 from django.urls.base import reverse
 from snapshotServer.models import StepResult, Snapshot, TestSession,\
-    TestCaseInSession, Error
+    TestCaseInSession, Error, TestInfo, ErrorGroup, ErrorCluster
+from django.db import connection
 from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import Permission
+from django.utils import timezone
 
 from variableServer.models import Application, TestEnvironment
 
@@ -331,7 +334,7 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         test_case_in_session, test_case_info = next(iter(response.context['object_list'].items()))
 
         self.assertEqual([], test_case_info['related_errors_number']) # tests with the same error (none as test has no error recorded)
-        self.assertEqual({'id': 0, 'error_short': 'loginInvalid', 'error': 'Error WebDriverException in sendKeys in loginInvalid>sendKeys on Page.user', 'color': 'crimson', 'cause': ''}, test_case_info['error_badge']) # Only the first error is kept
+        self.assertEqual({'id': 0, 'error_short': 'loginInvalid', 'error': 'Error WebDriverException in sendKeys in loginInvalid>sendKeys on Page.user', 'color': 'crimson', 'cause': '', 'cluster': None}, test_case_info['error_badge']) # Only the first error is kept
        
     def test_summary_report_result_ko_with_recorded_error_no_related(self):
         """
@@ -362,7 +365,7 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         self.assertEqual(3, test_case_info['failed_steps_number']) # number of failed steps
         self.assertEqual(12, test_case_info['duration']) # test duration
         self.assertEqual([], test_case_info['related_errors_number']) # tests with the same error (none as no test has the same error)
-        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': ''}, test_case_info['error_badge']) # badge information => no content
+        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': '', 'cluster': None}, test_case_info['error_badge']) # badge information => no content
         self.assertEqual({'Last State': {'type': 'multipleinfo', 'infos': [{'type': 'log', 'info': 'Browsermob proxy (captureNetwork option) is only compatible with DIRECT and <MANUAL>'}]}}, test_case_info['test_infos']) # test info
 
         # check content
@@ -417,7 +420,7 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         self.assertEqual(3, test_case_info['failed_steps_number']) # number of failed steps
         self.assertEqual(12, test_case_info['duration']) # test duration
         self.assertEqual([], test_case_info['related_errors_number']) # tests with the same error (none as no test has the same error)
-        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': 'Element not found, but element seems to be present on page, check the locator'}, test_case_info['error_badge']) # badge information => no content
+        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': 'Element not found, but element seems to be present on page, check the locator', 'cluster': None}, test_case_info['error_badge']) # badge information => no content
         self.assertEqual({'Last State': {'type': 'multipleinfo', 'infos': [{'type': 'log', 'info': 'Browsermob proxy (captureNetwork option) is only compatible with DIRECT and <MANUAL>'}]}}, test_case_info['test_infos']) # test info
 
         # check content
@@ -458,7 +461,11 @@ class TestTestSessionSummaryView(SnapshotTestCase):
                       exception="WebDriverException",
                       errorMessage="WebDriverException in search")
         error110.save()
-        error110.relatedErrors.set([error])
+        
+        # both errors are in the same group
+        group = ErrorGroup(fingerprint=error.fingerprint, firstSeen=timezone.now(), lastSeen=timezone.now())
+        group.save()
+        Error.objects.filter(pk__in=[error.id, error110.id]).update(group=group)
 
         response = client.get(reverse('testSessionSummaryView', kwargs={'sessionId': 110}))
         self.assertEqual(1, len(response.context['object_list']))
@@ -474,7 +481,7 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         self.assertEqual(2, test_case_info['failed_steps_number']) # number of failed steps
         self.assertEqual(7, test_case_info['duration']) # test duration
         self.assertEqual([TestCaseInSession.objects.get(id=11)], test_case_info['related_errors_number']) # tests with the same error (the related error is returned)
-        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': ''}, test_case_info['error_badge']) # badge information => information about the error
+        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': '', 'cluster': None}, test_case_info['error_badge']) # badge information => information about the error
         self.assertEqual({'Last State': {'type': 'multipleinfo', 'infos': [{'type': 'log', 'info': 'Browsermob proxy (captureNetwork option) is only compatible with DIRECT and <MANUAL>'}]}}, test_case_info['test_infos']) # test info
 
         # check content
@@ -523,7 +530,11 @@ class TestTestSessionSummaryView(SnapshotTestCase):
                       exception="WebDriverException",
                       errorMessage="WebDriverException in search")
         error110.save()
-        error110.relatedErrors.set([error])
+        
+        # both errors are in the same group
+        group = ErrorGroup(fingerprint=error.fingerprint, firstSeen=timezone.now(), lastSeen=timezone.now())
+        group.save()
+        Error.objects.filter(pk__in=[error.id, error110.id]).update(group=group)
 
         response = client.get(reverse('testSessionSummaryView', kwargs={'sessionId': 11}))
         self.assertEqual(2, len(response.context['object_list']))
@@ -533,12 +544,12 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         test_case_in_session, test_case_info = next(object_list_iterator)
         self.assertEqual(11, response.context['testSession'].id)
         self.assertEqual([TestCaseInSession.objects.get(id=110)], test_case_info['related_errors_number']) # the other test is returned
-        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': ''}, test_case_info['error_badge']) # badge information => information about the error
+        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': '', 'cluster': None}, test_case_info['error_badge']) # badge information => information about the error
 
         test_case_in_session, test_case_info = next(object_list_iterator)
         self.assertEqual(11, response.context['testSession'].id)
         self.assertEqual([TestCaseInSession.objects.get(id=11)], test_case_info['related_errors_number']) # the other test is returned
-        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': ''}, test_case_info['error_badge']) # badge information => information about the error
+        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': '', 'cluster': None}, test_case_info['error_badge']) # badge information => information about the error
 
         # check content
         html = self.remove_spaces(response.rendered_content)
@@ -593,12 +604,12 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         test_case_in_session, test_case_info = next(object_list_iterator)
         self.assertEqual(11, response.context['testSession'].id)
         self.assertEqual([], test_case_info['related_errors_number']) # the other test is returned
-        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': ''}, test_case_info['error_badge']) # badge information => information about the error
+        self.assertEqual({'id': 0, 'error_short': 'getErrorMessage<', 'error': 'Error WebDriverException in search in getErrorMessage<> >getText on HtmlElement error message', 'color': 'crimson', 'cause': '', 'cluster': None}, test_case_info['error_badge']) # badge information => information about the error
 
         test_case_in_session, test_case_info = next(object_list_iterator)
         self.assertEqual(11, response.context['testSession'].id)
         self.assertEqual([], test_case_info['related_errors_number']) # the other test is returned
-        self.assertEqual({'id': 1, 'error_short': 'getErrorMessage', 'error': 'Error WebDriverException in search in getErrorMessage>getText on HtmlElement error message', 'color': 'coral', 'cause': ''}, test_case_info['error_badge']) # badge information => information about the error
+        self.assertEqual({'id': 1, 'error_short': 'getErrorMessage', 'error': 'Error WebDriverException in search in getErrorMessage>getText on HtmlElement error message', 'color': 'coral', 'cause': '', 'cluster': None}, test_case_info['error_badge']) # badge information => information about the error
 
         # check content
         html = self.remove_spaces(response.rendered_content)
@@ -607,6 +618,48 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         self.assertTrue("""title="no description available">testJenkinsKo2</a><span class="badge bg-primary" style="background-color: coral !important" data-bs-toggle="tooltip" title="Error WebDriverException in search in getErrorMessage&gt;getText on HtmlElement error message">getErrorMessage</span></td><td name="stepsTotal-2">4""" in html)
         self.assertTrue("""title="no description available">testJenkinsKo</a><span class="badge bg-primary" style="background-color: crimson !important" data-bs-toggle="tooltip" title="Error WebDriverException in search in getErrorMessage&lt;&gt; &gt;getText on HtmlElement error message">getErrorMessage&lt;</span></td><td name="stepsTotal-1">5""" in html)
         
+    def test_summary_report_error_badge_per_cluster(self):
+        """
+        2 tests of the session fail with errors whose message only differ by variable parts
+        They share the same badge, even if action is different
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_results_application_myapp')))
+
+        tcis = TestCaseInSession.objects.get(pk=110)
+        tcis.session = TestSession.objects.get(pk=11)
+        tcis.save()
+
+        for step_result_id, action, message in [(13, "getErrorMessage<> >getText on HtmlElement error message", "Element 'login' not found after 10 seconds"),
+                                                 (130, "getErrorMessage>getText on HtmlElement error message", "Element 'password' not found after 30 seconds")]:
+            error = Error(stepResult=StepResult.objects.get(id=step_result_id), action=action, exception="WebDriverException", errorMessage=message)
+            error.save()
+            ErrorCluster.add_error(error)
+
+        response = client.get(reverse('testSessionSummaryView', kwargs={'sessionId': 11}))
+        badges = [test_case_info['error_badge'] for test_case_info in response.context['object_list'].values()]
+
+        self.assertEqual([0, 0], [badge['id'] for badge in badges])
+        self.assertEqual({'errors': 2, 'sessions': 1, 'applications': 1}, badges[0]['cluster'])
+
+    def test_summary_report_error_badge_cluster_across_sessions(self):
+        """
+        Badge tells how many times a similar error has been seen in other sessions
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_results_application_myapp')))
+
+        for step_result_id, message in [(13, "Element 'login' not found after 10 seconds"),
+                                        (130, "Element 'password' not found after 30 seconds")]:
+            error = Error(stepResult=StepResult.objects.get(id=step_result_id), action="getErrorMessage", exception="WebDriverException", errorMessage=message)
+            error.save()
+            ErrorCluster.add_error(error)
+
+        response = client.get(reverse('testSessionSummaryView', kwargs={'sessionId': 11}))
+        test_case_info = response.context['object_list'][TestCaseInSession.objects.get(pk=11)]
+        self.assertEqual({'errors': 2, 'sessions': 2, 'applications': 1}, test_case_info['error_badge']['cluster'])
+
+        html = self.remove_spaces(response.rendered_content)
+        self.assertTrue("""title="Error Element &#x27;login&#x27; not found after 10 seconds in getErrorMessage - similar error seen 2 time(s) in 2 session(s) of 1 application(s)">getErrorMessage</span>""" in html)
+
     def test_summary_report_result_skipped(self):
         """
         Check that the test is displayed in summary
@@ -636,3 +689,58 @@ class TestTestSessionSummaryView(SnapshotTestCase):
         # test is SKIPPED
         self.assertTrue("""<tr class="testSkipped"><td></td><td>jenkins</td><td class="alignleft"><a href='/snapshot/testResults/result/111/' info="skipped" data-bs-toggle="tooltip" title="no description available">testJenkins</a>""" in html)
 
+
+    def _add_failed_test(self, session, index):
+        """
+        Add a failed test to the session, with an error, a snapshot and a test info
+        """
+        template = TestCaseInSession.objects.get(pk=11)
+        tcis = TestCaseInSession(testCase=template.testCase, session=session, name='test-%d' % index, status='FAILURE', date=timezone.now())
+        tcis.save()
+        step_ok = StepResult(step=StepResult.objects.get(pk=13).step, testCase=tcis, result=True, duration=1000.0)
+        step_ok.save()
+        step_ko = StepResult(step=StepResult.objects.get(pk=13).step, testCase=tcis, result=False, duration=2000.0)
+        step_ko.save()
+        error = Error(stepResult=step_ko, action="getErrorMessage<> >getText", exception="WebDriverException", errorMessage="error %d" % (index % 2))
+        error.save()
+        ErrorGroup.add_error(error)
+        ErrorCluster.add_error(error)
+        Snapshot(stepResult=step_ko, image=None, refSnapshot=Snapshot.objects.get(pk=1), name='img', diffPixelCount=10, tooManyDiffs=True).save()
+        TestInfo(testCase=tcis, name='Issue', info='{"type": "string", "info": "some text"}').save()
+
+    def test_summary_report_constant_number_of_queries(self):
+        """
+        Number of queries does not depend on the number of tests in session
+        """
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_results_application_myapp')))
+        session = TestSession.objects.get(pk=11)
+        for i in range(2):
+            self._add_failed_test(session, i)
+            
+        # rollups of the tests loaded from fixtures are computed once, on first display
+        client.get(reverse('testSessionSummaryView', kwargs={'sessionId': 11}))
+
+        with CaptureQueriesContext(connection) as queries_few_tests:
+            response = client.get(reverse('testSessionSummaryView', kwargs={'sessionId': 11}))
+            response.render()
+        self.assertEqual(3, len(response.context['object_list']))
+
+        for i in range(2, 20):
+            self._add_failed_test(session, i)
+
+        with CaptureQueriesContext(connection) as queries_many_tests:
+            response = client.get(reverse('testSessionSummaryView', kwargs={'sessionId': 11}))
+            response.render()
+        self.assertEqual(21, len(response.context['object_list']))
+        self.assertEqual(len(queries_few_tests), len(queries_many_tests))
+
+        # results are still computed for each test
+        test_case_info = [info for test_case_in_session, info in response.context['object_list'].items() if test_case_in_session.name == 'test-5'][0]
+        self.assertFalse(test_case_info['snapshot_comparison_result'])
+        self.assertEqual(2, test_case_info['steps_number'])
+        self.assertEqual(1, test_case_info['failed_steps_number'])
+        self.assertEqual(3, test_case_info['duration'])
+        self.assertTrue(test_case_info['error_badge']['error'] in ['Error error 0 in getErrorMessage<> >getText', 'Error error 1 in getErrorMessage<> >getText'])
+        self.assertEqual({'errors': 20, 'sessions': 1, 'applications': 1}, test_case_info['error_badge']['cluster']) # messages only differ by a number
+        self.assertEqual(9, len(test_case_info['related_errors_number'])) # tests with the same error
+        self.assertEqual({'Issue': {'type': 'string', 'info': 'some text'}}, test_case_info['test_infos'])
@@ -161,6 +161,35 @@ class TestTestStatusView(SnapshotTestCase):
         s3.save()
           
 
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
+
+        response = client.get(reverse('testStatusView', kwargs={'testCaseId': 6}))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('UTF-8'))
+        self.assertTrue(data['8'])
+        self.assertTrue(data['9'])
+        self.assertFalse(data['10'])
+         
+    def test_session_status_with_diff_statistics(self):
+        """
+        Test the result of a test session status when differences have been computed with statistics
+        Result depends on the tolerance (tooManyDiffs), mask is not read
+        """
+        s1 = Snapshot.objects.get(pk=8)
+        s1.pixelsDiff = b'SRM1 not read'
+        s1.diffPixelCount = 0
+        s1.save()
+        s2 = Snapshot.objects.get(pk=9)
+        s2.pixelsDiff = b'SRM1 not read'
+        s2.diffPixelCount = 10
+        s2.tooManyDiffs = False
+        s2.save()
+        s3 = Snapshot.objects.get(pk=10)
+        s3.pixelsDiff = b'SRM1 not read'
+        s3.diffPixelCount = 1000
+        s3.tooManyDiffs = True
+        s3.save()
+
         user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='can_view_application_myapp', content_type=self.content_type_application)))
 
         response = client.get(reverse('testStatusView', kwargs={'testCaseId': 6}))
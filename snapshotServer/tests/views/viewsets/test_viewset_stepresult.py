@@ -4,6 +4,8 @@ from datetime import timedelta
 from unittest import mock
 from unittest.mock import patch
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from commonsServer import preferences
@@ -12,7 +14,8 @@ from snapshotServer.controllers.error_cause.error_cause_finder import ErrorCause
 from variableServer.models import Application, TestEnvironment
 from django.db.models import Q
 from django.contrib.contenttypes.models import ContentType
-from snapshotServer.models import StepResult, Error, TestCaseInSession, TestCase, TestSession, TestStep
+from snapshotServer.models import StepResult, Error, TestCaseInSession, TestCase, TestSession, TestStep,\
+    TestCaseInSessionSummary
 from django.contrib.auth.models import Permission
 from commonsServer.tests.test_api import TestApi
 
@@ -154,6 +157,24 @@ class TestViewsetStepResult(TestApi):
         self._create_stepresult(403)
 
 
+    def test_stepresult_create_updates_summary(self):
+        """
+        Test rollup is updated each time a step result is recorded
+        """
+        self._create_and_authenticate_user_with_permissions(
+            Permission.objects.filter(Q(codename__in=['add_stepresult', 'change_stepresult'], content_type=self.content_type_stepresult)))
+        step_count = StepResult.objects.filter(testCase=1).count()
+        response = self.client.post('/snapshot/api/stepresult/', data={'step': 1, 'testCase': 1, 'result': False, 'duration': 1500})
+        self.assertEqual(201, response.status_code)
+
+        summary = TestCaseInSessionSummary.objects.get(testCase=1)
+        self.assertEqual(step_count + 1, summary.stepsNumber)
+        self.assertEqual(1, summary.failedStepsNumber)
+
+        response = self.client.patch(f'/snapshot/api/stepresult/{response.data["id"]}/', data={'result': True})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, TestCaseInSessionSummary.objects.get(testCase=1).failedStepsNumber)
+
     def _update_stepresult(self, expected_status):
         response = self.client.patch('/snapshot/api/stepresult/1/', data={'stacktrace': '{"logs": "updated"}'})
         self.assertEqual(expected_status, response.status_code)
@@ -179,6 +200,19 @@ class TestViewsetStepResult(TestApi):
         response = self.client.patch('/snapshot/api/stepresult/12345/', data={'name': 'bla2'})
         self.assertEqual(404, response.status_code)
 
+    def test_stepresult_update_reads_step_result_once(self):
+        """
+        Step result read while checking application / environment permission is reused to update it
+        """
+        self._create_and_authenticate_user_with_permissions(
+            Permission.objects.filter(Q(codename='can_view_application_myapp')))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch('/snapshot/api/stepresult/1/', data={'stacktrace': '{"logs": "updated"}'})
+        self.assertEqual(200, response.status_code)
+        step_result_reads = [q['sql'] for q in queries.captured_queries
+                             if q['sql'].startswith('SELECT') and 'FROM "snapshotServer_stepresult"' in q['sql'] and '"snapshotServer_stepresult"."id" = 1' in q['sql']]
+        self.assertEqual(1, len(step_result_reads))
+
 
     def test_stepresult_update_with_application_restriction_and_app1_permission(self):
         """
@@ -394,7 +428,7 @@ class TestViewsetStepResult(TestApi):
         self.assertEqual('class java.lang.AssertionError', error.exception)
         self.assertEqual('', error.element)
         self.assertEqual(step_result_id, error.stepResult.id)
-        self.assertEqual(0, len(error.relatedErrors.all()))
+        self.assertEqual(0, error.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_result_ko_parsed_2_times(self):
@@ -516,8 +550,8 @@ class TestViewsetStepResult(TestApi):
         self.assertEqual(2, len(Error.objects.all()))
         error2 = Error.objects.get(stepResult=step_result_id2)
 
-        self.assertEqual(1, len(error1.relatedErrors.all()))
-        self.assertEqual(1, len(error2.relatedErrors.all()))
+        self.assertEqual(1, error1.related_errors().count())
+        self.assertEqual(1, error2.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_result_ko_related_error_too_old(self):
@@ -584,8 +618,8 @@ class TestViewsetStepResult(TestApi):
         self.assertEqual(2, len(Error.objects.all()))
         error2 = Error.objects.get(stepResult=step_result_id2)
 
-        self.assertEqual(0, len(error1.relatedErrors.all()))
-        self.assertEqual(0, len(error2.relatedErrors.all()))
+        self.assertEqual(0, error1.related_errors().count())
+        self.assertEqual(0, error2.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_result_ko_related_error_different(self):
@@ -677,10 +711,10 @@ class TestViewsetStepResult(TestApi):
         step_result_id4 = response.data['id']
         error4 = Error.objects.get(stepResult=step_result_id4)
 
-        self.assertEqual(0, len(error1.relatedErrors.all()))
-        self.assertEqual(0, len(error2.relatedErrors.all()))
-        self.assertEqual(0, len(error3.relatedErrors.all()))
-        self.assertEqual(0, len(error4.relatedErrors.all()))
+        self.assertEqual(0, error1.related_errors().count())
+        self.assertEqual(0, error2.related_errors().count())
+        self.assertEqual(0, error3.related_errors().count())
+        self.assertEqual(0, error4.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_result_action_failed(self):
@@ -742,7 +776,7 @@ class TestViewsetStepResult(TestApi):
         self.assertEqual('class java.lang.AssertionError', error.exception)
         self.assertEqual('', error.element)
         self.assertEqual(step_result_id, error.stepResult.id)
-        self.assertEqual(0, len(error.relatedErrors.all()))
+        self.assertEqual(0, error.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_result_action_failed_on_element(self):
@@ -807,7 +841,7 @@ class TestViewsetStepResult(TestApi):
         self.assertEqual('class java.lang.AssertionError', error.exception)
         self.assertEqual("button described by 'submit'", error.element)
         self.assertEqual(step_result_id, error.stepResult.id)
-        self.assertEqual(0, len(error.relatedErrors.all()))
+        self.assertEqual(0, error.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_result_action_failed_on_element_with_exception(self):
@@ -875,7 +909,7 @@ class TestViewsetStepResult(TestApi):
         self.assertEqual('class org.openqa.selenium.WebDriverException', error.exception)
         self.assertEqual("button described by 'submit'", error.element)
         self.assertEqual(step_result_id, error.stepResult.id)
-        self.assertEqual(0, len(error.relatedErrors.all()))
+        self.assertEqual(0, error.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_on_update(self):
@@ -945,7 +979,7 @@ class TestViewsetStepResult(TestApi):
         self.assertEqual('class org.openqa.selenium.WebDriverException', error.exception)
         self.assertEqual("button described by 'submit'", error.element)
         self.assertEqual(step_result_id, error.stepResult.id)
-        self.assertEqual(0, len(error.relatedErrors.all()))
+        self.assertEqual(0, error.related_errors().count())
 
 
     def test_stepresult_parse_stacktrace_result_ko_test_end(self):
@@ -8,6 +8,7 @@ from snapshotServer.views.picture_view import PictureView
 from snapshotServer.views.recompute_diff_view import RecomputeDiffView
 from snapshotServer.views.test_status_view import TestStatusView
 from snapshotServer.views.test_result_view import TestResultView
+from snapshotServer.views.test_result_steps_view import TestResultStepsView
 
 from django.urls.conf import re_path, path
 from snapshotServer.views.step_reference_view import StepReferenceView
@@ -45,6 +46,7 @@ urlpatterns = [
     re_path(r'^stepReference/$', StepReferenceView.as_view(), name='uploadStepRef'),
     
     re_path(r'^testResults/result/(?P<test_case_in_session_id>[0-9]+)/$', TestResultView.as_view(), name='testResultView'),
+    re_path(r'^testResults/result/(?P<test_case_in_session_id>[0-9]+)/steps/$', TestResultStepsView.as_view(), name='testResultStepsView'),
     re_path(r'^testResults/summary/(?P<sessionId>[0-9]+)/$', TestSessionSummaryView.as_view(), name='testSessionSummaryView'),
 
     re_path(r'^compare/compute/(?P<snapshot_id>[0-9]+)/$', RecomputeDiffView.as_view(), name='recompute'),
@@ -34,7 +34,7 @@ class ErrorAnalysisPermission(ContextSpecificPermissionsResultConsultation):
         test_case_in_session_id = view.kwargs.get('test_case_in_session_id', '')
         if test_case_in_session_id:
             try:
-                return self.get_object_application(TestCaseInSession.objects.get(pk=test_case_in_session_id))
+                return self.get_object_application(self.get_object_for_permission(request, TestCaseInSession, test_case_in_session_id, 'session__version__application', 'session__environment'))
             except TestCaseInSession.DoesNotExist:
                 return ''
         return ''
@@ -43,7 +43,7 @@ class ErrorAnalysisPermission(ContextSpecificPermissionsResultConsultation):
         test_case_in_session_id = view.kwargs.get('test_case_in_session_id', '')
         if test_case_in_session_id:
             try:
-                return self.get_object_environment(TestCaseInSession.objects.get(pk=test_case_in_session_id))
+                return self.get_object_environment(self.get_object_for_permission(request, TestCaseInSession, test_case_in_session_id, 'session__version__application', 'session__environment'))
             except TestCaseInSession.DoesNotExist:
                 return ''
         return ''
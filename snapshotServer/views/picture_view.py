@@ -3,19 +3,17 @@ Created on 26 juil. 2017
 
 @author: worm
 '''
-import pickle
 import base64
-import io
 import os
 
-from PIL import Image
-
 from django.views.generic.base import TemplateView
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 
 from snapshotServer.controllers.diff_computer import DiffComputer
-from snapshotServer.models import Snapshot, TestCaseInSession, TestStep, ExcludeZone
+from snapshotServer.controllers.diff_mask import DiffMask
+from snapshotServer.exceptions.diff_computer_busy_error import DiffComputerBusyError
+from snapshotServer.models import Snapshot, TestCaseInSession, TestStep, ExcludeZone, DiffJob
 
 from snapshotServer.views.login_required_mixin_conditional import LoginRequiredMixinConditional
 
@@ -70,6 +68,9 @@ class PictureView(LoginRequiredMixinConditional, TemplateView):
                         previous_snapshot = step_snapshot.refSnapshot
                         step_snapshot.refSnapshot = None
                         step_snapshot.pixelsDiff = None
+                        step_snapshot.diffPixelCount = None
+                        step_snapshot.diffPercentage = None
+                        step_snapshot.diffBoxes = None
                         step_snapshot.save()
                         
                         # copy exclude zones to the new ref so that they may be processed independently
@@ -78,7 +79,7 @@ class PictureView(LoginRequiredMixinConditional, TemplateView):
                         
                         # Compute differences for the following snapshots as they will depend on this new ref
                         for snap in step_snapshot.snapshotsUntilNextRef(previous_snapshot):
-                            DiffComputer.get_instance().add_jobs(step_snapshot, snap)
+                            DiffComputer.get_instance().add_jobs(step_snapshot, snap, priority=DiffJob.PRIORITY_BULK)
                             
                     elif self.request.GET['makeRef'] == 'False' and step_snapshot.refSnapshot is None:
                         # search a reference with a lower id, meaning that it has been recorded before our step
@@ -102,12 +103,15 @@ class PictureView(LoginRequiredMixinConditional, TemplateView):
                             
                             diff_computer = DiffComputer.get_instance()
                             
-                            # recompute diff pixels
-                            diff_computer.compute_now(step_snapshot.refSnapshot, step_snapshot)
+                            # recompute diff pixels. If server is too busy, they will be computed by diff workers before any other job
+                            try:
+                                diff_computer.compute_now(step_snapshot.refSnapshot, step_snapshot)
+                            except DiffComputerBusyError:
+                                diff_computer.add_jobs(step_snapshot.refSnapshot, step_snapshot, priority=DiffJob.PRIORITY_INTERACTIVE)
                             
                             # recompute all following snapshot as they will depend on a previous ref
                             for snap in step_snapshot.snapshotsUntilNextRef(step_snapshot):
-                                diff_computer.add_jobs(step_snapshot.refSnapshot, snap)
+                                diff_computer.add_jobs(step_snapshot.refSnapshot, snap, priority=DiffJob.PRIORITY_BULK)
         
                 ref_snapshot = step_snapshot.refSnapshot
                 
@@ -121,21 +125,19 @@ class PictureView(LoginRequiredMixinConditional, TemplateView):
                     snapshot_height = 0
                     snapshot_width = 0
                 
-                if diff_pixels_bin and snapshot_width and snapshot_height:
-                    try:
-                        diff_pixels = pickle.loads(diff_pixels_bin)
-                        diff_picture = base64.b64encode(diff_computer.get_instance().mark_diff(step_snapshot.image.width, step_snapshot.image.height, diff_pixels)).decode('ascii')
-                        diff_pixels_percentage = 0.0
-                    except Exception:
-#                         diff_picture_bin
-                        diff_picture = base64.b64encode(diff_pixels_bin).decode('ascii')
-                        with io.BytesIO(diff_pixels_bin) as input:
-                            diff_pixels_percentage = 100 * (sum(list(Image.open(input).getdata(3))) / 255) / (step_snapshot.image.width * step_snapshot.image.height)
-                            
-                else:
-                    diff_pixels = []
-                    diff_picture = None
-                    diff_pixels_percentage = 0.0
+                diff_picture = None
+                diff_pixels_percentage = 0.0
+                if diff_pixels_bin and snapshot_width and snapshot_height and step_snapshot.diffPixelCount != 0:
+                    
+                    # red picture is rendered from the stored mask only now, when a user looks at the comparison
+                    diff_mask = DiffMask.decode(diff_pixels_bin)
+                    if diff_mask is not None and diff_mask.mask.any():
+                        diff_picture = base64.b64encode(diff_mask.to_png()).decode('ascii')
+                        
+                    if step_snapshot.diffPercentage is not None:
+                        diff_pixels_percentage = step_snapshot.diffPercentage
+                    elif diff_mask is not None:
+                        diff_pixels_percentage = diff_mask.percentage()
                     
             # not snapshot has been recorded for this session
             else:
@@ -6,8 +6,10 @@ Created on 26 juil. 2017
 from django.http.response import HttpResponse
 
 from snapshotServer.controllers.diff_computer import DiffComputer
-from snapshotServer.models import Snapshot
+from snapshotServer.exceptions.diff_computer_busy_error import DiffComputerBusyError
+from snapshotServer.models import Snapshot, DiffJob
 from seleniumRobotServer.permissions.permissions import ContextSpecificPermissionsResultConsultation
+from rest_framework.exceptions import Throttled
 from rest_framework.generics import get_object_or_404, CreateAPIView
 
 class RecomputeDiffPermission(ContextSpecificPermissionsResultConsultation):
@@ -26,13 +28,13 @@ class RecomputeDiffPermission(ContextSpecificPermissionsResultConsultation):
         
     def get_application(self, request, view):
         if view.kwargs.get('snapshot_id', ''): # POST
-            return self.get_object_application(Snapshot.objects.get(pk=view.kwargs['snapshot_id']))
+            return self.get_object_application(self.get_object_for_permission(request, Snapshot, view.kwargs['snapshot_id'], 'stepResult__testCase__session__version__application', 'stepResult__testCase__session__environment'))
         else:
             return ''
 
     def get_environment(self, request, view):
         if view.kwargs.get('snapshot_id', ''): # POST
-            return self.get_object_environment(Snapshot.objects.get(pk=view.kwargs['snapshot_id']))
+            return self.get_object_environment(self.get_object_for_permission(request, Snapshot, view.kwargs['snapshot_id'], 'stepResult__testCase__session__version__application', 'stepResult__testCase__session__environment'))
         else:
             return ''
 
@@ -55,11 +57,14 @@ class RecomputeDiffView(CreateAPIView):
         if step_snapshot.refSnapshot:
             
             diff_computer = DiffComputer.get_instance()
-            diff_computer.compute_now(step_snapshot.refSnapshot, step_snapshot)
+            try:
+                diff_computer.compute_now(step_snapshot.refSnapshot, step_snapshot)
+            except DiffComputerBusyError as e:
+                raise Throttled(wait=e.retry_after, detail=str(e))
             
             # start computing differences for other snapshots sharing the same reference
             for snap in step_snapshot.snapshotWithSameRef():
-                diff_computer.add_jobs(step_snapshot.refSnapshot, snap)
+                diff_computer.add_jobs(step_snapshot.refSnapshot, snap, priority=DiffJob.PRIORITY_BULK)
             
             return HttpResponse(status=200)
         else:
@@ -2,14 +2,15 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 
 from snapshotServer.controllers.diff_computer import DiffComputer
+from snapshotServer.controllers.picture_comparator import compute_picture_hashes, decode_picture
+from snapshotServer.exceptions.diff_computer_busy_error import DiffComputerBusyError
 from snapshotServer.forms import ImageForComparisonUploadForm,\
     ImageForComparisonUploadFormNoStorage
-from snapshotServer.models import Snapshot, StepResult, Version, TestEnvironment
+from snapshotServer.models import Snapshot, StepResult, Version, TestEnvironment, SnapshotReference
 import json
 from django.http.response import HttpResponse
-import io
-from PIL import Image
 import os
+from rest_framework.exceptions import Throttled
 from rest_framework.generics import CreateAPIView, UpdateAPIView
 from seleniumRobotServer.permissions.permissions import ContextSpecificPermissionsResultRecording
 
@@ -27,15 +28,15 @@ class SnapshotUploadPermission(ContextSpecificPermissionsResultRecording):
         
     def get_application(self, request, view):
         if request.POST.get('stepResult', ''): # POST
-            return self.get_application_from_step_result(StepResult.objects.get(pk=request.POST['stepResult']))
+            return self.get_application_from_step_result(self.get_object_for_permission(request, StepResult, request.POST['stepResult'], 'testCase__session__version__application', 'testCase__session__environment'))
         elif request.POST.get('versionId', ''): #PUT
-            return self.get_application_from_version(Version.objects.get(pk=request.POST['versionId']))
+            return self.get_application_from_version(self.get_object_for_permission(request, Version, request.POST['versionId'], 'application'))
         else:
             return ''
 
     def get_environment(self, request, view):
         if request.POST.get('stepResult', ''): # POST
-            return self.get_environment_from_step_result(StepResult.objects.get(pk=request.POST['stepResult']))
+            return self.get_environment_from_step_result(self.get_object_for_permission(request, StepResult, request.POST['stepResult'], 'testCase__session__version__application', 'testCase__session__environment'))
         elif request.POST.get('environmentId', ''): #PUT
             return TestEnvironment.objects.get(pk=request.POST['environmentId'])
         else:
@@ -65,7 +66,7 @@ class SnapshotUploadView(CreateAPIView, UpdateAPIView):
         
         
         if form.is_valid():
-            return self.compare_or_store_snapshot(form, StepResult.objects.get(id=form.cleaned_data['stepResult']))
+            return self.compare_or_store_snapshot(form, StepResult.objects.select_related('testCase__session__version', 'testCase__testCase').get(id=form.cleaned_data['stepResult']))
         
         else:
             return Response(status=500, data=str(form.errors))
@@ -74,15 +75,12 @@ class SnapshotUploadView(CreateAPIView, UpdateAPIView):
         
         form = ImageForComparisonUploadFormNoStorage(request.POST, request.FILES)
 
-        try:
-            if form.is_valid():
-                return self.compare_or_store_snapshot(form, form.cleaned_data['stepResult'])
-        
-            else:
-                return Response(status=500, data=str(form.errors))
-        finally:
-            if 'testSession' in form.cleaned_data:
-                form.cleaned_data['testSession'].delete()
+        # step result is only built in memory, nothing is stored
+        if form.is_valid():
+            return self.compare_or_store_snapshot(form, form.cleaned_data['stepResult'])
+    
+        else:
+            return Response(status=500, data=str(form.errors))
     
 
     def compare_or_store_snapshot(self, form, step_result):
@@ -94,32 +92,24 @@ class SnapshotUploadView(CreateAPIView, UpdateAPIView):
         compare_option = form.cleaned_data.get('compare', 'true')       # how we compare image
         exclude_zones = form.cleaned_data.get('excludeZones', [])       # the exclusion zones that will be taken into account when computing
         
-        # check if a reference exists for this step in the same test case / same application / same version / same environment / same browser / same name
-        most_recent_reference_snapshot = Snapshot.objects.filter(stepResult__step=step_result.step,                                                    # same step in the test case
-                                                      stepResult__testCase__testCase__name=step_result.testCase.testCase.name,              # same test case
-                                                      stepResult__testCase__session__version=step_result.testCase.session.version,          # same version
-                                                      stepResult__testCase__session__environment=step_result.testCase.session.environment,  # same environment
-                                                      stepResult__testCase__session__browser__contains=step_result.testCase.session.browser,          # same browser
-                                                      refSnapshot=None,                                                                     # a reference image
-                                                      name=name).order_by('pk').last()                                                                          # same snapshot name
+        # hashes allow to detect that picture is identical to its reference without comparing pixels
+        file_hash, pixel_hash = compute_picture_hashes(image)
         
-        # check for a reference in previous versions
-        if not most_recent_reference_snapshot:
-            for app_version in reversed(step_result.testCase.session.version.previous_versions()):
-                most_recent_reference_snapshot = Snapshot.objects.filter(stepResult__step=step_result.step, 
-                                                              stepResult__testCase__testCase__name=step_result.testCase.testCase.name, 
-                                                              stepResult__testCase__session__version=app_version, 
-                                                              stepResult__testCase__session__environment=step_result.testCase.session.environment, 
-                                                              stepResult__testCase__session__browser__contains=step_result.testCase.session.browser, 
-                                                              refSnapshot=None,
-                                                              name=name).order_by('pk').last()     
-                if most_recent_reference_snapshot:
-                    break
+        # check if a reference exists for this step in the same test case / same application / same version (or previous ones) / same environment / same browser / same name
+        most_recent_reference_snapshot = SnapshotReference.find_reference(step_result, name)
         
         diff_pixels_percentage = 0.0
         
         if most_recent_reference_snapshot:
-            step_snapshot = Snapshot(stepResult=step_result, image=image, refSnapshot=most_recent_reference_snapshot, name=name, compareOption=compare_option, diffTolerance=diff_tolerance)
+            step_snapshot = Snapshot(stepResult=step_result, image=image, refSnapshot=most_recent_reference_snapshot, name=name, compareOption=compare_option, diffTolerance=diff_tolerance, 
+                                     fileHash=file_hash, pixelHash=pixel_hash)
+            
+            # picture is identical to the reference, so there is no difference to compute. Result is the same as a comparison without difference
+            same_content = step_snapshot.hasSameContentAs(most_recent_reference_snapshot)
+            if same_content:
+                step_snapshot.computed = True
+                step_snapshot.diffPixelCount = 0
+                step_snapshot.diffPercentage = 0.0
             
             # we store the snapshot for future use, when user needs to know why comparison failed
             if store_snapshot:
@@ -131,27 +121,27 @@ class SnapshotUploadView(CreateAPIView, UpdateAPIView):
                     exclude_zone.save()
             
                 # compute difference if a reference already exist
-                DiffComputer.get_instance().add_jobs(most_recent_reference_snapshot, step_snapshot)
+                if not same_content:
+                    DiffComputer.get_instance().add_jobs(most_recent_reference_snapshot, step_snapshot)
                 
             # we want the comparison result now, to tell if the test should fail or not
-            else:
-                step_snapshot.save()
+            # picture is compared in memory, without storing the snapshot or writing the file
+            elif not same_content:
                 try:
+                    DiffComputer.get_instance().compute_now(most_recent_reference_snapshot, step_snapshot, save_snapshot=False, additional_exclude_zones=exclude_zones, 
+                                                            step_picture=decode_picture(image))
 
-                    DiffComputer.get_instance().compute_now(most_recent_reference_snapshot, step_snapshot, save_snapshot=False, additional_exclude_zones=exclude_zones)
-
-                    if step_snapshot.pixelsDiff is not None:
-                        with io.BytesIO(step_snapshot.pixelsDiff) as input:
-
-                            # diff is represented by a red pixel
-                            diff_pixels_percentage = 100 * (sum(list(Image.open(input).getdata(3))) / 255) / (step_snapshot.image.width * step_snapshot.image.height)
-                finally:
-                    # we do not want object storage
-                    step_snapshot.delete()
+                    if step_snapshot.diffPercentage is not None:
+                        diff_pixels_percentage = step_snapshot.diffPercentage
+                        
+                except DiffComputerBusyError as e:
+                    # tell the client to come back later, instead of making all comparisons slower
+                    raise Throttled(wait=e.retry_after, detail=str(e))
 
         else:
             # snapshot is marked as computed as this is a reference snapshot
-            step_snapshot = Snapshot(stepResult=step_result, image=image, refSnapshot=None, name=name, compareOption=compare_option, computed=True, diffTolerance=diff_tolerance)
+            step_snapshot = Snapshot(stepResult=step_result, image=image, refSnapshot=None, name=name, compareOption=compare_option, computed=True, diffTolerance=diff_tolerance, 
+                                     fileHash=file_hash, pixelHash=pixel_hash)
             if store_snapshot:
                 step_snapshot.save()
             
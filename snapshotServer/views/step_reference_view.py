@@ -82,17 +82,17 @@ class StepReferencePermission(ContextSpecificPermissionsResultRecording):
         
     def get_application(self, request, view):
         if request.POST.get('stepResult', ''): # POST
-            return self.get_object_application(StepResult.objects.get(pk=request.data['stepResult']))
+            return self.get_object_application(self.get_object_for_permission(request, StepResult, request.data['stepResult'], 'testCase__session__version__application', 'testCase__session__environment'))
         elif view.kwargs.get('step_result_id', ''): # GET
-            return self.get_object_application(StepResult.objects.get(pk=view.kwargs['step_result_id']))
+            return self.get_object_application(self.get_object_for_permission(request, StepResult, view.kwargs['step_result_id'], 'testCase__session__version__application', 'testCase__session__environment'))
         else:
             return ''
 
     def get_environment(self, request, view):
         if request.POST.get('stepResult', ''): # POST
-            return self.get_object_environment(StepResult.objects.get(pk=request.data['stepResult']))
+            return self.get_object_environment(self.get_object_for_permission(request, StepResult, request.data['stepResult'], 'testCase__session__version__application', 'testCase__session__environment'))
         elif view.kwargs.get('step_result_id', ''): # GET
-            return self.get_object_environment(StepResult.objects.get(pk=view.kwargs['step_result_id']))
+            return self.get_object_environment(self.get_object_for_permission(request, StepResult, view.kwargs['step_result_id'], 'testCase__session__version__application', 'testCase__session__environment'))
         else:
             return ''
 
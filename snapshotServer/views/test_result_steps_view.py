@@ -0,0 +1,43 @@
+from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+from snapshotServer.views.test_result_view import TestResultView
+
+
+class TestResultStepsView(TestResultView):
+    """
+    Returns, as JSON, the rendered body of the steps of a test result, page by page
+    Used by TestResultView to load step bodies when they are expanded
+    ?page=<page number, starting at 1>&pageSize=<number of steps per page>
+    """
+    
+    max_page_size = 100
+    
+    def get(self, request, *args, **kwargs):
+        current_test = self.get_current_test()
+        
+        try:
+            page_size = min(max(int(request.GET.get('pageSize', self.steps_page_size)), 1), self.max_page_size)
+        except ValueError:
+            page_size = self.steps_page_size
+        
+        paginator = Paginator(self.step_results_queryset(current_test), page_size)
+        page = paginator.get_page(request.GET.get('page'))
+        
+        steps = []
+        for step_result in page:
+            if step_result.details is None:
+                step_result.details = {}
+            steps.append({
+                'id': step_result.id,
+                'stepId': step_result.step_id,
+                'html': render_to_string('snapshotServer/stepBody.html', {'stepResult': step_result, 'testCaseId': self.kwargs['test_case_in_session_id']}, request)
+                })
+        
+        return JsonResponse({
+            'count': paginator.count,
+            'page': page.number,
+            'pageCount': paginator.num_pages,
+            'steps': steps
+            })
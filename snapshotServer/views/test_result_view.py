@@ -8,7 +8,9 @@ from django.views.generic.list import ListView
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.utils.decorators import method_decorator
 from django.shortcuts import get_object_or_404
-from snapshotServer.models import TestCaseInSession, StepResult, Snapshot, Error, TestInfo
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from snapshotServer.models import TestCaseInSession, StepResult, Snapshot, Error
 import json
 from snapshotServer.views.login_required_mixin_conditional import LoginRequiredMixinConditional
 
@@ -16,43 +18,88 @@ from snapshotServer.views.login_required_mixin_conditional import LoginRequiredM
 class TestResultView(LoginRequiredMixinConditional, ListView):
     """
     View displaying a single test result
+    Page is built with a constant number of queries, whatever the number of steps. Only step headers are rendered in page: details
+    and snapshots of steps are not loaded, step bodies are loaded from TestResultStepsView when step is expanded
     """
     
     template_name = "snapshotServer/testResult.html"
+    
+    # number of step bodies loaded at once when a step is expanded
+    steps_page_size = 20
+    
+    def get_current_test(self):
+        """
+        Returns the requested test case in session, with everything needed to display the page header and check permissions
+        """
+        if not hasattr(self, '_current_test'):
+            self._current_test = get_object_or_404(TestCaseInSession.objects.select_related('session__version__application', 'session__environment', 'testCase'), 
+                                                   pk=self.kwargs['test_case_in_session_id'])
+        return self._current_test
+    
+    @staticmethod
+    def step_results_queryset(test_case_in_session):
+        """
+        Step results of the test, ordered by execution. Details have been parsed when step result has been recorded
+        """
+        return StepResult.objects.filter(testCase=test_case_in_session, step__in=test_case_in_session.testSteps.all()) \
+                                 .select_related('step') \
+                                 .defer('stacktrace') \
+                                 .order_by('id')
+    
+    @classmethod
+    def step_headers_queryset(cls, test_case_in_session):
+        """
+        Step results of the test, with only what step header displays. Status, name and video timestamp are read from details, which are not loaded
+        """
+        return cls.step_results_queryset(test_case_in_session) \
+                  .only('step', 'testCase', 'result', 'duration') \
+                  .annotate(stepStatus=KeyTextTransform('status', 'details'),
+                            stepName=KeyTextTransform('name', 'details'),
+                            videoTimeStamp=KeyTransform('videoTimeStamp', 'details'))
       
     def get_queryset(self):
         try:
-            test_case_in_session = self.kwargs['test_case_in_session_id']
-            test_steps = TestCaseInSession.objects.get(id=test_case_in_session).testSteps.all()
+            current_test = self.get_current_test()
+            
+            # comparison state of all snapshots of the test in one query, 'hasPixelsDiff' avoids loading the pixels
+            snapshots_by_step_result = {}
+            self.snapshots = list(Snapshot.objects.filter(stepResult__testCase=current_test)
+                                  .order_by('id')
+                                  .values('stepResult_id', 'tooManyDiffs', 'computingError', 'diffPixelCount', 
+                                          hasPixelsDiff=ExpressionWrapper(Q(pixelsDiff__isnull=False), output_field=BooleanField())))
+            for snapshot in self.snapshots:
+                snapshots_by_step_result.setdefault(snapshot['stepResult_id'], []).append(snapshot)
             
             step_snapshots = {}
-            for step_result in StepResult.objects.filter(testCase=test_case_in_session, step__in=test_steps).order_by('id'):
-                
-                # build logs from json string
-                try:
-                    details = json.loads(step_result.stacktrace)
-                except:
-                    details = {}
-                step_result.details = details
-                
-                try:
-                    step_snapshots[step_result] = list(Snapshot.objects.filter(stepResult = step_result))
-                except:
-                    step_snapshots[step_result] = None
+            for step_result in self.step_headers_queryset(current_test):
+                step_snapshots[step_result] = snapshots_by_step_result.get(step_result.id, [])
             
             return step_snapshots
                 
         except:
+            self.snapshots = []
             return []
         
+    def get_snapshot_comparison_result(self):
+        """
+        Same result as TestCaseInSession.isOkWithSnapshots, computed from the already loaded snapshots
+        """
+        if not self.snapshots:
+            return None
+        
+        computing_errors = len([s for s in self.snapshots if s['computingError']])
+        failed = len([s for s in self.snapshots if not s['computingError'] and s['tooManyDiffs'] and (s['diffPixelCount'] is not None or s['hasPixelsDiff'])])
+        return TestCaseInSession.snapshotComparisonResult(computing_errors, failed)
+        
     def get_context_data(self, **kwargs):
         context = super(TestResultView, self).get_context_data(**kwargs)
-        current_test = get_object_or_404(TestCaseInSession, pk=self.kwargs['test_case_in_session_id'])
+        current_test = self.get_current_test()
         context['currentTest'] = current_test
         context['session'] = current_test.session
         context['testCaseId'] = self.kwargs['test_case_in_session_id']
-        context['snasphotComparisonResult'] = current_test.isOkWithSnapshots()
+        context['snasphotComparisonResult'] = self.get_snapshot_comparison_result()
         context['status'] = current_test.status
+        context['stepsPageSize'] = self.steps_page_size
         
         # in case of computing error, do not display a step dedicated to it
         if context['snasphotComparisonResult'] == None:
@@ -73,13 +120,9 @@ class TestResultView(LoginRequiredMixinConditional, ListView):
             context['stacktrace'] = []
             context['logs'] = ['no logs available']
             
-        last_step = [s for s in current_test.testSteps.all() if s.name == 'Test end']
-        if last_step:
-            last_step_result = StepResult.objects.filter(testCase=current_test, step__in=last_step)
-            try:
-                context['lastStepDetails'] = json.loads(last_step_result[0].stacktrace)
-            except:
-                context['lastStepDetails'] = {}
+        last_step_results = [s for s in self.object_list if s.step.name == 'Test end']
+        if last_step_results:
+            context['lastStepDetails'] = StepResult.objects.filter(pk=last_step_results[0].id).values_list('details', flat=True).get() or {}
                 
         context['infos'] = {}
         for test_info in current_test.testInfos.all():
@@ -88,7 +131,7 @@ class TestResultView(LoginRequiredMixinConditional, ListView):
             except:
                 pass
 
-        errors = Error.objects.filter(stepResult__in=StepResult.objects.filter(testCase=current_test))
+        errors = Error.objects.filter(stepResult__testCase=current_test)
         for i, error in enumerate(errors):
             context['infos']['caused details_' + str(i)] = {"type":"errorcause","info": error.friendly_message, "errors": error.causeAnalysisErrors if error.causeAnalysisErrors else 'No error'}
 
@@ -96,12 +139,10 @@ class TestResultView(LoginRequiredMixinConditional, ListView):
         return context
     
     def get_target_application(self):
-        test_case_in_session = TestCaseInSession.objects.get(id=self.kwargs['test_case_in_session_id'])
-        return test_case_in_session.session.version.application
+        return self.get_current_test().session.version.application
 
     def get_target_environment(self):
-        test_case_in_session = TestCaseInSession.objects.get(id=self.kwargs['test_case_in_session_id'])
-        return test_case_in_session.session.environment
+        return self.get_current_test().session.environment
 
         
     
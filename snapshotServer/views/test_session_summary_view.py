@@ -4,18 +4,15 @@ Created on 3 déc. 2024
 @author: S047432
 '''
 import json
-from typing import Optional
 
+from django.db.models import Count, Min, Prefetch
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.generic.list import ListView
 
-from snapshotServer.models import TestSession, TestCaseInSession, StepResult, Error
-import json
-from django.utils import timezone
-from django.shortcuts import get_object_or_404
+from snapshotServer.models import TestSession, TestCaseInSession, StepResult, Error, TestInfo,\
+    TestCaseInSessionSummary
 from seleniumRobotServer.permissions.permissions import ENV_SPECIFIC_RESULT_VIEW_PERMISSION_PREFIX
 from snapshotServer.views.login_required_mixin_conditional import LoginRequiredMixinConditional
 
@@ -25,6 +22,7 @@ class TestSessionSummaryView(LoginRequiredMixinConditional, ListView):
     """
     View displaying a summary of tests executed during a test session
     This view will link to individual test results
+    Data is read with a fixed number of queries, whatever the number of tests in session, from the test rollups (TestCaseInSessionSummary)
     """
     
     template_name = "snapshotServer/testsSummary.html"
@@ -34,63 +32,109 @@ class TestSessionSummaryView(LoginRequiredMixinConditional, ListView):
       
     def get_queryset(self):
         
-        timezone.now()
-        
         session_id = self.kwargs['sessionId']
         test_case_in_session_data = {}
         badge_per_error = {None: {'id': -1, 'error_short': '', 'error': '', 'color': 'white'}}
         badge_index = 0
         
-        for test_case_in_session in TestCaseInSession.objects.filter(session = session_id).order_by("date"):
-            step_results = test_case_in_session.stepresult.all()
+        test_cases_in_session = TestCaseInSession.objects.filter(session=session_id)
+        errors_per_test = self.get_errors_in_tests(test_cases_in_session)
+        cluster_statistics = self.get_cluster_statistics(errors_per_test.values())
+        test_infos_per_test = self.get_test_infos(session_id)
+        
+        # step counts, duration and snapshot verdict are read from rollups
+        test_cases_in_session = list(test_cases_in_session.select_related('summary').order_by("date"))
+        summaries = TestCaseInSessionSummary.for_test_cases(test_cases_in_session)
+        
+        for test_case_in_session in test_cases_in_session:
+            summary = summaries[test_case_in_session.id]
 
-            error = self.get_error_in_test(test_case_in_session.stepresult.all().order_by("id"))
-            error_str = None
+            error = errors_per_test.get(test_case_in_session.id)
+            badge_key = None
+            related_errors = []
             
             if error:
-                error_str = str(error)
-                if error_str not in badge_per_error.keys():
-                    badge_per_error[error_str] = {'id': badge_index,
+                # similar errors share the same badge
+                badge_key = ('cluster', error.cluster_id) if error.cluster_id else str(error)
+                if badge_key not in badge_per_error.keys():
+                    badge_per_error[badge_key] = {'id': badge_index,
                                                   'error_short': error.action.split('>')[0],
-                                                  'error': error_str,
+                                                  'error': str(error),
                                                   'color': self.colors[badge_index % len(self.colors)],
-                                                  'cause': error.friendly_message()}
+                                                  'cause': error.friendly_message(),
+                                                  'cluster': cluster_statistics.get(error.cluster_id)}
                     badge_index += 1
+                    
+                # group contains the error itself, so remove our error
+                if error.group:
+                    related_errors = [e.stepResult.testCase for e in error.group.errors.all() if e.id != error.id]
 
-            
-            
             test_case_in_session_data[test_case_in_session] = {
-                        'snapshot_comparison_result': test_case_in_session.isOkWithSnapshots(),                     # no problem with snapshot comparison
-                        'steps_number': len(test_case_in_session.stepresult.all()),                                 # number of steps
-                        'failed_steps_number': len([sr for sr in step_results if not sr.result]),                   # number of failed steps
-                        'duration': int(test_case_in_session.duration() / 1000),                                    # duration
-                        'related_errors_number': self.get_related_errors_in_test(step_results),                     # number of tests with the same error
-                        'error_badge': badge_per_error[error_str],                                                  # info that will display on badge
-                        'test_infos': {info.name: json.loads(info.info) for info in test_case_in_session.testInfos.all()} # test infos
-
+                        'snapshot_comparison_result': summary.snapshotComparisonResult(),                         # no problem with snapshot comparison
+                        'steps_number': summary.stepsNumber,                                                      # number of steps
+                        'failed_steps_number': summary.failedStepsNumber,                                         # number of failed steps
+                        'duration': int(summary.duration / 1000),                                                 # duration
+                        'related_errors_number': related_errors,                                                  # number of tests with the same error
+                        'error_badge': badge_per_error[badge_key],                                                # info that will display on badge
+                        'test_infos': test_infos_per_test.get(test_case_in_session.id, {})                       # test infos
             }
 
         return test_case_in_session_data
-            
-    def get_related_errors_in_test(self, step_results: list[StepResult]) -> list[TestCaseInSession]:
-        error = self.get_error_in_test(step_results)
         
-        if error:
-            # relatedErrors contains the error itself its related, so remove our error
-            return [e.stepResult.testCase for e in error.relatedErrors.exclude(id=error.id)]
-        else:
-            return []
-        
-    def get_error_in_test(self, step_results: list[StepResult]) -> Optional[Error]:
+    def get_errors_in_tests(self, test_cases_in_session) -> dict[int, Error]:
         """
-        Returns the error that caused the test to fail (the first one)
+        Returns the error that caused each test to fail (the first error of the first failed step)
+        @return: dict {test case in session id: error}
         """
-        steps_in_error = [sr for sr in step_results if not sr.result][0:1]
-        if steps_in_error:
-            errors = steps_in_error[0].errors.all()
-            return errors[0] if errors else None
-        else:
-            return None
+        first_failed_steps = StepResult.objects.filter(testCase__in=test_cases_in_session, result=False) \
+            .values('testCase') \
+            .order_by() \
+            .annotate(first_step_result=Min('id')) \
+            .values('first_step_result')
+            
+        # groups only cover one ErrorGroup.TIME_FRAME, and only the fields displayed for related tests are read
+        related_errors = Error.objects.select_related('stepResult__testCase__session') \
+            .only('id', 'group', 'stepResult', 'stepResult__testCase', 'stepResult__testCase__name', 'stepResult__testCase__date', 
+                  'stepResult__testCase__session', 'stepResult__testCase__session__date') \
+            .order_by('id')
+            
+        errors_per_test = {}
+        for error in Error.objects.filter(stepResult__in=first_failed_steps) \
+                                  .select_related('stepResult__step', 'group') \
+                                  .prefetch_related(Prefetch('group__errors', queryset=related_errors)) \
+                                  .order_by('id'):
+            errors_per_test.setdefault(error.stepResult.testCase_id, error)
+            
+        return errors_per_test
+    
+    def get_cluster_statistics(self, errors) -> dict[int, dict]:
+        """
+        Returns, for the clusters of the errors, the number of errors, sessions and applications where they occurred
+        @return: dict {cluster id: {'errors': <count>, 'sessions': <count>, 'applications': <count>}}
+        """
+        counts = Error.objects.filter(cluster__in={error.cluster_id for error in errors if error.cluster_id}) \
+            .values('cluster') \
+            .order_by() \
+            .annotate(errors=Count('id'),
+                      sessions=Count('stepResult__testCase__session', distinct=True),
+                      applications=Count('stepResult__testCase__session__version__application', distinct=True))
+            
+        return {count.pop('cluster'): count for count in counts}
+    
+    def get_test_infos(self, session_id) -> dict[int, dict]:
+        """
+        Returns test infos of each test of the session
+        Also keeps the list of info names for the whole session, in order of appearance
+        @return: dict {test case in session id: {info name: info}}
+        """
+        self.test_info_names = []
+        test_infos_per_test = {}
+        for test_info in TestInfo.objects.filter(testCase__session=session_id).order_by('testCase', 'id'):
+            test_infos_per_test.setdefault(test_info.testCase_id, {})[test_info.name] = json.loads(test_info.info)
+            if test_info.name not in self.test_info_names:
+                self.test_info_names.append(test_info.name)
+                
+        return test_infos_per_test
         
     def get_target_application(self):
         test_session = TestSession.objects.get(id=self.kwargs['sessionId'])
@@ -106,12 +150,7 @@ class TestSessionSummaryView(LoginRequiredMixinConditional, ListView):
         
         session_id = self.kwargs['sessionId']
         context['testSession'] = get_object_or_404(TestSession, id=session_id)
-        context['testInfoList'] = []
-        
-        for test_case_in_session in context['testSession'].testcaseinsession_set.all():
-            for test_info in test_case_in_session.testInfos.all():
-                if test_info.name not in context['testInfoList']:
-                    context['testInfoList'].append(test_info.name)
+        context['testInfoList'] = self.test_info_names
 
         return context
 
@@ -29,12 +29,12 @@ class TestStatusPermission(ContextSpecificPermissionsResultRecording):
         
     def get_application(self, request, view):
         if view.kwargs.get('testCaseId', ''): # GET
-            return self.get_object_application(TestCaseInSession.objects.get(pk=view.kwargs['testCaseId']))
+            return self.get_object_application(self.get_object_for_permission(request, TestCaseInSession, view.kwargs['testCaseId'], 'session__version__application', 'session__environment'))
         return ''
 
     def get_environment(self, request, view):
         if view.kwargs.get('testCaseId', ''): # GET
-            return self.get_object_environment(TestCaseInSession.objects.get(pk=view.kwargs['testCaseId']))
+            return self.get_object_environment(self.get_object_for_permission(request, TestCaseInSession, view.kwargs['testCaseId'], 'session__version__application', 'session__environment'))
         return ''
 
 class TestStatusView(RetrieveAPIView):
@@ -55,20 +55,29 @@ class TestStatusView(RetrieveAPIView):
 
             testCase = TestCaseInSession.objects.get(pk=testCaseId)
             
+            # difference mask is not needed, result is given by stored statistics
             if testStepId:
-                snapshots = Snapshot.objects.filter(stepResult__testCase=testCase, stepResult__step=testStepId)
+                snapshots = Snapshot.objects.filter(stepResult__testCase=testCase, stepResult__step=testStepId).defer('pixelsDiff')
             else:
-                snapshots = Snapshot.objects.filter(stepResult__testCase=testCase)
+                snapshots = Snapshot.objects.filter(stepResult__testCase=testCase).defer('pixelsDiff')
             
             results = {} 
             for snapshot in snapshots:
-                if snapshot.refSnapshot is None:
+                if snapshot.refSnapshot_id is None:
                     results[snapshot.id] = True
                     continue
+                if snapshot.diffPixelCount is not None:
+                    results[snapshot.id] = not snapshot.tooManyDiffs
+                    continue
                 if snapshot.pixelsDiff is None:
                     continue
-                pixels = pickle.loads(snapshot.pixelsDiff)
-                results[snapshot.id] = not bool(pixels)
+                
+                # snapshots computed before statistics were stored
+                try:
+                    pixels = pickle.loads(snapshot.pixelsDiff)
+                    results[snapshot.id] = not bool(pixels)
+                except Exception:
+                    results[snapshot.id] = not snapshot.tooManyDiffs
                 
             return HttpResponse(json.dumps(results), content_type='application/json')
             
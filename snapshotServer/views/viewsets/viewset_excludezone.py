@@ -27,17 +27,17 @@ class ExcludeZonePermission(ContextSpecificPermissionsResultRecording):
 
     def get_application(self, request, view):
         if request.POST.get('snapshot', ''): # POST
-            return Snapshot.objects.get(pk=request.data['snapshot']).stepResult.testCase.session.version.application
+            return self.get_object_for_permission(request, Snapshot, request.data['snapshot'], 'stepResult__testCase__session__version__application', 'stepResult__testCase__session__environment').stepResult.testCase.session.version.application
         elif view.kwargs.get('pk', ''): # PATCH / DELETE, needed so that we can refuse access if object is unknown
-            return self.get_object_application(ExcludeZone.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_application(self.get_object_for_permission(request, ExcludeZone, view.kwargs['pk'], 'snapshot__stepResult__testCase__session__version__application', 'snapshot__stepResult__testCase__session__environment'))
         else:
             return ''
 
     def get_environment(self, request, view):
         if request.POST.get('snapshot', ''): # POST
-            return Snapshot.objects.get(pk=request.data['snapshot']).stepResult.testCase.session.environment
+            return self.get_object_for_permission(request, Snapshot, request.data['snapshot'], 'stepResult__testCase__session__version__application', 'stepResult__testCase__session__environment').stepResult.testCase.session.environment
         elif view.kwargs.get('pk', ''): # PATCH / DELETE, needed so that we can refuse access if object is unknown
-            return self.get_object_environment(ExcludeZone.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_environment(self.get_object_for_permission(request, ExcludeZone, view.kwargs['pk'], 'snapshot__stepResult__testCase__session__version__application', 'snapshot__stepResult__testCase__session__environment'))
         else:
             return ''
 
@@ -14,13 +14,13 @@ class ExecutionLogsPermission(ContextSpecificPermissionsResultRecording):
 
     def get_application(self, request, view):
         if request.POST.get('testCase', ''): # POST
-            return TestCaseInSession.objects.get(pk=request.data['testCase']).session.version.application
+            return self.get_object_for_permission(request, TestCaseInSession, request.data['testCase'], 'session__version__application', 'session__environment').session.version.application
         else:
             return ''
 
     def get_environment(self, request, view):
         if request.POST.get('testCase', ''): # POST
-            return TestCaseInSession.objects.get(pk=request.data['testCase']).session.environment
+            return self.get_object_for_permission(request, TestCaseInSession, request.data['testCase'], 'session__version__application', 'session__environment').session.environment
         else:
             return ''
 
@@ -48,17 +48,17 @@ class FilePermission(ContextSpecificPermissionsResultRecording):
 
     def get_application(self, request, view):
         if request.POST.get('stepResult', ''): # POST
-            return StepResult.objects.get(pk=request.data['stepResult']).testCase.session.version.application
+            return self.get_object_for_permission(request, StepResult, request.data['stepResult'], 'testCase__session__version__application', 'testCase__session__environment').testCase.session.version.application
         elif view.kwargs.get('pk', ''): # GET, needed so that we can refuse access if object is unknown
-            return self.get_object_application(File.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_application(self.get_object_for_permission(request, File, view.kwargs['pk'], 'stepResult__testCase__session__version__application', 'stepResult__testCase__session__environment'))
         else:
             return ''
 
     def get_environment(self, request, view):
         if request.POST.get('stepResult', ''): # POST
-            return StepResult.objects.get(pk=request.data['stepResult']).testCase.session.environment
+            return self.get_object_for_permission(request, StepResult, request.data['stepResult'], 'testCase__session__version__application', 'testCase__session__environment').testCase.session.environment
         elif view.kwargs.get('pk', ''): # GET, needed so that we can refuse access if object is unknown
-            return self.get_object_environment(File.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_environment(self.get_object_for_permission(request, File, view.kwargs['pk'], 'stepResult__testCase__session__version__application', 'stepResult__testCase__session__environment'))
         else:
             return ''
 
@@ -1,13 +1,10 @@
-import json
 import logging
-from datetime import timedelta
 
-from django.utils import timezone
 from rest_framework import serializers
 
 from seleniumRobotServer.permissions.permissions import ContextSpecificPermissionsResultRecording
 from snapshotServer.controllers.error_cause.error_cause_finder import ErrorCauseFinderExecutor
-from snapshotServer.models import StepResult, TestCaseInSession, Error, TestStep
+from snapshotServer.models import StepResult, TestCaseInSession, Error, TestStep, ErrorGroup, ErrorCluster
 from snapshotServer.viewsets import ResultRecordingViewSet
 
 logger = logging.getLogger(__name__)
@@ -33,17 +30,17 @@ class StepResultPermission(ContextSpecificPermissionsResultRecording):
 
     def get_application(self, request, view):
         if request.POST.get('testCase', ''): # POST
-            return TestCaseInSession.objects.get(pk=request.data['testCase']).session.version.application
+            return self.get_object_for_permission(request, TestCaseInSession, request.data['testCase'], 'session__version__application', 'session__environment').session.version.application
         elif view.kwargs.get('pk', ''): # PATCH needed so that we can refuse access if object is unknown
-            return self.get_object_application(StepResult.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_application(self.get_object_for_permission(request, StepResult, view.kwargs['pk'], 'testCase__session__version__application', 'testCase__session__environment'))
         else:
             return ''
 
     def get_environment(self, request, view):
         if request.POST.get('testCase', ''): # POST
-            return TestCaseInSession.objects.get(pk=request.data['testCase']).session.environment
+            return self.get_object_for_permission(request, TestCaseInSession, request.data['testCase'], 'session__version__application', 'session__environment').session.environment
         elif view.kwargs.get('pk', ''): # PATCH needed so that we can refuse access if object is unknown
-            return self.get_object_environment(StepResult.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_environment(self.get_object_for_permission(request, StepResult, view.kwargs['pk'], 'testCase__session__version__application', 'testCase__session__environment'))
         else:
             return ''
 
@@ -92,14 +89,14 @@ class StepResultViewSet(ResultRecordingViewSet): # post / patch
             and len(serializer.instance.stacktrace) > 100):
             try:
                 failed_step_results = StepResult.objects.filter(testCase=serializer.instance.testCase, result=False).exclude(step__name=TestStep.LAST_STEP_NAME).order_by('-pk')
-                step_result_details = json.loads(serializer.validated_data['stacktrace'])
+                step_result_details = serializer.instance.get_details()
 
                 # we won't analyze this step if it's the 'Test end' step
                 # EXCEPT when no previous step has failed (which means that error is in scenario)
                 if step_result_details['name'] == TestStep.LAST_STEP_NAME and len(failed_step_results) > 0:
                     return
 
-                failed_action, exception, exception_message, element = self.search_failed_action(step_result_details, step_result_details['action'])
+                failed_action, exception, exception_message, element = StepResult.search_failed_action(step_result_details, step_result_details['action'])
 
                 failed_action = failed_action if failed_action else step_result_details['name']
                 exception = exception if exception else step_result_details['exception']
@@ -116,44 +113,12 @@ class StepResultViewSet(ResultRecordingViewSet): # post / patch
                               element = element
                               )
                 error.save()
-                related_errors = self.search_related_errors(error)
-
-                if len(related_errors):
-                    error.relatedErrors.set(related_errors)
+                
+                # link to the same errors, raised in the last hour
+                ErrorGroup.add_error(error)
+                
+                # link to similar errors, whatever the session or application
+                ErrorCluster.add_error(error)
 
             except Exception as e:
                 logger.error("Error parsing stacktrace: " + str(e))
-
-    def search_related_errors(self, error):
-        """
-        Search for similar errors in a time frame of 1 hour
-
-        """
-        return Error.objects.filter(
-            action = error.action,
-            exception = error.exception,
-            errorMessage = error.errorMessage,
-            stepResult__testCase__date__gte=timezone.now() - timedelta(seconds=3600)
-        ).exclude(pk=error.id)
-
-    def search_failed_action(self, data, path=''):
-        """
-        Look for an action that has the 'failed' flag set to true and return the name and the exception message, if it's present
-        """
-
-        if 'actions' in data:
-
-            for action in data['actions']:
-
-                if action.get('type') == 'step' and 'actions' in action:
-                    failed_action, exception, exception_message, element = self.search_failed_action(action, path + '>' + action['action'])
-                    if failed_action:
-                        return failed_action, exception, exception_message, element
-
-                if action.get('failed', False):
-                    if action.get('element', ''):
-                        return f"{path}>{action['action']} on {action['origin']}.{action['element']}", action.get('exception', None), action.get('exceptionMessage', None), action.get('elementDescription', '')
-                    else:
-                        return f"{path}>{action['action']} in {action['origin']}", action.get('exception', None), action.get('exceptionMessage', None), ''
-
-        return None, None, None, None
\ No newline at end of file
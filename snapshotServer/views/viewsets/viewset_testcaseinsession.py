@@ -50,9 +50,9 @@ class TestCaseInSessionPermission(ContextSpecificPermissionsResultRecording):
     """
     def get_application(self, request, view):
         if request.POST.get('session', ''): # POST
-            return TestSession.objects.get(pk=request.data['session']).version.application
+            return self.get_object_for_permission(request, TestSession, request.data['session'], 'version__application', 'environment').version.application
         elif view.kwargs.get('pk', ''): # PATCH / GET, needed so that we can refuse access if object is unknown
-            return self.get_object_application(TestCaseInSession.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_application(self.get_object_for_permission(request, TestCaseInSession, view.kwargs['pk'], 'session__version__application', 'session__environment'))
         else:
             return ''
 
@@ -65,9 +65,9 @@ class TestCaseInSessionPermission(ContextSpecificPermissionsResultRecording):
 
     def get_environment(self, request, view):
         if request.POST.get('session', ''): # POST
-            return TestSession.objects.get(pk=request.data['session']).environment
+            return self.get_object_for_permission(request, TestSession, request.data['session'], 'version__application', 'environment').environment
         elif view.kwargs.get('pk', ''): # PATCH / GET, needed so that we can refuse access if object is unknown
-            return self.get_object_environment(TestCaseInSession.objects.get(pk=view.kwargs['pk']))
+            return self.get_object_environment(self.get_object_for_permission(request, TestCaseInSession, view.kwargs['pk'], 'session__version__application', 'session__environment'))
         else:
             return ''
 
@@ -19,7 +19,7 @@ class TestSessionPermission(ContextSpecificPermissionsResultRecording):
 
     def get_application(self, request, view):
         if request.POST.get('version', ''): # POST
-            return Version.objects.get(pk=request.data['version']).application
+            return self.get_object_for_permission(request, Version, request.data['version'], 'application').application
         else:
             return ''
 
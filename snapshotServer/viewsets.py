@@ -13,7 +13,8 @@ from rest_framework.permissions import AllowAny
 from django.views.generic import TemplateView
 
 from commonsServer.views.viewsets import perform_create
-from seleniumRobotServer.permissions.permissions import ContextSpecificPermissionsResultRecording
+from seleniumRobotServer.permissions.permissions import ContextSpecificPermissionsResultRecording, \
+    PermissionResolver
 from snapshotServer.models import TestSession
 from snapshotServer.views.login_required_mixin_conditional import LoginRequiredMixinConditional
 
@@ -41,6 +42,24 @@ class ResultRecordingViewSet(ViewSet,
     permission_classes = [ContextSpecificPermissionsResultRecording]
     recreate_existing_instance = True 
     
+    def get_object(self):
+        """
+        Reuse the object fetched while checking permissions (see PermissionResolver) instead of reading it again
+        Only done when the queryset is not filtered, so that the lookup gives the same result
+        """
+        queryset = self.get_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if (self.lookup_field == 'pk' 
+            and lookup_url_kwarg in self.kwargs 
+            and not queryset.query.is_empty() 
+            and not queryset.query.has_filters()):
+            obj = PermissionResolver.for_request(self.request).get_cached_object(queryset.model, self.kwargs[lookup_url_kwarg])
+            if obj is not None:
+                self.check_object_permissions(self.request, obj)
+                return obj
+        
+        return super().get_object()
+    
     def perform_create(self, serializer):
         """
         Check if we need to recreate or not the object
@@ -0,0 +1,120 @@
+import json
+import logging
+import random
+import string
+import time
+
+import numpy
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from commonsServer.tests.legacy_decryption import legacy_decrypt_data
+from commonsServer.utils import encryption
+
+logger = logging.getLogger(__name__)
+
+def percentile(durations, percent):
+    return float(numpy.percentile(durations, percent)) * 1000
+
+
+class Command(BaseCommand):
+    help = """Benchmark loading of protected (encrypted) variables, and print results as JSON
+Synthetic variables are created in a transaction which is rolled back at the end
+Timings:
+- eagerDecryption: variables are loaded and all values are decrypted with a new cipher for each value, as it was done before
+- load: variables are loaded, values are not read (e.g: filtered variables, admin list)
+- loadAndRead: variables are loaded and all values are read, decryption cache is empty
+- loadAndReadCached: variables are loaded and all values are read again, decrypted values are in cache"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variables', type=int, default=10000, help="number of protected variables to create")
+        parser.add_argument('--value-length', type=int, default=30, help="maximum length of variable values")
+        parser.add_argument('--iterations', type=int, default=5, help="number of times each scenario is timed")
+        parser.add_argument('--seed', type=int, default=0, help="seed of the random generator, so that data is the same between runs")
+        parser.add_argument('--output', help="file where JSON results are written. Defaults to standard output")
+
+    def handle(self, *args, **options):
+
+        if options['iterations'] < 1:
+            raise CommandError("At least 1 iteration is needed")
+        if options['value_length'] < 1:
+            raise CommandError("Value length must be at least 1")
+
+        with transaction.atomic():
+            try:
+                self._create_data(random.Random(options['seed']), options)
+                timings, equivalent = self._run_scenarios(options['iterations'])
+            finally:
+                transaction.set_rollback(True)
+
+        report = {
+            'variables': options['variables'],
+            'valueLength': options['value_length'],
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'cacheSize': settings.VARIABLE_DECRYPTION_CACHE_SIZE,
+            'equivalent': equivalent,
+            'timings': timings, # durations in milliseconds
+        }
+
+        content = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+        else:
+            self.stdout.write(content)
+
+    def _create_data(self, rng, options):
+        from variableServer.models import Variable, Value
+
+        characters = string.ascii_letters + string.digits
+        variables = [Variable(name='benchmark_var_%d' % i,
+                              value=Value(''.join(rng.choice(characters) for j in range(rng.randint(1, options['value_length'])))),
+                              protected=True)
+                     for i in range(options['variables'])]
+        Variable.objects.bulk_create(variables, batch_size=1000)
+        logger.info("created %d variables" % len(variables))
+
+    def _run_scenarios(self, iterations):
+        from variableServer.models import Variable
+
+        def load():
+            return list(Variable.objects.filter(name__startswith='benchmark_var_'))
+
+        def eager_decryption():
+            # values are still encrypted in loaded variables
+            return [legacy_decrypt_data(variable.__dict__['value']) for variable in load()]
+
+        def load_and_read():
+            encryption._cached_decrypt().cache_clear()
+            return [variable.value for variable in load()]
+
+        def load_and_read_cached():
+            return [variable.value for variable in load()]
+
+        calls = {
+            'eagerDecryption': eager_decryption,
+            'load': load,
+            'loadAndRead': load_and_read,
+            'loadAndReadCached': load_and_read_cached,
+        }
+
+        timings = {}
+        results = {}
+        for name, call in calls.items():
+            durations = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                results[name] = call()
+                durations.append(time.perf_counter() - start)
+
+            timings[name] = {
+                'p50': percentile(durations, 50),
+                'p95': percentile(durations, 95),
+                'min': min(durations) * 1000,
+                'max': max(durations) * 1000,
+            }
+
+        return timings, results['eagerDecryption'] == results['loadAndRead'] == results['loadAndReadCached']
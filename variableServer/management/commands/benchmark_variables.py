@@ -0,0 +1,136 @@
+import json
+import logging
+import random
+import time
+
+import numpy
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from variableServer.tests.chained_resolution import chained_queryset_resolution
+
+logger = logging.getLogger(__name__)
+
+def percentile(durations, percent):
+    return float(numpy.percentile(durations, percent)) * 1000
+
+
+class Command(BaseCommand):
+    help = """Benchmark variable resolution (variables applying to a version / environment / test), and print results as JSON
+Synthetic applications, environments, tests and variables are created in a transaction which is rolled back at the end
+VariableResolver is compared to the former chained queryset resolution"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variables', type=int, default=50000, help="number of variables to create")
+        parser.add_argument('--names', type=int, default=2000, help="number of distinct variable names")
+        parser.add_argument('--environment-depth', type=int, default=3, help="number of environments in the tree (the requested one and its generic ones)")
+        parser.add_argument('--tests', type=int, default=50, help="number of test cases")
+        parser.add_argument('--iterations', type=int, default=5, help="number of times each resolution is timed")
+        parser.add_argument('--seed', type=int, default=0, help="seed of the random generator, so that data is the same between runs")
+        parser.add_argument('--output', help="file where JSON results are written. Defaults to standard output")
+
+    def handle(self, *args, **options):
+
+        if options['iterations'] < 1:
+            raise CommandError("At least 1 iteration is needed")
+        if options['environment_depth'] < 1:
+            raise CommandError("Environment depth must be at least 1")
+
+        with transaction.atomic():
+            try:
+                version, environment, test = self._create_data(random.Random(options['seed']), options)
+                results = [self._run_scenario(version, environment, None, options['iterations']),
+                           self._run_scenario(version, environment, test, options['iterations'])]
+            finally:
+                transaction.set_rollback(True)
+
+        report = {
+            'variables': options['variables'],
+            'names': options['names'],
+            'environmentDepth': options['environment_depth'],
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'results': results,
+        }
+
+        content = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+        else:
+            self.stdout.write(content)
+
+    def _create_data(self, rng, options):
+        """
+        Creates an application with 2 linked applications, an environment tree, tests and variables spread among all scopes
+        @return: (version, environment, test) to request variables for
+        """
+        from variableServer.models import Application, Version, TestEnvironment, TestCase, Variable
+
+        applications = [Application.objects.create(name='benchmark_app_%d' % i) for i in range(3)]
+        applications[0].linkedApplication.add(*applications[1:])
+        versions = [Version.objects.create(application=applications[0], name='benchmark_%d' % i) for i in range(2)]
+
+        environment = None
+        environments = []
+        for i in range(options['environment_depth']):
+            environment = TestEnvironment.objects.create(name='benchmark_env_%d' % i, genericEnvironment=environment)
+            environments.append(environment)
+        tests = [TestCase.objects.create(name='benchmark_test_%d' % i, application=applications[0]) for i in range(max(1, options['tests']))]
+
+        variables = []
+        for i in range(options['variables']):
+            variables.append(Variable(name='var_%d' % rng.randrange(options['names']),
+                                      value='value_%d' % i,
+                                      application=rng.choice([None] + applications),
+                                      version=rng.choice([None, None] + versions),
+                                      environment=rng.choice([None] + environments),
+                                      reservable=rng.random() < 0.05,
+                                      timeToLive=rng.choice([-1, -1, -1, 5])))
+        variables = Variable.objects.bulk_create(variables, batch_size=1000)
+
+        # some variables are specific to tests
+        through = Variable.test.through
+        through.objects.bulk_create([through(variable_id=variable.id, testcase_id=rng.choice(tests).id) for variable in variables if rng.random() < 0.1],
+                                    batch_size=1000)
+
+        logger.info("created %d variables" % len(variables))
+        return versions[0], environment, tests[0]
+
+    def _run_scenario(self, version, environment, test, iterations):
+        from variableServer.models import Variable
+        from variableServer.utils.variable_resolver import VariableResolver
+
+        calls = {
+            'chainedQuerysets': lambda: chained_queryset_resolution(Variable.objects.all(), version, environment, test),
+            'resolver': lambda: VariableResolver(version, environment, test).resolve(),
+        }
+
+        timings = {}
+        results = {}
+        for name, call in calls.items():
+            durations = []
+            for i in range(iterations):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    variables, linked_variables = call()
+                    durations.append(time.perf_counter() - start)
+
+            results[name] = (sorted(set(v.id for v in variables)), sorted(set(v.id for v in linked_variables)))
+            timings[name] = {
+                'p50': percentile(durations, 50),
+                'p95': percentile(durations, 95),
+                'min': min(durations) * 1000,
+                'max': max(durations) * 1000,
+                'queries': len(queries.captured_queries),
+                'variables': len(variables),
+                'linkedVariables': len(linked_variables),
+            }
+
+        return {
+            'test': test is not None,
+            'equivalent': results['chainedQuerysets'] == results['resolver'],
+            'timings': timings, # durations in milliseconds
+        }
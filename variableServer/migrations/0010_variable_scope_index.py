@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('variableServer', '0009_alter_variable_value'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='variable',
+            index=models.Index(fields=['application', 'version', 'environment', 'name'], name='variable_scope_idx'),
+        ),
+    ]
@@ -3,16 +3,18 @@ import os
 from django.dispatch import receiver
 from django.conf import settings
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
 from django.utils import timezone
 from django.contrib import admin
 from django.urls import reverse
 from django.utils.html import format_html
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 
 from auditlog.registry import auditlog
 
 import commonsServer.models
 from commonsServer.utils.encryption import encrypt_data, decrypt_data
+from variableServer.utils.variable_cache import invalidate_variable_cache
 
 
 
@@ -35,25 +37,50 @@ class TestCase(commonsServer.models.TestCase):
 class Value(str):
     pass
 
+class EncryptedValue(str):
+    """
+    Encrypted value read from database, not decrypted yet
+    """
+    pass
+
+class EncryptedValueDescriptor(DeferredAttribute):
+    """
+    Decrypts the value of an EncryptedField the first time it's read, so that variables which are loaded but whose value is never read
+    (filtered variables, admin list which only shows 'valueProtected') are not decrypted
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncryptedValue):
+            value = instance.__dict__[self.field.attname] = decrypt_data(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
 class EncryptedField(models.CharField):
     """
     encrypted CharField in database
     Compatible with unencrypted data, encrypted strings will be carried
+    Encrypted data is decrypted when the field value is read (see EncryptedValueDescriptor)
     """
 
+    descriptor_class = EncryptedValueDescriptor
+
     def __init__(self, *args, **kwargs):
         self.prefix = "aes_str::::"
         super().__init__(*args, **kwargs)
 
     def from_db_value(self, value, expression, connection):
         """
-        After decrypting data library
+        After reading data from database. Decryption is deferred until value is read
         """
         if value is None:
             return value
         if value.startswith(self.prefix):
-            value = value[len(self.prefix):]
-            return decrypt_data(value)
+            return EncryptedValue(value[len(self.prefix):])
         else:
             return value
 
@@ -73,7 +100,10 @@ class EncryptedField(models.CharField):
         """
         Before the encrypted data storage
         """
-        if value and isinstance(value, Value):
+        if isinstance(value, EncryptedValue):
+            # value has not been decrypted
+            value = self.prefix + value
+        elif value and isinstance(value, Value):
             value = encrypt_data(value)
             value = self.prefix + value
         elif isinstance(value, str):
@@ -87,6 +117,10 @@ class Variable(models.Model):
     class Meta:
         permissions = (("see_protected_var", "Can see protected vars"),
                        )
+        indexes = [
+            # variables of one scope are read from this index when they are resolved (see VariableResolver)
+            models.Index(fields=['application', 'version', 'environment', 'name'], name='variable_scope_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -209,6 +243,53 @@ def delete_variable_file(sender, instance, **kwargs):
     if instance.uploadFile:
         instance.delete_variable_file()
 
+@receiver(post_save, sender=Variable)
+@receiver(post_save, sender=commonsServer.models.Application)
+@receiver(post_save, sender=Application)
+@receiver(post_save, sender='snapshotServer.Application')
+@receiver(post_save, sender='elementInfoServer.Application')
+@receiver(post_save, sender=commonsServer.models.Version)
+@receiver(post_save, sender=Version)
+@receiver(post_save, sender='snapshotServer.Version')
+@receiver(post_save, sender='elementInfoServer.Version')
+@receiver(post_save, sender=commonsServer.models.TestCase)
+@receiver(post_save, sender=TestCase)
+@receiver(post_save, sender='snapshotServer.TestCase')
+@receiver(post_save, sender=commonsServer.models.TestEnvironment)
+@receiver(post_save, sender=TestEnvironment)
+@receiver(post_save, sender='snapshotServer.TestEnvironment')
+def invalidate_resolved_variables(sender, instance, update_fields=None, **kwargs):
+    """
+    Resolved variables (see VariableResolver) are cached. They depend on variables, but also on linked applications, versions, tests and environment tree
+    These models are also saved through the proxy models of each application, which are listed as signals are sent with the proxy model as sender
+    Reserving / releasing a variable only saves its release date. This does not change resolution as reservation state is always read from database
+    """
+    if isinstance(instance, Variable) and instance.reservable and update_fields == frozenset(['releaseDate']):
+        return
+
+    invalidate_variable_cache()
+
+@receiver(post_delete, sender=Variable)
+@receiver(post_delete, sender=commonsServer.models.TestCase)
+@receiver(post_delete, sender=TestCase)
+@receiver(post_delete, sender='snapshotServer.TestCase')
+def invalidate_resolved_variables_on_deletion(sender, **kwargs):
+    """
+    Variables specific to a deleted test are not specific anymore
+    Deleting an application, version or environment deletes its variables
+    Senders are listed so that other models can still be deleted without signals (fast delete)
+    """
+    invalidate_variable_cache()
+
+@receiver(m2m_changed, sender=Variable.test.through)
+@receiver(m2m_changed, sender=commonsServer.models.Application.linkedApplication.through)
+def invalidate_resolved_variables_on_relation_change(sender, action, **kwargs):
+    """
+    Tests of a variable or linked applications changed
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_variable_cache()
+
 def custom_mask(value: str) -> str:
     return value[:2] + "****" + value[-1:]
 
@@ -0,0 +1,45 @@
+import datetime
+
+from django.utils import timezone
+
+from variableServer.utils.utils import updateVariables
+
+def chained_queryset_resolution(queryset, version, environment, test=None, older_than=0, variable_name=None):
+    """
+    Variable resolution as it was done before VariableResolver, with one queryset layer per scope
+    Kept as a reference: tests compare results with VariableResolver, and 'benchmark_variables' command compares performance
+    @return: (variables of the application, variables of the linked applications)
+    """
+    all_variables = queryset.filter(timeToLive__lte=0) | queryset.filter(timeToLive__gt=0, creationDate__lt=timezone.now() - datetime.timedelta(older_than))
+
+    variables = all_variables.filter(application=None, version=None, environment=None, test=None)
+    variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=None, test=None))
+    variables = updateVariables(variables, all_variables.filter(application=version.application, version=version, environment=None, test=None))
+
+    environment_tree = [environment] + environment.get_parent_environments()
+    environment_tree.reverse()
+
+    for env in environment_tree:
+        variables = updateVariables(variables, all_variables.filter(application=None, version=None, test=None, environment=env))
+    variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=None, test=test))
+    for env in environment_tree:
+        variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=env, test=None))
+    for env in environment_tree:
+        variables = updateVariables(variables, all_variables.filter(application=version.application, version=version, environment=env, test=None))
+    if test:
+        for env in environment_tree:
+            variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=env, test=test))
+        for env in environment_tree:
+            variables = updateVariables(variables, all_variables.filter(application=version.application, version=version, environment=env, test=test))
+
+    linked_application_variables = queryset.none()
+    for linked_application in version.application.linkedApplication.all():
+        linked_application_variables = updateVariables(linked_application_variables, all_variables.filter(application=linked_application, version=None, environment=None, test=None, reservable=False))
+        for env in environment_tree:
+            linked_application_variables = updateVariables(linked_application_variables, all_variables.filter(application=linked_application, version=None, environment=env, test=None, reservable=False))
+
+    if variable_name:
+        variables = variables.filter(name=variable_name)
+        linked_application_variables = linked_application_variables.filter(name=variable_name)
+
+    return list(variables), list(linked_application_variables)
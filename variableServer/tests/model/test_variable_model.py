@@ -1,9 +1,12 @@
+import io
 import json
+from unittest.mock import patch
 
+from django.core.management import call_command
 from django.test.testcases import TestCase
 from django.db import connection
 
-from variableServer.models import Variable, Value, Application
+from variableServer.models import Variable, Value, Application, EncryptedValue
 
 
 class TestAdmin(TestCase):
@@ -88,6 +91,62 @@ class TestAdmin(TestCase):
             row = cursor.fetchone()
             self.assertEqual(row[0], 'myValue')
 
+    def test_protected_value_decrypted_when_read(self):
+        """
+        Value is decrypted only when it's read, and only once
+        """
+        Variable(name="key", value="myValue", protected=True).save()
+
+        with patch('variableServer.models.decrypt_data', autospec=True, side_effect=lambda value: 'myValue') as mock_decrypt:
+            var = Variable.objects.get(name='key')
+            self.assertEqual('****', var.valueProtected())
+            self.assertIsInstance(var.__dict__['value'], EncryptedValue)
+            mock_decrypt.assert_not_called()
+
+            self.assertEqual(var.value, 'myValue')
+            self.assertEqual(var.value, 'myValue')
+            self.assertEqual(1, mock_decrypt.call_count)
+
+    def test_save_loaded_protected_variable(self):
+        """
+        Check value of a loaded protected variable is still encrypted after save
+        """
+        Variable(name="key", value="myValue", protected=True).save()
+
+        var = Variable.objects.get(name='key')
+        var.description = 'new description'
+        var.save()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT value from variableServer_variable WHERE name = 'key'")
+            self.assertTrue(cursor.fetchone()[0].startswith('aes_str::::'))
+        self.assertEqual(Variable.objects.get(name='key').value, 'myValue')
+
+    def test_save_protected_to_not_protected_variable(self):
+        """
+        Check value is decrypted in database when variable is not protected anymore
+        """
+        Variable(name="key", value="myValue", protected=True).save()
+
+        var = Variable.objects.get(name='key')
+        var.protected = False
+        var.save()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT value from variableServer_variable WHERE name = 'key'")
+            self.assertEqual(cursor.fetchone()[0], 'myValue')
+
+    def test_benchmark_decryption(self):
+        out = io.StringIO()
+        call_command('benchmark_decryption', variables=50, iterations=1, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertTrue(report['equivalent'])
+        self.assertEqual({'eagerDecryption', 'load', 'loadAndRead', 'loadAndReadCached'}, set(report['timings']))
+
+        # benchmark data is removed
+        self.assertFalse(Variable.objects.filter(name__startswith='benchmark_var_').exists())
+
     def test_name_with_app_without_app(self):
         var = Variable(name="key", value="myValue", protected=False)
         self.assertEqual(var.nameWithApp(), 'key')
@@ -1,19 +1,25 @@
 import datetime
 import time
 import os
+from unittest.mock import patch
 
+from auditlog.models import LogEntry
 from django.contrib.auth.models import Permission
+from django.db import connection
 from django.db.models import Q
 from django.test import override_settings
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls.base import reverse
 from django.utils import timezone
 from django.conf import settings
 
 from commonsServer.tests.test_api import TestApi
+from variableServer.exceptions.AllVariableAlreadyReservedException import AllVariableAlreadyReservedException
 from variableServer.models import Variable, Version, \
     TestEnvironment, TestCase, Application
 from variableServer.utils.utils import updateVariables
+from variableServer.views.api_view import VariableFilter, reservation_waiters
 
 
 class TestApiView(TestApi):
@@ -381,7 +387,7 @@ class TestApiView(TestApi):
         Check that release dates are correctly managed
         variable is returned if
         - releaseDate is None
-        - releaseDate is in the past (then it should be set to None)
+        - releaseDate is in the past (then it should be returned as None, but it's only reset in database by scheduled job)
         """
         self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='view_variable')))
         version = Version.objects.get(pk=3)
@@ -402,6 +408,7 @@ class TestApiView(TestApi):
         self.assertEqual("value2", all_variables['var1']['value'])
         self.assertIsNone(all_variables['var1']['releaseDate'])  # release date should be reset
         self.assertTrue('var0' in all_variables)  # no release date
+        self.assertIsNotNone(Variable.objects.get(pk=all_variables['var1']['id']).releaseDate)
 
 
     def test_get_variables_override_global(self):
@@ -799,6 +806,144 @@ class TestApiView(TestApi):
                           'releaseDate should be null as variable should not be reserved')
 
 
+    def test_reserve_variables_with_one_update(self):
+        """
+        Reservable variables are reserved with a single update, without audit log entry
+        """
+        version = Version.objects.get(pk=3)
+        Variable(name='login1', value='user1', application=version.application, reservable=True).save()
+        Variable(name='login2', value='user2', application=version.application, reservable=True).save()
+        log_entries = LogEntry.objects.count()
+
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='view_variable')))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('variableApi'), data={'version': 3, 'environment': 3, 'test': 1})
+        self.assertEqual(response.status_code, 200, 'status code should be 200: ' + str(response.content))
+
+        all_variables = self._convert_to_dict(response.data)
+        self.assertIsNotNone(all_variables['login1']['releaseDate'])
+        self.assertIsNotNone(all_variables['login2']['releaseDate'])
+        self.assertEqual(2, Variable.objects.filter(name__in=['login1', 'login2']).exclude(releaseDate=None).count())
+        self.assertEqual(1, len([q for q in queries.captured_queries if q['sql'].startswith('UPDATE "variableServer_variable"')]))
+        self.assertEqual(log_entries, LogEntry.objects.count())
+
+    def test_lock_skips_unavailable_variable(self):
+        """
+        When the picked variable has been reserved by an other request, an other variable with the same name is used
+        """
+        version = Version.objects.get(pk=3)
+        variable1 = Variable.objects.create(name='login', value='user1', application=version.application, reservable=True)
+        variable2 = Variable.objects.create(name='login', value='user2', application=version.application, reservable=True)
+        candidates = [variable1, variable2]
+
+        # variable1 is reserved after candidates have been read
+        Variable.objects.filter(pk=variable1.id).update(releaseDate=timezone.now() + datetime.timedelta(seconds=60))
+
+        for i in range(5):
+            locked_variables = VariableFilter()._lock_one_variable_per_name(candidates, timezone.now())
+            self.assertEqual([variable2], locked_variables)
+
+        # no variable available anymore
+        Variable.objects.filter(pk=variable2.id).update(releaseDate=timezone.now() + datetime.timedelta(seconds=60))
+        self.assertEqual([], VariableFilter()._lock_one_variable_per_name(candidates, timezone.now()))
+
+    def test_reserve_variable_reserved_in_the_meantime(self):
+        """
+        Without row locks (SQLite), an other request may reserve the variable between selection and reservation
+        """
+        version = Version.objects.get(pk=3)
+        variable = Variable.objects.create(name='login', value='user1', application=version.application, reservable=True)
+        Variable.objects.filter(pk=variable.id).update(releaseDate=timezone.now() + datetime.timedelta(seconds=60))
+
+        with self.assertRaises(AllVariableAlreadyReservedException):
+            VariableFilter()._reserve_reservable_variables([variable], 'app', 'version', 'env', 'test', 60, timezone.now())
+
+    def test_reserve_other_candidate_when_reserved_in_the_meantime(self):
+        """
+        Without row locks (SQLite), when the variable has been reserved by an other request, an other available variable with the same name is reserved
+        """
+        version = Version.objects.get(pk=3)
+        variable1 = Variable.objects.create(name='login', value='user1', application=version.application, reservable=True)
+        variable2 = Variable.objects.create(name='login', value='user2', application=version.application, reservable=True)
+        variable3 = Variable.objects.create(name='login', value='user3', application=version.application, reservable=True)
+        password = Variable.objects.create(name='password', value='pwd', application=version.application, reservable=True)
+        url = Variable.objects.create(name='url', value='http://app', application=version.application)
+        Variable.objects.filter(pk__in=[variable1.id, variable2.id]).update(releaseDate=timezone.now() + datetime.timedelta(seconds=60))
+
+        reserved_variables = VariableFilter()._reserve_reservable_variables([variable1, password, url], 'app', 'version', 'env', 'test', 60, timezone.now(),
+                                                                            [variable1, variable2, variable3, password])
+        self.assertEqual([variable3, password, url], reserved_variables)
+        self.assertIsNotNone(reserved_variables[0].releaseDate)
+        self.assertIsNotNone(Variable.objects.get(pk=variable3.id).releaseDate)
+        self.assertIsNotNone(Variable.objects.get(pk=password.id).releaseDate)
+
+        # all candidates have been reserved
+        with self.assertRaises(AllVariableAlreadyReservedException):
+            VariableFilter()._reserve_reservable_variables([variable1], 'app', 'version', 'env', 'test', 60, timezone.now(), [variable1, variable2, variable3])
+
+
+    def test_wait_for_reservation_end(self):
+        """
+        With 'wait' parameter, request waits for the reservation of the variable to end, instead of failing
+        """
+        version = Version.objects.get(pk=3)
+        variable = Variable.objects.create(name='login', value='user1', application=version.application, reservable=True,
+                                           releaseDate=timezone.now() + datetime.timedelta(seconds=1))
+
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='view_variable')))
+        start = time.monotonic()
+        response = self.client.get(reverse('variableApi'), data={'version': 3, 'environment': 3, 'test': 1, 'wait': 10})
+        self.assertEqual(response.status_code, 200, 'status code should be 200: ' + str(response.content))
+        self.assertLess(time.monotonic() - start, 5)
+
+        all_variables = self._convert_to_dict(response.data)
+        self.assertEqual(variable.id, all_variables['login']['id'])
+        self.assertIsNotNone(all_variables['login']['releaseDate'])
+
+    def test_wait_for_reservation_timeout(self):
+        """
+        When waiting delay is over, request fails as if it did not wait
+        """
+        version = Version.objects.get(pk=3)
+        Variable.objects.create(name='login', value='user1', application=version.application, reservable=True,
+                                releaseDate=timezone.now() + datetime.timedelta(seconds=60))
+
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='view_variable')))
+        start = time.monotonic()
+        response = self.client.get(reverse('variableApi'), data={'version': 3, 'environment': 3, 'test': 1, 'wait': 1})
+        self.assertEqual(response.status_code, 423, 'status code should be 423: ' + str(response.content))
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+
+    def test_wait_queue_shared_by_pool(self):
+        """
+        Requests reserving from the same pool of variables are queued together, even if they request different contexts
+        """
+        version = Version.objects.get(pk=3)
+        variable1 = Variable.objects.create(name='login', value='user1', application=version.application, reservable=True)
+        variable2 = Variable.objects.create(name='login', value='user2', application=version.application, reservable=True)
+
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='view_variable')))
+        with patch.object(reservation_waiters, 'wait', side_effect=lambda key, attempt, timeout, retry_delay: attempt()) as mock_wait:
+            self.client.get(reverse('variableApi'), data={'version': 3, 'environment': 3, 'test': 1, 'wait': 1})
+            self.client.get(reverse('variableApi'), data={'version': 3, 'environment': 3, 'test': 1, 'name': 'login', 'wait': 1})
+
+        self.assertEqual(frozenset([variable1.id, variable2.id]), mock_wait.call_args_list[0][0][0])
+        self.assertEqual(frozenset([variable1.id, variable2.id]), mock_wait.call_args_list[1][0][0])
+
+    def test_reservation_statistics(self):
+        user, client = self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='view_variable')))
+        response = self.client.get(reverse('variableReservationStatistics'))
+        self.assertEqual(response.status_code, 200, 'status code should be 200: ' + str(response.content))
+        self.assertIn('waiting', response.data)
+        self.assertIn('averageWaitTime', response.data)
+
+        # only for administrators
+        user.is_staff = False
+        user.save()
+        response = self.client.get(reverse('variableReservationStatistics'))
+        self.assertEqual(response.status_code, 403, 'status code should be 403: ' + str(response.content))
+
+
     def test_reservable_state_correction_without_permission(self):
         """
         Check 'add_variable' permission is required to set reservable state
@@ -1103,7 +1248,8 @@ class TestApiView(TestApi):
 
     def test_destroy_old_variables(self):
         """
-        Check that if a variable reached its max number of days, it's automatically removed
+        Check that if a variable reached its max number of days, it's not returned
+        It's deleted by scheduled job, not by the request
         """
 
         version = Version.objects.get(pk=2)
@@ -1120,6 +1266,7 @@ class TestApiView(TestApi):
         all_variables = self._convert_to_dict(response.data)
 
         self.assertNotIn('oldVar', all_variables, "oldVar should be removed, as it's too old")
+        self.assertTrue(Variable.objects.filter(name='oldVar').exists())
 
 
     def test_do_not_destroy_not_so_old_variables(self):
@@ -0,0 +1,82 @@
+import datetime
+import os
+from unittest.mock import patch
+
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
+from variableServer.models import Variable, Application
+from variableServer.models import TestCase as TestCaseModel
+from variableServer.utils.expiry import release_expired_reservations, delete_expired_variables
+
+
+class TestExpiry(TestCase):
+    '''
+    Expired reservations and variables are handled by a scheduled job
+    '''
+
+    def setUp(self):
+        self.application = Application.objects.create(name='expiryApp')
+
+    def test_release_expired_reservations(self):
+        reserved = Variable.objects.create(name='login', value='user1', application=self.application, reservable=True,
+                                           releaseDate=timezone.now() + datetime.timedelta(seconds=60))
+        released = Variable.objects.create(name='login', value='user2', application=self.application, reservable=True,
+                                           releaseDate=timezone.now() - datetime.timedelta(seconds=60))
+
+        self.assertEqual(1, release_expired_reservations())
+        self.assertIsNotNone(Variable.objects.get(pk=reserved.id).releaseDate)
+        self.assertIsNone(Variable.objects.get(pk=released.id).releaseDate)
+
+    def test_delete_expired_variables(self):
+        """
+        Only variables whose time to live is over are deleted, with their test relations
+        """
+        test = TestCaseModel.objects.create(name='expiryTest', application=self.application)
+        expired = Variable.objects.create(name='old', value='old', creationDate=timezone.now() - datetime.timedelta(days=2), timeToLive=1)
+        expired.test.add(test)
+        Variable.objects.create(name='young', value='young', creationDate=timezone.now() - datetime.timedelta(hours=23), timeToLive=1)
+        Variable.objects.create(name='forever', value='forever', creationDate=timezone.now() - datetime.timedelta(days=2), timeToLive=-1)
+        Variable.objects.create(name='forever0', value='forever', creationDate=timezone.now() - datetime.timedelta(days=2), timeToLive=0)
+
+        self.assertEqual(1, delete_expired_variables())
+        self.assertEqual({'young', 'forever', 'forever0'}, set(Variable.objects.values_list('name', flat=True)))
+        self.assertFalse(Variable.test.through.objects.filter(variable_id=expired.id).exists())
+        self.assertEqual(0, delete_expired_variables())
+
+    def test_delete_expired_variables_by_batch(self):
+        """
+        Expired variables are deleted by batches, and their deletion is recorded in audit log
+        """
+        for i in range(5):
+            Variable.objects.create(name='old%d' % i, value='old', creationDate=timezone.now() - datetime.timedelta(days=2), timeToLive=1)
+        Variable.objects.create(name='young', value='young', creationDate=timezone.now() - datetime.timedelta(hours=23), timeToLive=1)
+
+        with patch('variableServer.utils.expiry.DELETION_BATCH_SIZE', 2):
+            self.assertEqual(5, delete_expired_variables())
+
+        self.assertEqual(['young'], list(Variable.objects.values_list('name', flat=True)))
+        self.assertEqual(5, LogEntry.objects.get_for_model(Variable).filter(action=LogEntry.Action.DELETE).count())
+
+    def test_delete_expired_variables_with_file(self):
+        """
+        File of an expired variable is deleted too
+        """
+        file_path = os.path.join(settings.MEDIA_ROOT, 'variables', 'expiryApp', 'expired.csv')
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w') as f:
+            f.write('some,data')
+
+        Variable.objects.create(name='file', uploadFile='variables/expiryApp/expired.csv', application=self.application,
+                                creationDate=timezone.now() - datetime.timedelta(days=2), timeToLive=1)
+
+        try:
+            self.assertEqual(1, delete_expired_variables())
+            self.assertFalse(Variable.objects.filter(name='file').exists())
+            self.assertFalse(os.path.exists(file_path))
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            os.rmdir(os.path.dirname(file_path))
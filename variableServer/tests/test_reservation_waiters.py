@@ -0,0 +1,124 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from variableServer.exceptions.AllVariableAlreadyReservedException import AllVariableAlreadyReservedException
+from variableServer.utils.reservation_waiters import ReservationWaiters
+
+
+class Pool:
+    """
+    Pool of variables, shared between threads
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self.lock = threading.Lock()
+
+    def reserve(self, name='login'):
+        with self.lock:
+            if self.size == 0:
+                raise AllVariableAlreadyReservedException([name])
+            self.size -= 1
+            return name
+
+    def release(self, waiters):
+        with self.lock:
+            self.size += 1
+        waiters.notify_release()
+
+
+class TestReservationWaiters(SimpleTestCase):
+
+    def _wait_in_thread(self, waiters, pool, name, timeout, results):
+        def wait():
+            try:
+                results[name] = waiters.wait('key', lambda: pool.reserve(name), timeout, lambda: 60)
+            except AllVariableAlreadyReservedException:
+                results[name] = None
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        return thread
+
+    def _wait_for_waiters(self, waiters, count):
+        for i in range(100):
+            if waiters.stats()['waiting'] == count:
+                return
+            time.sleep(0.02)
+        self.fail("%d waiters expected" % count)
+
+    def test_served_immediately(self):
+        waiters = ReservationWaiters(10)
+        self.assertEqual('login', waiters.wait('key', Pool(1).reserve, 5, lambda: 1))
+
+        stats = waiters.stats()
+        self.assertEqual(1, stats['served'])
+        self.assertEqual(0, stats['waiting'])
+
+    def test_timeout(self):
+        waiters = ReservationWaiters(10)
+        start = time.monotonic()
+        with self.assertRaises(AllVariableAlreadyReservedException):
+            waiters.wait('key', Pool(0).reserve, 0.3, lambda: 0.1)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        stats = waiters.stats()
+        self.assertEqual(1, stats['timeouts'])
+        self.assertGreaterEqual(stats['maxWaitTime'], 300)
+
+    def test_woken_by_release(self):
+        """
+        Waiting request tries again as soon as a variable is released, without waiting for retry delay
+        """
+        waiters = ReservationWaiters(10)
+        pool = Pool(0)
+        results = {}
+        thread = self._wait_in_thread(waiters, pool, 'login', 10, results)
+        self._wait_for_waiters(waiters, 1)
+
+        start = time.monotonic()
+        pool.release(waiters)
+        thread.join(5)
+
+        self.assertEqual('login', results['login'])
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_retried_after_delay(self):
+        """
+        Without notification (e.g: reservation ended), request tries again after retry delay
+        """
+        waiters = ReservationWaiters(10)
+        pool = Pool(0)
+        threading.Timer(0.2, lambda: setattr(pool, 'size', 1)).start()
+
+        self.assertEqual('login', waiters.wait('key', pool.reserve, 5, lambda: 0.1))
+
+    def test_served_in_arrival_order(self):
+        waiters = ReservationWaiters(10)
+        pool = Pool(0)
+        results = {}
+        first = self._wait_in_thread(waiters, pool, 'first', 10, results)
+        self._wait_for_waiters(waiters, 1)
+        second = self._wait_in_thread(waiters, pool, 'second', 1, results)
+        self._wait_for_waiters(waiters, 2)
+
+        pool.release(waiters)
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual('first', results['first'])
+        self.assertIsNone(results['second'])
+
+    def test_too_many_waiters(self):
+        """
+        Over the limit, request does not wait
+        """
+        waiters = ReservationWaiters(0)
+        start = time.monotonic()
+        with self.assertRaises(AllVariableAlreadyReservedException):
+            waiters.wait('key', Pool(0).reserve, 10, lambda: 1)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(1, waiters.stats()['rejected'])
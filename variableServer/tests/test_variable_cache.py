@@ -0,0 +1,165 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.test import override_settings
+from django.urls.base import reverse
+
+from commonsServer.tests.test_api import TestApi
+import snapshotServer.models
+from variableServer.models import Variable, Version, TestEnvironment, TestCase, Application
+from variableServer.utils.variable_cache import GENERATION_KEY, get_resolved_variables
+from variableServer.utils.variable_resolver import VariableResolver
+
+
+@override_settings(VARIABLE_CACHE_TIMEOUT=60)
+class TestVariableCache(TestApi):
+    '''
+    Resolved variables are cached, and cache is invalidated when anything used for resolution changes
+    Cache is disabled by default (VARIABLE_CACHE_TIMEOUT)
+    '''
+
+    def setUp(self):
+        self.application = Application.objects.create(name='cacheApp')
+        self.linked_application = Application.objects.create(name='cacheLinkedApp')
+        self.version = Version.objects.create(name='1.0', application=self.application)
+        self.generic_environment = TestEnvironment.objects.create(name='cacheGenericEnv')
+        self.environment = TestEnvironment.objects.create(name='cacheEnv')
+        self.test = TestCase.objects.create(name='cacheTest', application=self.application)
+        self.other_test = TestCase.objects.create(name='cacheOtherTest', application=self.application)
+
+        Variable.objects.create(name='url', value='http://app', application=self.application)
+        self._create_and_authenticate_user_with_permissions(Permission.objects.filter(Q(codename='view_variable') | Q(codename='change_variable')))
+
+    def _get_variables(self, **params):
+        data = {'version': self.version.id, 'environment': self.environment.id, 'test': self.test.id}
+        data.update(params)
+        response = self.client.get(reverse('variableApi'), data=data)
+        self.assertEqual(response.status_code, 200, 'status code should be 200: ' + str(response.content))
+        return {variable['name']: variable for variable in response.data}
+
+    def test_variables_resolved_once(self):
+        """
+        Same context requested twice is resolved only once
+        """
+        with patch('variableServer.views.api_view.VariableResolver.resolve', autospec=True, side_effect=VariableResolver.resolve) as mock_resolve:
+            self.assertEqual('http://app', self._get_variables()['url']['value'])
+            self.assertEqual('http://app', self._get_variables()['url']['value'])
+            self.assertEqual(1, mock_resolve.call_count)
+
+            # an other context is resolved
+            self._get_variables(test=self.other_test.id)
+            self._get_variables(name='url')
+            self.assertEqual(3, mock_resolve.call_count)
+
+    @override_settings(VARIABLE_CACHE_TIMEOUT=0)
+    def test_variables_resolved_without_cache(self):
+        with patch('variableServer.views.api_view.VariableResolver.resolve', autospec=True, side_effect=VariableResolver.resolve) as mock_resolve:
+            self._get_variables()
+            self._get_variables()
+            self.assertEqual(2, mock_resolve.call_count)
+
+    def test_variables_older_than_not_cached(self):
+        """
+        With 'olderThan', returned variables depend on time, so they are not cached
+        """
+        with patch('variableServer.views.api_view.VariableResolver.resolve', autospec=True, side_effect=VariableResolver.resolve) as mock_resolve:
+            self._get_variables(olderThan=1)
+            self._get_variables(olderThan=1)
+            self.assertEqual(2, mock_resolve.call_count)
+
+    def test_invalidate_on_variable_creation(self):
+        self._get_variables()
+        Variable.objects.create(name='url', value='http://env', application=self.application, environment=self.environment)
+        self.assertEqual('http://env', self._get_variables()['url']['value'])
+
+    def test_invalidate_on_variable_update(self):
+        self._get_variables()
+        variable = Variable.objects.get(name='url', application=self.application)
+        variable.value = 'http://app2'
+        variable.save()
+        self.assertEqual('http://app2', self._get_variables()['url']['value'])
+
+    def test_invalidate_on_variable_deletion(self):
+        self._get_variables()
+        Variable.objects.get(name='url', application=self.application).delete()
+        self.assertNotIn('url', self._get_variables())
+
+    def test_invalidate_on_variable_test_change(self):
+        """
+        Variable becomes specific to an other test
+        """
+        self._get_variables()
+        Variable.objects.get(name='url', application=self.application).test.add(self.other_test)
+        self.assertNotIn('url', self._get_variables())
+
+    def test_invalidate_on_linked_application_change(self):
+        Variable.objects.create(name='login', value='user', application=self.linked_application)
+        self.assertNotIn('cacheLinkedApp.login', self._get_variables())
+
+        self.application.linkedApplication.add(self.linked_application)
+        self.assertIn('cacheLinkedApp.login', self._get_variables())
+
+    def test_invalidate_on_generic_environment_change(self):
+        Variable.objects.create(name='url', value='http://generic', application=self.application, environment=self.generic_environment)
+        self.assertEqual('http://app', self._get_variables()['url']['value'])
+
+        self.environment.genericEnvironment = self.generic_environment
+        self.environment.save()
+        self.assertEqual('http://generic', self._get_variables()['url']['value'])
+
+    def test_invalidate_on_proxy_model_change(self):
+        """
+        Models used for resolution are saved through the proxy models of each application
+        """
+        Variable.objects.create(name='url', value='http://generic', application=self.application, environment=self.generic_environment)
+        self.assertEqual('http://app', self._get_variables()['url']['value'])
+
+        environment = snapshotServer.models.TestEnvironment.objects.get(pk=self.environment.id)
+        environment.genericEnvironment = self.generic_environment
+        environment.save()
+        self.assertEqual('http://generic', self._get_variables()['url']['value'])
+
+    def test_invalidate_once_committed(self):
+        """
+        Variables resolved by other requests before the change is committed are not kept in cache
+        """
+        self._get_variables()
+        generation = cache.get(GENERATION_KEY)
+        with transaction.atomic():
+            Variable.objects.create(name='url', value='http://env', application=self.application, environment=self.environment)
+            self.assertEqual(generation + 1, cache.get(GENERATION_KEY))
+
+            # resolved from the state before commit
+            get_resolved_variables(self.version, self.environment, self.test, None, lambda: ([], []))
+
+        self.assertEqual(generation + 2, cache.get(GENERATION_KEY))
+        self.assertEqual('http://env', self._get_variables()['url']['value'])
+
+    def test_reservable_variables_reserved_from_cache(self):
+        """
+        Reservation state is always read from database, and reserving / releasing a variable does not invalidate cache
+        """
+        Variable.objects.create(name='login', value='user1', application=self.application, reservable=True)
+        Variable.objects.create(name='login', value='user2', application=self.application, reservable=True)
+
+        with patch('variableServer.views.api_view.VariableResolver.resolve', autospec=True, side_effect=VariableResolver.resolve) as mock_resolve:
+            login1 = self._get_variables()['login']
+            login2 = self._get_variables()['login']
+            self.assertNotEqual(login1['id'], login2['id'])
+            self.assertIsNotNone(login1['releaseDate'])
+            self.assertIsNotNone(login2['releaseDate'])
+
+            # all variables are reserved
+            response = self.client.get(reverse('variableApi'), data={'version': self.version.id, 'environment': self.environment.id, 'test': self.test.id})
+            self.assertEqual(response.status_code, 423, 'status code should be 423: ' + str(response.content))
+
+            # release one of them
+            response = self.client.patch(reverse('variableApiPut', kwargs={'pk': login1['id']}), {'releaseDate': ''})
+            self.assertEqual(response.status_code, 200, 'status code should be 200: ' + str(response.content))
+            self.assertIsNone(Variable.objects.get(pk=login1['id']).releaseDate)
+
+            self.assertEqual(login1['id'], self._get_variables()['login']['id'])
+            self.assertEqual(1, mock_resolve.call_count)
@@ -0,0 +1,145 @@
+import datetime
+import io
+import json
+import random
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from variableServer.models import Variable, Version, TestEnvironment, Application
+from variableServer.models import TestCase as TestCaseModel
+from variableServer.tests.chained_resolution import chained_queryset_resolution
+from variableServer.utils.expiry import expired_filter
+from variableServer.utils.variable_resolver import VariableResolver
+
+
+class TestVariableResolver(TestCase):
+    '''
+    VariableResolver must give the same variables as the former chained queryset resolution
+    '''
+
+    def setUp(self):
+        self.applications = [Application.objects.create(name='app_%d' % i) for i in range(4)]
+        self.applications[0].linkedApplication.add(self.applications[1], self.applications[2])
+        self.versions = [Version.objects.create(application=self.applications[0], name='v%d' % i) for i in range(2)]
+        self.versions.append(Version.objects.create(application=self.applications[3], name='v'))
+
+        self.environments = []
+        generic_environment = None
+        for i in range(3):
+            generic_environment = TestEnvironment.objects.create(name='env_%d' % i, genericEnvironment=generic_environment)
+            self.environments.append(generic_environment)
+        self.environments.append(TestEnvironment.objects.create(name='other_env'))
+
+        self.tests = [TestCaseModel.objects.create(name='test_%d' % i, application=self.applications[0]) for i in range(3)]
+
+    def _create_variables(self, seed, count=400, names=25):
+        rng = random.Random(seed)
+        for i in range(count):
+            variable = Variable.objects.create(name='var_%d' % rng.randrange(names),
+                                               value='value_%d' % i,
+                                               application=rng.choice([None] + self.applications),
+                                               version=rng.choice([None, None] + self.versions),
+                                               environment=rng.choice([None] + self.environments),
+                                               reservable=rng.random() < 0.1,
+                                               timeToLive=rng.choice([-1, -1, 0, 5]),
+                                               creationDate=timezone.now() - datetime.timedelta(days=rng.choice([0, 10])))
+            if rng.random() < 0.3:
+                variable.test.set(rng.sample(self.tests, rng.randint(1, 2)))
+
+    def _assert_equivalent(self, version, environment, test=None, older_than=0, name=None):
+        # former resolution was done once expired variables were deleted
+        not_expired_variables = Variable.objects.exclude(expired_filter(timezone.now()))
+        expected_variables, expected_linked_variables = chained_queryset_resolution(not_expired_variables, version, environment, test, older_than, name)
+        variables, linked_variables = VariableResolver(version, environment, test, older_than).resolve(name)
+
+        context = "version=%s, environment=%s, test=%s, olderThan=%d, name=%s" % (version.name, environment.name, test, older_than, name)
+        self.assertEqual(sorted(set(v.id for v in expected_variables)), sorted(v.id for v in variables), context)
+        self.assertEqual(sorted(set(v.id for v in expected_linked_variables)), sorted(v.id for v in linked_variables), context)
+
+    def test_same_result_as_chained_querysets(self):
+        for seed in range(3):
+            Variable.objects.all().delete()
+            self._create_variables(seed)
+            for version in self.versions:
+                for environment in self.environments:
+                    for test in [None] + self.tests:
+                        self._assert_equivalent(version, environment, test)
+
+    def test_same_result_as_chained_querysets_with_options(self):
+        self._create_variables(42)
+        for environment in self.environments:
+            self._assert_equivalent(self.versions[0], environment, self.tests[0], older_than=5)
+            self._assert_equivalent(self.versions[0], environment, None, name='var_1')
+            self._assert_equivalent(self.versions[0], environment, self.tests[1], name='var_2')
+
+    def test_application_variable_overrides_environment_variable_without_test(self):
+        """
+        Without test, application variable overrides environment variable, but not with a test
+        """
+        app_variable = Variable.objects.create(name='url', value='app', application=self.applications[0])
+        env_variable = Variable.objects.create(name='url', value='env', environment=self.environments[0])
+
+        variables, linked_variables = VariableResolver(self.versions[0], self.environments[0]).resolve()
+        self.assertEqual([app_variable], variables)
+
+        variables, linked_variables = VariableResolver(self.versions[0], self.environments[0], self.tests[0]).resolve()
+        self.assertEqual([env_variable], variables)
+
+    def test_variables_with_same_scope_are_all_kept(self):
+        variable1 = Variable.objects.create(name='login', value='user1', application=self.applications[0], reservable=True)
+        variable2 = Variable.objects.create(name='login', value='user2', application=self.applications[0], reservable=True)
+        Variable.objects.create(name='login', value='global')
+
+        variables, linked_variables = VariableResolver(self.versions[0], self.environments[0]).resolve()
+        self.assertEqual({variable1, variable2}, set(variables))
+
+    def test_linked_application_variables(self):
+        """
+        Variables of linked applications are never reservable, and do not depend on version
+        """
+        variable = Variable.objects.create(name='url', value='linked', application=self.applications[1], environment=self.environments[0])
+        Variable.objects.create(name='url', value='linked', application=self.applications[1], version=self.versions[0])
+        Variable.objects.create(name='login', value='linked', application=self.applications[1], reservable=True)
+
+        variables, linked_variables = VariableResolver(self.versions[0], self.environments[2]).resolve()
+        self.assertEqual([], variables)
+        self.assertEqual([variable], linked_variables)
+
+    def test_expired_variables_ignored(self):
+        """
+        Expired variables are not returned, even if they have not been deleted yet
+        """
+        variable = Variable.objects.create(name='url', value='app', application=self.applications[0])
+        Variable.objects.create(name='url', value='expired', application=self.applications[0], environment=self.environments[0],
+                                creationDate=timezone.now() - datetime.timedelta(days=2), timeToLive=1)
+
+        variables, linked_variables = VariableResolver(self.versions[0], self.environments[0]).resolve()
+        self.assertEqual([variable], variables)
+
+    def test_resolution_queries(self):
+        """
+        Time to live values are read in one query, then each scope in one query, and resolved variables in a last one
+        """
+        self._create_variables(1)
+        resolver = VariableResolver(self.versions[0], self.environments[2], self.tests[0])
+        scopes_number = len(set(resolver.scopes())) + len(set(resolver.linked_application_scopes()))
+        with self.assertNumQueries(scopes_number + 2):
+            variables, linked_variables = resolver.resolve()
+            for variable in variables + linked_variables:
+                str(variable.application)
+                str(variable.environment)
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        call_command('benchmark_variables', variables=300, names=20, tests=3, iterations=1, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(2, len(report['results']))
+        for result in report['results']:
+            self.assertTrue(result['equivalent'])
+            self.assertEqual({'chainedQuerysets', 'resolver'}, set(result['timings']))
+
+        # benchmark data is removed
+        self.assertFalse(Variable.objects.filter(name__startswith='var_').exists())
@@ -10,6 +10,7 @@ urlpatterns = [
     re_path(r'^api/variable/(?P<var_id>[0-9]+)/file$', api_view.VariableDownload.as_view({'get':'get'}), name='download_variable'),
     re_path(r'^api/variable/(?P<pk>[0-9]+)/$', VariableList.as_view({'patch': 'patch', 'delete': 'delete'}), name='variableApiPut'),
     re_path(r'^api/variable', VariableList.as_view({'get': 'get', 'post': 'post'}), name='variableApi'),
+    re_path(r'^api/reservation/statistics$', api_view.VariableReservationStatistics.as_view(), name='variableReservationStatistics'),
     re_path(r'^api', api_view.Ping.as_view(), name='variablePing'),
     re_path(r'copyVariables', var_action_view.copy_variables, name='copy_variables'),
     re_path(r'changeVariables', var_action_view.change_variables, name='change_variables'),
@@ -0,0 +1,63 @@
+import datetime
+import logging
+
+from django.db.models import Q, F, ExpressionWrapper, DurationField
+from django.utils import timezone
+
+from variableServer.models import Variable
+from variableServer.utils.variable_cache import invalidate_variable_cache
+
+logger = logging.getLogger(__name__)
+
+# number of expired variables deleted in each transaction
+DELETION_BATCH_SIZE = 500
+
+def expired_filter(now):
+    """
+    Filter on variables whose time to live ('timeToLive' days after creation) is over
+    """
+    return Q(timeToLive__gt=0, creationDate__lt=now - ExpressionWrapper(F('timeToLive') * datetime.timedelta(days=1), output_field=DurationField()))
+
+def is_expired(time_to_live, creation_date, now):
+    return time_to_live > 0 and creation_date < now - datetime.timedelta(days=time_to_live)
+
+def available_filter(now):
+    """
+    Filter on variables which are not reserved, or whose reservation is over
+    """
+    return Q(releaseDate=None) | Q(releaseDate__lte=now)
+
+def is_available(variable, now):
+    return variable.releaseDate is None or variable.releaseDate <= now
+
+def release_expired_reservations():
+    """
+    Release variables whose reservation is over
+    Until this is done, these variables are already considered as available when they are requested
+    """
+    released = Variable.objects.filter(releaseDate__lte=timezone.now()).update(releaseDate=None)
+    if released:
+        # update does not send signals
+        invalidate_variable_cache()
+        logger.info("unreserved %d variables automatically" % released)
+    return released
+
+def delete_expired_variables():
+    """
+    Delete variables whose time to live is over
+    Until this is done, these variables are already excluded when variables are requested
+
+    Variables are deleted by batches, each in its own transaction, so that tables are not locked for long when many variables expire at once
+    Deletion goes through the ORM: files are removed, deletions are recorded in audit log and resolved variables are invalidated (signals)
+    """
+    now = timezone.now()
+    deleted = 0
+    while True:
+        expired_ids = list(Variable.objects.filter(expired_filter(now)).order_by('id').values_list('id', flat=True)[:DELETION_BATCH_SIZE])
+        if not expired_ids:
+            break
+        deleted += Variable.objects.filter(pk__in=expired_ids).delete()[1].get(Variable._meta.label, 0)
+
+    if deleted:
+        logger.info("deleted %d expired variables" % deleted)
+    return deleted
@@ -0,0 +1,113 @@
+import collections
+import threading
+import time
+
+from variableServer.exceptions.AllVariableAlreadyReservedException import AllVariableAlreadyReservedException
+
+class ReservationWaiters:
+    """
+    Requests waiting for reservable variables to be released (see 'wait' parameter of variable API), in this process
+
+    Requests with the same key (the pool of reservable variables they reserve from) are served in arrival order: only the oldest one tries to reserve variables
+    when a variable is released, the next one tries once it's served or gone
+    Between 2 attempts, a request waits for a release in this process (see 'notify_release'), or for a delay given by caller (e.g: when a reservation ends)
+    """
+
+    def __init__(self, max_waiters):
+        """
+        @param max_waiters: maximum number of waiting requests. Over this limit, requests do not wait
+                            Each waiting request holds a server thread, so it must be lower than the number of threads, leaving threads for the requests releasing variables
+        """
+        self.max_waiters = max_waiters
+        self.waiting = 0
+        self.served = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._releases = 0
+        self._queues = {}
+        self._condition = threading.Condition()
+
+    def wait(self, key, attempt, timeout, retry_delay):
+        """
+        Calls 'attempt' until it does not raise AllVariableAlreadyReservedException, or 'timeout' seconds are elapsed
+        @param key: requests with the same key are served in arrival order
+        @param attempt: function reserving variables
+        @param timeout: maximum number of seconds to wait
+        @param retry_delay: function returning the maximum number of seconds to wait before next attempt, when no release is notified
+        @return: result of 'attempt'
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+
+        with self._condition:
+            if self.waiting >= self.max_waiters:
+                self.rejected += 1
+                return attempt()
+
+            ticket = object()
+            queue = self._queues.setdefault(key, collections.deque())
+            queue.append(ticket)
+            self.waiting += 1
+
+        try:
+            while True:
+                with self._condition:
+                    # previous requests are served first
+                    turn = self._condition.wait_for(lambda: queue[0] is ticket, deadline - time.monotonic())
+                    releases = self._releases
+
+                try:
+                    result = attempt()
+                    self._record(start, served=True)
+                    return result
+                except AllVariableAlreadyReservedException:
+                    remaining = deadline - time.monotonic()
+                    if not turn or remaining <= 0:
+                        self._record(start, served=False)
+                        raise
+
+                with self._condition:
+                    self._condition.wait_for(lambda: self._releases != releases, min(remaining, retry_delay()))
+        finally:
+            with self._condition:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[key]
+                self.waiting -= 1
+                self._condition.notify_all()
+
+    def notify_release(self):
+        """
+        A variable has been released, waiting requests should try again
+        """
+        with self._condition:
+            self._releases += 1
+            self._condition.notify_all()
+
+    def _record(self, start, served):
+        duration = time.monotonic() - start
+        with self._condition:
+            if served:
+                self.served += 1
+            else:
+                self.timeouts += 1
+            self.wait_time += duration
+            self.max_wait_time = max(self.max_wait_time, duration)
+
+    def stats(self):
+        """
+        Waiting requests and wait times in milliseconds, for monitoring
+        """
+        with self._condition:
+            finished = self.served + self.timeouts
+            return {
+                'maxWaiters': self.max_waiters,
+                'waiting': self.waiting,
+                'served': self.served,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'averageWaitTime': self.wait_time * 1000 / finished if finished else 0,
+                'maxWaitTime': self.max_wait_time * 1000,
+            }
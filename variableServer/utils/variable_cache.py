@@ -0,0 +1,83 @@
+import datetime
+import hashlib
+import itertools
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+CACHE_PREFIX = "resolved_variables:"
+GENERATION_KEY = CACHE_PREFIX + "generation"
+
+logger = logging.getLogger(__name__)
+
+def _generation():
+    """
+    Current generation of resolved variables. Each invalidation increments it, so that previously stored entries are never read again
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # time based initial value, so that entries stored before the generation key was evicted cannot be reused
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+def _cache_key(generation, version, environment, test, name):
+    # name is hashed as it may contain characters not allowed in cache keys
+    name_hash = hashlib.sha1(name.encode('utf-8')).hexdigest() if name else ''
+    return f"{CACHE_PREFIX}{generation}:{version.id}:{environment.id}:{test.id if test else ''}:{name_hash}"
+
+def get_resolved_variables(version, environment, test, name, resolve):
+    """
+    Returns the variables that apply to this context, from cache if they have already been resolved
+    Returned variables are copies, they can be modified by caller
+
+    @param resolve: function returning (variables, linked application variables), called when context is not in cache
+    @return: (variables, linked application variables)
+    """
+    timeout = settings.VARIABLE_CACHE_TIMEOUT
+    if not timeout:
+        return resolve()
+
+    key = _cache_key(_generation(), version, environment, test, name)
+    resolved_variables = cache.get(key)
+    if resolved_variables is None:
+        resolved_variables = resolve()
+        timeout = _expiry_timeout(timeout, resolved_variables)
+        if timeout > 0:
+            cache.set(key, resolved_variables, timeout)
+    else:
+        logger.debug("resolved variables read from cache for (version=%d, environment=%d)" % (version.id, environment.id))
+
+    return resolved_variables
+
+def _expiry_timeout(timeout, resolved_variables):
+    """
+    Resolved variables must not be read from cache once one of them has expired (its time to live is over)
+    @return: number of seconds resolved variables can be kept
+    """
+    now = timezone.now()
+    for variable in itertools.chain(*resolved_variables):
+        if variable.timeToLive > 0:
+            timeout = min(timeout, int((variable.creationDate + datetime.timedelta(days=variable.timeToLive) - now).total_seconds()))
+    return timeout
+
+def invalidate_variable_cache():
+    """
+    Invalidates all resolved variables, whatever their context
+    When called inside a transaction, generation is incremented again once it's committed: until then, other requests still read
+    the previous variables from database, and what they store in cache meanwhile must not be used afterwards
+    """
+    _increment_generation()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(_increment_generation)
+
+def _increment_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # generation is not in cache anymore, a new one will be created
+        pass
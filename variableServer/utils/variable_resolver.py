@@ -0,0 +1,143 @@
+import datetime
+
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from variableServer.models import Variable
+
+NO_TEST = 'noTest'
+WITH_TEST = 'withTest'
+
+class VariableResolver:
+    """
+    Computes the variables that apply to a test context (version, environment, test)
+
+    Specificity is given by the list of scopes returned by 'scopes()', from the most generic to the most specific. Each scope is a tuple
+    (application id, version id, environment id, test scope) where test scope is NO_TEST (variable is not related to any test) or WITH_TEST
+    (variable is related to the requested test)
+    Scopes are read from the most specific to the most generic one, one query each, reading only id and name of the variables (see index 'variable_scope_idx').
+    A variable is kept if no more specific scope defines its name. Only the kept variables are then read.
+
+    When several variables with the same name have the same specificity, they are all kept (e.g: a pool of reservable variables)
+    """
+
+    def __init__(self, version, environment, test=None, older_than=0, queryset=None):
+        """
+        @param older_than: number of days. Variables with a time to live are only returned if they have been created before this number of days
+        @param queryset: variables to search in. Defaults to all variables
+        """
+        self.version = version
+        self.application = version.application
+        self.environment = environment
+        self.test = test
+        self.older_than = older_than
+        self.queryset = queryset if queryset is not None else Variable.objects.all()
+
+        # first environment is the most generic one, the latest is the most precise
+        self.environment_tree = [environment] + environment.get_parent_environments()
+        self.environment_tree.reverse()
+        self.linked_applications = list(self.application.linkedApplication.all())
+
+    def scopes(self):
+        """
+        Scopes of the variables of the application, from the most generic to the most specific
+        """
+        application_id = self.application.id
+        version_id = self.version.id
+        environment_ids = [env.id for env in self.environment_tree]
+
+        scopes = [(None, None, None, NO_TEST),
+                  (application_id, None, None, NO_TEST),
+                  (application_id, version_id, None, NO_TEST)]
+        scopes += [(None, None, env_id, NO_TEST) for env_id in environment_ids]
+
+        # without test, application variables are more specific than environment ones
+        scopes.append((application_id, None, None, WITH_TEST if self.test else NO_TEST))
+        scopes += [(application_id, None, env_id, NO_TEST) for env_id in environment_ids]
+        scopes += [(application_id, version_id, env_id, NO_TEST) for env_id in environment_ids]
+        if self.test:
+            scopes += [(application_id, None, env_id, WITH_TEST) for env_id in environment_ids]
+            scopes += [(application_id, version_id, env_id, WITH_TEST) for env_id in environment_ids]
+        return scopes
+
+    def linked_application_scopes(self):
+        """
+        Scopes of the variables of linked applications, from the most generic to the most specific
+        """
+        scopes = []
+        for linked_application in self.linked_applications:
+            scopes.append((linked_application.id, None, None, NO_TEST))
+            scopes += [(linked_application.id, None, env.id, NO_TEST) for env in self.environment_tree]
+        return scopes
+
+    def valid_filter(self, now):
+        """
+        Filter on variables which are not expired, and, when they have a time to live, created before 'older_than' days
+        Expiry is compared with one date per time to live value, as date arithmetic is slow in database (SQLite)
+        """
+        created_before = now - datetime.timedelta(self.older_than)
+        valid = Q(timeToLive__lte=0)
+        for time_to_live in self.queryset.filter(timeToLive__gt=0).order_by().values_list('timeToLive', flat=True).distinct():
+            valid |= Q(timeToLive=time_to_live, creationDate__lt=created_before, creationDate__gte=now - datetime.timedelta(days=time_to_live))
+        return valid
+
+    def resolve(self, name=None):
+        """
+        @param name: if given, only variables with this name are returned
+        @return: (variables of the application, variables of the linked applications). Linked application variables are never reservable
+        """
+        variables = self.queryset.filter(self.valid_filter(timezone.now()))
+        if name:
+            variables = variables.filter(name=name)
+
+        variable_ids = self._most_specific(variables, self.scopes())
+        linked_variable_ids = self._most_specific(variables.filter(reservable=False), self.linked_application_scopes())
+        resolved_variables = self._read_variables(set(variable_ids + linked_variable_ids))
+
+        # application and environment of returned variables are already known, do not read them again
+        # they are put in relation cache, which is faster than setting them through the relation descriptor
+        applications = {application.id: application for application in [self.application] + self.linked_applications}
+        environments = {environment.id: environment for environment in self.environment_tree}
+        application_field = Variable._meta.get_field('application')
+        environment_field = Variable._meta.get_field('environment')
+        for variable in resolved_variables.values():
+            if variable.application_id:
+                application_field.set_cached_value(variable, applications[variable.application_id])
+            if variable.environment_id:
+                environment_field.set_cached_value(variable, environments[variable.environment_id])
+
+        return ([resolved_variables[variable_id] for variable_id in variable_ids],
+                [resolved_variables[variable_id] for variable_id in linked_variable_ids])
+
+    def _most_specific(self, variables, scopes):
+        """
+        For each name, ids of the variables of the most specific scope defining it
+        @param scopes: scopes from the most generic to the most specific. When a scope is present several times, the most specific position is kept
+        @return: sorted list of variable ids
+        """
+        ranks = {scope: rank for rank, scope in enumerate(scopes)}
+
+        most_specific = {}
+        for application_id, version_id, environment_id, test_scope in sorted(ranks, key=ranks.get, reverse=True):
+            scope_variables = {}
+            for variable_id, variable_name in (variables
+                    .filter(application=application_id, version=version_id, environment=environment_id, test=self.test if test_scope == WITH_TEST else None)
+                    .values_list('id', 'name')):
+                if variable_name not in most_specific:
+                    scope_variables.setdefault(variable_name, []).append(variable_id)
+            most_specific.update(scope_variables)
+
+        return sorted(variable_id for variable_ids in most_specific.values() for variable_id in variable_ids)
+
+    def _read_variables(self, variable_ids):
+        """
+        Read the variables, by batches when database limits the number of query parameters
+        @return: dict {variable id: variable}
+        """
+        variable_ids = list(variable_ids)
+        batch_size = connections[self.queryset.db].features.max_query_params or len(variable_ids) or 1
+        variables = {}
+        for i in range(0, len(variable_ids), batch_size):
+            variables.update({variable.id: variable for variable in self.queryset.filter(id__in=variable_ids[i:i + batch_size])})
+        return variables
@@ -7,14 +7,15 @@ import datetime
 import logging
 import os
 import random
-import time
 from builtins import ValueError
 
-from django.db import transaction
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
 from django.http.response import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from rest_framework import permissions
+from rest_framework import permissions, renderers
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -24,11 +25,16 @@ from seleniumRobotServer.permissions.permissions import ContextPermissionChecker
     ContextSpecificPermissionsVariables
 from variableServer.exceptions.AllVariableAlreadyReservedException import AllVariableAlreadyReservedException
 from variableServer.models import Variable, TestEnvironment, Version, TestCase, Application
-from variableServer.utils.utils import updateVariables
+from variableServer.utils.expiry import available_filter, is_available
+from variableServer.utils.reservation_waiters import ReservationWaiters
+from variableServer.utils.variable_cache import get_resolved_variables
+from variableServer.utils.variable_resolver import VariableResolver
 from variableServer.views.serializers import VariableSerializer
 
 logger = logging.getLogger(__name__)
 
+reservation_waiters = ReservationWaiters(settings.VARIABLE_RESERVATION_MAX_WAITERS)
+
 class Ping(APIView):
     
     # allow anyone on this view
@@ -84,6 +90,7 @@ class VariableFilter:
         variable_name = request.query_params.get('name', None)
         variable_value = request.query_params.get('value', None)
         reserve_reservable_variables = request.query_params.get('reserve', 'true') == 'true'
+        wait = min(int(request.query_params.get('wait', '0')), settings.VARIABLE_RESERVATION_MAX_WAIT)
         
         version_name = 'N/A'
         application_name = 'N/A'
@@ -126,80 +133,79 @@ class VariableFilter:
         else:
             test = None
             
-        # get list of all variables that applies (variables that live forever and those which have not been obsolated
-        all_variables = queryset.filter(timeToLive__lte=0) | queryset.filter(timeToLive__gt=0, creationDate__lt=timezone.now() - datetime.timedelta(older_than))
-        
-        variables = all_variables.filter(application=None, version=None, environment=None, test=None)
-        
-        # variables specific to one of the parameters, the other remain null
-        variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=None, test=None))
-        variables = updateVariables(variables, all_variables.filter(application=version.application, version=version, environment=None, test=None))
-        
-        # for each queryset depending on environment, we will first get the generic environment related variable and then update them
-        # with the specific environment ones
-        # for that purpose, we build the list of environments, first one is the most generic one, the latest is the most precise
-        environment_tree = [environment] + environment.get_parent_environments()
-        environment_tree.reverse()
-
-        # environment specific variables
-        for env in environment_tree:
-            variables = updateVariables(variables, all_variables.filter(application=None, version=None, test=None, environment=env))
-        
-        # application / test specific variables
-        variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=None, test=test))
-        
-        # more precise variables
-        # application / environment specific variables
-        for env in environment_tree:
-            variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=env, test=None))
-        
-        # application / version/ environment specific variables
-        for env in environment_tree:
-            variables = updateVariables(variables, all_variables.filter(application=version.application, version=version, environment=env, test=None))
-        
-        if test:
-            # application / environment / test specific variables
-            for env in environment_tree:
-                variables = updateVariables(variables, all_variables.filter(application=version.application, version=None, environment=env, test=test))
-           
-            # application / version / environment / test specific variables
-            for env in environment_tree:
-                variables = updateVariables(variables, all_variables.filter(application=version.application, version=version, environment=env, test=test))
-        
-        # in case name is provided, filter variables
-        if variable_name:
-            variables = variables.filter(name=variable_name)
-
-        variable_list = list(variables)
+        # get variables that apply, each one overriding the more generic ones with the same name
+        resolver = VariableResolver(version, environment, test, older_than, queryset)
+        if older_than:
+            # variables returned depend on time, do not cache them
+            variable_list, linked_application_variable_list = resolver.resolve(variable_name)
+        else:
+            variable_list, linked_application_variable_list = get_resolved_variables(version, environment, test, variable_name, lambda: resolver.resolve(variable_name))
 
         # in case value is provided, filter variables
         if variable_value:
             variable_list = [v for v in variable_list if v.value == variable_value]
 
+        reservation_context = (application_name, version_name, environment_name, test_name)
+        if wait > 0 and reserve_reservable_variables:
+            # wait for other tests to release reservable variables, instead of failing
+            # requests reserving from the same pool of variables are served in arrival order, whatever the context they requested
+            initial_list = reservation_waiters.wait(frozenset(v.id for v in variable_list if v.reservable),
+                                                    lambda: self._select_variables(variable_list, reserve_reservable_variables, reservation_context, reservation_duration),
+                                                    wait,
+                                                    lambda: self._next_release_delay(variable_list))
+        else:
+            initial_list = self._select_variables(variable_list, reserve_reservable_variables, reservation_context, reservation_duration)
+
+        # for now, we get variables from linked application, but if any is reservable, it won't be reserved
+        initial_list += self._get_linked_application_variables(linked_application_variable_list, variable_value)
+        
+        return initial_list
+    
+    def _select_variables(self, variable_list, reserve_reservable_variables, reservation_context, reservation_duration):
+        """
+        Select one variable per name, among those which are not reserved, and reserve it if it's reservable
+        @param reservation_context: (application, version, environment, test) names, for logging
+        @raise AllVariableAlreadyReservedException: when all variables with the same name are reserved
+        """
         variable_names = list(set([v.name for v in variable_list]))
 
+        # only reservable (or reserved) variables need to be read again to get their current reservation state
+        # variables whose reservation is over are available, even if they have not been released yet (see expiry.release_expired_reservations)
+        now = timezone.now()
+        available_variables = [var for var in variable_list if not var.reservable and var.releaseDate is None]
+        candidates = list(Variable.objects.filter(available_filter(now)).filter(id__in=[var.id for var in variable_list if var.reservable or var.releaseDate is not None]).order_by('id'))
+        reservable_variables = candidates
 
         # see: https://github.com/bhecquet/seleniumRobot-server/issues/128
         with transaction.atomic():
 
-            filtered_variables = Variable.objects.select_for_update().filter(releaseDate=None).filter(id__in=[var.id for var in variable_list]).order_by('id')
-            unique_variable_list = self._unique_variable(filtered_variables)
+            if reserve_reservable_variables:
+                reservable_variables = self._lock_one_variable_per_name(candidates, now)
+            for variable in reservable_variables:
+                if variable.releaseDate is not None and is_available(variable, now):
+                    variable.releaseDate = None
+            unique_variable_list = self._unique_variable(available_variables + reservable_variables)
             
             # check we still have all variables after filtering. Else test may fail
             filtered_variable_names = list(set([v.name for v in unique_variable_list]))
             if (len(filtered_variable_names) < len(variable_names)):
                 raise AllVariableAlreadyReservedException([v for v in variable_names if v not in filtered_variable_names])
             
-            initial_list = []
             if reserve_reservable_variables:            
-                initial_list = self._reserve_reservable_variables(unique_variable_list, application_name, version_name, environment_name, test_name, reservation_duration)
+                return self._reserve_reservable_variables(unique_variable_list, *reservation_context, reservation_duration, now, candidates)
             else:
-                initial_list = unique_variable_list
+                return unique_variable_list
 
-        # for now, we get variables from linked application, but if any is reservable, it won't be reserved
-        initial_list += self._get_linked_application_variables(all_variables, version.application, environment_tree, variable_name, variable_value)
-        
-        return initial_list
+    def _next_release_delay(self, variable_list):
+        """
+        Number of seconds before the next reservation among these variables ends, at most VARIABLE_RESERVATION_POLL_INTERVAL
+        as releases done by other server processes are not notified
+        """
+        now = timezone.now()
+        next_release_date = Variable.objects.filter(id__in=[v.id for v in variable_list if v.reservable], releaseDate__gt=now).aggregate(Min('releaseDate'))['releaseDate__min']
+        if next_release_date is None:
+            return settings.VARIABLE_RESERVATION_POLL_INTERVAL
+        return min(settings.VARIABLE_RESERVATION_POLL_INTERVAL, (next_release_date - now).total_seconds())
     
     def _filter_delete_queryset(self, request, queryset, view):
         """
@@ -252,39 +258,90 @@ class VariableFilter:
                 existing_variable_names.append(variable.name)
         return unique_variable_list
 
-    def _reserve_reservable_variables(self, variable_list, application, version, environment, test, reservation_duration):
+    def _lock_one_variable_per_name(self, variable_list, now):
+        """
+        Among available variables, lock one variable per name, chosen randomly, so that it can be reserved
+        Variables locked by an other request are skipped (SKIP LOCKED) instead of waiting for this request to finish, and an other variable
+        with the same name is tried. So, concurrent requests on the same pool of variables do not wait for each other
+        
+        Databases without row locks (SQLite) serialize writes. Then, reservation only updates variables which are still available (see _reserve_reservable_variables)
+        """
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        candidates = list(variable_list)
+        random.shuffle(candidates)
+        
+        locked_variables = {}
+        while True:
+            picked_variables = {}
+            for variable in candidates:
+                if variable.name not in locked_variables and variable.name not in picked_variables:
+                    picked_variables[variable.name] = variable
+            if not picked_variables:
+                break
+            
+            picked_ids = [variable.id for variable in picked_variables.values()]
+            candidates = [variable for variable in candidates if variable.id not in picked_ids]
+            for variable in Variable.objects.select_for_update(skip_locked=skip_locked).filter(available_filter(now)).filter(id__in=picked_ids):
+                locked_variables[variable.name] = variable
+                
+        return list(locked_variables.values())
+
+    def _reserve_reservable_variables(self, variable_list, application, version, environment, test, reservation_duration, now, candidates=()):
         """
         among all variables of the queryset, mark all variables as reserved (releaseDate not null) when the are flagged as reservable
         Release will occur 15 mins after now
+        Reservation is done with a single update, only on variables which are still available
+        
+        Without row locks (SQLite), an other request may have reserved some of the variables in the meantime. These variables are replaced
+        by other candidates with the same name, and the update is done again for them
         
         @param reservation_duration: number of seconds the variables will be reserved
+        @param candidates: available variables which may replace the ones reserved in the meantime
+        @raise AllVariableAlreadyReservedException: when all candidates of a name have been reserved by other requests
         """
-        for variable in variable_list:
-            if variable.reservable:
-                variable.releaseDate = timezone.now() + datetime.timedelta(seconds=reservation_duration)
-                variable.save()
-                logger.info("reserve variable [%d] %s=%s for (application=%s, version=%s, environment=%s, test=%s)" % (variable.id, variable.name, variable.value, application, version, environment, test))
+        variables_to_reserve = {variable.name: variable for variable in variable_list if variable.reservable}
+        if not variables_to_reserve:
+            return variable_list
+        
+        release_date = now + datetime.timedelta(seconds=reservation_duration)
+        reserved_variables = {}
+        remaining_candidates = [variable for variable in candidates if variable.reservable and variable.id not in [v.id for v in variables_to_reserve.values()]]
+        random.shuffle(remaining_candidates)
+        
+        while variables_to_reserve:
+            variable_ids = [variable.id for variable in variables_to_reserve.values()]
+            reserved = Variable.objects.filter(available_filter(now)).filter(id__in=variable_ids).update(releaseDate=release_date)
+            if reserved == len(variable_ids):
+                reserved_variables.update(variables_to_reserve)
+                break
+            
+            reserved_variable_ids = set(Variable.objects.filter(id__in=variable_ids, releaseDate=release_date).values_list('id', flat=True))
+            reserved_variables.update({name: variable for name, variable in variables_to_reserve.items() if variable.id in reserved_variable_ids})
+            
+            # try an other candidate for each variable reserved by an other request
+            lost_names = [name for name, variable in variables_to_reserve.items() if variable.id not in reserved_variable_ids]
+            variables_to_reserve = {}
+            for variable in remaining_candidates:
+                if variable.name in lost_names and variable.name not in variables_to_reserve:
+                    variables_to_reserve[variable.name] = variable
+                    
+            # transaction is rolled back
+            exhausted_names = [name for name in lost_names if name not in variables_to_reserve]
+            if exhausted_names:
+                raise AllVariableAlreadyReservedException(exhausted_names)
+            
+            remaining_candidates = [variable for variable in remaining_candidates if variable not in variables_to_reserve.values()]
+        
+        for variable in reserved_variables.values():
+            variable.releaseDate = release_date
+            logger.info("reserve variable [%d] %s=%s for (application=%s, version=%s, environment=%s, test=%s)" % (variable.id, variable.name, variable.value, application, version, environment, test))
                 
-        return variable_list
+        return [reserved_variables[variable.name] if variable.reservable else variable for variable in variable_list]
     
-    def _get_linked_application_variables(self, all_variables, application, environment_tree, variable_name, variable_value):
+    def _get_linked_application_variables(self, linked_application_variable_list, variable_value):
         """
-        Get all variables of the applications linked to the requested application
+        Get all variables of the applications linked to the requested application, named with their application
         """
-        
-        linked_application_variables = Variable.objects.none()
-        if application.linkedApplication:
-            for linked_application in application.linkedApplication.all():
-                linked_application_variables = updateVariables(linked_application_variables, all_variables.filter(application=linked_application, version=None, environment=None, test=None, reservable=False))
-            
-                for env in environment_tree:
-                    linked_application_variables = updateVariables(linked_application_variables, all_variables.filter(application=linked_application, version=None, environment=env, test=None, reservable=False))
-
-        # in case name is provided, filter variables
-        if variable_name:
-            linked_application_variables = linked_application_variables.filter(name=variable_name)
-
-        linked_application_variable_list = list(linked_application_variables)
 
         # in case value is provided, filter variables
         if variable_value:
@@ -332,21 +389,6 @@ class VariableList(ApplicationSpecificViewSet):
     permission_classes = [VariablesPermissions]
     queryset = Variable.objects.none()
     
-    def _reset_past_release_dates(self):
-
-        updated = Variable.objects.filter(releaseDate__lte=time.strftime('%Y-%m-%d %H:%M:%S%z')).update(releaseDate=None)
-        if updated:
-            logger.info("unreserved %d variables automatically" % updated)
-        
-    def _delete_old_variables(self):
-        """
-        Delete variables which contains a positive value for 'timeToLive' and which are still there whereas they expired
-        """
-        for var in Variable.objects.filter(timeToLive__gt=0):
-            if timezone.now() - datetime.timedelta(var.timeToLive) > var.creationDate:
-                var.delete()
-                
-    
     def get_queryset(self):
         return Variable.objects.all()
     
@@ -354,13 +396,8 @@ class VariableList(ApplicationSpecificViewSet):
     def get(self, request, *args, **kwargs):
         """
         Get all variables corresponding to requested args
+        Expired variables and reservations are not handled here, but by a scheduled job (see expiry.py)
         """
-        # reset 
-        self._reset_past_release_dates()
-        
-        # remove old variables
-        self._delete_old_variables()
-        
         return self.list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
@@ -380,7 +417,21 @@ class VariableList(ApplicationSpecificViewSet):
             except:
                 pass
         
-        return self.partial_update(request, *args, **kwargs)
+        response = self.partial_update(request, *args, **kwargs)
+        if release_date == '':
+            # requests waiting for a variable may get this one
+            reservation_waiters.notify_release()
+        return response
+
+class VariableReservationStatistics(APIView):
+    """
+    Requests waiting for reservable variables in the process serving the request (wait times in milliseconds), for monitoring
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (renderers.JSONRenderer,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(reservation_waiters.stats())
 
 class VariableDownloadPermissions(ContextSpecificPermissionsVariables):
 
@@ -26,4 +26,15 @@ class VariableSerializer(serializers.ModelSerializer):
         """
         instance = super(VariableSerializer, self).create(validated_data)
         instance._correctReservableState()
-        return instance
\ No newline at end of file
+        return instance
+
+    def update(self, instance, validated_data):
+        """
+        When a reservable variable is released (or reserved), only save its release date, so that resolved variables are kept in cache
+        (see models.invalidate_resolved_variables)
+        """
+        if instance.reservable and set(validated_data) == {'releaseDate'}:
+            instance.releaseDate = validated_data['releaseDate']
+            instance.save(update_fields=['releaseDate'])
+            return instance
+        return super().update(instance, validated_data)
\ No newline at end of file